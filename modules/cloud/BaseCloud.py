@@ -1,7 +1,9 @@
 import json
+import threading
 from abc import ABCMeta, abstractmethod
-from pathlib import Path
+from pathlib import Path, PurePosixPath
 
+from modules.cloud.UploadManifest import UploadManifest
 from modules.util.callbacks.TrainCallbacks import TrainCallbacks
 from modules.util.commands.TrainCommands import TrainCommands
 from modules.util.config.CloudConfig import CloudConfig
@@ -32,7 +34,7 @@ class BaseCloud(metaclass=ABCMeta):
         self.file_sync.sync_down_dir(local=local.with_suffix(local.suffix+"_embeddings"),
                            remote=remote.with_suffix(remote.suffix+"_embeddings"))
 
-    def upload_config(self,commands : TrainCommands=None):
+    def upload_config(self,commands : TrainCommands=None,upload_concepts : bool=True):
         local_config_path=Path(self.config.local_workspace_dir,f"remote_config-{get_string_timestamp()}.json")
         #no need to upload secrets - hugging face token is transferred via environment variable:
         with local_config_path.open(mode="w") as f:
@@ -52,19 +54,59 @@ class BaseCloud(metaclass=ABCMeta):
             if hasattr(add_embedding,"local_model_name"):
                 self.file_sync.sync_up(local=Path(add_embedding.local_model_name),remote=Path(add_embedding.model_name))
 
-        for concept in self.config.concepts:
-            print(f"uploading concept {concept.name}...")
-            if commands and commands.get_stop_command():
-                return
-
-            if hasattr(concept,"local_path"):
-                self.file_sync.sync_up_dir(
-                    local=Path(concept.local_path),
-                    remote=Path(concept.path),
-                    recursive=concept.include_subdirectories)
+        if upload_concepts:
+            self.upload_concepts(commands)
+        else:
+            #replace the manifest of a previous run before the trainer is started:
+            self.__upload_manifest(UploadManifest([concept.name for concept in self.config.concepts]))
+
+    def upload_concepts(self,commands : TrainCommands=None,streaming : bool=False):
+        #if streaming, the trainer is already running, and waits for the upload manifest to be complete:
+        manifest=UploadManifest([concept.name for concept in self.config.concepts])
+        try:
+            for concept in self.config.concepts:
+                print(f"uploading concept {concept.name}...")
+                if commands and commands.get_stop_command():
+                    return
+
+                if hasattr(concept,"local_path"):
+                    self.file_sync.sync_up_dir(
+                        local=Path(concept.local_path),
+                        remote=Path(concept.path),
+                        recursive=concept.include_subdirectories)
+
+                if hasattr(concept.text,"local_prompt_path"):
+                    self.file_sync.sync_up_file(local=Path(concept.text.local_prompt_path),remote=Path(concept.text.prompt_path))
+
+                if streaming:
+                    manifest.uploaded.append(concept.name)
+                    self.__upload_manifest(manifest)
+        except Exception as e:
+            if streaming:
+                manifest.error=str(e)
+                self.__upload_manifest(manifest)
+            raise
+
+        if streaming:
+            manifest.complete=True
+            self.__upload_manifest(manifest)
+
+    def __upload_manifest(self,manifest : UploadManifest):
+        local=Path(self.config.local_workspace_dir,"remote_upload_manifest.json")
+        manifest.save(local)
+        self._upload_manifest_file(local)
 
-            if hasattr(concept.text,"local_prompt_path"):
-                self.file_sync.sync_up_file(local=Path(concept.text.local_prompt_path),remote=Path(concept.text.prompt_path))
+    @staticmethod
+    def _excluded_download_dirs(config : TrainConfig) -> list[str]:
+        #directories that are never downloaded don't need to be scanned by the remote manifest
+        names=[name for name in ['samples','save','backup','tensorboard']
+               if not BaseCloud._filter_download(config=config.cloud,path=Path(name))]
+        #the remote cache can be inside the workspace
+        cache_dir=PurePosixPath(config.cache_dir)
+        workspace_dir=PurePosixPath(config.workspace_dir)
+        if cache_dir != workspace_dir and cache_dir.is_relative_to(workspace_dir):
+            names.append(cache_dir.name)
+        return names
 
     @staticmethod
     def _filter_download(config : CloudConfig,path : Path):
@@ -89,7 +131,9 @@ class BaseCloud(metaclass=ABCMeta):
         pass
 
     @abstractmethod
-    def exec_callback(self,callbacks : TrainCallbacks):
+    def exec_callback(self,callbacks : TrainCallbacks,stop_event : threading.Event) -> bool:
+        #passes events to callbacks until the connection is lost, the trainer has finished or stop_event is set.
+        #Returns True if the trainer has finished
         pass
 
     @abstractmethod
@@ -125,6 +169,10 @@ class BaseCloud(metaclass=ABCMeta):
     def _upload_config_file(self,local : Path):
         pass
 
+    @abstractmethod
+    def _upload_manifest_file(self,local : Path):
+        pass
+
     @abstractmethod
     def delete_workspace(self):
         pass
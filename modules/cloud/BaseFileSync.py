@@ -33,7 +33,7 @@ class BaseFileSync(metaclass=ABCMeta):
         pass
 
     @abstractmethod
-    def sync_down_dir(self,local : Path,remote : Path,filter=None):
+    def sync_down_dir(self,local : Path,remote : Path,filter=None,exclude_dirs: list[str] | None=None):
         pass
 
     @staticmethod
@@ -1,115 +1,64 @@
+import json
 import shlex
-from abc import abstractmethod
 from pathlib import Path
 
-from modules.cloud.BaseFileSync import BaseFileSync
+from modules.cloud import SyncManifest as sync_manifest_module
+from modules.cloud.ManifestFileSync import ManifestFileSync
+from modules.cloud.SyncManifest import SyncManifest
 from modules.util.config.CloudConfig import CloudConfig, CloudSecretsConfig
 
 import fabric
 
+REMOTE_MANIFEST_CACHE_DIR = "~/.cache/onetrainer/sync_manifest"
 
-class BaseSSHFileSync(BaseFileSync):
+
+class BaseSSHFileSync(ManifestFileSync):
     def __init__(self, config: CloudConfig, secrets: CloudSecretsConfig):
         super().__init__(config, secrets)
-        self.sync_connection=fabric.Connection(host=secrets.host,port=secrets.port,user=secrets.user)
+        self.sync_connection=fabric.Connection(host=secrets.host,port=secrets.port,user=secrets.user,
+                                               connect_kwargs=self._connect_kwargs())
+        self.manifest_script=Path(sync_manifest_module.__file__).read_text(encoding='utf-8')
+
+    def _connect_kwargs(self):
+        return {'compress': True} if self.config.sync_compression else {}
 
     def close(self):
+        super().close()
         if self.sync_connection:
             self.sync_connection.close()
 
-    @abstractmethod
-    def upload_files(self,local_files,remote_dir: Path):
-        pass
-
-    @abstractmethod
-    def download_files(self,local_dir: Path,remote_files):
-        pass
-
-    @abstractmethod
-    def upload_file(self,local_file: Path,remote_file: Path):
-        pass
-
-    @abstractmethod
-    def download_file(self,local_file: Path,remote_file: Path):
-        pass
-
-    def sync_up_file(self,local : Path,remote : Path):
-        sync_info=self.__get_sync_info(remote)
-        if not self.__needs_upload(local=local,remote=remote,sync_info=sync_info):
-            return
-
+    def _remote_manifest(self,remote : Path,exclude_dirs: list[str] | None=None) -> SyncManifest:
         self.sync_connection.open()
-        self.sync_connection.run(f'mkdir -p {shlex.quote(remote.parent.as_posix())}',in_stream=False)
-        self.upload_file(local_file=local,remote_file=remote)
-
-
-    def sync_up_dir(self,local : Path,remote: Path,recursive: bool,sync_info=None):
-        if sync_info is None:
-            sync_info=self.__get_sync_info(remote)
-        self.sync_connection.open()
-        self.sync_connection.run(f'mkdir -p {shlex.quote(remote.as_posix())}',in_stream=False)
-        files=[]
-        for local_entry in local.iterdir():
-            if local_entry.is_file():
-                remote_entry=remote/local_entry.name
-                if self.__needs_upload(local=local_entry,remote=remote_entry,sync_info=sync_info):
-                    files.append(local_entry)
-            elif recursive and local_entry.is_dir():
-                self.sync_up_dir(local=local_entry,remote=remote/local_entry.name,recursive=True,sync_info=sync_info)
-
-        self.upload_files(local_files=files,remote_dir=remote)
+        exclude_dirs=exclude_dirs or []
 
-    def sync_down_file(self,local : Path,remote : Path):
-        sync_info=self.__get_sync_info(remote)
-        if not self.__needs_download(local=local,remote=remote,sync_info=sync_info):
-            return
-        local.parent.mkdir(parents=True,exist_ok=True)
-        self.download_file(local_file=local,remote_file=remote)
-
-    def sync_down_dir(self,local : Path,remote : Path,filter=None):
-        sync_info=self.__get_sync_info(remote)
-        dirs={}
-        for remote_entry in sync_info:
-            local_entry=local / remote_entry.relative_to(remote)
-            if ((filter is not None and not filter(remote_entry))
-                or not self.__needs_download(local=local_entry,remote=remote_entry,sync_info=sync_info)):
-                continue
-
-            if local_entry.parent not in dirs:
-                dirs[local_entry.parent]=[]
-            dirs[local_entry.parent].append(remote_entry)
-
-        for dir,files in dirs.items():
-            dir.mkdir(parents=True,exist_ok=True)
-            self.download_files(local_dir=dir,remote_files=files)
-
-
-    def __get_sync_info(self,remote : Path):
-        cmd = f'find {shlex.quote(remote.as_posix())} -type f -exec stat --printf "%n\\t%s\\t%Y\\n"' + ' {} \\;'
-        self.sync_connection.open()
+        #the manifest script only needs the python standard library, and hashes are cached on the remote side:
+        cmd=f'python3 -c {shlex.quote(self.manifest_script)} {shlex.quote(remote.as_posix())} {shlex.quote(REMOTE_MANIFEST_CACHE_DIR)}'
+        cmd+=''.join(f' {shlex.quote(name)}' for name in exclude_dirs)
+        result=self.sync_connection.run(cmd,warn=True,hide=True,in_stream=False)
+        if result.exited == 0:
+            try:
+                return SyncManifest.from_dict(json.loads(result.stdout))
+            except (ValueError,KeyError):
+                pass
+
+        #fall back to size and mtime from a single find process if python is not available
+        prune=' -o '.join(f'-name {shlex.quote(name)}' for name in exclude_dirs)
+        prune=f'-type d \\( {prune} \\) -prune -o ' if prune else ''
+        cmd=f'find {shlex.quote(remote.as_posix())} {prune}-type f -printf "%p\\t%s\\t%T@\\n"'
         result=self.sync_connection.run(cmd,warn=True,hide=True,in_stream=False)
-        info={}
+        manifest=SyncManifest(remote)
         for line in result.stdout.splitlines():
             sp=line.split('\t')
-            info[Path(sp[0])]={
+            if len(sp) != 3:
+                continue
+            manifest.entries[Path(sp[0]).relative_to(remote).as_posix()]={
                     'size': int(sp[1]),
-                    'mtime': int(sp[2])
+                    'mtime': float(sp[2]),
                 }
-        return info
+        return manifest
 
-    @staticmethod
-    def __needs_upload(local : Path,remote : Path,sync_info):
-        return (
-            remote not in sync_info
-            or local.stat().st_size != sync_info[remote]['size']
-            or local.stat().st_mtime > sync_info[remote]['mtime']
-        )
-
-    @staticmethod
-    def __needs_download(local : Path,remote : Path,sync_info):
-        return (
-            not local.exists()
-            or remote not in sync_info
-            or local.stat().st_size != sync_info[remote]['size']
-            or local.stat().st_mtime < sync_info[remote]['mtime']
-        )
+    def _make_remote_dirs(self,remote_dirs: list[Path]):
+        self.sync_connection.open()
+        for i in range(0,len(remote_dirs),100):
+            dirs=' '.join(shlex.quote(remote_dir.as_posix()) for remote_dir in remote_dirs[i:i+100])
+            self.sync_connection.run(f'mkdir -p {dirs}',in_stream=False)
@@ -0,0 +1,399 @@
+import contextlib
+import json
+import os
+import pickle
+import secrets
+import select
+import socket
+import struct
+import threading
+import time
+import traceback
+import zlib
+from collections import deque
+from collections.abc import Callable
+from enum import IntEnum
+from typing import BinaryIO
+
+from modules.util.callbacks.TrainCallbacks import TrainCallbacks
+from modules.util.commands.TrainCommands import TrainCommands
+from modules.util.config.SampleConfig import SampleConfig
+from modules.util.TrainProgress import TrainProgress
+
+
+class EventType(IntEnum):
+    # trainer -> client
+    TRAIN_PROGRESS = 1
+    STATUS = 2
+    SAMPLE_DEFAULT = 3
+    SAMPLE_DEFAULT_PROGRESS = 4
+    SAMPLE_CUSTOM = 5
+    SAMPLE_CUSTOM_PROGRESS = 6
+    END = 7
+
+    # client -> trainer
+    COMMAND_STOP = 16
+    COMMAND_SAMPLE_DEFAULT = 17
+    COMMAND_SAMPLE_CUSTOM = 18
+    COMMAND_BACKUP = 19
+    COMMAND_SAVE = 20
+
+
+# these events only describe the latest state. If they are still waiting to be sent, they are replaced
+# by a newer event of the same type instead of being queued
+COALESCED_EVENTS = {
+    EventType.TRAIN_PROGRESS,
+    EventType.SAMPLE_DEFAULT_PROGRESS,
+    EventType.SAMPLE_CUSTOM_PROGRESS,
+}
+
+FRAME_MAGIC = b'OT'
+# magic, session id, sequence number, event type, payload length, crc32 of the payload
+FRAME_HEADER = struct.Struct('<2sIQBII')
+MAX_PAYLOAD_SIZE = 64 * 1024 * 1024
+
+TRAIN_PROGRESS = struct.Struct('<6q')
+SAMPLE_PROGRESS = struct.Struct('<2q')
+
+
+def encode_frame(session: int, sequence: int, event_type: EventType, payload: bytes) -> bytes:
+    return FRAME_HEADER.pack(FRAME_MAGIC, session, sequence, event_type, len(payload), zlib.crc32(payload)) + payload
+
+
+class FrameDecoder:
+    """
+    Splits a byte stream into frames. Data can be fed in pieces of any size. Damaged data, like the rest
+    of a frame that was cut off by a lost connection, is skipped until the next valid frame.
+    """
+
+    def __init__(self, offset: int = 0):
+        self.buffer = bytearray()
+        # stream offset of the end of the last complete frame
+        self.offset = offset
+
+    def feed(self, data: bytes) -> list[tuple[int, int, EventType, bytes]]:
+        self.buffer += data
+        frames = []
+        position = 0
+
+        while len(self.buffer) - position >= FRAME_HEADER.size:
+            magic, session, sequence, event_type, length, crc = FRAME_HEADER.unpack_from(self.buffer, position)
+            if magic != FRAME_MAGIC or length > MAX_PAYLOAD_SIZE:
+                position += 1
+                continue
+
+            end = position + FRAME_HEADER.size + length
+            if len(self.buffer) < end:
+                break
+
+            payload = bytes(self.buffer[position + FRAME_HEADER.size:end])
+            if zlib.crc32(payload) != crc:
+                position += 1
+                continue
+
+            position = end
+            # events of unknown type, from a newer version, are skipped
+            with contextlib.suppress(ValueError):
+                frames.append((session, sequence, EventType(event_type), payload))
+
+        del self.buffer[:position]
+        self.offset += position
+        return frames
+
+
+class EventReader:
+    """
+    Decodes events from a stream. Events are deduplicated by their sequence number, so a writer can resend
+    events after a reconnect. Sequence numbers are counted per session: every writer has its own session id,
+    so a new writer on the same stream, like a client that reattaches to a detached trainer, starts again at 1.
+    offset can be used to resume reading a persistent stream, like a file.
+    """
+
+    def __init__(self):
+        self.decoder = FrameDecoder()
+        self.last_sequences = {}
+        self.ended = False
+
+    @property
+    def offset(self) -> int:
+        return self.decoder.offset
+
+    def reconnect(self, offset: int | None = None):
+        """
+        Discards incomplete data of the previous connection. The next connection starts at offset,
+        or at the end of the last complete event if offset is None.
+        """
+        self.decoder = FrameDecoder(self.offset if offset is None else offset)
+
+    def feed(self, data: bytes) -> list[tuple[EventType, bytes]]:
+        events = []
+        for session, sequence, event_type, payload in self.decoder.feed(data):
+            if sequence <= self.last_sequences.get(session, 0):
+                continue
+            self.last_sequences[session] = sequence
+            if event_type == EventType.END:
+                self.ended = True
+            events.append((event_type, payload))
+        return events
+
+
+class EventWriter:
+    """
+    Writes events to a stream from a background thread, so the caller is never slowed down by the transport.
+
+    The queue is bounded: progress events replace older pending events of the same type, all other events
+    block the caller while the queue is full. If writing fails, the stream is reopened with connect(), and
+    the last resend_size events are written again. The reader drops the ones it has already received.
+    """
+
+    def __init__(
+            self,
+            connect: Callable[[], BinaryIO],
+            queue_size: int = 64,
+            resend_size: int = 0,
+            max_retries: int = 3,
+            retry_interval: float = 2.0,
+    ):
+        self.connect = connect
+        self.queue_size = queue_size
+        self.max_retries = max_retries
+        self.retry_interval = retry_interval
+
+        self.stream = None
+        self.session = secrets.randbits(32)
+        self.sequence = 0
+        self.pending = deque()
+        self.sent = deque(maxlen=resend_size)
+        self.condition = threading.Condition()
+        self.writing = False
+        self.closed = False
+
+        self.thread = threading.Thread(target=self.__run, daemon=True)
+        self.thread.start()
+
+    def send(self, event_type: EventType, payload: bytes = b''):
+        with self.condition:
+            if self.closed:
+                return
+
+            if event_type in COALESCED_EVENTS:
+                for i, (pending_type, _) in enumerate(self.pending):
+                    if pending_type == event_type:
+                        self.pending[i] = (event_type, payload)
+                        return
+
+            self.condition.wait_for(lambda: len(self.pending) < self.queue_size or self.closed)
+            if self.closed:
+                return
+            self.pending.append((event_type, payload))
+            self.condition.notify_all()
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """
+        Waits until all pending events are written. Returns False on timeout.
+        """
+        with self.condition:
+            return self.condition.wait_for(lambda: not self.pending and not self.writing, timeout)
+
+    def close(self, timeout: float | None = None):
+        self.flush(timeout)
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        self.thread.join(timeout)
+        self.__close_stream()
+
+    def __close_stream(self):
+        if self.stream is not None:
+            with contextlib.suppress(Exception):
+                self.stream.close()
+            self.stream = None
+
+    def __write(self, frame: bytes):
+        if self.stream is None:
+            self.stream = self.connect()
+            for sent_frame in self.sent:
+                self.stream.write(sent_frame)
+        self.stream.write(frame)
+        self.stream.flush()
+
+    def __run(self):
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.pending or self.closed)
+                if not self.pending:
+                    return
+                event_type, payload = self.pending.popleft()
+                self.writing = True
+                self.condition.notify_all()
+
+            self.sequence += 1
+            frame = encode_frame(self.session, self.sequence, event_type, payload)
+            for retry in range(self.max_retries + 1):
+                try:
+                    self.__write(frame)
+                    break
+                except Exception:  # noqa: PERF203
+                    self.__close_stream()
+                    if retry == self.max_retries:
+                        traceback.print_exc()
+                        print(f"dropping event {event_type.name}")
+                    else:
+                        time.sleep(self.retry_interval)
+            self.sent.append(frame)
+
+            with self.condition:
+                self.writing = False
+                self.condition.notify_all()
+
+    def train_callbacks(self) -> TrainCallbacks:
+        return TrainCallbacks(
+            on_update_train_progress=lambda train_progress, max_sample, max_epoch: self.send(
+                EventType.TRAIN_PROGRESS, encode_train_progress(train_progress, max_sample, max_epoch)),
+            on_update_status=lambda status: self.send(EventType.STATUS, status.encode('utf-8')),
+            on_sample_default=lambda sampler_output: self.send(EventType.SAMPLE_DEFAULT, pickle.dumps(sampler_output)),
+            on_update_sample_default_progress=lambda step, max_step: self.send(
+                EventType.SAMPLE_DEFAULT_PROGRESS, SAMPLE_PROGRESS.pack(step, max_step)),
+            on_sample_custom=lambda sampler_output: self.send(EventType.SAMPLE_CUSTOM, pickle.dumps(sampler_output)),
+            on_update_sample_custom_progress=lambda step, max_step: self.send(
+                EventType.SAMPLE_CUSTOM_PROGRESS, SAMPLE_PROGRESS.pack(step, max_step)),
+        )
+
+    def send_commands(self, commands: TrainCommands, send_stop: bool = True):
+        if send_stop and commands.get_stop_command():
+            self.send(EventType.COMMAND_STOP)
+        for sample_config in commands.get_and_reset_sample_custom_commands():
+            # only the fields that differ from the defaults are sent
+            sample_diff = sample_config.diff(SampleConfig.default_values())
+            self.send(EventType.COMMAND_SAMPLE_CUSTOM, json.dumps(sample_diff).encode('utf-8'))
+        if commands.get_and_reset_sample_default_command():
+            self.send(EventType.COMMAND_SAMPLE_DEFAULT)
+        if commands.get_and_reset_backup_command():
+            self.send(EventType.COMMAND_BACKUP)
+        if commands.get_and_reset_save_command():
+            self.send(EventType.COMMAND_SAVE)
+
+
+def encode_train_progress(train_progress: TrainProgress, max_sample: int, max_epoch: int) -> bytes:
+    return TRAIN_PROGRESS.pack(
+        train_progress.epoch,
+        train_progress.epoch_step,
+        train_progress.epoch_sample,
+        train_progress.global_step,
+        max_sample,
+        max_epoch,
+    )
+
+
+def apply_callback_event(callbacks: TrainCallbacks, event_type: EventType, payload: bytes):
+    match event_type:
+        case EventType.TRAIN_PROGRESS:
+            epoch, epoch_step, epoch_sample, global_step, max_sample, max_epoch = TRAIN_PROGRESS.unpack(payload)
+            callbacks.on_update_train_progress(
+                TrainProgress(epoch, epoch_step, epoch_sample, global_step), max_sample, max_epoch)
+        case EventType.STATUS:
+            callbacks.on_update_status(payload.decode('utf-8'))
+        case EventType.SAMPLE_DEFAULT:
+            # ModelSamplerOutput is pickled as a JPEG byte stream
+            callbacks.on_sample_default(pickle.loads(payload))
+        case EventType.SAMPLE_DEFAULT_PROGRESS:
+            callbacks.on_update_sample_default_progress(*SAMPLE_PROGRESS.unpack(payload))
+        case EventType.SAMPLE_CUSTOM:
+            callbacks.on_sample_custom(pickle.loads(payload))
+        case EventType.SAMPLE_CUSTOM_PROGRESS:
+            callbacks.on_update_sample_custom_progress(*SAMPLE_PROGRESS.unpack(payload))
+
+
+def apply_command_event(commands: TrainCommands, event_type: EventType, payload: bytes):
+    match event_type:
+        case EventType.COMMAND_STOP:
+            commands.stop()
+        case EventType.COMMAND_SAMPLE_DEFAULT:
+            commands.sample_default()
+        case EventType.COMMAND_SAMPLE_CUSTOM:
+            commands.sample_custom(SampleConfig.default_values().apply_diff(json.loads(payload.decode('utf-8'))))
+        case EventType.COMMAND_BACKUP:
+            commands.backup()
+        case EventType.COMMAND_SAVE:
+            commands.save()
+
+
+def socket_receiver(sock, timeout: float = 1.0) -> Callable[[], bytes | None]:
+    """
+    Receives from a socket or an SSH channel. Returns None if nothing was received within timeout,
+    and b'' at the end of the stream.
+    """
+    sock.settimeout(timeout)
+
+    def receive() -> bytes | None:
+        try:
+            return sock.recv(65536)
+        except TimeoutError:
+            return None
+
+    return receive
+
+
+def fd_receiver(fd: int, timeout: float = 1.0) -> Callable[[], bytes | None]:
+    """
+    Receives from a file descriptor of a pipe. Returns None if nothing was received within timeout,
+    and b'' at the end of the stream.
+    """
+
+    def receive() -> bytes | None:
+        readable, _, _ = select.select([fd], [], [], timeout)
+        if not readable:
+            return None
+        return os.read(fd, 65536)
+
+    return receive
+
+
+def read_events(
+        receive: Callable[[], bytes | None],
+        reader: EventReader,
+        handle: Callable[[EventType, bytes], None],
+        stop_event: threading.Event | None = None,
+) -> bool:
+    """
+    Passes all events to handle, until the stream ends, an END event is received, or stop_event is set
+    and no more data arrives. Returns True if an END event was received.
+    """
+    while True:
+        data = receive()
+        if data is None:
+            if stop_event is not None and stop_event.is_set():
+                return False
+            continue
+        if not data:
+            return False
+
+        for event_type, payload in reader.feed(data):
+            try:
+                handle(event_type, payload)
+            except Exception:  # noqa: PERF203
+                traceback.print_exc()
+
+        if reader.ended:
+            return True
+
+
+class LocalEventChannel:
+    """
+    Connects an EventWriter to an EventReader in the same process through a socket pair.
+    Used to test the event stream without a remote machine.
+    """
+
+    def __init__(self, queue_size: int = 64, resend_size: int = 0):
+        self.write_socket, self.read_socket = socket.socketpair()
+        self.writer = EventWriter(lambda: self.write_socket.makefile('wb'), queue_size, resend_size)
+        self.reader = EventReader()
+        self.receive = socket_receiver(self.read_socket)
+
+    def read_events(self, handle: Callable[[EventType, bytes], None], stop_event: threading.Event | None = None) -> bool:
+        return read_events(self.receive, self.reader, handle, stop_event)
+
+    def close(self):
+        self.writer.close(timeout=5)
+        self.write_socket.close()
+        self.read_socket.close()
@@ -1,3 +1,4 @@
+import threading
 from pathlib import Path
 
 from modules.cloud.BaseSSHFileSync import BaseSSHFileSync
@@ -9,42 +10,62 @@ import fabric
 class FabricFileSync(BaseSSHFileSync):
     def __init__(self, config: CloudConfig, secrets: CloudSecretsConfig):
         super().__init__(config,secrets)
+        #every worker thread keeps its own connection for all of its transfers. The workers live as long as this
+        #object, so there are at most one connection per worker and one for the calling thread
+        self.thread_local=threading.local()
+        self.connections=[]
+        self.connections_lock=threading.Lock()
 
-    def __upload_batch(self,local_files,remote_dir : Path):
-        with fabric.Connection(host=self.secrets.host,port=self.secrets.port,user=self.secrets.user) as connection:
-            for local_file in local_files:
-                self.__put(connection,local_file=local_file,remote_file=remote_dir / local_file.name)
+    def __connection(self):
+        connection=getattr(self.thread_local,'connection',None)
+        if connection is None:
+            connection=fabric.Connection(host=self.secrets.host,port=self.secrets.port,user=self.secrets.user,
+                                         connect_kwargs=self._connect_kwargs())
+            self.thread_local.connection=connection
+            with self.connections_lock:
+                self.connections.append(connection)
+        return connection
 
-    def upload_files(self,local_files,remote_dir : Path):
-        if len(local_files) == 1:
-            self.__put(self.sync_connection,local_file=local_files[0],remote_file=remote_dir/local_files[0].name)
-        else:
-            self._run_batches(
-                lambda local_files:self.__upload_batch(local_files=local_files,remote_dir=remote_dir),
-                tasks=local_files,
-                workers=4,
-                max_batch_size=100)
+    def close(self):
+        #stops the worker threads first, no transfer can use a connection after it is closed
+        super().close()
+        with self.connections_lock:
+            for connection in self.connections:
+                connection.close()
+            self.connections.clear()
 
-    def __download_batch(self,local_dir : Path,remote_files):
-        with fabric.Connection(host=self.secrets.host,port=self.secrets.port,user=self.secrets.user) as connection:
-            for remote_file in remote_files:
-                self.__get(connection,local_file=local_dir / remote_file.name,remote_file=remote_file)
+    def _upload_batch(self,files: list[tuple[Path,Path]]):
+        connection=self.__connection()
+        for local_file,remote_file in files:
+            self.__put(connection,local_file=local_file,remote_file=remote_file)
 
-    def download_files(self,local_dir : Path,remote_files):
-        if len(remote_files) == 1:
-            self.__get(self.sync_connection,local_file=local_dir/remote_files[0].name,remote_file=remote_files[0])
-        else:
-            self._run_batches(
-                lambda remote_files:self.__download_batch(local_dir=local_dir,remote_files=remote_files),
-                tasks=remote_files,
-                workers=4,
-                max_batch_size=100)
+    def _download_batch(self,files: list[tuple[Path,Path]]):
+        connection=self.__connection()
+        for local_file,remote_file in files:
+            self.__get(connection,local_file=local_file,remote_file=remote_file)
 
-    def upload_file(self,local_file: Path,remote_file: Path):
-        self.__put(self.sync_connection,local_file,remote_file)
+    def _upload_chunks(self,local: Path,remote: Path,chunks: list[int],size: int) -> bool:
+        print(f"Uploading {len(chunks)} changed chunks of {str(local)}...")
+        connection=self.__connection()
+        try:
+            with local.open('rb') as source,connection.sftp().open(remote.as_posix(),'r+b') as target:
+                target.set_pipelined(True)
+                self._copy_chunks(source,target,chunks,size)
+        except OSError:
+            connection.close()
+            raise
+        return True
 
-    def download_file(self,local_file: Path,remote_file: Path):
-        self.__get(self.sync_connection,local_file,remote_file)
+    def _download_chunks(self,local: Path,remote: Path,chunks: list[int],size: int) -> bool:
+        print(f"\nDownloading {len(chunks)} changed chunks of {str(local)}...")
+        connection=self.__connection()
+        try:
+            with connection.sftp().open(remote.as_posix(),'rb') as source,local.open('r+b') as target:
+                self._copy_chunks(source,target,chunks,size)
+        except OSError:
+            connection.close()
+            raise
+        return True
 
     @staticmethod
     def __put(connection,local_file: Path,remote_file: Path):
@@ -1,10 +1,9 @@
-import pickle
 import shlex
 import threading
-import time
 from pathlib import Path
 
 from modules.cloud.BaseCloud import BaseCloud
+from modules.cloud.EventStream import EventReader, EventWriter, apply_callback_event, read_events, socket_receiver
 from modules.cloud.FabricFileSync import FabricFileSync
 from modules.cloud.NativeSCPFileSync import NativeSCPFileSync
 from modules.util.callbacks.TrainCallbacks import TrainCallbacks
@@ -24,11 +23,15 @@ class LinuxCloud(BaseCloud):
         self.callback_connection=None
         self.command_connection=None
         self.tensorboard_tunnel_stop=None
+        self.event_reader=EventReader()
+        self.command_writer=None
+        self.stop_sent=False
 
         name=config.cloud.run_id if config.cloud.detach_trainer else get_string_timestamp()
         self.callback_file=f'{config.cloud.remote_dir}/{name}.callback'
         self.command_pipe=f'{config.cloud.remote_dir}/{name}.command'
         self.config_file=f'{config.cloud.remote_dir}/{name}.json'
+        self.upload_manifest_file=f'{config.cloud.remote_dir}/{name}.upload'
         self.exit_status_file=f'{config.cloud.remote_dir}/{name}.exit'
         self.log_file=f'{config.cloud.remote_dir}/{name}.log'
         self.pid_file=f'{config.cloud.remote_dir}/{name}.pid'
@@ -116,6 +119,9 @@ class LinuxCloud(BaseCloud):
             self.tensorboard_tunnel_stop.set()
         if self.callback_connection:
             self.callback_connection.close()
+        if self.command_writer:
+            self.command_writer.close(timeout=5)
+            self.command_writer=None
         if self.command_connection:
             self.command_connection.close()
         if self.file_sync:
@@ -151,13 +157,15 @@ class LinuxCloud(BaseCloud):
         cmd+=f' && {config.onetrainer_dir}/run-cmd.sh train_remote --config-path={shlex.quote(self.config_file)} \
                                                                    --callback-path={shlex.quote(self.callback_file)} \
                                                                    --command-path={shlex.quote(self.command_pipe)}'
+        if config.stream_concept_upload:
+            cmd+=f' --upload-manifest-path={shlex.quote(self.upload_manifest_file)}'
 
         if config.detach_trainer:
             self.connection.run(f'rm -f {self.exit_status_file}',in_stream=False)
 
             cmd=f"({cmd} ; exit_status=$? ; echo $exit_status > {self.exit_status_file}; exit $exit_status)"
 
-            #if the callback file still exists 10 seconds after the trainer has exited, the client must be detached, because the clients reads and deletes this file:
+            #if the callback file still exists 10 seconds after the trainer has exited, the client must be detached, because the client deletes this file after it has read all events:
             cmd+=f" && (sleep 10 && test -f {shlex.quote(self.callback_file)} && {self._get_action_cmd(config.on_detached_finish)} || true) \
                     || (sleep 10 && test -f {shlex.quote(self.callback_file)} && {self._get_action_cmd(config.on_detached_error)})"
 
@@ -178,74 +186,56 @@ class LinuxCloud(BaseCloud):
 
 
 
-    def exec_callback(self,callbacks : TrainCallbacks):
-        #callbacks are a file instead of a named pipe, because of the blocking behaviour of linux pipes:
+    def exec_callback(self,callbacks : TrainCallbacks,stop_event : threading.Event) -> bool:
+        #callbacks are an event file instead of a named pipe, because of the blocking behaviour of linux pipes:
         #writing to pipes on the cloud can slow down training, and would cause issues in case
         #of a detached cloud trainer.
         #
-        #use 'rename' as the atomic operation, to avoid race conditions between reader and writer:
-
-        file=f'{shlex.quote(self.callback_file)}'
-        cmd=f'mv "{file}" "{file}.read" \
-           && cat "{file}.read" \
-           && rm "{file}.read"'
+        #the file is streamed through a single channel by 'tail -F', which follows the file as the trainer appends to it.
+        #After a reconnect, the stream resumes at the end of the last complete event:
+        self.event_reader.reconnect()
+        file=shlex.quote(self.callback_file)
+        cmd=f'tail -c +{self.event_reader.offset+1} -F {file} 2>/dev/null'
 
         self.callback_connection.open()
-        in_file,out_file,err_file=self.callback_connection.client.exec_command(cmd)
-
+        channel=self.callback_connection.client.get_transport().open_session()
         try:
-            while True:
-                try:
-                    while not out_file.channel.recv_ready() and not out_file.channel.exit_status_ready():
-                        #even though reading from out_file is blocking, it doesn't block if there
-                        #is *no* data available yet, which results in an unpickling error.
-                        #wait until there is at least some data before reading:
-                        time.sleep(0.1)
-                    name=pickle.load(out_file)
-                except EOFError:
-                    return
-                params=pickle.load(out_file)
-
-                fun=getattr(callbacks,name)
-                fun(*params)
+            channel.exec_command(cmd)
+            ended=read_events(socket_receiver(channel),self.event_reader,
+                              lambda event_type,payload:apply_callback_event(callbacks,event_type,payload),stop_event)
         finally:
-            in_file.close()
-            out_file.close()
-            err_file.close()
+            channel.close()
 
+        if ended:
+            #the trainer has finished. Deleting the event file tells a detached trainer that the client has received all events:
+            self.callback_connection.run(f'rm -f {file}',warn=True,in_stream=False)
+        return ended
+
+    def __open_command_stream(self):
+        self.command_connection.open()
+        channel=self.command_connection.client.get_transport().open_session()
+        channel.exec_command(f'test -p {shlex.quote(self.command_pipe)} && cat > {shlex.quote(self.command_pipe)}')
+        return channel.makefile('wb')
 
     def send_commands(self,commands : TrainCommands):
-        try:
-            self.command_connection.open()
-            in_file,out_file,err_file=self.command_connection.client.exec_command(
-                f'test -e {shlex.quote(self.command_pipe)} \
-                && cat > {shlex.quote(self.command_pipe)}'
-            )
-            try:
-                pickle.dump(commands,in_file)
-                in_file.flush()
-                in_file.channel.shutdown_write()
-            finally:
-                in_file.close()
-                out_file.close()
-                err_file.close()
-
-            commands.reset()
-        except Exception:
-            if not self.command_connection.is_connected:
-                print("\n\nCommand SSH connection lost. Attempting to reconnect...")
-                self.command_connection.open()
-                self.send_commands(commands)
-            else:
-                raise
+        #all commands are sent through one persistent channel, which is reopened if the connection was lost.
+        #The last commands are sent again after a reconnect; the trainer ignores the ones it has already received:
+        if self.command_writer is None:
+            self.command_writer=EventWriter(self.__open_command_stream,resend_size=16)
+        self.command_writer.send_commands(commands,send_stop=not self.stop_sent)
+        self.stop_sent=commands.get_stop_command()
 
     def _upload_config_file(self,local : Path):
         self.file_sync.sync_up_file(local,Path(self.config_file))
 
+    def _upload_manifest_file(self,local : Path):
+        self.file_sync.sync_up_file(local,Path(self.upload_manifest_file))
+
     def sync_workspace(self):
         self.file_sync.sync_down_dir(local=Path(self.config.local_workspace_dir),
                                   remote=Path(self.config.workspace_dir),
-                                  filter=lambda path:BaseCloud._filter_download(config=self.config.cloud,path=path))
+                                  filter=lambda path:BaseCloud._filter_download(config=self.config.cloud,path=path),
+                                  exclude_dirs=BaseCloud._excluded_download_dirs(self.config))
 
     def delete_workspace(self):
         self.connection.run(f"rm -r {shlex.quote(self.config.workspace_dir)}",in_stream=False)
@@ -0,0 +1,47 @@
+import shutil
+from pathlib import Path
+
+from modules.cloud.ManifestFileSync import ManifestFileSync
+from modules.cloud.SyncManifest import SyncManifest
+from modules.util.config.CloudConfig import CloudConfig, CloudSecretsConfig
+
+REMOTE_MANIFEST_CACHE_DIR = Path("workspace-cache/sync_manifest/remote")
+
+
+class LocalFileSync(ManifestFileSync):
+    """
+    Syncs with "remote" paths on the local file system, for example a mounted network drive.
+    Also used to test the sync logic without an SSH connection.
+    """
+
+    def __init__(self, config: CloudConfig, secrets: CloudSecretsConfig):
+        super().__init__(config, secrets)
+
+    def _remote_manifest(self, remote: Path, exclude_dirs: list[str] | None = None) -> SyncManifest:
+        return SyncManifest.build_cached(remote, REMOTE_MANIFEST_CACHE_DIR, exclude_dirs)
+
+    def _make_remote_dirs(self, remote_dirs: list[Path]):
+        for remote_dir in remote_dirs:
+            remote_dir.mkdir(parents=True, exist_ok=True)
+
+    def _upload_batch(self, files: list[tuple[Path, Path]]):
+        for local_file, remote_file in files:
+            print(f"Uploading {str(local_file)}...")
+            shutil.copyfile(local_file, remote_file)
+
+    def _download_batch(self, files: list[tuple[Path, Path]]):
+        for local_file, remote_file in files:
+            print(f"\nDownloading {str(local_file)}...")
+            shutil.copyfile(remote_file, local_file)
+
+    def _upload_chunks(self, local: Path, remote: Path, chunks: list[int], size: int) -> bool:
+        print(f"Uploading {len(chunks)} changed chunks of {str(local)}...")
+        with local.open('rb') as source, remote.open('r+b') as target:
+            self._copy_chunks(source, target, chunks, size)
+        return True
+
+    def _download_chunks(self, local: Path, remote: Path, chunks: list[int], size: int) -> bool:
+        print(f"\nDownloading {len(chunks)} changed chunks of {str(local)}...")
+        with remote.open('rb') as source, local.open('r+b') as target:
+            self._copy_chunks(source, target, chunks, size)
+        return True
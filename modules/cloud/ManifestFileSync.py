@@ -0,0 +1,185 @@
+import concurrent.futures
+from abc import abstractmethod
+from collections.abc import Callable
+from pathlib import Path
+
+from modules.cloud.BaseFileSync import BaseFileSync
+from modules.cloud.SyncManifest import CHUNK_SIZE, SyncManifest
+from modules.util.config.CloudConfig import CloudConfig, CloudSecretsConfig
+
+LOCAL_MANIFEST_CACHE_DIR = Path("workspace-cache/sync_manifest")
+
+
+class ManifestFileSync(BaseFileSync):
+    """
+    File sync that compares a manifest of both sides, with size, mtime and content hash of every file.
+    Only files with a different content are transferred, and large files only transfer their changed chunks if
+    the transport supports it. All transfers run on a pool of workers, which is kept until the sync is closed, so
+    transports can keep a connection for each worker.
+
+    Subclasses implement the transport: building the remote manifest, creating remote directories and
+    transferring batches of files.
+    """
+
+    def __init__(self, config: CloudConfig, secrets: CloudSecretsConfig, workers: int = 4, max_batch_size: int = 100):
+        super().__init__(config, secrets)
+        self.workers = workers
+        self.max_batch_size = max_batch_size
+        self.__executor = None
+
+    def close(self):
+        if self.__executor is not None:
+            self.__executor.shutdown()
+            self.__executor = None
+
+    @abstractmethod
+    def _remote_manifest(self, remote: Path, exclude_dirs: list[str] | None = None) -> SyncManifest:
+        """builds the manifest of a remote file or directory tree, without directories named in exclude_dirs"""
+
+    @abstractmethod
+    def _make_remote_dirs(self, remote_dirs: list[Path]):
+        pass
+
+    @abstractmethod
+    def _upload_batch(self, files: list[tuple[Path, Path]]):
+        """uploads a list of (local, remote) files. all remote files are in the same directory"""
+
+    @abstractmethod
+    def _download_batch(self, files: list[tuple[Path, Path]]):
+        """downloads a list of (local, remote) files. all local files are in the same directory"""
+
+    def _upload_chunks(self, local: Path, remote: Path, chunks: list[int], size: int) -> bool:
+        """writes the given chunks of a local file into an existing remote file. returns False if not supported"""
+        return False
+
+    def _download_chunks(self, local: Path, remote: Path, chunks: list[int], size: int) -> bool:
+        """writes the given chunks of a remote file into an existing local file. returns False if not supported"""
+        return False
+
+    @staticmethod
+    def _copy_chunks(source, target, chunks: list[int], size: int):
+        for chunk in chunks:
+            source.seek(chunk * CHUNK_SIZE)
+            data = source.read(CHUNK_SIZE)
+            target.seek(chunk * CHUNK_SIZE)
+            target.write(data)
+        target.truncate(size)
+
+    def sync_up_file(self, local: Path, remote: Path):
+        local_manifest = SyncManifest.build(local)
+        local_entry = local_manifest.entry(local)
+        if local_entry is None:
+            return
+
+        remote_entry = self._remote_manifest(remote).entry(remote)
+        self.__transfer(upload=True, transfers=[(local, remote, local_entry, remote_entry)])
+
+    def sync_up_dir(self, local: Path, remote: Path, recursive: bool):
+        local_manifest = SyncManifest.build_cached(local, LOCAL_MANIFEST_CACHE_DIR)
+        remote_manifest = self._remote_manifest(remote)
+
+        transfers = []
+        for relative_path, local_entry in local_manifest.entries.items():
+            if not recursive and '/' in relative_path:
+                continue
+            remote_entry = remote_manifest.entries.get(relative_path)
+            transfers.append((local / relative_path, remote / relative_path, local_entry, remote_entry))
+
+        self._make_remote_dirs([remote])
+        self.__transfer(upload=True, transfers=transfers)
+
+    def sync_down_file(self, local: Path, remote: Path):
+        remote_entry = self._remote_manifest(remote).entry(remote)
+        if remote_entry is None:
+            return
+
+        local_entry = SyncManifest.build(local).entry(local)
+        self.__transfer(upload=False, transfers=[(local, remote, remote_entry, local_entry)])
+
+    def sync_down_dir(
+            self,
+            local: Path,
+            remote: Path,
+            filter: Callable[[Path], bool] | None = None,
+            exclude_dirs: list[str] | None = None,
+    ):
+        remote_manifest = self._remote_manifest(remote, exclude_dirs)
+        local_manifest = SyncManifest.build_cached(local, LOCAL_MANIFEST_CACHE_DIR, exclude_dirs)
+
+        transfers = []
+        for relative_path, remote_entry in remote_manifest.entries.items():
+            remote_path = remote / relative_path
+            if filter is not None and not filter(remote_path):
+                continue
+            local_entry = local_manifest.entries.get(relative_path)
+            transfers.append((local / relative_path, remote_path, remote_entry, local_entry))
+
+        self.__transfer(upload=False, transfers=transfers)
+
+    def __transfer(self, upload: bool, transfers: list[tuple[Path, Path, dict, dict | None]]):
+        """
+        Transfers all files with changed content. Each transfer is (local, remote, source entry, target entry).
+        """
+        whole_files = {}
+        chunk_transfers = []
+        for local, remote, source_entry, target_entry in transfers:
+            if not SyncManifest.needs_transfer(source_entry, target_entry):
+                continue
+
+            chunks = SyncManifest.changed_chunks(source_entry, target_entry)
+            if chunks is not None:
+                chunk_transfers.append((local, remote, chunks, source_entry['size']))
+            else:
+                target_dir = remote.parent if upload else local.parent
+                whole_files.setdefault(target_dir, []).append((local, remote))
+
+        file_count = sum(len(files) for files in whole_files.values()) + len(chunk_transfers)
+        if file_count == 0:
+            return
+        print(f"{'Uploading' if upload else 'Downloading'} {file_count} changed files, "
+              f"{len(transfers) - file_count} files are unchanged")
+
+        target_dirs = {(remote.parent if upload else local.parent) for local, remote, _, _ in chunk_transfers}
+        target_dirs.update(whole_files.keys())
+        if upload:
+            self._make_remote_dirs(sorted(target_dirs))
+        else:
+            for target_dir in target_dirs:
+                target_dir.mkdir(parents=True, exist_ok=True)
+
+        tasks = []
+        for files in whole_files.values():
+            for i in range(0, len(files), self.max_batch_size):
+                batch = files[i:i + self.max_batch_size]
+                tasks.append(lambda batch=batch: self.__transfer_batch(upload, batch))
+        for local, remote, chunks, size in chunk_transfers:
+            tasks.append(lambda local=local, remote=remote, chunks=chunks, size=size:
+                         self.__transfer_chunks(upload, local, remote, chunks, size))
+
+        self.__run_tasks(tasks)
+
+    def __transfer_batch(self, upload: bool, files: list[tuple[Path, Path]]):
+        if upload:
+            self._upload_batch(files)
+        else:
+            self._download_batch(files)
+
+    def __transfer_chunks(self, upload: bool, local: Path, remote: Path, chunks: list[int], size: int):
+        transferred = self._upload_chunks(local, remote, chunks, size) if upload \
+            else self._download_chunks(local, remote, chunks, size)
+        if not transferred:
+            self.__transfer_batch(upload, [(local, remote)])
+
+    def __run_tasks(self, tasks: list[Callable[[], None]]):
+        if len(tasks) == 1:
+            tasks[0]()
+            return
+
+        if self.__executor is None:
+            self.__executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.workers)
+        futures = [self.__executor.submit(task) for task in tasks]
+        concurrent.futures.wait(futures)
+
+        for future in futures:
+            if (exception := future.exception()):
+                raise exception
@@ -8,46 +8,35 @@ from modules.util.config.CloudConfig import CloudConfig, CloudSecretsConfig
 class NativeSCPFileSync(BaseSSHFileSync):
     def __init__(self, config: CloudConfig, secrets: CloudSecretsConfig):
         super().__init__(config, secrets)
+        self.max_batch_size=50
         self.base_args=[
                 "scp",
                 "-P", str(secrets.port),
                 "-o", "StrictHostKeyChecking=no",
             ]
+        if config.sync_compression:
+            self.base_args.append("-C")
 
-    def __upload_batch(self,local_files,remote_dir : Path):
+    def _upload_batch(self,files: list[tuple[Path,Path]]):
         args=self.base_args.copy()
-        args.extend(str(file) for file in local_files)
-        args.append(f"{self.secrets.user}@{self.secrets.host}:{remote_dir.as_posix()}")
+        if len(files) == 1:
+            local_file,remote_file=files[0]
+            args.append(str(local_file))
+            args.append(f"{self.secrets.user}@{self.secrets.host}:{remote_file.as_posix()}")
+        else:
+            #all remote files of a batch are in the same directory
+            args.extend(str(local_file) for local_file,_ in files)
+            args.append(f"{self.secrets.user}@{self.secrets.host}:{files[0][1].parent.as_posix()}")
         subprocess.run(args).check_returncode()
 
-    def upload_files(self,local_files,remote_dir : Path):
-        self._run_batches(
-            lambda local_files:self.__upload_batch(local_files=local_files,remote_dir=remote_dir),
-            tasks=local_files,
-            workers=4,
-            max_batch_size=50)
-
-    def __download_batch(self,local_dir : Path,remote_files):
+    def _download_batch(self,files: list[tuple[Path,Path]]):
         args=self.base_args.copy()
-        args.extend(f"{self.secrets.user}@{self.secrets.host}:{file.as_posix()}" for file in remote_files)
-        args.append(local_dir)
+        if len(files) == 1:
+            local_file,remote_file=files[0]
+            args.append(f"{self.secrets.user}@{self.secrets.host}:{remote_file.as_posix()}")
+            args.append(str(local_file))
+        else:
+            #all local files of a batch are in the same directory
+            args.extend(f"{self.secrets.user}@{self.secrets.host}:{remote_file.as_posix()}" for _,remote_file in files)
+            args.append(str(files[0][0].parent))
         subprocess.run(args).check_returncode()
-
-    def download_files(self,local_dir : Path,remote_files):
-        self._run_batches(
-            lambda remote_files:self.__download_batch(local_dir=local_dir,remote_files=remote_files),
-            tasks=remote_files,
-            workers=4,
-            max_batch_size=50)
-
-    def upload_file(self,local_file: Path,remote_file: Path):
-        subprocess.run(self.base_args + [
-                str(local_file),
-                f"{self.secrets.user}@{self.secrets.host}:{remote_file.as_posix()}",
-            ]).check_returncode()
-
-    def download_file(self,local_file: Path,remote_file: Path):
-        subprocess.run(self.base_args + [
-                f"{self.secrets.user}@{self.secrets.host}:{remote_file.as_posix()}",
-                str(local_file),
-            ]).check_returncode()
@@ -0,0 +1,181 @@
+import contextlib
+import hashlib
+import json
+import os
+import sys
+from pathlib import Path
+
+# This module only uses the standard library. Its source is executed on the remote side with "python3 -c",
+# so it can't import anything from OneTrainer.
+
+MANIFEST_VERSION = 1
+CHUNK_SIZE = 16 * 1024 * 1024
+# files of at least this size also get a hash for each chunk, so only changed chunks need to be transferred
+CHUNKED_FILE_SIZE = 4 * CHUNK_SIZE
+
+
+class SyncManifest:
+    """
+    Describes all files of a directory tree. Entries are keyed by the path relative to the root, and contain
+    size, mtime, a content hash and, for large files, the hashes of all chunks.
+    Entries without a hash only come from remote systems that can't run the manifest script.
+    """
+
+    def __init__(self, root: Path, entries: dict[str, dict] | None = None):
+        self.root = root
+        self.entries = entries if entries is not None else {}
+
+    def path(self, relative_path: str) -> Path:
+        return self.root / relative_path
+
+    def entry(self, path: Path) -> dict | None:
+        try:
+            return self.entries.get(path.relative_to(self.root).as_posix())
+        except ValueError:
+            return None
+
+    @staticmethod
+    def __hash_file(path: Path, size: int) -> tuple[str, list[str] | None]:
+        file_hash = hashlib.blake2b(digest_size=16)
+        chunk_hashes = [] if size >= CHUNKED_FILE_SIZE else None
+        with path.open("rb") as f:
+            while chunk := f.read(CHUNK_SIZE):
+                file_hash.update(chunk)
+                if chunk_hashes is not None:
+                    chunk_hashes.append(hashlib.blake2b(chunk, digest_size=16).hexdigest())
+        return file_hash.hexdigest(), chunk_hashes
+
+    @staticmethod
+    def build(
+            root: Path,
+            previous: 'SyncManifest | None' = None,
+            exclude_dirs: list[str] | None = None,
+    ) -> 'SyncManifest':
+        """
+        Scans a file or directory tree. Hashes of files with the same size and mtime as in previous are reused.
+        Directories with a name in exclude_dirs are not scanned.
+        """
+        manifest = SyncManifest(root)
+        previous_entries = previous.entries if previous is not None else {}
+
+        if root.is_file():
+            paths = [(root.name, root)]
+            manifest.root = root.parent
+        elif root.is_dir():
+            paths = []
+            for dir_path, dir_names, filenames in os.walk(root):
+                if exclude_dirs:
+                    dir_names[:] = [name for name in dir_names if name not in exclude_dirs]
+                for filename in filenames:
+                    path = Path(dir_path) / filename
+                    paths.append((path.relative_to(root).as_posix(), path))
+        else:
+            paths = []
+
+        for relative_path, path in paths:
+            try:
+                stat = path.stat()
+                entry = {
+                    'size': stat.st_size,
+                    'mtime': stat.st_mtime,
+                }
+                previous_entry = previous_entries.get(relative_path)
+                if previous_entry is not None and previous_entry.get('hash') is not None \
+                        and previous_entry['size'] == entry['size'] and previous_entry['mtime'] == entry['mtime']:
+                    entry['hash'] = previous_entry['hash']
+                    entry['chunks'] = previous_entry.get('chunks')
+                else:
+                    entry['hash'], entry['chunks'] = SyncManifest.__hash_file(path, stat.st_size)
+                manifest.entries[relative_path] = entry
+            except OSError:  # noqa: PERF203
+                # the file was deleted or can't be read while scanning
+                pass
+
+        return manifest
+
+    @staticmethod
+    def needs_transfer(source: dict, target: dict | None) -> bool:
+        """
+        Returns True if the target entry doesn't have the content of the source entry.
+        """
+        if target is None or source['size'] != target['size']:
+            return True
+        if source.get('hash') is not None and target.get('hash') is not None:
+            return source['hash'] != target['hash']
+        # without a hash, only a newer source file is transferred
+        return source['mtime'] > target['mtime']
+
+    @staticmethod
+    def changed_chunks(source: dict, target: dict | None) -> list[int] | None:
+        """
+        Returns the indices of all chunks that need to be transferred to update the target entry,
+        or None if the whole file needs to be transferred.
+        """
+        if target is None or source.get('chunks') is None or target.get('chunks') is None:
+            return None
+
+        source_chunks = source['chunks']
+        target_chunks = target['chunks']
+        changed = [
+            i for i, chunk_hash in enumerate(source_chunks)
+            if i >= len(target_chunks) or target_chunks[i] != chunk_hash
+        ]
+
+        # patching only pays off if most of the file is unchanged
+        if len(changed) > len(source_chunks) // 2:
+            return None
+        return changed
+
+    def to_dict(self) -> dict:
+        return {
+            'version': MANIFEST_VERSION,
+            'root': self.root.as_posix(),
+            'entries': self.entries,
+        }
+
+    @staticmethod
+    def from_dict(data: dict) -> 'SyncManifest':
+        if data.get('version') != MANIFEST_VERSION:
+            return SyncManifest(Path(data.get('root', '')))
+        return SyncManifest(Path(data['root']), data['entries'])
+
+    @staticmethod
+    def load(path: Path) -> 'SyncManifest | None':
+        try:
+            with path.open("r") as f:
+                return SyncManifest.from_dict(json.load(f))
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def save(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = path.with_suffix(path.suffix + ".tmp")
+        with temp_path.open("w") as f:
+            json.dump(self.to_dict(), f)
+        os.replace(temp_path, path)
+
+    @staticmethod
+    def cache_path(cache_dir: Path, root: Path) -> Path:
+        key = hashlib.sha256(str(root.absolute()).encode("utf-8")).hexdigest()[:32]
+        return cache_dir / f"{key}.json"
+
+    @staticmethod
+    def build_cached(root: Path, cache_dir: Path, exclude_dirs: list[str] | None = None) -> 'SyncManifest':
+        """
+        Builds a manifest, reusing and updating the hashes cached in cache_dir.
+        """
+        cache_path = SyncManifest.cache_path(cache_dir, root)
+        manifest = SyncManifest.build(root, SyncManifest.load(cache_path), exclude_dirs)
+        with contextlib.suppress(OSError):
+            manifest.save(cache_path)
+        return manifest
+
+
+def main():
+    # usage: python3 SyncManifest.py <root> <cache dir> [excluded directory names...]
+    manifest = SyncManifest.build_cached(Path(sys.argv[1]), Path(sys.argv[2]).expanduser(), sys.argv[3:])
+    json.dump(manifest.to_dict(), sys.stdout)
+
+
+if __name__ == '__main__':
+    main()
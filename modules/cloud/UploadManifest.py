@@ -0,0 +1,71 @@
+import json
+import os
+import time
+from pathlib import Path
+
+from modules.util.callbacks.TrainCallbacks import TrainCallbacks
+from modules.util.commands.TrainCommands import TrainCommands
+
+
+class UploadManifest:
+    """
+    Describes the progress of a concept upload that runs while the remote trainer is already loading the model.
+    The client uploads this file after each concept, and the trainer waits until it is complete before it
+    creates the data loader.
+    """
+
+    def __init__(self, concepts: list[str], uploaded: list[str] | None = None, complete: bool = False,
+                 error: str | None = None):
+        self.concepts = concepts
+        self.uploaded = uploaded if uploaded is not None else []
+        self.complete = complete
+        self.error = error
+
+    def to_dict(self) -> dict:
+        return {
+            'concepts': self.concepts,
+            'uploaded': self.uploaded,
+            'complete': self.complete,
+            'error': self.error,
+        }
+
+    @staticmethod
+    def from_dict(data: dict) -> 'UploadManifest':
+        return UploadManifest(data['concepts'], data['uploaded'], data['complete'], data.get('error'))
+
+    @staticmethod
+    def load(path: Path) -> 'UploadManifest | None':
+        try:
+            with path.open("r") as f:
+                return UploadManifest.from_dict(json.load(f))
+        except (OSError, ValueError, KeyError):
+            # not uploaded yet, or only partially written
+            return None
+
+    def save(self, path: Path):
+        temp_path = path.with_suffix(path.suffix + ".tmp")
+        with temp_path.open("w") as f:
+            json.dump(self.to_dict(), f)
+        os.replace(temp_path, path)
+
+
+def wait_for_upload(path: Path, callbacks: TrainCallbacks, commands: TrainCommands, interval: float = 1.0):
+    """
+    Blocks until the client has uploaded all concepts. Raises an exception if the upload has failed,
+    or if the training was stopped in the meantime.
+    """
+    last_count = -1
+    while True:
+        manifest = UploadManifest.load(path)
+        if manifest is not None:
+            if manifest.error is not None:
+                raise RuntimeError(f"concept upload failed: {manifest.error}")
+            if manifest.complete:
+                return
+            if len(manifest.uploaded) != last_count:
+                last_count = len(manifest.uploaded)
+                callbacks.on_update_status(f"waiting for concept upload ({last_count}/{len(manifest.concepts)})")
+
+        if commands.get_stop_command():
+            raise RuntimeError("training stopped while waiting for the concept upload")
+        time.sleep(interval)
@@ -0,0 +1,174 @@
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import nullcontext
+
+from modules.util.torch_util import torch_gc
+
+from mgds.PipelineModule import PipelineModule
+from mgds.pipelineModuleTypes.RandomAccessPipelineModule import RandomAccessPipelineModule
+
+import torch
+from torch import Tensor
+
+from diffusers import AutoencoderKL
+from diffusers.models.autoencoders.vae import DiagonalGaussianDistribution
+
+
+class BatchedEncodeVAE(
+    PipelineModule,
+    RandomAccessPipelineModule,
+):
+    """
+    Replacement for EncodeVAE in the latent caching pass. When a sample is requested, upcoming samples of the same
+    resolution bucket are encoded together with it in a single VAE batch, and handed out when they are requested.
+
+    The images of a batch are loaded and augmented on worker threads. Only one batch is encoded at a time, other
+    data loader threads keep loading the next batch in the meantime. If a batch doesn't fit into memory, the batch
+    size for that resolution is halved. The output is the same per sample latent distribution EncodeVAE returns.
+    """
+
+    # number of batches ahead of the requested sample that are searched for samples of the same bucket
+    LOOKAHEAD_BATCHES = 8
+
+    def __init__(
+            self,
+            in_name: str,
+            out_name: str,
+            resolution_in_name: str,
+            vae: AutoencoderKL,
+            autocast_contexts: list[torch.autocast | None] = None,
+            dtype: torch.dtype | None = None,
+            batch_size: int = 8,
+            num_workers: int = 2,
+    ):
+        super().__init__()
+        self.in_name = in_name
+        self.out_name = out_name
+        self.resolution_in_name = resolution_in_name
+        self.vae = vae
+
+        self.autocast_contexts = [nullcontext()] if autocast_contexts is None else autocast_contexts
+        self.dtype = dtype
+        self.batch_size = max(1, batch_size)
+        self.num_workers = max(1, num_workers)
+
+        self.__lock = threading.Lock()
+        self.__encode_lock = threading.Lock()
+        self.__variation = None
+        self.__pending: dict[int, Future] = {}
+        self.__done: set[int] = set()
+
+        # reduced batch sizes of image shapes that ran out of memory
+        self.__max_batch_sizes: dict[tuple[int, ...], int] = {}
+
+    def length(self) -> int:
+        return self._get_previous_length(self.in_name)
+
+    def get_inputs(self) -> list[str]:
+        return [self.in_name, self.resolution_in_name]
+
+    def get_outputs(self) -> list[str]:
+        return [self.out_name]
+
+    def __reset(self, variation: int):
+        self.__variation = variation
+        self.__pending.clear()
+        self.__done.clear()
+
+    def start(self, variation: int):
+        with self.__lock:
+            self.__reset(variation)
+
+    def __claim_batch(self, variation: int, index: int) -> dict[int, Future]:
+        # called with the lock held, returns the indices of the new batch together with their futures
+        resolution = self._get_previous_item(variation, self.resolution_in_name, index)
+
+        batch = {index: Future()}
+        end = min(self.length(), index + 1 + self.batch_size * self.LOOKAHEAD_BATCHES)
+        for other in range(index + 1, end):
+            if len(batch) >= self.batch_size:
+                break
+            if other in self.__pending or other in self.__done:
+                continue
+            if self._get_previous_item(variation, self.resolution_in_name, other) == resolution:
+                batch[other] = Future()
+
+        self.__pending.update(batch)
+        return batch
+
+    def __encode(self, images: list[Tensor]) -> list[DiagonalGaussianDistribution]:
+        image_batch = torch.stack(images)
+        if self.dtype:
+            image_batch = image_batch.to(device=self.vae.device, dtype=self.dtype)
+
+        with torch.no_grad(), self._all_contexts(self.autocast_contexts):
+            parameters = self.vae.encode(image_batch).latent_dist.parameters
+
+        # a view would keep the whole batch alive, and torch.save would write its entire storage for each sample
+        return [DiagonalGaussianDistribution(parameters[i:i + 1].clone()) for i in range(len(images))]
+
+    def __encode_shape_group(self, images: list[Tensor]) -> list[DiagonalGaussianDistribution]:
+        shape = tuple(images[0].shape)
+        distributions = []
+
+        with self.__encode_lock:
+            start = 0
+            while start < len(images):
+                batch_size = min(len(images) - start, self.__max_batch_sizes.get(shape, self.batch_size))
+                try:
+                    distributions.extend(self.__encode(images[start:start + batch_size]))
+                    start += batch_size
+                except torch.OutOfMemoryError:
+                    if batch_size == 1:
+                        raise
+                    self.__max_batch_sizes[shape] = batch_size // 2
+                    print(f"Reducing the caching batch size for {list(shape)} to {batch_size // 2}")
+                    torch_gc(force=True)
+
+        return distributions
+
+    def __encode_batch(self, variation: int, batch: dict[int, Future]):
+        indices = list(batch.keys())
+        try:
+            with ThreadPoolExecutor(max_workers=min(self.num_workers, len(indices))) as executor:
+                images = list(executor.map(lambda i: self._get_previous_item(variation, self.in_name, i), indices))
+
+            # the bucket only determines the crop resolution, encode each tensor shape separately
+            shape_groups = {}
+            for index, image in zip(indices, images, strict=True):
+                shape_groups.setdefault(tuple(image.shape), []).append((index, image))
+
+            for group in shape_groups.values():
+                distributions = self.__encode_shape_group([image for _, image in group])
+                for (index, _), distribution in zip(group, distributions, strict=True):
+                    batch[index].set_result(distribution)
+        except Exception as e:
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(e)
+
+    def get_item(self, variation: int, index: int, requested_name: str = None) -> dict:
+        batch = None
+        with self.__lock:
+            if variation != self.__variation:
+                self.__reset(variation)
+
+            future = self.__pending.get(index)
+            if future is None:
+                batch = self.__claim_batch(variation, index)
+                future = batch[index]
+
+        if batch is not None:
+            self.__encode_batch(variation, batch)
+
+        try:
+            distribution = future.result()
+        finally:
+            with self.__lock:
+                if self.__variation == variation and self.__pending.get(index) is future:
+                    del self.__pending[index]
+                    self.__done.add(index)
+
+        return {
+            self.out_name: distribution
+        }
@@ -0,0 +1,143 @@
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from modules.util import concept_archive, path_util
+from modules.util.image_util import read_image_size
+
+from mgds.PipelineModule import PipelineModule
+from mgds.pipelineModuleTypes.RandomAccessPipelineModule import RandomAccessPipelineModule
+
+import av
+import cv2
+from tqdm import tqdm
+
+
+def _read_resolution(path: str) -> tuple[int, int]:
+    if not path_util.is_supported_video_extension(os.path.splitext(path)[1]):
+        width, height = read_image_size(concept_archive.file_source(path))
+    elif concept_archive.is_member(path):
+        # cv2 can only open files, archive members are read with av
+        with av.open(concept_archive.file_source(path)) as container:
+            stream = container.streams.video[0]
+            width, height = stream.codec_context.width, stream.codec_context.height
+    else:
+        video = cv2.VideoCapture(path)
+        try:
+            width = int(video.get(cv2.CAP_PROP_FRAME_WIDTH))
+            height = int(video.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        finally:
+            video.release()
+
+    if width <= 0 or height <= 0:
+        raise ValueError(f"invalid header resolution {width}x{height}")
+
+    return height, width
+
+
+class CalcAspectFromHeader(
+    PipelineModule,
+    RandomAccessPipelineModule,
+):
+    """
+    Replacement for CalcAspect that reads the resolution from the file header instead of the decoded image or video,
+    so aspect bucketing and batch sorting don't need to decode any pixels.
+
+    All resolutions are read in a parallel pre-pass at the start of each epoch. They are stored in an index file
+    together with the file size and modification time, so each file is only read once.
+    The decoded image is used instead if the header can't be read, or if the sample is cropped before bucketing.
+    """
+
+    def __init__(
+            self,
+            path_in_name: str,
+            image_in_name: str,
+            resolution_out_name: str,
+            index_path: str,
+            decode_enabled_in_name: str | None = None,
+    ):
+        super().__init__()
+        self.path_in_name = path_in_name
+        self.image_in_name = image_in_name
+        self.resolution_out_name = resolution_out_name
+        self.index_path = index_path
+        self.decode_enabled_in_name = decode_enabled_in_name
+
+        self.__index = None
+        self.__index_changed = False
+        self.__index_lock = threading.Lock()
+
+    def length(self) -> int:
+        return self._get_previous_length(self.path_in_name)
+
+    def get_inputs(self) -> list[str]:
+        inputs = [self.path_in_name, self.image_in_name]
+        if self.decode_enabled_in_name:
+            inputs.append(self.decode_enabled_in_name)
+        return inputs
+
+    def get_outputs(self) -> list[str]:
+        return [self.resolution_out_name]
+
+    def __load_index(self):
+        self.__index = {}
+        try:
+            with open(self.index_path, "r") as f:
+                self.__index = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+    def __save_index(self):
+        os.makedirs(os.path.dirname(self.index_path) or ".", exist_ok=True)
+        path_util.write_json_atomic(self.index_path, self.__index)
+
+    def __header_resolution(self, path: str) -> tuple[int, int] | None:
+        try:
+            size, mtime = concept_archive.file_stat(path)
+        except OSError:
+            return None
+
+        entry = self.__index.get(path)
+        if entry is not None and entry[0] == size and entry[1] == mtime:
+            return entry[2], entry[3]
+
+        try:
+            height, width = _read_resolution(path)
+        except Exception:
+            return None
+
+        with self.__index_lock:
+            self.__index[path] = [size, mtime, height, width]
+            self.__index_changed = True
+
+        return height, width
+
+    def start(self, variation: int):
+        if self.__index is None:
+            self.__load_index()
+
+        paths = {self._get_previous_item(variation, self.path_in_name, index) for index in range(self.length())}
+
+        with ThreadPoolExecutor(max_workers=min(32, (os.cpu_count() or 1) * 4)) as executor:
+            for _ in tqdm(executor.map(self.__header_resolution, paths), total=len(paths), desc='reading resolutions'):
+                pass
+
+        if self.__index_changed:
+            self.__save_index()
+            self.__index_changed = False
+
+    def get_item(self, variation: int, index: int, requested_name: str = None) -> dict:
+        resolution = None
+
+        if not self.decode_enabled_in_name or not self._get_previous_item(variation, self.decode_enabled_in_name, index):
+            path = self._get_previous_item(variation, self.path_in_name, index)
+            resolution = self.__header_resolution(path)
+
+        if resolution is None:
+            image = self._get_previous_item(variation, self.image_in_name, index)
+            resolution = image.shape[-2], image.shape[-1]
+
+        return {
+            self.resolution_out_name: resolution
+        }
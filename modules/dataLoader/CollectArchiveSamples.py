@@ -0,0 +1,92 @@
+import os
+
+from modules.util import concept_archive
+
+from mgds.PipelineModule import PipelineModule
+from mgds.pipelineModuleTypes.RandomAccessPipelineModule import RandomAccessPipelineModule
+
+
+class CollectArchiveSamples(
+    PipelineModule,
+    RandomAccessPipelineModule,
+):
+    """
+    Appends the samples of concept archives to the paths collected from concept directories. Archives are read
+    straight from their tar shards through the archive index, nothing is extracted.
+
+    Each sample gets its member path, the path it would have if the archive directory was the concept directory,
+    so sidecar paths and file names are derived as usual. The shard order is shuffled in each epoch, samples keep
+    their order within a shard, so loading the samples in order reads each shard sequentially.
+    """
+
+    def __init__(
+            self,
+            path_in_name: str,
+            concept_in_name: str,
+            path_out_name: str,
+            concept_out_name: str,
+            extensions: set[str],
+            exclude_postfix: list[str],
+    ):
+        super().__init__()
+        self.path_in_name = path_in_name
+        self.concept_in_name = concept_in_name
+        self.path_out_name = path_out_name
+        self.concept_out_name = concept_out_name
+        self.extensions = {extension.lower() for extension in extensions}
+        self.exclude_postfix = exclude_postfix
+
+        # per shard: (concept, member paths in shard order)
+        self.__shards = []
+        self.__samples = []
+
+    def set_concepts(self, concepts: list[dict]):
+        """
+        Registers the enabled archive concepts. Called before the data set is created.
+        """
+        self.__shards = []
+        for concept in concepts:
+            if not concept['enabled'] or not concept_archive.is_concept_archive(concept['path']):
+                continue
+
+            archive_path = os.path.abspath(concept['path'])
+            for shard in concept_archive.register_archive(archive_path):
+                paths = [
+                    concept_archive.member_path(archive_path, name)
+                    for name, _ in sorted(shard["members"].items(), key=lambda member: member[1][0])
+                    if self.__is_sample(name)
+                ]
+                if paths:
+                    self.__shards.append((concept, paths))
+
+    def __is_sample(self, member_name: str) -> bool:
+        name, extension = os.path.splitext(member_name)
+        return extension.lower() in self.extensions and not any(name.endswith(postfix) for postfix in self.exclude_postfix)
+
+    def length(self) -> int:
+        return self._get_previous_length(self.path_in_name) + sum(len(paths) for _, paths in self.__shards)
+
+    def get_inputs(self) -> list[str]:
+        return [self.path_in_name, self.concept_in_name]
+
+    def get_outputs(self) -> list[str]:
+        return [self.path_out_name, self.concept_out_name]
+
+    def start(self, variation: int):
+        shards = list(self.__shards)
+        self._get_rand(variation).shuffle(shards)
+        self.__samples = [(concept, path) for concept, paths in shards for path in paths]
+
+    def get_item(self, variation: int, index: int, requested_name: str = None) -> dict:
+        previous_length = self._get_previous_length(self.path_in_name)
+        if index < previous_length:
+            return {
+                self.path_out_name: self._get_previous_item(variation, self.path_in_name, index),
+                self.concept_out_name: self._get_previous_item(variation, self.concept_in_name, index),
+            }
+
+        concept, path = self.__samples[index - previous_length]
+        return {
+            self.path_out_name: path,
+            self.concept_out_name: concept,
+        }
@@ -0,0 +1,45 @@
+from modules.util import distributed_util
+
+from mgds.MGDS import MGDS
+
+from torch.utils.data import Dataset
+
+
+class DistributedDataSet(Dataset):
+    """
+    Shards an MGDS data set across processes. Every process builds the same epoch order, but only reads every
+    world_size-th batch of it. Batches are never split, so all samples of a batch still come from the same
+    aspect ratio bucket.
+    """
+
+    def __init__(
+            self,
+            ds: MGDS,
+            batch_size: int,
+    ):
+        super().__init__()
+
+        self.ds = ds
+        self.batch_size = batch_size
+        self.rank = distributed_util.rank()
+        self.world_size = distributed_util.world_size()
+
+    def __local_batch_count(self, global_batch_count: int) -> int:
+        # drop the last incomplete round of batches, so every process runs the same number of steps
+        return global_batch_count // self.world_size
+
+    def __len__(self) -> int:
+        return self.__local_batch_count(len(self.ds) // self.batch_size) * self.batch_size
+
+    def __getitem__(self, index: int) -> dict:
+        local_batch = index // self.batch_size
+        global_batch = local_batch * self.world_size + self.rank
+        return self.ds[global_batch * self.batch_size + index % self.batch_size]
+
+    def approximate_length(self) -> int:
+        return self.__local_batch_count(self.ds.approximate_length())
+
+    def start_next_epoch(self):
+        # only the main process writes the cache. All other processes read it after it is done
+        with distributed_util.main_process_first():
+            self.ds.start_next_epoch()
@@ -0,0 +1,124 @@
+import hashlib
+import math
+import os
+import re
+import threading
+
+from modules.util import concept_archive, path_util
+
+from mgds.PipelineModule import PipelineModule
+from mgds.pipelineModuleTypes.RandomAccessPipelineModule import RandomAccessPipelineModule
+
+from PIL import Image, ImageOps
+
+
+class DownscaledSourceCache(
+    PipelineModule,
+    RandomAccessPipelineModule,
+):
+    """
+    Replaces the path of a large source image with the path of a downscaled copy, so the full resolution file
+    doesn't need to be decoded in every epoch if latents are not cached.
+
+    Aspect ratio buckets never need a short side larger than the target resolution. The copy keeps a short side of
+    the largest target resolution plus a margin for the aspect ratio quantization, so cropping and augmentations
+    still run on the same pixels. Copies are named by a hash of the source path, size and mtime, changed source files
+    get a new copy. PNG sources, like masks, are stored as PNG, all other images as high quality JPEG.
+    """
+
+    # additional short side margin, buckets can be slightly wider or taller than the image
+    RESOLUTION_MARGIN = 1.25
+
+    def __init__(
+            self,
+            path_in_name: str,
+            path_out_name: str,
+            cache_dir: str,
+            target_resolution_in_name: str,
+            enable_target_resolutions_override_in_name: str,
+            target_resolutions_override_in_name: str,
+    ):
+        super().__init__()
+        self.path_in_name = path_in_name
+        self.path_out_name = path_out_name
+        self.cache_dir = cache_dir
+        self.target_resolution_in_name = target_resolution_in_name
+        self.enable_target_resolutions_override_in_name = enable_target_resolutions_override_in_name
+        self.target_resolutions_override_in_name = target_resolutions_override_in_name
+
+    def length(self) -> int:
+        return self._get_previous_length(self.path_in_name)
+
+    def get_inputs(self) -> list[str]:
+        return [
+            self.path_in_name,
+            self.target_resolution_in_name,
+            self.enable_target_resolutions_override_in_name,
+            self.target_resolutions_override_in_name,
+        ]
+
+    def get_outputs(self) -> list[str]:
+        return [self.path_out_name]
+
+    def __max_short_side(self, variation: int, index: int) -> int:
+        target_resolution = self._get_previous_item(variation, self.target_resolution_in_name, index)
+        if self._get_previous_item(variation, self.enable_target_resolutions_override_in_name, index):
+            target_resolution = self._get_previous_item(variation, self.target_resolutions_override_in_name, index)
+
+        resolutions = [int(x.strip()) for x in re.split(r'\D', str(target_resolution)) if x.strip() != '']
+        return math.ceil(max(resolutions) * self.RESOLUTION_MARGIN)
+
+    def __cache_path(self, path: str, max_short_side: int) -> str:
+        size, mtime = concept_archive.file_stat(path)
+        key = f"{os.path.abspath(path)}|{size}|{mtime}|{max_short_side}"
+        extension = ".png" if os.path.splitext(path)[1].lower() == ".png" else ".jpg"
+        return os.path.join(self.cache_dir, hashlib.sha256(key.encode("utf-8")).hexdigest()[:32] + extension)
+
+    def __write_downscaled(self, path: str, cache_path: str, max_short_side: int) -> bool:
+        with Image.open(concept_archive.file_source(path)) as image:
+            exif_size = image.size
+            if image.getexif().get(0x0112, 1) in [5, 6, 7, 8]:
+                exif_size = exif_size[1], exif_size[0]
+
+            scale = max_short_side / min(exif_size)
+            if scale >= 1:
+                return False
+
+            # JPEG sources can be decoded at a reduced size, which is much faster than a full decode
+            image.draft(image.mode, (math.ceil(image.size[0] * scale), math.ceil(image.size[1] * scale)))
+            image = ImageOps.exif_transpose(image)
+
+            size = round(exif_size[0] * scale), round(exif_size[1] * scale)
+            image = image.resize(size, Image.Resampling.LANCZOS)
+
+            # write to a temporary file first, another thread could read the same path
+            temp_path = f"{cache_path}.{threading.get_ident()}.write"
+            if cache_path.endswith(".png"):
+                image.save(temp_path, format="PNG", compress_level=1)
+            else:
+                if image.mode not in ["RGB", "L"]:
+                    image = image.convert("RGB")
+                image.save(temp_path, format="JPEG", quality=95, subsampling=0)
+            os.replace(temp_path, cache_path)
+
+        return True
+
+    def get_item(self, variation: int, index: int, requested_name: str = None) -> dict:
+        path = self._get_previous_item(variation, self.path_in_name, index)
+
+        if concept_archive.is_file(path) and os.path.splitext(path)[1].lower() in path_util.supported_image_extensions():
+            max_short_side = self.__max_short_side(variation, index)
+            cache_path = self.__cache_path(path, max_short_side)
+            if os.path.isfile(cache_path):
+                path = cache_path
+            else:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                try:
+                    if self.__write_downscaled(path, cache_path, max_short_side):
+                        path = cache_path
+                except Exception as e:
+                    print(f"Could not cache a downscaled copy of {path}: {e}")
+
+        return {
+            self.path_out_name: path
+        }
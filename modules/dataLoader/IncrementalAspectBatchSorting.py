@@ -0,0 +1,146 @@
+import threading
+
+from mgds.PipelineModule import PipelineModule
+from mgds.pipelineModuleTypes.RandomAccessPipelineModule import RandomAccessPipelineModule
+
+
+class IncrementalAspectBatchSorting(
+    PipelineModule,
+    RandomAccessPipelineModule,
+):
+    """
+    Sorts samples into batches of the same resolution, like AspectBatchSorting, but plans the epoch on a background
+    thread. The samples are visited in a random order, and a batch is emitted as soon as its resolution bucket is
+    filled, so the first batches can be read before the resolutions of all samples are known.
+
+    Incomplete batches are dropped at the end of the epoch, so a fully planned epoch has the same length as with
+    AspectBatchSorting. The batches are contiguous ranges of the output indices, in the order they were emitted.
+    Reading an index that isn't planned yet waits for it, length() waits for the whole plan.
+    """
+
+    def __init__(
+            self,
+            resolution_in_name: str,
+            names: list[str],
+            batch_size: int,
+    ):
+        super().__init__()
+        self.resolution_in_name = resolution_in_name
+        self.names = names
+        self.batch_size = batch_size
+
+        self.__condition = threading.Condition()
+        self.__generation = 0
+        self.__index_list = []
+        self.__planned = True
+        self.__exception = None
+
+        # number of visited samples, in total and per resolution, used to estimate the length of the epoch
+        self.__total_count = 0
+        self.__visited_count = 0
+        self.__resolution_counts: dict[tuple[int, int], int] = {}
+
+    def length(self) -> int:
+        with self.__condition:
+            while not self.__planned:
+                self.__condition.wait()
+            self.__raise_exception()
+            return len(self.__index_list)
+
+    def get_inputs(self) -> list[str]:
+        return [self.resolution_in_name] + self.names
+
+    def get_outputs(self) -> list[str]:
+        return self.names
+
+    def __raise_exception(self):
+        # called with the lock held
+        if self.__exception is not None:
+            raise RuntimeError("planning the epoch failed") from self.__exception
+
+    def wait_for_samples(self, count: int) -> bool:
+        """
+        Waits until at least count samples are planned. Returns False if the epoch has fewer samples.
+        """
+        with self.__condition:
+            while len(self.__index_list) < count and not self.__planned:
+                self.__condition.wait()
+            self.__raise_exception()
+            return len(self.__index_list) >= count
+
+    def estimated_length(self) -> int:
+        """
+        Returns the number of samples in the epoch. Until the plan is complete, the number of samples per resolution
+        is extrapolated from the samples that were already visited. Waits until the first batch is planned.
+        """
+        self.wait_for_samples(self.batch_size)
+
+        with self.__condition:
+            if self.__planned or self.__visited_count == 0:
+                return len(self.__index_list)
+
+            estimated_length = 0
+            for count in self.__resolution_counts.values():
+                estimated_count = count * self.__total_count // self.__visited_count
+                estimated_length += estimated_count - estimated_count % self.batch_size
+            return max(estimated_length, len(self.__index_list))
+
+    def start(self, variation: int):
+        order = list(range(self._get_previous_length(self.resolution_in_name)))
+        self._get_rand(variation).shuffle(order)
+
+        with self.__condition:
+            # a planner that is still running for the previous epoch stops after its current sample
+            self.__generation += 1
+            self.__index_list = []
+            self.__planned = False
+            self.__exception = None
+            self.__total_count = len(order)
+            self.__visited_count = 0
+            self.__resolution_counts = {}
+
+            thread = threading.Thread(target=self.__plan, args=(variation, self.__generation, order), daemon=True)
+            thread.start()
+
+    def __plan(self, variation: int, generation: int, order: list[int]):
+        buckets = {}
+        exception = None
+
+        try:
+            for index in order:
+                resolution = self._get_previous_item(variation, self.resolution_in_name, index)
+                resolution = int(resolution[0]), int(resolution[1])
+
+                bucket = buckets.setdefault(resolution, [])
+                bucket.append(index)
+
+                with self.__condition:
+                    if generation != self.__generation:
+                        return
+
+                    self.__visited_count += 1
+                    self.__resolution_counts[resolution] = self.__resolution_counts.get(resolution, 0) + 1
+
+                    if len(bucket) == self.batch_size:
+                        self.__index_list.extend(bucket)
+                        bucket.clear()
+                        self.__condition.notify_all()
+        except Exception as e:
+            exception = e
+
+        with self.__condition:
+            if generation == self.__generation:
+                self.__planned = True
+                self.__exception = exception
+                self.__condition.notify_all()
+
+    def get_item(self, variation: int, index: int, requested_name: str = None) -> dict:
+        if not self.wait_for_samples(index + 1):
+            raise IndexError(f"index {index} is out of range for an epoch of {len(self.__index_list)} samples")
+        index = self.__index_list[index]
+
+        item = {}
+        for name in self.names:
+            item[name] = self._get_previous_item(variation, name, index)
+
+        return item
@@ -0,0 +1,136 @@
+import math
+import threading
+from collections.abc import Iterator
+
+from modules.dataLoader.IncrementalAspectBatchSorting import IncrementalAspectBatchSorting
+from modules.util import distributed_util
+
+from mgds.MGDS import MGDS
+
+from torch.utils.data import DataLoader, Dataset, Sampler
+
+
+class LazyEpochDataSet(Dataset):
+    """
+    Wraps an MGDS data set that uses IncrementalAspectBatchSorting. Batches are handed to the data loader as soon as
+    they are planned, instead of after the whole epoch is sorted. In distributed training, every process reads every
+    world_size-th batch.
+
+    If start_next_epoch_in_background is set, the next epoch is started on a background thread as soon as the last
+    batch of the current epoch was loaded, so it's planned during the last training step, or the last steps if batches
+    are prefetched. The trainer reports each loaded batch with batch_loaded(). This is only possible if starting an
+    epoch doesn't need the model, and never in distributed training, where it waits for other processes.
+    """
+
+    def __init__(
+            self,
+            ds: MGDS,
+            batch_sorting: IncrementalAspectBatchSorting,
+            initial_epoch_sample: int,
+    ):
+        super().__init__()
+
+        self.ds = ds
+        self.batch_sorting = batch_sorting
+        self.rank = distributed_util.rank()
+        self.world_size = distributed_util.world_size()
+
+        self.start_next_epoch_in_background = False
+
+        # when resuming in the middle of an epoch, MGDS skips the samples that were already trained on
+        self.__initial_epoch_sample = initial_epoch_sample
+        self.__skipped_samples = 0
+
+        self.__next_epoch_thread = None
+        self.__next_epoch_exception = None
+
+        # the number of batches of the current epoch, known once the last one was handed to the data loader
+        self.__batch_count = None
+        self.__loaded_batch_count = 0
+
+    def __len__(self) -> int:
+        # waits until the whole epoch is planned
+        return len(self.ds)
+
+    def __getitem__(self, index: int) -> dict:
+        return self.ds[index]
+
+    def __first_batch(self) -> int:
+        return math.ceil(self.__skipped_samples / self.batch_sorting.batch_size)
+
+    def batches(self) -> Iterator[list[int]]:
+        batch_size = self.batch_sorting.batch_size
+        first_batch = self.__first_batch()
+
+        def round_is_planned(round_index: int) -> bool:
+            # the last incomplete round of batches is dropped, so every process runs the same number of steps
+            return self.batch_sorting.wait_for_samples((first_batch + (round_index + 1) * self.world_size) * batch_size)
+
+        round_index = 0
+        has_next_round = round_is_planned(round_index)
+        while has_next_round:
+            start = (first_batch + round_index * self.world_size + self.rank) * batch_size - self.__skipped_samples
+            round_index += 1
+
+            # looking one round ahead tells batch_loaded() which batch is the last one
+            has_next_round = round_is_planned(round_index)
+            if not has_next_round:
+                self.__batch_count = round_index
+
+            yield list(range(start, start + batch_size))
+
+    def batch_loaded(self):
+        """
+        Called by the trainer after every batch that was loaded by the data loader. After the last batch of the
+        epoch, the pipeline isn't read anymore, and the next epoch can be started.
+        """
+        self.__loaded_batch_count += 1
+        if self.start_next_epoch_in_background and self.world_size == 1 and self.__next_epoch_thread is None \
+                and self.__loaded_batch_count == self.__batch_count:
+            self.__next_epoch_thread = threading.Thread(target=self.__start_next_epoch_in_background, daemon=True)
+            self.__next_epoch_thread.start()
+
+    def approximate_length(self) -> int:
+        batch_count = self.batch_sorting.estimated_length() // self.batch_sorting.batch_size - self.__first_batch()
+        return max(0, batch_count) // self.world_size
+
+    def __start_next_epoch_in_background(self):
+        try:
+            self.ds.start_next_epoch()
+        except Exception as e:
+            self.__next_epoch_exception = e
+
+    def start_next_epoch(self):
+        if self.__next_epoch_thread is not None:
+            self.__next_epoch_thread.join()
+            self.__next_epoch_thread = None
+
+            exception, self.__next_epoch_exception = self.__next_epoch_exception, None
+            if exception is not None:
+                raise exception
+        else:
+            # only the main process writes the cache. All other processes read it after it is done
+            with distributed_util.main_process_first():
+                self.ds.start_next_epoch()
+
+        self.__skipped_samples, self.__initial_epoch_sample = self.__initial_epoch_sample, 0
+        self.__batch_count = None
+        self.__loaded_batch_count = 0
+
+
+class LazyEpochBatchSampler(Sampler[list[int]]):
+    def __init__(self, ds: LazyEpochDataSet):
+        super().__init__()
+
+        self.ds = ds
+
+    def __iter__(self) -> Iterator[list[int]]:
+        yield from self.ds.batches()
+
+    def __len__(self) -> int:
+        return self.ds.approximate_length()
+
+
+class LazyEpochDataLoader(DataLoader):
+    def __init__(self, ds: LazyEpochDataSet):
+        super().__init__(ds, batch_sampler=LazyEpochBatchSampler(ds))
@@ -0,0 +1,73 @@
+import os
+
+from modules.util import concept_archive
+
+from mgds.PipelineModule import PipelineModule
+from mgds.pipelineModuleTypes.RandomAccessPipelineModule import RandomAccessPipelineModule
+
+import torch
+
+import numpy as np
+from PIL import Image, ImageOps
+
+
+class LoadArchiveImage(
+    PipelineModule,
+    RandomAccessPipelineModule,
+):
+    """
+    Loads images that are members of a concept archive, LoadImage can only open files. Paths that are not archive
+    members pass through the image of the previous module.
+    """
+
+    def __init__(
+            self,
+            path_in_name: str,
+            image_out_name: str,
+            range_min: float,
+            range_max: float,
+            supported_extensions: set[str],
+            channels: int = 3,
+            dtype: torch.dtype | None = None,
+    ):
+        super().__init__()
+        self.path_in_name = path_in_name
+        self.image_out_name = image_out_name
+        self.range_min = range_min
+        self.range_max = range_max
+        self.supported_extensions = supported_extensions
+        self.channels = channels
+        self.dtype = dtype
+
+    def length(self) -> int:
+        return self._get_previous_length(self.path_in_name)
+
+    def get_inputs(self) -> list[str]:
+        return [self.path_in_name, self.image_out_name]
+
+    def get_outputs(self) -> list[str]:
+        return [self.image_out_name]
+
+    def get_item(self, variation: int, index: int, requested_name: str = None) -> dict:
+        path = self._get_previous_item(variation, self.path_in_name, index)
+
+        if not concept_archive.is_member(path) or os.path.splitext(path)[1].lower() not in self.supported_extensions:
+            return {
+                self.image_out_name: self._get_previous_item(variation, self.image_out_name, index)
+            }
+
+        with Image.open(concept_archive.file_source(path)) as image:
+            image = ImageOps.exif_transpose(image)
+            image = image.convert('RGB' if self.channels == 3 else 'L')
+            array = np.array(image)
+
+        # (height, width, channels) -> (channels, height, width)
+        image = torch.from_numpy(array)
+        image = image.unsqueeze(0) if image.ndim == 2 else image.permute(2, 0, 1)
+        image = image.to(device=self.pipeline.device)
+        image = image.to(dtype=self.dtype if self.dtype else torch.float32)
+        image = image / 255.0 * (self.range_max - self.range_min) + self.range_min
+
+        return {
+            self.image_out_name: image
+        }
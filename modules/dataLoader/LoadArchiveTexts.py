@@ -0,0 +1,45 @@
+from modules.util import concept_archive
+
+from mgds.PipelineModule import PipelineModule
+from mgds.pipelineModuleTypes.RandomAccessPipelineModule import RandomAccessPipelineModule
+
+
+class LoadArchiveTexts(
+    PipelineModule,
+    RandomAccessPipelineModule,
+):
+    """
+    Loads the lines of text files that are members of a concept archive, LoadMultipleTexts can only open files.
+    Paths that are not archive members pass through the texts of the previous module.
+    """
+
+    def __init__(
+            self,
+            path_in_name: str,
+            texts_out_name: str,
+    ):
+        super().__init__()
+        self.path_in_name = path_in_name
+        self.texts_out_name = texts_out_name
+
+    def length(self) -> int:
+        return self._get_previous_length(self.path_in_name)
+
+    def get_inputs(self) -> list[str]:
+        return [self.path_in_name, self.texts_out_name]
+
+    def get_outputs(self) -> list[str]:
+        return [self.texts_out_name]
+
+    def get_item(self, variation: int, index: int, requested_name: str = None) -> dict:
+        path = self._get_previous_item(variation, self.path_in_name, index)
+
+        if not concept_archive.is_member(path):
+            return {
+                self.texts_out_name: self._get_previous_item(variation, self.texts_out_name, index)
+            }
+
+        text = concept_archive.read_member(path).decode('utf-8')
+        return {
+            self.texts_out_name: [line.strip() for line in text.splitlines() if line.strip() != '']
+        }
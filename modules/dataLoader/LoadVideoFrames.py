@@ -0,0 +1,248 @@
+import bisect
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from modules.util import concept_archive, path_util
+
+from mgds.PipelineModule import PipelineModule
+from mgds.pipelineModuleTypes.RandomAccessPipelineModule import RandomAccessPipelineModule
+
+import torch
+
+import av
+import numpy as np
+from tqdm import tqdm
+
+
+def _frame_number(pts: int, start_time: int, time_base, fps: float) -> int:
+    return round(float((pts - start_time) * time_base) * fps)
+
+
+def _probe_video(path: str) -> tuple[float, int, list[int]]:
+    """
+    Returns the frame rate, frame count and keyframe numbers of a video. Only the container is demuxed, no frames
+    are decoded.
+    """
+    with av.open(concept_archive.file_source(path)) as container:
+        stream = container.streams.video[0]
+        fps = float(stream.average_rate or stream.guessed_rate)
+        start_time = stream.start_time or 0
+
+        frame_count = 0
+        keyframes = []
+        for packet in container.demux(stream):
+            if packet.pts is None or packet.size == 0:
+                continue
+            frame_count += 1
+            if packet.is_keyframe:
+                keyframes.append(_frame_number(packet.pts, start_time, stream.time_base, fps))
+
+    if fps <= 0 or frame_count == 0:
+        raise ValueError("video has no frames")
+
+    return fps, frame_count, sorted(keyframes)
+
+
+def _decode_frames(
+        path: str,
+        frame_numbers: list[int],
+        fps: float,
+        keyframes: list[int],
+        threaded: bool,
+) -> list[np.ndarray]:
+    """
+    Decodes the requested frames of a video as RGB arrays. The decoder seeks to the keyframe before the first
+    requested frame, and seeks again if there is a keyframe between two requested frames. Only the requested
+    frames are converted to RGB.
+    """
+    def keyframe_before(frame_number: int) -> int:
+        index = bisect.bisect_right(keyframes, frame_number) - 1
+        return keyframes[index] if index >= 0 else 0
+
+    remaining = sorted(set(frame_numbers))
+    frames = {}
+    last_frame = None
+
+    with av.open(concept_archive.file_source(path)) as container:
+        stream = container.streams.video[0]
+        if threaded:
+            stream.thread_type = "AUTO"
+        start_time = stream.start_time or 0
+
+        while remaining:
+            seek_frame = keyframe_before(remaining[0])
+            container.seek(start_time + int(seek_frame / fps / stream.time_base), stream=stream, backward=True)
+
+            reached_end = True
+            for frame in container.decode(stream):
+                frame_number = _frame_number(frame.pts, start_time, frame.time_base, fps) \
+                    if frame.pts is not None else seek_frame
+                seek_frame = frame_number + 1
+                if frame_number < remaining[0]:
+                    continue
+
+                # a missing frame number is replaced by the next decoded frame
+                last_frame = frame.to_ndarray(format="rgb24")
+                while remaining and remaining[0] <= frame_number:
+                    frames[remaining.pop(0)] = last_frame
+
+                if not remaining or keyframe_before(remaining[0]) > frame_number + 1:
+                    reached_end = False
+                    break
+
+            if reached_end:
+                break
+
+    if last_frame is None:
+        raise ValueError(f"could not decode any frames of {path}")
+
+    # frames past the end of the stream repeat the last decoded frame
+    return [frames.get(frame_number, last_frame) for frame_number in frame_numbers]
+
+
+class LoadVideoFrames(
+    PipelineModule,
+    RandomAccessPipelineModule,
+):
+    """
+    Replacement for LoadVideo that only decodes the frames of the sampled clip. A random clip window of the target
+    frame count is chosen, frames are taken at the target frame rate, and the decoder seeks to the keyframe before
+    each needed frame instead of decoding the video from the start.
+
+    The frame rate, frame count and keyframe positions of each video are read in a parallel pre-pass at the start of
+    each epoch. They are stored in an index file together with the file size and modification time, so each file is
+    only demuxed once. Paths that are not videos pass through the image of the previous module.
+    """
+
+    def __init__(
+            self,
+            path_in_name: str,
+            target_frame_count_in_name: str,
+            video_out_name: str,
+            range_min: float,
+            range_max: float,
+            target_frame_rate: float,
+            supported_extensions: set[str],
+            index_path: str,
+            threaded_decoding: bool = False,
+            dtype: torch.dtype | None = None,
+    ):
+        super().__init__()
+        self.path_in_name = path_in_name
+        self.target_frame_count_in_name = target_frame_count_in_name
+        self.video_out_name = video_out_name
+        self.range_min = range_min
+        self.range_max = range_max
+        self.target_frame_rate = target_frame_rate
+        self.supported_extensions = supported_extensions
+        self.index_path = index_path
+        self.threaded_decoding = threaded_decoding
+        self.dtype = dtype
+
+        self.__index = None
+        self.__index_changed = False
+        self.__index_lock = threading.Lock()
+
+    def length(self) -> int:
+        return self._get_previous_length(self.path_in_name)
+
+    def get_inputs(self) -> list[str]:
+        return [self.path_in_name, self.target_frame_count_in_name, self.video_out_name]
+
+    def get_outputs(self) -> list[str]:
+        return [self.video_out_name]
+
+    def __is_video(self, path: str) -> bool:
+        return os.path.splitext(path)[1].lower() in self.supported_extensions
+
+    def __load_index(self):
+        self.__index = {}
+        try:
+            with open(self.index_path, "r") as f:
+                self.__index = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+    def __save_index(self):
+        os.makedirs(os.path.dirname(self.index_path) or ".", exist_ok=True)
+        path_util.write_json_atomic(self.index_path, self.__index)
+
+    def __video_info(self, path: str) -> tuple[float, int, list[int]] | None:
+        try:
+            size, mtime = concept_archive.file_stat(path)
+        except OSError:
+            return None
+
+        entry = self.__index.get(path)
+        if entry is not None and entry[0] == size and entry[1] == mtime:
+            return entry[2], entry[3], entry[4]
+
+        try:
+            fps, frame_count, keyframes = _probe_video(path)
+        except Exception:
+            return None
+
+        with self.__index_lock:
+            self.__index[path] = [size, mtime, fps, frame_count, keyframes]
+            self.__index_changed = True
+
+        return fps, frame_count, keyframes
+
+    def start(self, variation: int):
+        if self.__index is None:
+            self.__load_index()
+
+        paths = {self._get_previous_item(variation, self.path_in_name, index) for index in range(self.length())}
+        paths = [path for path in paths if self.__is_video(path)]
+        if not paths:
+            return
+
+        with ThreadPoolExecutor(max_workers=min(32, (os.cpu_count() or 1) * 4)) as executor:
+            for _ in tqdm(executor.map(self.__video_info, paths), total=len(paths), desc='indexing videos'):
+                pass
+
+        if self.__index_changed:
+            self.__save_index()
+            self.__index_changed = False
+
+    def __clip_frame_numbers(self, variation: int, index: int, fps: float, frame_count: int) -> list[int]:
+        target_frame_count = int(self._get_previous_item(variation, self.target_frame_count_in_name, index))
+
+        # frames are skipped to reach the target frame rate, but never repeated
+        step = max(1.0, fps / self.target_frame_rate)
+        target_frame_count = max(1, min(target_frame_count, int((frame_count - 1) / step) + 1))
+        window_length = round((target_frame_count - 1) * step) + 1
+
+        rand = self._get_rand(variation, index)
+        first_frame = rand.randint(0, frame_count - window_length)
+        return [first_frame + round(i * step) for i in range(target_frame_count)]
+
+    def get_item(self, variation: int, index: int, requested_name: str = None) -> dict:
+        path = self._get_previous_item(variation, self.path_in_name, index)
+
+        if not self.__is_video(path):
+            return {
+                self.video_out_name: self._get_previous_item(variation, self.video_out_name, index)
+            }
+
+        if self.__index is None:
+            self.__load_index()
+        info = self.__video_info(path)
+        if info is None:
+            raise ValueError(f"could not read video {path}")
+        fps, frame_count, keyframes = info
+
+        frame_numbers = self.__clip_frame_numbers(variation, index, fps, frame_count)
+        frames = _decode_frames(path, frame_numbers, fps, keyframes, self.threaded_decoding)
+
+        # (frames, height, width, channels) -> (channels, frames, height, width)
+        video = torch.from_numpy(np.stack(frames)).permute(3, 0, 1, 2)
+        video = video.to(device=self.pipeline.device)
+        video = video.to(dtype=self.dtype if self.dtype else torch.float32)
+        video = video / 255.0 * (self.range_max - self.range_min) + self.range_min
+
+        return {
+            self.video_out_name: video
+        }
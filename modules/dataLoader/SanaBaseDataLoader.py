@@ -46,6 +46,7 @@ class SanaBaseDataLoader(
         if is_validation:
             config = copy.copy(config)
             config.batch_size = 1
+            config.token_budget_batching = False
 
         self.__ds = self.create_dataset(
             config=config,
@@ -53,7 +54,7 @@ class SanaBaseDataLoader(
             train_progress=train_progress,
             is_validation=is_validation,
         )
-        self.__dl = TrainDataLoader(self.__ds, config.batch_size)
+        self.__dl = self._create_data_loader(self.__ds, config)
 
     def get_data_set(self) -> MGDS:
         return self.__ds
@@ -3,6 +3,10 @@ import os
 import re
 
 from modules.dataLoader.BaseDataLoader import BaseDataLoader
+from modules.dataLoader.CalcAspectFromHeader import CalcAspectFromHeader
+from modules.dataLoader.CollectArchiveSamples import CollectArchiveSamples
+from modules.dataLoader.DownscaledSourceCache import DownscaledSourceCache
+from modules.dataLoader.LoadArchiveImage import LoadArchiveImage
 from modules.model.StableDiffusionModel import StableDiffusionModel
 from modules.util import path_util
 from modules.util.config.TrainConfig import TrainConfig
@@ -11,14 +15,11 @@ from modules.util.TrainProgress import TrainProgress
 
 from mgds.MGDS import MGDS, TrainDataLoader
 from mgds.OutputPipelineModule import OutputPipelineModule
-from mgds.pipelineModules.AspectBatchSorting import AspectBatchSorting
 from mgds.pipelineModules.AspectBucketing import AspectBucketing
-from mgds.pipelineModules.CalcAspect import CalcAspect
 from mgds.pipelineModules.CollectPaths import CollectPaths
 from mgds.pipelineModules.DecodeVAE import DecodeVAE
 from mgds.pipelineModules.DiskCache import DiskCache
 from mgds.pipelineModules.EncodeVAE import EncodeVAE
-from mgds.pipelineModules.InlineAspectBatchSorting import InlineAspectBatchSorting
 from mgds.pipelineModules.LoadImage import LoadImage
 from mgds.pipelineModules.ModifyPath import ModifyPath
 from mgds.pipelineModules.RandomBrightness import RandomBrightness
@@ -56,6 +57,7 @@ class StableDiffusionFineTuneVaeDataLoader(BaseDataLoader):
         if is_validation:
             config = copy.copy(config)
             config.batch_size = 1
+            config.token_budget_batching = False
 
         self.__ds = self.create_dataset(
             config=config,
@@ -63,7 +65,7 @@ class StableDiffusionFineTuneVaeDataLoader(BaseDataLoader):
             train_progress=train_progress,
             is_validation=is_validation,
         )
-        self.__dl = TrainDataLoader(self.__ds, config.batch_size)
+        self.__dl = self._create_data_loader(self.__ds, config)
 
     def get_data_set(self) -> MGDS:
         return self.__ds
@@ -93,10 +95,14 @@ class StableDiffusionFineTuneVaeDataLoader(BaseDataLoader):
             path_out_name='image_path', concept_out_name='concept',
             extensions=supported_extensions, include_postfix=None, exclude_postfix=['-masklabel']
         )
+        collect_archive_samples = CollectArchiveSamples(
+            path_in_name='image_path', concept_in_name='concept', path_out_name='image_path', concept_out_name='concept',
+            extensions=supported_extensions, exclude_postfix=['-masklabel']
+        )
 
         mask_path = ModifyPath(in_name='image_path', out_name='mask_path', postfix='-masklabel', extension='.png')
 
-        modules = [collect_paths]
+        modules = [collect_paths, collect_archive_samples]
 
         if config.masked_training:
             modules.append(mask_path)
@@ -104,13 +110,30 @@ class StableDiffusionFineTuneVaeDataLoader(BaseDataLoader):
         return modules
 
     def __load_input_modules(self, config: TrainConfig) -> list:
-        load_image = LoadImage(path_in_name='image_path', image_out_name='image', range_min=-1.0, range_max=1.0, supported_extensions=path_util.supported_image_extensions())
-        load_mask = LoadImage(path_in_name='mask_path', image_out_name='latent_mask', range_min=0, range_max=1, channels=1, supported_extensions=path_util.supported_image_extensions())
+        # without latent caching, the downscaled source cache avoids decoding full resolution images in every epoch
+        use_source_cache = config.source_cache and not config.latent_caching
+        source_cache_dir = os.path.join(config.cache_dir, 'source')
+        source_cache_image = DownscaledSourceCache(path_in_name='image_path', path_out_name='image_load_path', cache_dir=source_cache_dir, target_resolution_in_name='settings.target_resolution', enable_target_resolutions_override_in_name='concept.image.enable_resolution_override', target_resolutions_override_in_name='concept.image.resolution_override')
+        source_cache_mask = DownscaledSourceCache(path_in_name='mask_path', path_out_name='mask_load_path', cache_dir=source_cache_dir, target_resolution_in_name='settings.target_resolution', enable_target_resolutions_override_in_name='concept.image.enable_resolution_override', target_resolutions_override_in_name='concept.image.resolution_override')
+
+        load_image = LoadImage(path_in_name='image_load_path' if use_source_cache else 'image_path', image_out_name='image', range_min=-1.0, range_max=1.0, supported_extensions=path_util.supported_image_extensions())
+        load_archive_image = LoadArchiveImage(path_in_name='image_load_path' if use_source_cache else 'image_path', image_out_name='image', range_min=-1.0, range_max=1.0, supported_extensions=path_util.supported_image_extensions())
+        load_mask = LoadImage(path_in_name='mask_load_path' if use_source_cache else 'mask_path', image_out_name='latent_mask', range_min=0, range_max=1, channels=1, supported_extensions=path_util.supported_image_extensions())
+        load_archive_mask = LoadArchiveImage(path_in_name='mask_load_path' if use_source_cache else 'mask_path', image_out_name='latent_mask', range_min=0, range_max=1, channels=1, supported_extensions=path_util.supported_image_extensions())
+
+        modules = []
 
-        modules = [load_image]
+        if use_source_cache:
+            modules.append(source_cache_image)
+            if config.masked_training:
+                modules.append(source_cache_mask)
+
+        modules.append(load_image)
+        modules.append(load_archive_image)
 
         if config.masked_training:
             modules.append(load_mask)
+            modules.append(load_archive_mask)
 
         return modules
 
@@ -131,7 +154,11 @@ class StableDiffusionFineTuneVaeDataLoader(BaseDataLoader):
         return modules
 
     def __aspect_bucketing_in(self, config: TrainConfig):
-        calc_aspect = CalcAspect(image_in_name='image', resolution_out_name='original_resolution')
+        calc_aspect = CalcAspectFromHeader(
+            path_in_name='image_path', image_in_name='image', resolution_out_name='original_resolution',
+            index_path=os.path.join(config.cache_dir, 'resolution_index.json'),
+            decode_enabled_in_name='concept.image.enable_random_circular_mask_shrink' if config.masked_training else None,
+        )
 
         aspect_bucketing = AspectBucketing(
             quantization=8,
@@ -241,19 +268,16 @@ class StableDiffusionFineTuneVaeDataLoader(BaseDataLoader):
         sort_names = output_names + ['concept']
         output_names = output_names + [('concept.loss_weight', 'loss_weight')]
         output_names = output_names + [('concept.type', 'concept_type')]
+        output_names = output_names + [('concept.name', 'concept_name')]
 
         # add for calculating loss per concept
         if config.validation:
-            output_names.append(('concept.name', 'concept_name'))
             output_names.append(('concept.path', 'concept_path'))
             output_names.append(('concept.seed', 'concept_seed'))
 
         image_sample = SampleVAEDistribution(in_name='latent_image_distribution', out_name='latent_image', mode='mean')
 
-        if config.latent_caching:
-            batch_sorting = AspectBatchSorting(resolution_in_name='crop_resolution', names=sort_names, batch_size=config.batch_size)
-        else:
-            batch_sorting = InlineAspectBatchSorting(resolution_in_name='crop_resolution', names=sort_names, batch_size=config.batch_size)
+        batch_sorting = self._batch_sorting(config, sort_names)
 
         output = OutputPipelineModule(names=output_names)
 
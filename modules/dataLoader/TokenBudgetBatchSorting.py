@@ -0,0 +1,82 @@
+from mgds.PipelineModule import PipelineModule
+from mgds.pipelineModuleTypes.RandomAccessPipelineModule import RandomAccessPipelineModule
+
+from tqdm import tqdm
+
+
+class TokenBudgetBatchSorting(
+    PipelineModule,
+    RandomAccessPipelineModule,
+):
+    """
+    Sorts samples into batches of the same resolution, like AspectBatchSorting. Instead of a fixed batch size,
+    each resolution bucket gets the batch size that fills a budget of pixels per batch. batch_size is the batch size
+    at the base resolution, lower resolution buckets get larger batches, higher resolution buckets get smaller ones.
+
+    The batches are contiguous ranges of the output indices, their sizes are returned by batch_sizes().
+    """
+
+    def __init__(
+            self,
+            resolution_in_name: str,
+            names: list[str],
+            batch_size: int,
+            base_pixels: int,
+    ):
+        super().__init__()
+        self.resolution_in_name = resolution_in_name
+        self.names = names
+        self.token_budget = batch_size * base_pixels
+
+        self.index_list = []
+        self.__batch_sizes = []
+
+    def length(self) -> int:
+        return len(self.index_list)
+
+    def get_inputs(self) -> list[str]:
+        return [self.resolution_in_name] + self.names
+
+    def get_outputs(self) -> list[str]:
+        return self.names
+
+    def bucket_batch_size(self, resolution: tuple[int, int]) -> int:
+        return max(1, self.token_budget // (resolution[0] * resolution[1]))
+
+    def batch_sizes(self) -> list[int]:
+        return self.__batch_sizes
+
+    def __bucket_indices(self, variation: int) -> dict[tuple[int, int], list[int]]:
+        buckets = {}
+        for index in tqdm(range(self._get_previous_length(self.resolution_in_name)), desc='sorting resolutions'):
+            resolution = self._get_previous_item(variation, self.resolution_in_name, index)
+            resolution = int(resolution[0]), int(resolution[1])
+            buckets.setdefault(resolution, []).append(index)
+        return buckets
+
+    def start(self, variation: int):
+        rand = self._get_rand(variation)
+
+        batches = []
+        # sorted, so every process of a distributed run creates the same order
+        for resolution, indices in sorted(self.__bucket_indices(variation).items()):
+            rand.shuffle(indices)
+
+            # buckets with fewer samples than their batch size still get one smaller batch
+            batch_size = min(self.bucket_batch_size(resolution), len(indices))
+            # incomplete batches are dropped, like in AspectBatchSorting
+            batches.extend(indices[i:i + batch_size] for i in range(0, len(indices) - batch_size + 1, batch_size))
+
+        rand.shuffle(batches)
+
+        self.index_list = [index for batch in batches for index in batch]
+        self.__batch_sizes = [len(batch) for batch in batches]
+
+    def get_item(self, variation: int, index: int, requested_name: str = None) -> dict:
+        index = self.index_list[index]
+
+        item = {}
+        for name in self.names:
+            item[name] = self._get_previous_item(variation, name, index)
+
+        return item
@@ -0,0 +1,74 @@
+from collections.abc import Iterator
+
+from modules.dataLoader.TokenBudgetBatchSorting import TokenBudgetBatchSorting
+from modules.util import distributed_util
+
+from mgds.MGDS import MGDS
+
+from torch.utils.data import DataLoader, Dataset, Sampler
+
+
+class TokenBudgetDataSet(Dataset):
+    """
+    Wraps an MGDS data set that uses TokenBudgetBatchSorting, and splits its samples into batches of varying size.
+    In distributed training, every process reads every world_size-th batch.
+    """
+
+    def __init__(
+            self,
+            ds: MGDS,
+            batch_sorting: TokenBudgetBatchSorting,
+    ):
+        super().__init__()
+
+        self.ds = ds
+        self.batch_sorting = batch_sorting
+        self.rank = distributed_util.rank()
+        self.world_size = distributed_util.world_size()
+
+    def __len__(self) -> int:
+        return len(self.ds)
+
+    def __getitem__(self, index: int) -> dict:
+        return self.ds[index]
+
+    def batches(self) -> list[list[int]]:
+        # when resuming in the middle of an epoch, MGDS skips the samples that were already trained on
+        skipped_samples = self.batch_sorting.length() - len(self.ds)
+
+        batches = []
+        start = 0
+        for batch_size in self.batch_sorting.batch_sizes():
+            if start >= skipped_samples:
+                batches.append(list(range(start - skipped_samples, start - skipped_samples + batch_size)))
+            start += batch_size
+
+        # drop the last incomplete round of batches, so every process runs the same number of steps
+        local_batch_count = len(batches) // self.world_size
+        return batches[self.rank::self.world_size][:local_batch_count]
+
+    def approximate_length(self) -> int:
+        return len(self.batches())
+
+    def start_next_epoch(self):
+        # only the main process writes the cache. All other processes read it after it is done
+        with distributed_util.main_process_first():
+            self.ds.start_next_epoch()
+
+
+class TokenBudgetBatchSampler(Sampler[list[int]]):
+    def __init__(self, ds: TokenBudgetDataSet):
+        super().__init__()
+
+        self.ds = ds
+
+    def __iter__(self) -> Iterator[list[int]]:
+        yield from self.ds.batches()
+
+    def __len__(self) -> int:
+        return self.ds.approximate_length()
+
+
+class TokenBudgetDataLoader(DataLoader):
+    def __init__(self, ds: TokenBudgetDataSet):
+        super().__init__(ds, batch_sampler=TokenBudgetBatchSampler(ds))
@@ -1,19 +1,50 @@
 import json
+import re
 from abc import ABCMeta
 
+from modules.dataLoader.CollectArchiveSamples import CollectArchiveSamples
+from modules.dataLoader.DistributedDataSet import DistributedDataSet
+from modules.dataLoader.IncrementalAspectBatchSorting import IncrementalAspectBatchSorting
+from modules.dataLoader.LazyEpochDataSet import LazyEpochDataLoader, LazyEpochDataSet
+from modules.dataLoader.TokenBudgetBatchSorting import TokenBudgetBatchSorting
+from modules.dataLoader.TokenBudgetDataSet import TokenBudgetDataLoader, TokenBudgetDataSet
+from modules.util import distributed_util
 from modules.util.config.ConceptConfig import ConceptConfig
 from modules.util.config.TrainConfig import TrainConfig
 from modules.util.enum.ConceptType import ConceptType
 from modules.util.TrainProgress import TrainProgress
 
-from mgds.MGDS import MGDS
+from mgds.MGDS import MGDS, TrainDataLoader
 from mgds.PipelineModule import PipelineState
+from mgds.pipelineModules.AspectBatchSorting import AspectBatchSorting
+from mgds.pipelineModules.InlineAspectBatchSorting import InlineAspectBatchSorting
 
 import torch
 
 
 class DataLoaderMgdsMixin(metaclass=ABCMeta):
 
+    def _batch_sorting(self, config: TrainConfig, names: list[str]):
+        if config.token_budget_batching:
+            # the configured batch size applies to the highest resolution, or to an exact <width>x<height> resolution
+            resolutions = [int(x.strip()) for x in re.split(r'\D', config.resolution) if x.strip() != '']
+            base_pixels = resolutions[0] * resolutions[1] if 'x' in config.resolution else max(resolutions) ** 2
+            return TokenBudgetBatchSorting(resolution_in_name='crop_resolution', names=names, batch_size=config.batch_size, base_pixels=base_pixels)
+        elif config.lazy_epoch_planning:
+            return IncrementalAspectBatchSorting(resolution_in_name='crop_resolution', names=names, batch_size=config.batch_size)
+        elif config.latent_caching:
+            return AspectBatchSorting(resolution_in_name='crop_resolution', names=names, batch_size=config.batch_size)
+        else:
+            return InlineAspectBatchSorting(resolution_in_name='crop_resolution', names=names, batch_size=config.batch_size)
+
+    def _create_data_loader(self, ds, config: TrainConfig):
+        if isinstance(ds, TokenBudgetDataSet):
+            return TokenBudgetDataLoader(ds)
+        if isinstance(ds, LazyEpochDataSet):
+            return LazyEpochDataLoader(ds)
+
+        return TrainDataLoader(ds, config.batch_size)
+
     def _create_mgds(
             self,
             config: TrainConfig,
@@ -32,6 +63,12 @@ class DataLoaderMgdsMixin(metaclass=ABCMeta):
         # convert before passing to MGDS
         concepts = [c.to_dict() for c in concepts]
 
+        # archive concepts are read straight from their shards
+        for modules in definition:
+            for module in modules:
+                if isinstance(module, CollectArchiveSamples):
+                    module.set_concepts(concepts)
+
         settings = {
             "target_resolution": config.resolution,
             "target_frames": config.frames,
@@ -49,4 +86,19 @@ class DataLoaderMgdsMixin(metaclass=ABCMeta):
             initial_epoch_sample=train_progress.epoch_sample,
         )
 
+        if config.token_budget_batching:
+            batch_sorting = next(
+                module for modules in definition for module in modules if isinstance(module, TokenBudgetBatchSorting)
+            )
+            return TokenBudgetDataSet(ds, batch_sorting)
+
+        if config.lazy_epoch_planning and not is_validation:
+            batch_sorting = next(
+                module for modules in definition for module in modules if isinstance(module, IncrementalAspectBatchSorting)
+            )
+            return LazyEpochDataSet(ds, batch_sorting, train_progress.epoch_sample)
+
+        if distributed_util.is_enabled() and not is_validation:
+            return DistributedDataSet(ds, config.batch_size)
+
         return ds
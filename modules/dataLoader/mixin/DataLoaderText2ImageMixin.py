@@ -1,25 +1,30 @@
+import os
 import re
 from collections.abc import Callable
 
+from modules.dataLoader.BatchedEncodeVAE import BatchedEncodeVAE
+from modules.dataLoader.CalcAspectFromHeader import CalcAspectFromHeader
+from modules.dataLoader.CollectArchiveSamples import CollectArchiveSamples
+from modules.dataLoader.DownscaledSourceCache import DownscaledSourceCache
+from modules.dataLoader.LoadArchiveImage import LoadArchiveImage
+from modules.dataLoader.LoadArchiveTexts import LoadArchiveTexts
+from modules.dataLoader.LoadVideoFrames import LoadVideoFrames
 from modules.util import path_util
 from modules.util.config.TrainConfig import TrainConfig
 from modules.util.enum.DataType import DataType
 
 from mgds.OutputPipelineModule import OutputPipelineModule
-from mgds.pipelineModules.AspectBatchSorting import AspectBatchSorting
 from mgds.pipelineModules.AspectBucketing import AspectBucketing
-from mgds.pipelineModules.CalcAspect import CalcAspect
 from mgds.pipelineModules.CapitalizeTags import CapitalizeTags
 from mgds.pipelineModules.CollectPaths import CollectPaths
 from mgds.pipelineModules.DropTags import DropTags
+from mgds.pipelineModules.EncodeVAE import EncodeVAE
 from mgds.pipelineModules.GenerateImageLike import GenerateImageLike
 from mgds.pipelineModules.GenerateMaskedConditioningImage import GenerateMaskedConditioningImage
 from mgds.pipelineModules.GetFilename import GetFilename
 from mgds.pipelineModules.ImageToVideo import ImageToVideo
-from mgds.pipelineModules.InlineAspectBatchSorting import InlineAspectBatchSorting
 from mgds.pipelineModules.LoadImage import LoadImage
 from mgds.pipelineModules.LoadMultipleTexts import LoadMultipleTexts
-from mgds.pipelineModules.LoadVideo import LoadVideo
 from mgds.pipelineModules.ModifyPath import ModifyPath
 from mgds.pipelineModules.RandomBrightness import RandomBrightness
 from mgds.pipelineModules.RandomCircularMaskShrink import RandomCircularMaskShrink
@@ -58,12 +63,16 @@ class DataLoaderText2ImageMixin:
             path_out_name='image_path', concept_out_name='concept',
             extensions=supported_extensions, include_postfix=None, exclude_postfix=['-masklabel','-condlabel']
         )
+        collect_archive_samples = CollectArchiveSamples(
+            path_in_name='image_path', concept_in_name='concept', path_out_name='image_path', concept_out_name='concept',
+            extensions=supported_extensions, exclude_postfix=['-masklabel','-condlabel']
+        )
 
         mask_path = ModifyPath(in_name='image_path', out_name='mask_path', postfix='-masklabel', extension='.png')
         cond_path = ModifyPath(in_name='image_path', out_name='cond_path', postfix='-condlabel', extension='.png')
         sample_prompt_path = ModifyPath(in_name='image_path', out_name='sample_prompt_path', postfix='', extension='.txt')
 
-        modules = [collect_paths, sample_prompt_path]
+        modules = [collect_paths, collect_archive_samples, sample_prompt_path]
 
         if config.masked_training:
             modules.append(mask_path)
@@ -78,17 +87,29 @@ class DataLoaderText2ImageMixin:
             train_dtype: DataType,
             allow_video: bool = False,
     ) -> list:
-        load_image = LoadImage(path_in_name='image_path', image_out_name='image', range_min=0, range_max=1, supported_extensions=path_util.supported_image_extensions(), dtype=train_dtype.torch_dtype())
-        load_video = LoadVideo(path_in_name='image_path', target_frame_count_in_name='settings.target_frames', video_out_name='image', range_min=0, range_max=1, target_frame_rate=24, supported_extensions=path_util.supported_video_extensions(), dtype=train_dtype.torch_dtype())
+        # without latent caching, the downscaled source cache avoids decoding full resolution images in every epoch
+        use_source_cache = config.source_cache and not config.latent_caching
+        source_cache_dir = os.path.join(config.cache_dir, 'source')
+        source_cache_image = DownscaledSourceCache(path_in_name='image_path', path_out_name='image_load_path', cache_dir=source_cache_dir, target_resolution_in_name='settings.target_resolution', enable_target_resolutions_override_in_name='concept.image.enable_resolution_override', target_resolutions_override_in_name='concept.image.resolution_override')
+        source_cache_mask = DownscaledSourceCache(path_in_name='mask_path', path_out_name='mask_load_path', cache_dir=source_cache_dir, target_resolution_in_name='settings.target_resolution', enable_target_resolutions_override_in_name='concept.image.enable_resolution_override', target_resolutions_override_in_name='concept.image.resolution_override')
+        source_cache_cond = DownscaledSourceCache(path_in_name='cond_path', path_out_name='cond_load_path', cache_dir=source_cache_dir, target_resolution_in_name='settings.target_resolution', enable_target_resolutions_override_in_name='concept.image.enable_resolution_override', target_resolutions_override_in_name='concept.image.resolution_override')
+
+        load_image = LoadImage(path_in_name='image_load_path' if use_source_cache else 'image_path', image_out_name='image', range_min=0, range_max=1, supported_extensions=path_util.supported_image_extensions(), dtype=train_dtype.torch_dtype())
+        load_archive_image = LoadArchiveImage(path_in_name='image_load_path' if use_source_cache else 'image_path', image_out_name='image', range_min=0, range_max=1, supported_extensions=path_util.supported_image_extensions(), dtype=train_dtype.torch_dtype())
+        # frame threading is only worth it if the data loader doesn't already decode several videos in parallel
+        load_video = LoadVideoFrames(path_in_name='image_path', target_frame_count_in_name='settings.target_frames', video_out_name='image', range_min=0, range_max=1, target_frame_rate=24, supported_extensions=path_util.supported_video_extensions(), index_path=os.path.join(config.cache_dir, 'video_index.json'), threaded_decoding=config.dataloader_threads <= 1, dtype=train_dtype.torch_dtype())
         image_to_video = ImageToVideo(in_name='image', out_name='image')
 
         generate_mask = GenerateImageLike(image_in_name='image', image_out_name='mask', color=255, range_min=0, range_max=1)
-        load_mask = LoadImage(path_in_name='mask_path', image_out_name='mask', range_min=0, range_max=1, channels=1, supported_extensions={".png"}, dtype=train_dtype.torch_dtype())
+        load_mask = LoadImage(path_in_name='mask_load_path' if use_source_cache else 'mask_path', image_out_name='mask', range_min=0, range_max=1, channels=1, supported_extensions={".png"}, dtype=train_dtype.torch_dtype())
+        load_archive_mask = LoadArchiveImage(path_in_name='mask_load_path' if use_source_cache else 'mask_path', image_out_name='mask', range_min=0, range_max=1, channels=1, supported_extensions={".png"}, dtype=train_dtype.torch_dtype())
         mask_to_video = ImageToVideo(in_name='mask', out_name='mask')
 
-        load_cond_image = LoadImage(path_in_name='cond_path', image_out_name='custom_conditioning_image', range_min=0, range_max=1, supported_extensions=path_util.supported_image_extensions(), dtype=train_dtype.torch_dtype())
+        load_cond_image = LoadImage(path_in_name='cond_load_path' if use_source_cache else 'cond_path', image_out_name='custom_conditioning_image', range_min=0, range_max=1, supported_extensions=path_util.supported_image_extensions(), dtype=train_dtype.torch_dtype())
+        load_archive_cond_image = LoadArchiveImage(path_in_name='cond_load_path' if use_source_cache else 'cond_path', image_out_name='custom_conditioning_image', range_min=0, range_max=1, supported_extensions=path_util.supported_image_extensions(), dtype=train_dtype.torch_dtype())
 
         load_sample_prompts = LoadMultipleTexts(path_in_name='sample_prompt_path', texts_out_name='sample_prompts')
+        load_archive_sample_prompts = LoadArchiveTexts(path_in_name='sample_prompt_path', texts_out_name='sample_prompts')
         load_concept_prompts = LoadMultipleTexts(path_in_name='concept.text.prompt_path', texts_out_name='concept_prompts')
         filename_prompt = GetFilename(path_in_name='image_path', filename_out_name='filename_prompt', include_extension=False)
         select_prompt_input = SelectInput(setting_name='concept.text.prompt_source', out_name='prompts', setting_to_in_name_map={
@@ -98,21 +119,32 @@ class DataLoaderText2ImageMixin:
         }, default_in_name='sample_prompts')
         select_random_text = SelectRandomText(texts_in_name='prompts', text_out_name='prompt')
 
-        modules = [load_image, load_video]
+        modules = []
+
+        if use_source_cache:
+            modules.append(source_cache_image)
+            if config.masked_training:
+                modules.append(source_cache_mask)
+            if config.custom_conditioning_image:
+                modules.append(source_cache_cond)
+
+        modules.extend([load_image, load_archive_image, load_video])
 
         if allow_video:
             modules.append(image_to_video)
 
-        modules.extend([load_sample_prompts, load_concept_prompts, filename_prompt, select_prompt_input, select_random_text])
+        modules.extend([load_sample_prompts, load_archive_sample_prompts, load_concept_prompts, filename_prompt, select_prompt_input, select_random_text])
 
         if config.masked_training:
             modules.append(generate_mask)
             modules.append(load_mask)
+            modules.append(load_archive_mask)
         elif config.model_type.has_mask_input():
             modules.append(generate_mask)
 
         if config.custom_conditioning_image:
             modules.append(load_cond_image)
+            modules.append(load_archive_cond_image)
 
         if allow_video:
             modules.append(mask_to_video)
@@ -136,8 +168,27 @@ class DataLoaderText2ImageMixin:
 
         return modules
 
+    def _encode_vae(
+            self,
+            config: TrainConfig,
+            in_name: str,
+            out_name: str,
+            vae: AutoencoderKL,
+            autocast_contexts: list[torch.autocast | None] = None,
+            dtype: torch.dtype | None = None,
+    ):
+        # with latent caching, all samples are encoded in one pass, so samples of the same bucket can be batched
+        if config.latent_caching:
+            return BatchedEncodeVAE(in_name=in_name, out_name=out_name, resolution_in_name='crop_resolution', vae=vae, autocast_contexts=autocast_contexts, dtype=dtype, batch_size=config.caching_batch_size, num_workers=config.dataloader_threads)
+        return EncodeVAE(in_name=in_name, out_name=out_name, vae=vae, autocast_contexts=autocast_contexts, dtype=dtype)
+
     def _aspect_bucketing_in(self, config: TrainConfig, aspect_bucketing_quantization: int, frame_dim_enabled:bool=False):
-        calc_aspect = CalcAspect(image_in_name='image', resolution_out_name='original_resolution')
+        # the random mask rotate crop augmentation changes the resolution, those samples need to be decoded
+        calc_aspect = CalcAspectFromHeader(
+            path_in_name='image_path', image_in_name='image', resolution_out_name='original_resolution',
+            index_path=os.path.join(config.cache_dir, 'resolution_index.json'),
+            decode_enabled_in_name='concept.image.enable_random_mask_rotate_crop' if config.masked_training or config.model_type.has_mask_input() else None,
+        )
 
         aspect_bucketing_quantization = AspectBucketing(
             quantization=aspect_bucketing_quantization,
@@ -260,10 +311,10 @@ class DataLoaderText2ImageMixin:
         output_names = output_names + [
             ('concept.loss_weight', 'loss_weight'),
             ('concept.type', 'concept_type'),
+            ('concept.name', 'concept_name'),
         ]
 
         if config.validation:
-            output_names.append(('concept.name', 'concept_name'))
             output_names.append(('concept.path', 'concept_path'))
             output_names.append(('concept.seed', 'concept_seed'))
 
@@ -275,10 +326,7 @@ class DataLoaderText2ImageMixin:
             before_cache_fun=before_cache_image_fun,
         )
 
-        if config.latent_caching:
-            batch_sorting = AspectBatchSorting(resolution_in_name='crop_resolution', names=sort_names, batch_size=config.batch_size)
-        else:
-            batch_sorting = InlineAspectBatchSorting(resolution_in_name='crop_resolution', names=sort_names, batch_size=config.batch_size)
+        batch_sorting = self._batch_sorting(config, sort_names)
 
         output = OutputPipelineModule(names=output_names)
 
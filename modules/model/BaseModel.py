@@ -7,6 +7,7 @@ from modules.module.LoRAModule import LoRAModuleWrapper
 from modules.util.config.TrainConfig import TrainConfig
 from modules.util.enum.DataType import DataType
 from modules.util.enum.ModelType import ModelType
+from modules.util.ModelResidency import ModelResidency
 from modules.util.modelSpec.ModelSpec import ModelSpec
 from modules.util.NamedParameterGroup import NamedParameterGroupCollection
 from modules.util.TrainProgress import TrainProgress
@@ -76,6 +77,8 @@ class BaseModel(metaclass=ABCMeta):
     embedding_state_dicts: dict[str, dict[str, Tensor]] | None
     autocast_context: torch.autocast | nullcontext
     train_dtype: DataType
+    residency: ModelResidency
+    inference_only: bool
 
     def __init__(
             self,
@@ -93,6 +96,9 @@ class BaseModel(metaclass=ABCMeta):
         self.embedding_state_dicts = {}
         self.autocast_context = nullcontext()
         self.train_dtype = DataType.FLOAT_32
+        self.residency = ModelResidency()
+        # set before setup_model() if the model is only used for sampling. No optimizer or ema are created
+        self.inference_only = False
 
     @abstractmethod
     def to(self, device: torch.device):
@@ -106,6 +112,10 @@ class BaseModel(metaclass=ABCMeta):
     def adapters(self) -> list[LoRAModuleWrapper]:
         pass
 
+    def denoiser_adapter(self) -> LoRAModuleWrapper | None:
+        """Returns the adapter of the unet, transformer or prior, if it exists"""
+        return None
+
     @staticmethod
     def _add_embeddings_to_prompt(
             additional_embeddings: list[BaseModelEmbedding],
@@ -9,6 +9,7 @@ from modules.module.LoRAModule import LoRAModuleWrapper
 from modules.util.enum.DataType import DataType
 from modules.util.enum.ModelType import ModelType
 from modules.util.LayerOffloadConductor import LayerOffloadConductor
+from modules.util.ModelResidency import tracked_component_to
 
 import torch
 from torch import Tensor
@@ -175,6 +176,9 @@ class HiDreamModel(BaseModel):
             self.transformer_lora,
         ] if a is not None]
 
+    def denoiser_adapter(self) -> LoRAModuleWrapper | None:
+        return self.transformer_lora
+
     def all_embeddings(self) -> list[HiDreamModelEmbedding]:
         return self.additional_embeddings \
                + ([self.embedding] if self.embedding is not None else [])
@@ -195,6 +199,7 @@ class HiDreamModel(BaseModel):
         return [embedding.text_encoder_4_embedding for embedding in self.additional_embeddings] \
                + ([self.embedding.text_encoder_4_embedding] if self.embedding is not None else [])
 
+    @tracked_component_to("vae")
     def vae_to(self, device: torch.device):
         self.vae.to(device=device)
 
@@ -204,6 +209,7 @@ class HiDreamModel(BaseModel):
         self.text_encoder_3_to(device=device)
         self.text_encoder_4_to(device=device)
 
+    @tracked_component_to("text_encoder_1")
     def text_encoder_1_to(self, device: torch.device):
         if self.text_encoder_1 is not None:
             self.text_encoder_1.to(device=device)
@@ -211,6 +217,7 @@ class HiDreamModel(BaseModel):
         if self.text_encoder_1_lora is not None:
             self.text_encoder_1_lora.to(device)
 
+    @tracked_component_to("text_encoder_2")
     def text_encoder_2_to(self, device: torch.device):
         if self.text_encoder_2 is not None:
             self.text_encoder_2.to(device=device)
@@ -218,6 +225,7 @@ class HiDreamModel(BaseModel):
         if self.text_encoder_2_lora is not None:
             self.text_encoder_2_lora.to(device)
 
+    @tracked_component_to("text_encoder_3")
     def text_encoder_3_to(self, device: torch.device):
         if self.text_encoder_3 is not None:
             if self.text_encoder_3_offload_conductor is not None and \
@@ -229,6 +237,7 @@ class HiDreamModel(BaseModel):
         if self.text_encoder_3_lora is not None:
             self.text_encoder_3_lora.to(device)
 
+    @tracked_component_to("text_encoder_4")
     def text_encoder_4_to(self, device: torch.device):
         if self.text_encoder_4 is not None:
             if self.text_encoder_4_offload_conductor is not None and \
@@ -240,6 +249,7 @@ class HiDreamModel(BaseModel):
         if self.text_encoder_4_lora is not None:
             self.text_encoder_4_lora.to(device)
 
+    @tracked_component_to("transformer")
     def transformer_to(self, device: torch.device):
         if self.transformer_offload_conductor is not None and \
                 self.transformer_offload_conductor.layer_offload_activated():
@@ -9,6 +9,7 @@ from modules.module.LoRAModule import LoRAModuleWrapper
 from modules.util.enum.DataType import DataType
 from modules.util.enum.ModelType import ModelType
 from modules.util.LayerOffloadConductor import LayerOffloadConductor
+from modules.util.ModelResidency import tracked_component_to
 
 import torch
 from torch import Tensor
@@ -134,6 +135,9 @@ class HunyuanVideoModel(BaseModel):
             self.transformer_lora,
         ] if a is not None]
 
+    def denoiser_adapter(self) -> LoRAModuleWrapper | None:
+        return self.transformer_lora
+
     def all_embeddings(self) -> list[HunyuanVideoModelEmbedding]:
         return self.additional_embeddings \
                + ([self.embedding] if self.embedding is not None else [])
@@ -146,6 +150,7 @@ class HunyuanVideoModel(BaseModel):
         return [embedding.text_encoder_2_embedding for embedding in self.additional_embeddings] \
                + ([self.embedding.text_encoder_2_embedding] if self.embedding is not None else [])
 
+    @tracked_component_to("vae")
     def vae_to(self, device: torch.device):
         self.vae.to(device=device)
 
@@ -153,6 +158,7 @@ class HunyuanVideoModel(BaseModel):
         self.text_encoder_1_to(device=device)
         self.text_encoder_2_to(device=device)
 
+    @tracked_component_to("text_encoder_1")
     def text_encoder_1_to(self, device: torch.device):
         if self.text_encoder_1 is not None:
             if self.text_encoder_1_offload_conductor is not None and \
@@ -164,6 +170,7 @@ class HunyuanVideoModel(BaseModel):
         if self.text_encoder_1_lora is not None:
             self.text_encoder_1_lora.to(device)
 
+    @tracked_component_to("text_encoder_2")
     def text_encoder_2_to(self, device: torch.device):
         if self.text_encoder_2 is not None:
             self.text_encoder_2.to(device=device)
@@ -171,6 +178,7 @@ class HunyuanVideoModel(BaseModel):
         if self.text_encoder_2_lora is not None:
             self.text_encoder_2_lora.to(device)
 
+    @tracked_component_to("transformer")
     def transformer_to(self, device: torch.device):
         if self.transformer_offload_conductor is not None and \
                 self.transformer_offload_conductor.layer_offload_activated():
@@ -8,6 +8,7 @@ from modules.module.LoRAModule import LoRAModuleWrapper
 from modules.util.enum.DataType import DataType
 from modules.util.enum.ModelType import ModelType
 from modules.util.LayerOffloadConductor import LayerOffloadConductor
+from modules.util.ModelResidency import tracked_component_to
 
 import torch
 from torch import Tensor
@@ -100,6 +101,9 @@ class PixArtAlphaModel(BaseModel):
             self.transformer_lora,
         ] if a is not None]
 
+    def denoiser_adapter(self) -> LoRAModuleWrapper | None:
+        return self.transformer_lora
+
     def all_embeddings(self) -> list[PixArtAlphaModelEmbedding]:
         return self.additional_embeddings \
                + ([self.embedding] if self.embedding is not None else [])
@@ -108,9 +112,11 @@ class PixArtAlphaModel(BaseModel):
         return [embedding.text_encoder_embedding for embedding in self.additional_embeddings] \
                + ([self.embedding.text_encoder_embedding] if self.embedding is not None else [])
 
+    @tracked_component_to("vae")
     def vae_to(self, device: torch.device):
         self.vae.to(device=device)
 
+    @tracked_component_to("text_encoder")
     def text_encoder_to(self, device: torch.device):
         if self.text_encoder_offload_conductor is not None and \
                 self.text_encoder_offload_conductor.layer_offload_activated():
@@ -121,6 +127,7 @@ class PixArtAlphaModel(BaseModel):
         if self.text_encoder_lora is not None:
             self.text_encoder_lora.to(device)
 
+    @tracked_component_to("transformer")
     def transformer_to(self, device: torch.device):
         if self.transformer_offload_conductor is not None and \
                 self.transformer_offload_conductor.layer_offload_activated():
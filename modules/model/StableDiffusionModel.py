@@ -8,6 +8,7 @@ from modules.util.convert.rescale_noise_scheduler_to_zero_terminal_snr import (
     rescale_noise_scheduler_to_zero_terminal_snr,
 )
 from modules.util.enum.ModelType import ModelType
+from modules.util.ModelResidency import tracked_component_to
 
 import torch
 from torch import Tensor
@@ -96,6 +97,9 @@ class StableDiffusionModel(BaseModel):
             self.unet_lora,
         ] if a is not None]
 
+    def denoiser_adapter(self) -> LoRAModuleWrapper | None:
+        return self.unet_lora
+
     def all_embeddings(self) -> list[StableDiffusionModelEmbedding]:
         return self.additional_embeddings \
                + ([self.embedding] if self.embedding is not None else [])
@@ -104,19 +108,23 @@ class StableDiffusionModel(BaseModel):
         return [embedding.text_encoder_embedding for embedding in self.additional_embeddings] \
                + ([self.embedding.text_encoder_embedding] if self.embedding is not None else [])
 
+    @tracked_component_to("vae")
     def vae_to(self, device: torch.device):
         self.vae.to(device=device)
 
+    @tracked_component_to("depth_estimator")
     def depth_estimator_to(self, device: torch.device):
         if self.depth_estimator is not None:
             self.depth_estimator.to(device=device)
 
+    @tracked_component_to("text_encoder")
     def text_encoder_to(self, device: torch.device):
         self.text_encoder.to(device=device)
 
         if self.text_encoder_lora is not None:
             self.text_encoder_lora.to(device)
 
+    @tracked_component_to("unet")
     def unet_to(self, device: torch.device):
         self.unet.to(device=device)
 
@@ -10,6 +10,7 @@ from modules.util.convert.rescale_noise_scheduler_to_zero_terminal_snr import (
 )
 from modules.util.enum.DataType import DataType
 from modules.util.enum.ModelType import ModelType
+from modules.util.ModelResidency import tracked_component_to
 
 import torch
 from torch import Tensor
@@ -112,6 +113,9 @@ class StableDiffusionXLModel(BaseModel):
             self.unet_lora,
         ] if a is not None]
 
+    def denoiser_adapter(self) -> LoRAModuleWrapper | None:
+        return self.unet_lora
+
     def all_embeddings(self) -> list[StableDiffusionXLModelEmbedding]:
         return self.additional_embeddings \
                + ([self.embedding] if self.embedding is not None else [])
@@ -124,31 +128,29 @@ class StableDiffusionXLModel(BaseModel):
         return [embedding.text_encoder_2_embedding for embedding in self.additional_embeddings] \
                + ([self.embedding.text_encoder_2_embedding] if self.embedding is not None else [])
 
+    @tracked_component_to("vae")
     def vae_to(self, device: torch.device):
         self.vae.to(device=device)
 
     def text_encoder_to(self, device: torch.device):
-        self.text_encoder_1.to(device=device)
-        self.text_encoder_2.to(device=device)
-
-        if self.text_encoder_1_lora is not None:
-            self.text_encoder_1_lora.to(device)
-
-        if self.text_encoder_2_lora is not None:
-            self.text_encoder_2_lora.to(device)
+        self.text_encoder_1_to(device=device)
+        self.text_encoder_2_to(device=device)
 
+    @tracked_component_to("text_encoder_1")
     def text_encoder_1_to(self, device: torch.device):
         self.text_encoder_1.to(device=device)
 
         if self.text_encoder_1_lora is not None:
             self.text_encoder_1_lora.to(device)
 
+    @tracked_component_to("text_encoder_2")
     def text_encoder_2_to(self, device: torch.device):
         self.text_encoder_2.to(device=device)
 
         if self.text_encoder_2_lora is not None:
             self.text_encoder_2_lora.to(device)
 
+    @tracked_component_to("unet")
     def unet_to(self, device: torch.device):
         self.unet.to(device=device)
 
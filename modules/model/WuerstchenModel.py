@@ -6,6 +6,7 @@ from modules.module.AdditionalEmbeddingWrapper import AdditionalEmbeddingWrapper
 from modules.module.LoRAModule import LoRAModuleWrapper
 from modules.util.enum.DataType import DataType
 from modules.util.enum.ModelType import ModelType
+from modules.util.ModelResidency import tracked_component_to
 
 import torch
 import torchvision
@@ -129,6 +130,9 @@ class WuerstchenModel(BaseModel):
             self.prior_prior_lora,
         ] if a is not None]
 
+    def denoiser_adapter(self) -> LoRAModuleWrapper | None:
+        return self.prior_prior_lora
+
     def all_embeddings(self) -> list[WuerstchenModelEmbedding]:
         return self.additional_embeddings \
                + ([self.embedding] if self.embedding is not None else [])
@@ -137,24 +141,30 @@ class WuerstchenModel(BaseModel):
         return [embedding.text_encoder_embedding for embedding in self.additional_embeddings] \
                + ([self.embedding.prior_text_encoder_embedding] if self.embedding is not None else [])
 
+    @tracked_component_to("decoder_text_encoder")
     def decoder_text_encoder_to(self, device: torch.device):
         self.decoder_text_encoder.to(device=device)
 
+    @tracked_component_to("decoder_decoder")
     def decoder_decoder_to(self, device: torch.device):
         self.decoder_decoder.to(device=device)
 
+    @tracked_component_to("decoder_vqgan")
     def decoder_vqgan_to(self, device: torch.device):
         self.decoder_vqgan.to(device=device)
 
+    @tracked_component_to("effnet_encoder")
     def effnet_encoder_to(self, device: torch.device):
         self.effnet_encoder.to(device=device)
 
+    @tracked_component_to("prior_text_encoder")
     def prior_text_encoder_to(self, device: torch.device):
         self.prior_text_encoder.to(device=device)
 
         if self.prior_text_encoder_lora is not None:
             self.prior_text_encoder_lora.to(device)
 
+    @tracked_component_to("prior_prior")
     def prior_prior_to(self, device: torch.device):
         self.prior_prior.to(device=device)
 
@@ -5,6 +5,7 @@ import traceback
 from modules.model.WuerstchenModel import WuerstchenEfficientNetEncoder, WuerstchenModel
 from modules.modelLoader.mixin.HFModelLoaderMixin import HFModelLoaderMixin
 from modules.util.convert.convert_stable_cascade_ckpt_to_diffusers import convert_stable_cascade_ckpt_to_diffusers
+from modules.util.convert.lazy_conversion import SafetensorsSource, load_state_dict_lazy
 from modules.util.enum.ModelType import ModelType
 from modules.util.ModelNames import ModelNames
 from modules.util.ModelWeightDtypes import ModelWeightDtypes
@@ -138,7 +139,10 @@ class WuerstchenModelLoader(
                     with open(config_filename, "r") as config_file:
                         prior_config = json.load(config_file)
                 prior_prior = StableCascadeUNet(**prior_config)
-                prior_prior.load_state_dict(convert_stable_cascade_ckpt_to_diffusers(load_file(prior_prior_model_name)))
+                # tensors are read from the memory mapped file and converted one at a time
+                load_state_dict_lazy(
+                    prior_prior, convert_stable_cascade_ckpt_to_diffusers(SafetensorsSource(prior_prior_model_name))
+                )
                 prior_prior = self._convert_diffusers_sub_module_to_dtype(
                     prior_prior, weight_dtypes.prior, weight_dtypes.fallback_train_dtype
                 )
@@ -11,8 +11,6 @@ import torch
 
 from transformers import T5EncoderModel
 
-from safetensors.torch import save_file
-
 
 class FluxModelSaver(
     DtypeModelSaverMixin,
@@ -74,15 +72,14 @@ class FluxModelSaver(
             destination: str,
             dtype: torch.dtype | None,
     ):
+        # the converted tensors are created one at a time while they are written
         state_dict = convert_flux_diffusers_to_ckpt(
             model.transformer.state_dict(),
         )
-        save_state_dict = self._convert_state_dict_dtype(state_dict, dtype)
-        self._convert_state_dict_to_contiguous(save_state_dict)
 
         os.makedirs(Path(destination).parent.absolute(), exist_ok=True)
 
-        save_file(save_state_dict, destination, self._create_safetensors_header(model, save_state_dict))
+        self._save_safetensors_streaming(model, state_dict, destination, dtype)
 
     def __save_internal(
             self,
@@ -2,10 +2,12 @@ import copy
 import hashlib
 import json
 from collections import OrderedDict
+from collections.abc import Mapping
 from datetime import datetime
 
 from modules.model.BaseModel import BaseModel
 from modules.util import git_util
+from modules.util.convert.lazy_conversion import save_safetensors_streaming
 from modules.util.enum.ConfigPart import ConfigPart
 from modules.util.modelSpec.ModelSpec import ModelSpec
 
@@ -93,3 +95,19 @@ class DtypeModelSaverMixin:
         elif model.model_type.is_sd_v2():
             kohya_header["ss_v2"] = "True"
         return model_spec_dict | one_trainer_header | kohya_header
+
+    def _save_safetensors_streaming(
+            self,
+            model: BaseModel,
+            state_dict: Mapping[str, Tensor],
+            destination: str,
+            dtype: torch.dtype | None,
+    ):
+        # converts and writes one tensor at a time. The hash is calculated while writing
+        save_safetensors_streaming(
+            state_dict,
+            destination,
+            self._create_safetensors_header(model),
+            dtype,
+            hash_key="modelspec.hash_sha256",
+        )
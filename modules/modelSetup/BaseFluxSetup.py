@@ -190,6 +190,11 @@ class BaseFluxSetup(
                     and not self.stop_embedding_training_elapsed(embedding_config, model.train_progress)
                 embedding.requires_grad_(train_embedding_2)
 
+    def single_pass_prior_batch_dims(self) -> dict[str, int]:
+        return {
+            "hidden_states": 0, "timestep": 0, "guidance": 0, "pooled_projections": 0, "encoder_hidden_states": 0,
+        }
+
     def predict(
             self,
             model: FluxModel,
@@ -200,7 +205,7 @@ class BaseFluxSetup(
             deterministic: bool = False,
     ) -> dict:
         with model.autocast_context:
-            batch_seed = 0 if deterministic else train_progress.global_step
+            batch_seed = self._deterministic_seed if deterministic else train_progress.global_step
             generator = torch.Generator(device=config.train_device)
             generator.manual_seed(batch_seed)
             rand = Random(batch_seed)
@@ -234,7 +239,7 @@ class BaseFluxSetup(
                 scaled_latent_conditioning_image = \
                     (batch['latent_conditioning_image'] - vae_shift_factor) * vae_scaling_factor
 
-            latent_noise = self._create_noise(scaled_latent_image, config, generator)
+            latent_noise = self._create_noise(scaled_latent_image, config, generator, deterministic)
 
             timestep = self._get_timestep_discrete(
                 model.noise_scheduler.config['num_train_timesteps'],
@@ -374,7 +379,7 @@ class BaseFluxSetup(
 
         return model_output_data
 
-    def calculate_loss(
+    def calculate_losses(
             self,
             model: FluxModel,
             batch: dict,
@@ -387,4 +392,4 @@ class BaseFluxSetup(
             config=config,
             train_device=self.train_device,
             sigmas=model.noise_scheduler.sigmas.to(device=self.train_device),
-        ).mean()
+        )
@@ -278,6 +278,14 @@ class BaseHiDreamSetup(
                     and not self.stop_embedding_training_elapsed(embedding_config, model.train_progress)
                 embedding.requires_grad_(train_embedding_4)
 
+    def single_pass_prior_batch_dims(self) -> dict[str, int]:
+        return {
+            "hidden_states": 0, "timesteps": 0, "encoder_hidden_states_t5": 0, "pooled_embeds": 0,
+            "hidden_states_masks": 0, "img_sizes": 0, "img_ids": 0,
+            # the llama3 hidden states of all layers are stacked in the first dimension
+            "encoder_hidden_states_llama3": 1,
+        }
+
     def predict(
             self,
             model: HiDreamModel,
@@ -288,7 +296,7 @@ class BaseHiDreamSetup(
             deterministic: bool = False,
     ) -> dict:
         with model.autocast_context:
-            batch_seed = 0 if deterministic else train_progress.global_step
+            batch_seed = self._deterministic_seed if deterministic else train_progress.global_step
             generator = torch.Generator(device=config.train_device)
             generator.manual_seed(batch_seed)
             rand = Random(batch_seed)
@@ -331,7 +339,7 @@ class BaseHiDreamSetup(
                 scaled_latent_conditioning_image = \
                     (batch['latent_conditioning_image'] - vae_shift_factor) * vae_scaling_factor
 
-            latent_noise = self._create_noise(scaled_latent_image, config, generator)
+            latent_noise = self._create_noise(scaled_latent_image, config, generator, deterministic)
 
             timestep = self._get_timestep_discrete(
                 model.noise_scheduler.config['num_train_timesteps'],
@@ -458,7 +466,7 @@ class BaseHiDreamSetup(
 
         return model_output_data
 
-    def calculate_loss(
+    def calculate_losses(
             self,
             model: HiDreamModel,
             batch: dict,
@@ -471,4 +479,4 @@ class BaseHiDreamSetup(
             config=config,
             train_device=self.train_device,
             sigmas=model.noise_scheduler.sigmas.to(device=self.train_device),
-        ).mean()
+        )
@@ -192,6 +192,12 @@ class BaseHunyuanVideoSetup(
                     and not self.stop_embedding_training_elapsed(embedding_config, model.train_progress)
                 embedding.requires_grad_(train_embedding_2)
 
+    def single_pass_prior_batch_dims(self) -> dict[str, int]:
+        return {
+            "hidden_states": 0, "timestep": 0, "guidance": 0, "pooled_projections": 0, "encoder_hidden_states": 0,
+            "encoder_attention_mask": 0,
+        }
+
     def predict(
             self,
             model: HunyuanVideoModel,
@@ -202,7 +208,7 @@ class BaseHunyuanVideoSetup(
             deterministic: bool = False,
     ) -> dict:
         with model.autocast_context:
-            batch_seed = 0 if deterministic else train_progress.global_step
+            batch_seed = self._deterministic_seed if deterministic else train_progress.global_step
             generator = torch.Generator(device=config.train_device)
             generator.manual_seed(batch_seed)
             rand = Random(batch_seed)
@@ -232,7 +238,7 @@ class BaseHunyuanVideoSetup(
             if scaled_latent_image.ndim == 4:
                 scaled_latent_image = scaled_latent_image.unsqueeze(2)
 
-            latent_noise = self._create_noise(scaled_latent_image, config, generator)
+            latent_noise = self._create_noise(scaled_latent_image, config, generator, deterministic)
 
             timestep = self._get_timestep_discrete(
                 model.noise_scheduler.config['num_train_timesteps'],
@@ -337,7 +343,7 @@ class BaseHunyuanVideoSetup(
 
         return model_output_data
 
-    def calculate_loss(
+    def calculate_losses(
             self,
             model: HunyuanVideoModel,
             batch: dict,
@@ -350,4 +356,4 @@ class BaseHunyuanVideoSetup(
             config=config,
             train_device=self.train_device,
             sigmas=model.noise_scheduler.sigmas.to(device=self.train_device),
-        ).mean()
+        )
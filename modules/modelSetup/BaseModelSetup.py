@@ -1,3 +1,5 @@
+import dataclasses
+import inspect
 from abc import ABCMeta, abstractmethod
 from contextlib import contextmanager
 
@@ -6,6 +8,7 @@ from modules.util.config.TrainConfig import TrainConfig, TrainEmbeddingConfig
 from modules.util.enum.TrainingMethod import TrainingMethod
 from modules.util.NamedParameterGroup import NamedParameterGroupCollection
 from modules.util.TimedActionMixin import TimedActionMixin
+from modules.util.torch_util import set_module_output_device
 from modules.util.TrainProgress import TrainProgress
 
 import torch
@@ -62,6 +65,26 @@ class BaseModelSetup(
     ):
         pass
 
+    def _text_encoder_device(
+            self,
+            config: TrainConfig,
+            text_encoder: torch.nn.Module | None,
+            train: bool,
+    ) -> torch.device:
+        """
+        Returns the device of a text encoder that is used during training. If a text encoder device is configured,
+        frozen text encoders encode on that device, and only their outputs are moved to the train device.
+        """
+        if text_encoder is None:
+            return self.train_device
+
+        if train or not config.text_encoder_device:
+            set_module_output_device(text_encoder, None)
+            return self.train_device
+
+        set_module_output_device(text_encoder, self.train_device)
+        return torch.device(config.text_encoder_device)
+
     @abstractmethod
     def predict(
             self,
@@ -75,6 +98,15 @@ class BaseModelSetup(
         pass
 
     @abstractmethod
+    def calculate_losses(
+            self,
+            model: BaseModel,
+            batch: dict,
+            data: dict,
+            config: TrainConfig,
+    ) -> Tensor:
+        """returns the loss of each sample in the batch"""
+
     def calculate_loss(
             self,
             model: BaseModel,
@@ -82,7 +114,7 @@ class BaseModelSetup(
             data: dict,
             config: TrainConfig,
     ) -> Tensor:
-        pass
+        return self.calculate_losses(model, batch, data, config).mean()
 
     @abstractmethod
     def after_optimizer_step(
@@ -214,3 +246,105 @@ class BaseModelSetup(
         finally:
             for adapter in model.adapters():
                 adapter.hook_to_module()
+
+    def single_pass_prior_batch_dims(self) -> dict[str, int]:
+        """
+        Names the batched arguments of the denoiser, mapped to their batch dimension. single_pass_prior_model()
+        only doubles these arguments. Setups that don't name any arguments don't support the single pass.
+        """
+        return {}
+
+    def supports_single_pass_prior_model(self, model: BaseModel) -> bool:
+        # text encoder adapters would have to be disabled before the conditioning is calculated,
+        # which needs a separate forward pass
+        denoiser_adapter = model.denoiser_adapter()
+        return len(self.single_pass_prior_batch_dims()) > 0 \
+            and denoiser_adapter is not None \
+            and all(adapter is denoiser_adapter for adapter in model.adapters())
+
+    @contextmanager
+    def single_pass_prior_model(self, model: BaseModel, config: TrainConfig, batch_size: int):
+        """
+        Calculates the prior prediction in the same forward pass as the trained prediction. The inputs of the
+        denoiser are doubled along the batch dimension, and the adapter is disabled for the second half. The prior
+        half of the output is stored. Calling predict() inside the context returned by the yielded function replays
+        the stored output instead of running the denoiser, so the prior prediction gets the same post-processing.
+
+        The context needs to stay open until backward() is done, because checkpointed layers are recalculated
+        during the backward pass, and need the same per-sample scales.
+        """
+        if config.training_method is not TrainingMethod.LORA:
+            raise NotImplementedError("Prior model is only available with LoRA training")
+
+        adapter = model.denoiser_adapter()
+        denoiser = adapter.orig_module
+        signature = inspect.signature(denoiser.forward)
+        batch_dims = self.single_pass_prior_batch_dims()
+        prior_outputs = []
+        replaying = False
+
+        def double(data, dim: int):
+            # nested containers, like added_cond_kwargs, only contain batched tensors
+            if isinstance(data, Tensor):
+                return torch.cat([data, data], dim=dim)
+            elif isinstance(data, list | tuple):
+                return type(data)(double(x, dim) for x in data)
+            elif isinstance(data, dict):
+                return {key: double(value, dim) for key, value in data.items()}
+            return data
+
+        def split(output):
+            if isinstance(output, Tensor):
+                return output[:batch_size], output[batch_size:].detach()
+            elif isinstance(output, tuple):
+                trained_output, prior_output = split(output[0])
+                return (trained_output, *output[1:]), (prior_output, *output[1:])
+            elif dataclasses.is_dataclass(output) and hasattr(output, "sample"):
+                trained_output, prior_output = split(output.sample)
+                return dataclasses.replace(output, sample=trained_output), \
+                    dataclasses.replace(output, sample=prior_output)
+            raise NotImplementedError(f"Can't split denoiser output of type {type(output)}")
+
+        def forward_pre_hook(module, args, kwargs):
+            if replaying:
+                return None
+            arguments = signature.bind(*args, **kwargs)
+            for name, dim in batch_dims.items():
+                if name in arguments.arguments:
+                    arguments.arguments[name] = double(arguments.arguments[name], dim)
+            return arguments.args, arguments.kwargs
+
+        def forward_hook(module, args, kwargs, output):
+            if replaying:
+                return None
+            trained_output, prior_output = split(output)
+            prior_outputs.append(prior_output)
+            return trained_output
+
+        @contextmanager
+        def replay_prior_model():
+            nonlocal replaying
+            replaying = True
+            orig_forward = denoiser.__dict__.get("forward")
+            denoiser.forward = lambda *args, **kwargs: prior_outputs.pop(0)
+            try:
+                yield
+            finally:
+                if orig_forward is None:
+                    del denoiser.forward
+                else:
+                    denoiser.forward = orig_forward
+                replaying = False
+
+        pre_hook_handle = denoiser.register_forward_pre_hook(forward_pre_hook, with_kwargs=True)
+        hook_handle = denoiser.register_forward_hook(forward_hook, with_kwargs=True)
+        adapter.set_sample_scale(torch.cat([
+            torch.ones(batch_size, device=self.train_device),
+            torch.zeros(batch_size, device=self.train_device),
+        ]))
+        try:
+            yield replay_prior_model
+        finally:
+            adapter.set_sample_scale(None)
+            pre_hook_handle.remove()
+            hook_handle.remove()
@@ -156,6 +156,9 @@ class BaseSanaSetup(
                 and not self.stop_embedding_training_elapsed(embedding_config, model.train_progress)
             embedding.requires_grad_(train_embedding)
 
+    def single_pass_prior_batch_dims(self) -> dict[str, int]:
+        return {"hidden_states": 0, "encoder_hidden_states": 0, "encoder_attention_mask": 0, "timestep": 0}
+
     def predict(
             self,
             model: SanaModel,
@@ -166,7 +169,7 @@ class BaseSanaSetup(
             deterministic: bool = False,
     ) -> dict:
         with model.autocast_context:
-            batch_seed = 0 if deterministic else train_progress.global_step
+            batch_seed = self._deterministic_seed if deterministic else train_progress.global_step
             generator = torch.Generator(device=config.train_device)
             generator.manual_seed(batch_seed)
             rand = Random(batch_seed)
@@ -192,7 +195,7 @@ class BaseSanaSetup(
             if config.model_type.has_conditioning_image_input():
                 scaled_latent_conditioning_image = batch['latent_conditioning_image'] * vae_scaling_factor
 
-            latent_noise = self._create_noise(scaled_latent_image, config, generator)
+            latent_noise = self._create_noise(scaled_latent_image, config, generator, deterministic)
 
             timestep = self._get_timestep_discrete(
                 model.noise_scheduler.config['num_train_timesteps'],
@@ -293,7 +296,7 @@ class BaseSanaSetup(
 
         return model_output_data
 
-    def calculate_loss(
+    def calculate_losses(
             self,
             model: SanaModel,
             batch: dict,
@@ -306,4 +309,4 @@ class BaseSanaSetup(
             config=config,
             train_device=self.train_device,
             betas=model.noise_scheduler.betas.to(device=self.train_device),
-        ).mean()
+        )
@@ -132,6 +132,9 @@ class BaseStableDiffusionSetup(
                 and not self.stop_embedding_training_elapsed(embedding_config, model.train_progress)
             embedding.requires_grad_(train_embedding)
 
+    def single_pass_prior_batch_dims(self) -> dict[str, int]:
+        return {"sample": 0, "timestep": 0, "encoder_hidden_states": 0, "class_labels": 0}
+
     def predict(
             self,
             model: StableDiffusionModel,
@@ -142,7 +145,7 @@ class BaseStableDiffusionSetup(
             deterministic: bool = False,
     ) -> dict:
         with model.autocast_context:
-            batch_seed = 0 if deterministic else train_progress.global_step
+            batch_seed = self._deterministic_seed if deterministic else train_progress.global_step
             generator = torch.Generator(device=config.train_device)
             generator.manual_seed(batch_seed)
             rand = Random(batch_seed)
@@ -167,7 +170,7 @@ class BaseStableDiffusionSetup(
             if config.model_type.has_conditioning_image_input():
                 scaled_latent_conditioning_image = batch['latent_conditioning_image'] * vae_scaling_factor
 
-            latent_noise = self._create_noise(scaled_latent_image, config, generator)
+            latent_noise = self._create_noise(scaled_latent_image, config, generator, deterministic)
 
             timestep = self._get_timestep_discrete(
                 model.noise_scheduler.config['num_train_timesteps'],
@@ -309,7 +312,7 @@ class BaseStableDiffusionSetup(
             model_output_data['prediction_type'] = model.noise_scheduler.config.prediction_type
             return model_output_data
 
-    def calculate_loss(
+    def calculate_losses(
             self,
             model: StableDiffusionModel,
             batch: dict,
@@ -322,4 +325,4 @@ class BaseStableDiffusionSetup(
             config=config,
             train_device=self.train_device,
             betas=model.noise_scheduler.betas.to(device=self.train_device),
-        ).mean()
+        )
@@ -176,6 +176,9 @@ class BaseStableDiffusionXLSetup(
                 and not self.stop_embedding_training_elapsed(embedding_config, model.train_progress)
             embedding.requires_grad_(train_embedding_2)
 
+    def single_pass_prior_batch_dims(self) -> dict[str, int]:
+        return {"sample": 0, "timestep": 0, "encoder_hidden_states": 0, "added_cond_kwargs": 0}
+
     def predict(
             self,
             model: StableDiffusionXLModel,
@@ -186,7 +189,7 @@ class BaseStableDiffusionXLSetup(
             deterministic: bool = False,
     ) -> dict:
         with model.autocast_context:
-            batch_seed = 0 if deterministic else train_progress.global_step
+            batch_seed = self._deterministic_seed if deterministic else train_progress.global_step
             generator = torch.Generator(device=config.train_device)
             generator.manual_seed(batch_seed)
             rand = Random(batch_seed)
@@ -218,7 +221,7 @@ class BaseStableDiffusionXLSetup(
             if config.model_type.has_conditioning_image_input():
                 scaled_latent_conditioning_image = batch['latent_conditioning_image'] * vae_scaling_factor
 
-            latent_noise = self._create_noise(scaled_latent_image, config, generator)
+            latent_noise = self._create_noise(scaled_latent_image, config, generator, deterministic)
 
             timestep = self._get_timestep_discrete(
                 model.noise_scheduler.config['num_train_timesteps'],
@@ -357,7 +360,7 @@ class BaseStableDiffusionXLSetup(
         model_output_data['prediction_type'] = model.noise_scheduler.config.prediction_type
         return model_output_data
 
-    def calculate_loss(
+    def calculate_losses(
             self,
             model: StableDiffusionXLModel,
             batch: dict,
@@ -370,4 +373,4 @@ class BaseStableDiffusionXLSetup(
             config=config,
             train_device=self.train_device,
             betas=model.noise_scheduler.betas.to(device=self.train_device),
-        ).mean()
+        )
@@ -180,6 +180,14 @@ class BaseWuerstchenSetup(
             alpha_cumprod = alpha_cumprod.unsqueeze(-1)
         return alpha_cumprod
 
+    def single_pass_prior_batch_dims(self) -> dict[str, int]:
+        return {
+            # Wuerstchen v2 prior
+            "x": 0, "r": 0, "c": 0,
+            # Stable Cascade prior
+            "sample": 0, "timestep_ratio": 0, "clip_text_pooled": 0, "clip_text": 0, "clip_img": 0,
+        }
+
     def predict(
             self,
             model: WuerstchenModel,
@@ -196,12 +204,12 @@ class BaseWuerstchenSetup(
             elif model.model_type.is_stable_cascade():
                 scaled_latent_image = latent_image
 
-            batch_seed = 0 if deterministic else train_progress.global_step
+            batch_seed = self._deterministic_seed if deterministic else train_progress.global_step
             generator = torch.Generator(device=config.train_device)
             generator.manual_seed(batch_seed)
             rand = Random(batch_seed)
 
-            latent_noise = self._create_noise(scaled_latent_image, config, generator)
+            latent_noise = self._create_noise(scaled_latent_image, config, generator, deterministic)
 
             timestep = self._get_timestep_continuous(
                 deterministic,
@@ -332,7 +340,7 @@ class BaseWuerstchenSetup(
 
         return model_output_data
 
-    def calculate_loss(
+    def calculate_losses(
             self,
             model: WuerstchenModel,
             batch: dict,
@@ -345,4 +353,4 @@ class BaseWuerstchenSetup(
             config=config,
             train_device=self.train_device,
             alphas_cumprod_fun=self.__alpha_cumprod,
-        ).mean()
+        )
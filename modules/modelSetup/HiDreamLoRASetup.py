@@ -256,10 +256,10 @@ class HiDreamLoRASetup(
             config.train_text_encoder_4_or_embedding() \
             or not config.latent_caching
 
-        model.text_encoder_1_to(self.train_device if text_encoder_1_on_train_device else self.temp_device)
-        model.text_encoder_2_to(self.train_device if text_encoder_2_on_train_device else self.temp_device)
-        model.text_encoder_3_to(self.train_device if text_encoder_3_on_train_device else self.temp_device)
-        model.text_encoder_4_to(self.train_device if text_encoder_4_on_train_device else self.temp_device)
+        model.text_encoder_1_to(self._text_encoder_device(config, model.text_encoder_1, config.train_text_encoder_or_embedding()) if text_encoder_1_on_train_device else self.temp_device)
+        model.text_encoder_2_to(self._text_encoder_device(config, model.text_encoder_2, config.train_text_encoder_2_or_embedding()) if text_encoder_2_on_train_device else self.temp_device)
+        model.text_encoder_3_to(self._text_encoder_device(config, model.text_encoder_3, config.train_text_encoder_3_or_embedding()) if text_encoder_3_on_train_device else self.temp_device)
+        model.text_encoder_4_to(self._text_encoder_device(config, model.text_encoder_4, config.train_text_encoder_4_or_embedding()) if text_encoder_4_on_train_device else self.temp_device)
         model.vae_to(self.train_device if vae_on_train_device else self.temp_device)
         model.transformer_to(self.train_device)
 
@@ -131,7 +131,7 @@ class PixArtAlphaLoRASetup(
             or config.train_any_embedding() \
             or not config.latent_caching
 
-        model.text_encoder_to(self.train_device if text_encoder_on_train_device else self.temp_device)
+        model.text_encoder_to(self._text_encoder_device(config, model.text_encoder, config.text_encoder.train or config.train_any_embedding()) if text_encoder_on_train_device else self.temp_device)
         model.vae_to(self.train_device if vae_on_train_device else self.temp_device)
         model.transformer_to(self.train_device)
 
@@ -105,7 +105,7 @@ class WuerstchenFineTuneSetup(
             or config.train_any_embedding() \
             or not config.latent_caching
 
-        model.prior_text_encoder_to(self.train_device if text_encoder_on_train_device else self.temp_device)
+        model.prior_text_encoder_to(self._text_encoder_device(config, model.prior_text_encoder, config.text_encoder.train or config.train_any_embedding()) if text_encoder_on_train_device else self.temp_device)
         model.prior_prior_to(self.train_device)
 
         if model.model_type.is_wuerstchen_v2():
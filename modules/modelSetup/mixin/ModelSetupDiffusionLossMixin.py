@@ -242,7 +242,7 @@ class ModelSetupDiffusionLossMixin(metaclass=ABCMeta):
         loss_weight = batch['loss_weight']
         batch_size_scale = \
             1 if config.loss_scaler in [LossScaler.NONE, LossScaler.GRADIENT_ACCUMULATION] \
-                else config.batch_size
+                else loss_weight.shape[0]
         gradient_accumulation_steps_scale = \
             1 if config.loss_scaler in [LossScaler.NONE, LossScaler.BATCH] \
                 else config.gradient_accumulation_steps
@@ -289,7 +289,7 @@ class ModelSetupDiffusionLossMixin(metaclass=ABCMeta):
         loss_weight = batch['loss_weight']
         batch_size_scale = \
             1 if config.loss_scaler in [LossScaler.NONE, LossScaler.GRADIENT_ACCUMULATION] \
-                else config.batch_size
+                else loss_weight.shape[0]
         gradient_accumulation_steps_scale = \
             1 if config.loss_scaler in [LossScaler.NONE, LossScaler.BATCH] \
                 else config.gradient_accumulation_steps
@@ -14,12 +14,43 @@ class ModelSetupNoiseMixin(metaclass=ABCMeta):
         super().__init__()
 
         self.__weights = None
+        self._deterministic_seed = 0
+        self._deterministic_timestep = 0.5
+        self._deterministic_sample_seeds = None
+
+    def set_deterministic_noise(self, seed: int = 0, timestep: float = 0.5, sample_seeds: list[int] | None = None):
+        """
+        Sets the seed and the timestep used by predict() if deterministic is True.
+        The timestep is a fraction of the noise schedule, between 0 and 1.
+        If sample_seeds is set, the noise of each sample of the next batches is created from its own seed,
+        so it doesn't depend on the position of the sample in the batch, or on the batch size.
+        """
+        self._deterministic_seed = seed
+        self._deterministic_timestep = timestep
+        self._deterministic_sample_seeds = sample_seeds
 
     def _create_noise(
             self,
             source_tensor: Tensor,
             config: TrainConfig,
-            generator: Generator
+            generator: Generator,
+            deterministic: bool = False,
+    ) -> Tensor:
+        if deterministic and self._deterministic_sample_seeds is not None:
+            noise = []
+            for i, sample_seed in enumerate(self._deterministic_sample_seeds):
+                sample_generator = torch.Generator(device=generator.device)
+                sample_generator.manual_seed(sample_seed)
+                noise.append(self.__create_noise(source_tensor[i:i + 1], config, sample_generator))
+            return torch.cat(noise)
+
+        return self.__create_noise(source_tensor, config, generator)
+
+    def __create_noise(
+            self,
+            source_tensor: Tensor,
+            config: TrainConfig,
+            generator: Generator,
     ) -> Tensor:
         noise = torch.randn(
             source_tensor.shape,
@@ -61,7 +92,7 @@ class ModelSetupNoiseMixin(metaclass=ABCMeta):
         if deterministic:
             # -1 is for zero-based indexing
             return torch.tensor(
-                int(num_train_timesteps * 0.5) - 1,
+                max(int(num_train_timesteps * self._deterministic_timestep) - 1, 0),
                 dtype=torch.long,
                 device=generator.device,
             ).unsqueeze(0)
@@ -164,7 +195,7 @@ class ModelSetupNoiseMixin(metaclass=ABCMeta):
         if deterministic:
             return torch.full(
                 size=(batch_size,),
-                fill_value=0.5,
+                fill_value=self._deterministic_timestep,
                 device=generator.device,
             )
         else:
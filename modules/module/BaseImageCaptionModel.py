@@ -1,7 +1,9 @@
 import contextlib
 import os
 from abc import ABCMeta, abstractmethod
+from collections import deque
 from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 from modules.util import path_util
@@ -44,6 +46,8 @@ class CaptionSample:
         self.captions = [caption]
 
     def add_caption(self, caption: str):
+        if self.captions is None:
+            self.captions = []
         self.captions.append(caption)
 
     def save_caption(self):
@@ -69,6 +73,8 @@ class BaseImageCaptionModel(metaclass=ABCMeta):
             self,
             caption_sample: CaptionSample,
             initial_caption: str = "",
+            caption_prefix: str = "",
+            caption_postfix: str = "",
     ) -> str:
         """
         Generates caption for a single CaptionSample
@@ -76,10 +82,91 @@ class BaseImageCaptionModel(metaclass=ABCMeta):
         Args:
             caption_sample (`CaptionSample`): the sample to caption
             initial_caption (`str`): the initial caption
+            caption_prefix (`str`): add this to the start of the generated caption
+            caption_postfix (`str`): add this to the end of the generated caption
 
         Returns: the generated caption
         """
 
+    def generate_captions(
+            self,
+            caption_samples: list[CaptionSample],
+            initial_caption: str = "",
+            caption_prefix: str = "",
+            caption_postfix: str = "",
+    ) -> list[str]:
+        """
+        Generates captions for a batch of CaptionSamples. Models that support batched inference override this,
+        the default implementation captions one sample at a time.
+
+        Args:
+            caption_samples (`[CaptionSample]`): the samples to caption
+            initial_caption (`str`): the initial caption
+            caption_prefix (`str`): add this to the start of the generated captions
+            caption_postfix (`str`): add this to the end of the generated captions
+
+        Returns: the generated captions, in the same order as the samples
+        """
+        return [
+            self.generate_caption(caption_sample, initial_caption, caption_prefix, caption_postfix)
+            for caption_sample in caption_samples
+        ]
+
+    def prepare_image(self, image: Image) -> Image:
+        """
+        Prepares a loaded image for captioning, for example by resizing it to the input size of the model.
+        Called from the loading threads of caption_images, so it should only do thread safe CPU work.
+
+        Args:
+            image (`Image`): the loaded image
+
+        Returns: the prepared image
+        """
+        return image
+
+    @staticmethod
+    def __apply_caption(caption_sample: CaptionSample, predicted_caption: str, mode: str):
+        if mode == 'replace' or mode == 'fill':
+            caption_sample.set_caption(predicted_caption)
+
+        if mode == 'add':
+            caption_sample.add_caption(predicted_caption)
+
+    def __load_sample(self, filename: str, mode: str) -> CaptionSample | None:
+        caption_sample = CaptionSample(filename)
+
+        existing_caption = caption_sample.get_caption()
+        if mode == 'fill' and existing_caption is not None and existing_caption != "":
+            return None
+
+        caption_sample.image = self.prepare_image(caption_sample.get_image())
+        return caption_sample
+
+    def __caption_batch(
+            self,
+            caption_samples: list[CaptionSample],
+            initial_caption: str,
+            caption_prefix: str,
+            caption_postfix: str,
+            error_callback: Callable[[str], None] | None,
+    ) -> list[tuple[CaptionSample, str]]:
+        try:
+            predicted_captions = self.generate_captions(caption_samples, initial_caption, caption_prefix, caption_postfix)
+            return list(zip(caption_samples, predicted_captions, strict=True))
+        except Exception:
+            if len(caption_samples) == 1:
+                if error_callback is not None:
+                    error_callback(caption_samples[0].image_filename)
+                return []
+
+        # retry the samples of a failed batch one at a time, so a single broken sample doesn't fail the whole batch
+        results = []
+        for caption_sample in caption_samples:
+            results.extend(self.__caption_batch(
+                [caption_sample], initial_caption, caption_prefix, caption_postfix, error_callback
+            ))
+        return results
+
     def caption_image(
             self,
             filename: str,
@@ -101,20 +188,12 @@ class BaseImageCaptionModel(metaclass=ABCMeta):
                 - fill: creates a new caption for all samples without a caption
                 - add: creates a new caption for all samples, appending if a caption already exists
         """
-        caption_sample = CaptionSample(filename)
-
-        existing_caption = caption_sample.get_caption()
-        if mode == 'fill' and existing_caption is not None and existing_caption != "":
+        caption_sample = self.__load_sample(filename, mode)
+        if caption_sample is None:
             return
 
         predicted_caption = self.generate_caption(caption_sample, initial_caption, caption_prefix, caption_postfix)
-
-        if mode == 'replace' or mode == 'fill':
-            caption_sample.set_caption(predicted_caption)
-
-        if mode == 'add':
-            caption_sample.add_caption(predicted_caption)
-
+        self.__apply_caption(caption_sample, predicted_caption, mode)
         caption_sample.save_caption()
 
     def caption_images(
@@ -126,10 +205,15 @@ class BaseImageCaptionModel(metaclass=ABCMeta):
             mode: str = 'fill',
             progress_callback: Callable[[int, int], None] = None,
             error_callback: Callable[[str], None] = None,
+            batch_size: int = 1,
+            num_workers: int | None = None,
     ):
         """
         Captions all samples in a list
 
+        Images are decoded and prepared by a pool of loading threads while the model captions the previous batch,
+        caption files are written by a separate thread. Callbacks are always called from the calling thread.
+
         Parameters:
             filenames (`[str]`): a list of sample filenames
             initial_caption (`str`): an initial caption. the generated caption will start with this string
@@ -141,18 +225,77 @@ class BaseImageCaptionModel(metaclass=ABCMeta):
                 - add: creates a new caption for all samples, appending if a caption already exists
             progress_callback (`Callable[[int, int], None]`): called after every processed image
             error_callback (`Callable[[str], None]`): called for every exception
+            batch_size (`int`): the number of images captioned in a single forward pass
+            num_workers (`int`): the number of image loading threads, defaults to the number of CPU cores, up to 8
         """
+        batch_size = max(1, batch_size)
+        if num_workers is None:
+            num_workers = min(8, os.cpu_count() or 1)
+        # enough loaded samples to fill the next two batches, without holding all images in memory
+        prefetch_count = 2 * batch_size + num_workers
+
+        processed_count = 0
+
+        def on_processed(count: int):
+            nonlocal processed_count
+            for _ in range(count):
+                processed_count += 1
+                progress_bar.update()
+                if progress_callback is not None:
+                    progress_callback(processed_count, len(filenames))
 
         if progress_callback is not None:
             progress_callback(0, len(filenames))
-        for i, filename in enumerate(tqdm(filenames)):
-            try:
-                self.caption_image(filename, initial_caption, caption_prefix, caption_postfix, mode)
-            except Exception:
-                if error_callback is not None:
-                    error_callback(filename)
-            if progress_callback is not None:
-                progress_callback(i + 1, len(filenames))
+
+        with ThreadPoolExecutor(max_workers=num_workers, thread_name_prefix="caption_load") as load_executor, \
+                ThreadPoolExecutor(max_workers=1, thread_name_prefix="caption_write") as write_executor, \
+                tqdm(total=len(filenames)) as progress_bar:
+            filename_iter = iter(filenames)
+            pending = deque()
+
+            def fill_pending():
+                while len(pending) < prefetch_count:
+                    filename = next(filename_iter, None)
+                    if filename is None:
+                        break
+                    pending.append((filename, load_executor.submit(self.__load_sample, filename, mode)))
+
+            def caption_batch(caption_samples: list[CaptionSample]):
+                for caption_sample, predicted_caption in self.__caption_batch(
+                        caption_samples, initial_caption, caption_prefix, caption_postfix, error_callback
+                ):
+                    # the image is not needed anymore, the writer only needs the captions
+                    caption_sample.image = None
+                    self.__apply_caption(caption_sample, predicted_caption, mode)
+                    write_executor.submit(caption_sample.save_caption)
+                on_processed(len(caption_samples))
+
+            batch = []
+            fill_pending()
+            while pending:
+                filename, future = pending.popleft()
+                fill_pending()
+
+                try:
+                    caption_sample = future.result()
+                except Exception:
+                    if error_callback is not None:
+                        error_callback(filename)
+                    on_processed(1)
+                    continue
+
+                if caption_sample is None:
+                    # already captioned in fill mode
+                    on_processed(1)
+                    continue
+
+                batch.append(caption_sample)
+                if len(batch) >= batch_size:
+                    caption_batch(batch)
+                    batch = []
+
+            if batch:
+                caption_batch(batch)
 
     def caption_folder(
             self,
@@ -164,6 +307,8 @@ class BaseImageCaptionModel(metaclass=ABCMeta):
             progress_callback: Callable[[int, int], None] = None,
             error_callback: Callable[[str], None] = None,
             include_subdirectories: bool = False,
+            batch_size: int = 1,
+            num_workers: int | None = None,
     ):
         """
         Captions all samples in a folder
@@ -180,6 +325,8 @@ class BaseImageCaptionModel(metaclass=ABCMeta):
             progress_callback (`Callable[[int, int], None]`): called after every processed image
             error_callback (`Callable[[str], None]`): called for every exception
             include_subdirectories (`bool`): whether to include subfolders when processing samples
+            batch_size (`int`): the number of images captioned in a single forward pass
+            num_workers (`int`): the number of image loading threads, defaults to the number of CPU cores, up to 8
         """
 
         filenames = self.__get_sample_filenames(sample_dir, include_subdirectories)
@@ -191,4 +338,6 @@ class BaseImageCaptionModel(metaclass=ABCMeta):
             mode=mode,
             progress_callback=progress_callback,
             error_callback=error_callback,
+            batch_size=batch_size,
+            num_workers=num_workers,
         )
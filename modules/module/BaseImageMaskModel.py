@@ -1,14 +1,17 @@
 import os
 from abc import ABCMeta, abstractmethod
+from collections import deque
 from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import Any
 
 from modules.util import path_util
 from modules.util.image_util import load_image
 
 import torch
-from torch import Tensor
-from torchvision.transforms import transforms
+from torch import Tensor, nn
+from torchvision.transforms import functional, transforms
 
 from PIL import Image
 from tqdm import tqdm
@@ -22,6 +25,7 @@ class MaskSample:
 
         self.image = None
         self.mask_tensor = None
+        self.model_input: Any = None
 
         self.height = 0
         self.width = 0
@@ -127,7 +131,155 @@ class BaseImageMaskModel(metaclass=ABCMeta):
         recursive_prefix = "" if not include_subdirectories else "**/"
         return [str(p) for p in sample_dir.glob(f'{recursive_prefix}*') if __is_supported_image_extension(p)]
 
+    # whether the generated masks mark the regions that should not be included in the mask
+    invert_masks: bool = False
+
+    smoothing_kernel_radius: int | None = None
+    smoothing_kernel: nn.Conv2d | None = None
+    expand_kernel_radius: int | None = None
+    expand_kernel: nn.Conv2d | None = None
+
+    def _create_average_kernel(self, kernel_radius: int | None) -> nn.Conv2d | None:
+        if kernel_radius is None:
+            return None
+
+        kernel_size = kernel_radius * 2 + 1
+        kernel_weights = torch.ones(1, 1, kernel_size, kernel_size) / (kernel_size * kernel_size)
+        kernel = nn.Conv2d(
+            in_channels=1, out_channels=1, kernel_size=kernel_size, bias=False, padding_mode='replicate',
+            padding=kernel_radius
+        )
+        kernel.weight.data = kernel_weights
+        kernel.requires_grad_(False)
+        kernel.to(self.device)
+        return kernel
+
+    def _process_masks(
+            self,
+            masks: Tensor,
+            mask_samples: list[MaskSample],
+            threshold: float,
+            smooth_pixels: int,
+            expand_pixels: int,
+    ) -> list[Tensor]:
+        """
+        Turns a batch of predicted masks into binary masks at the resolution of each sample
+
+        Parameters:
+            masks (`Tensor`): predicted masks in the range 0 to 1, shape (batch, channels, height, width).
+                the mean over all channels is used
+            mask_samples (`[MaskSample]`): the samples of the batch
+            threshold (`float`): threshold for including pixels in the mask
+            smooth_pixels (`int`): radius of a smoothing operation applied to the predicted masks
+            expand_pixels (`int`): amount of expansion of the generated masks in all directions
+
+        Returns: a mask of shape (1, 1, height, width) for each sample
+        """
+        if self.smoothing_kernel_radius != smooth_pixels:
+            self.smoothing_kernel = self._create_average_kernel(smooth_pixels)
+            self.smoothing_kernel_radius = smooth_pixels
+
+        if self.expand_kernel_radius != expand_pixels:
+            self.expand_kernel = self._create_average_kernel(expand_pixels)
+            self.expand_kernel_radius = expand_pixels
+
+        masks = masks.mean(1).unsqueeze(1)
+        if self.smoothing_kernel is not None:
+            masks = self.smoothing_kernel(masks)
+
+        # resizing and expansion happen at the target resolution, samples of the same resolution are batched
+        resolution_indices = {}
+        for i, mask_sample in enumerate(mask_samples):
+            resolution_indices.setdefault((mask_sample.height, mask_sample.width), []).append(i)
+
+        processed_masks = [None] * len(mask_samples)
+        for (height, width), indices in resolution_indices.items():
+            mask = functional.resize(masks[indices], [height, width])
+            mask = (mask > threshold).float()
+            if self.expand_kernel is not None:
+                mask = self.expand_kernel(mask)
+            mask = (mask > 0).float()
+
+            for i, index in enumerate(indices):
+                processed_masks[index] = mask[i:i + 1]
+
+        return processed_masks
+
+    def prepare_sample(self, mask_sample: MaskSample):
+        """
+        Loads the image of a sample and stores the model input in mask_sample.model_input.
+        Called from the loading threads of mask_images, so it should only do thread safe CPU work.
+
+        Parameters:
+            mask_sample (`MaskSample`): the sample to prepare
+        """
+        mask_sample.model_input = mask_sample.get_image()
+
     @abstractmethod
+    def generate_masks(
+            self,
+            mask_samples: list[MaskSample],
+            prompts: list[str],
+            threshold: float = 0.3,
+            smooth_pixels: int = 5,
+            expand_pixels: int = 10,
+    ) -> list[Tensor]:
+        """
+        Generates masks for a batch of prepared samples
+
+        Parameters:
+            mask_samples (`[MaskSample]`): the samples, prepared by prepare_sample
+            prompts (`[str]`): a list of prompts used to create a mask
+            threshold (`float`): threshold for including pixels in the mask
+            smooth_pixels (`int`): radius of a smoothing operation applied to the generated mask
+            expand_pixels (`int`): amount of expansion of the generated mask in all directions
+
+        Returns: a mask of shape (1, 1, height, width) for each sample, in the same order as the samples
+        """
+
+    def __load_sample(self, filename: str, mode: str) -> MaskSample | None:
+        mask_sample = MaskSample(filename, self.device)
+
+        if mode == 'fill':
+            if mask_sample.get_mask_tensor() is not None:
+                return None
+        elif mode != 'replace':
+            # load the existing mask before it is needed on the main thread
+            mask_sample.get_mask_tensor()
+
+        self.prepare_sample(mask_sample)
+        # only the resolution of the image is needed after this point
+        mask_sample.image = None
+
+        return mask_sample
+
+    def __mask_batch(
+            self,
+            mask_samples: list[MaskSample],
+            prompts: list[str],
+            threshold: float,
+            smooth_pixels: int,
+            expand_pixels: int,
+            error_callback: Callable[[str], None] | None,
+    ) -> list[tuple[MaskSample, Tensor]]:
+        try:
+            with torch.no_grad():
+                predicted_masks = self.generate_masks(mask_samples, prompts, threshold, smooth_pixels, expand_pixels)
+            return list(zip(mask_samples, predicted_masks, strict=True))
+        except Exception:
+            if len(mask_samples) == 1:
+                if error_callback is not None:
+                    error_callback(mask_samples[0].image_filename)
+                return []
+
+        # retry the samples of a failed batch one at a time, so a single broken sample doesn't fail the whole batch
+        results = []
+        for mask_sample in mask_samples:
+            results.extend(self.__mask_batch(
+                [mask_sample], prompts, threshold, smooth_pixels, expand_pixels, error_callback
+            ))
+        return results
+
     def mask_image(
             self,
             filename: str,
@@ -155,6 +307,15 @@ class BaseImageMaskModel(metaclass=ABCMeta):
             smooth_pixels (`int`): radius of a smoothing operation applied to the generated mask
             expand_pixels (`int`): amount of expansion of the generated mask in all directions
         """
+        mask_sample = self.__load_sample(filename, mode)
+        if mask_sample is None:
+            return
+
+        with torch.no_grad():
+            predicted_mask = self.generate_masks([mask_sample], prompts, threshold, smooth_pixels, expand_pixels)[0]
+        mask_sample.apply_mask(mode, predicted_mask, alpha, self.invert_masks)
+
+        mask_sample.save_mask()
 
     def mask_images(
             self,
@@ -167,10 +328,16 @@ class BaseImageMaskModel(metaclass=ABCMeta):
             expand_pixels: int = 10,
             progress_callback: Callable[[int, int], None] = None,
             error_callback: Callable[[str], None] = None,
+            batch_size: int = 1,
+            num_workers: int | None = None,
     ):
         """
         Masks all samples in a list
 
+        Images are decoded and prepared by a pool of loading threads while the model masks the previous batch,
+        masks are encoded and written by a pool of writing threads. Callbacks are always called from the calling
+        thread.
+
         Parameters:
             filenames (`[str]`): a list of sample filenames
             prompts (`[str]`): a list of prompts used to create a mask
@@ -186,18 +353,96 @@ class BaseImageMaskModel(metaclass=ABCMeta):
             expand_pixels (`int`): amount of expansion of the generated mask in all directions
             progress_callback (`Callable[[int, int], None]`): called after every processed image
             error_callback (`Callable[[str], None]`): called for every exception
+            batch_size (`int`): the number of images masked in a single forward pass
+            num_workers (`int`): the number of image loading threads, defaults to the number of CPU cores, up to 8
         """
+        batch_size = max(1, batch_size)
+        if num_workers is None:
+            num_workers = min(8, os.cpu_count() or 1)
+        # enough loaded samples to fill the next two batches, without holding all images in memory
+        prefetch_count = 2 * batch_size + num_workers
+
+        processed_count = 0
+
+        def on_processed(count: int):
+            nonlocal processed_count
+            for _ in range(count):
+                processed_count += 1
+                progress_bar.update()
+                if progress_callback is not None:
+                    progress_callback(processed_count, len(filenames))
+
+        def on_error(filename: str):
+            if error_callback is not None:
+                error_callback(filename)
 
         if progress_callback is not None:
             progress_callback(0, len(filenames))
-        for i, filename in enumerate(tqdm(filenames)):
-            try:
-                self.mask_image(filename, prompts, mode, alpha, threshold, smooth_pixels, expand_pixels)
-            except Exception:
-                if error_callback is not None:
-                    error_callback(filename)
-            if progress_callback is not None:
-                progress_callback(i + 1, len(filenames))
+
+        with ThreadPoolExecutor(max_workers=num_workers, thread_name_prefix="mask_load") as load_executor, \
+                ThreadPoolExecutor(max_workers=num_workers, thread_name_prefix="mask_write") as write_executor, \
+                tqdm(total=len(filenames)) as progress_bar:
+            filename_iter = iter(filenames)
+            pending = deque()
+            writes = deque()
+
+            def fill_pending():
+                while len(pending) < prefetch_count:
+                    filename = next(filename_iter, None)
+                    if filename is None:
+                        break
+                    pending.append((filename, load_executor.submit(self.__load_sample, filename, mode)))
+
+            def wait_for_writes(max_count: int):
+                # every queued write holds a full resolution mask, so the queue is bounded
+                while len(writes) > max_count:
+                    filename, future = writes.popleft()
+                    try:
+                        future.result()
+                    except Exception:
+                        on_error(filename)
+
+            def mask_batch(mask_samples: list[MaskSample]):
+                for mask_sample, predicted_mask in self.__mask_batch(
+                        mask_samples, prompts, threshold, smooth_pixels, expand_pixels, on_error
+                ):
+                    mask_sample.model_input = None
+                    try:
+                        mask_sample.apply_mask(mode, predicted_mask, alpha, self.invert_masks)
+                    except Exception:
+                        on_error(mask_sample.image_filename)
+                        continue
+                    writes.append((mask_sample.image_filename, write_executor.submit(mask_sample.save_mask)))
+                wait_for_writes(prefetch_count)
+                on_processed(len(mask_samples))
+
+            batch = []
+            fill_pending()
+            while pending:
+                filename, future = pending.popleft()
+                fill_pending()
+
+                try:
+                    mask_sample = future.result()
+                except Exception:
+                    on_error(filename)
+                    on_processed(1)
+                    continue
+
+                if mask_sample is None:
+                    # already masked in fill mode
+                    on_processed(1)
+                    continue
+
+                batch.append(mask_sample)
+                if len(batch) >= batch_size:
+                    mask_batch(batch)
+                    batch = []
+
+            if batch:
+                mask_batch(batch)
+
+            wait_for_writes(0)
 
     def mask_folder(
             self,
@@ -211,6 +456,8 @@ class BaseImageMaskModel(metaclass=ABCMeta):
             progress_callback: Callable[[int, int], None] = None,
             error_callback: Callable[[str], None] = None,
             include_subdirectories: bool = False,
+            batch_size: int = 1,
+            num_workers: int | None = None,
     ):
         """
         Masks all samples in a folder
@@ -231,6 +478,8 @@ class BaseImageMaskModel(metaclass=ABCMeta):
             progress_callback (`Callable[[int, int], None]`): called after every processed image
             error_callback (`Callable[[str], None]`): called for every exception
             include_subdirectories (`bool`): whether to include subdirectories when processing samples
+            batch_size (`int`): the number of images masked in a single forward pass
+            num_workers (`int`): the number of image loading threads, defaults to the number of CPU cores, up to 8
         """
 
         filenames = self.__get_sample_filenames(sample_dir, include_subdirectories)
@@ -244,4 +493,6 @@ class BaseImageMaskModel(metaclass=ABCMeta):
             expand_pixels=expand_pixels,
             progress_callback=progress_callback,
             error_callback=error_callback,
+            batch_size=batch_size,
+            num_workers=num_workers,
         )
@@ -3,8 +3,7 @@ import os
 from modules.module.BaseImageMaskModel import BaseImageMaskModel, MaskSample
 
 import torch
-from torch import Tensor, nn
-from torchvision.transforms import functional, transforms
+from torch import Tensor
 
 import numpy as np
 import onnxruntime
@@ -30,15 +29,15 @@ class BaseRembgModel(BaseImageMaskModel):
 
         self.model = self.__load_model()
 
-        self.smoothing_kernel_radius = None
-        self.smoothing_kernel = self.__create_average_kernel(self.smoothing_kernel_radius)
+        model_input = self.model.get_inputs()[0]
+        self.input_name = model_input.name
+        self.output_name = self.model.get_outputs()[0].name
+        # models exported with a fixed batch size can only run batches of that size
+        self.max_batch_size = model_input.shape[0] if isinstance(model_input.shape[0], int) else None
 
-        self.expand_kernel_radius = None
-        self.expand_kernel = self.__create_average_kernel(self.expand_kernel_radius)
-
-        self.image2Tensor = transforms.Compose([
-            transforms.ToTensor(),
-        ])
+        self.io_binding = self.model.io_binding()
+        self.input_buffer = None
+        self.output_buffer = None
 
     def __load_model(self) -> onnxruntime.InferenceSession:
         path = os.path.join("external", "models", "rembg")
@@ -57,35 +56,35 @@ class BaseRembgModel(BaseImageMaskModel):
             provider = "CUDAExecutionProvider" if "CUDAExecutionProvider" in onnxruntime.get_available_providers() else "CPUExecutionProvider"
         return onnxruntime.InferenceSession(os.path.join(path, self.model_filename), providers=[provider])
 
-    def __create_average_kernel(self, kernel_radius: int | None):
-        if kernel_radius is None:
-            return None
-
-        kernel_size = kernel_radius * 2 + 1
-        kernel_weights = torch.ones(1, 1, kernel_size, kernel_size) / (kernel_size * kernel_size)
-        kernel = nn.Conv2d(
-            in_channels=1, out_channels=1, kernel_size=kernel_size, bias=False, padding_mode='replicate',
-            padding=kernel_radius
+    def __run(self, normalized_images: list[ndarray]) -> ndarray:
+        batch_size = len(normalized_images)
+
+        # input and output buffers are reused for all batches, and only reallocated if a batch is larger
+        if self.input_buffer is None or self.input_buffer.shape[0] < batch_size:
+            self.input_buffer = np.empty((batch_size, *normalized_images[0].shape), dtype=np.float32)
+            self.output_buffer = None
+        input_buffer = self.input_buffer[:batch_size]
+        np.stack(normalized_images, out=input_buffer)
+
+        self.io_binding.bind_cpu_input(self.input_name, input_buffer)
+        if self.output_buffer is None:
+            self.io_binding.bind_output(self.output_name, 'cpu')
+            self.model.run_with_iobinding(self.io_binding)
+            output = self.io_binding.copy_outputs_to_cpu()[0]
+            if batch_size == self.input_buffer.shape[0]:
+                self.output_buffer = np.empty_like(output)
+            return output
+
+        output_buffer = self.output_buffer[:batch_size]
+        self.io_binding.bind_output(
+            self.output_name,
+            'cpu',
+            element_type=np.float32,
+            shape=output_buffer.shape,
+            buffer_ptr=output_buffer.ctypes.data,
         )
-        kernel.weight.data = kernel_weights
-        kernel.requires_grad_(False)
-        kernel.to(self.device)
-        return kernel
-
-    def __process_mask(self, mask: Tensor, target_height: int, target_width: int, threshold: float) -> Tensor:
-        while len(mask.shape) < 4:
-            mask = mask.unsqueeze(0)
-
-        mask = mask.mean(1).unsqueeze(1)
-        if self.smoothing_kernel is not None:
-            mask = self.smoothing_kernel(mask)
-        mask = functional.resize(mask, [target_height, target_width])
-        mask = (mask > threshold).float()
-        if self.expand_kernel is not None:
-            mask = self.expand_kernel(mask)
-        mask = (mask > 0).float()
-
-        return mask
+        self.model.run_with_iobinding(self.io_binding)
+        return output_buffer
 
     def __normalize(
             self,
@@ -106,54 +105,39 @@ class BaseRembgModel(BaseImageMaskModel):
 
         tmpImg = tmpImg.transpose((2, 0, 1))
 
-        return np.expand_dims(tmpImg, 0).astype(np.float32)
-
-    def mask_image(
-            self,
-            filename: str,
-            prompts: list[str],
-            mode: str = 'fill',
-            alpha: float = 1.0,
-            threshold: float = 0.3,
-            smooth_pixels: int = 5,
-            expand_pixels: int = 10
-    ):
-        mask_sample = MaskSample(filename, self.device)
-
-        if mode == 'fill' and mask_sample.get_mask_tensor() is not None:
-            return
-
-        if self.smoothing_kernel_radius != smooth_pixels:
-            self.smoothing_kernel = self.__create_average_kernel(smooth_pixels)
-            self.smoothing_kernel_radius = smooth_pixels
-
-        if self.expand_kernel_radius != expand_pixels:
-            self.expand_kernel = self.__create_average_kernel(expand_pixels)
-            self.expand_kernel_radius = expand_pixels
-
-        image = mask_sample.get_image()
+        return tmpImg.astype(np.float32)
 
-        normalized_image = self.__normalize(
-            image,
+    def prepare_sample(self, mask_sample: MaskSample):
+        mask_sample.model_input = self.__normalize(
+            mask_sample.get_image(),
             (0.485, 0.456, 0.406),
             (0.229, 0.224, 0.225),
             (320, 320)
         )
 
-        input_name = self.model.get_inputs()[0].name
-        mask = self.model.run(None, {input_name: normalized_image})
+    def generate_masks(
+            self,
+            mask_samples: list[MaskSample],
+            prompts: list[str],
+            threshold: float = 0.3,
+            smooth_pixels: int = 5,
+            expand_pixels: int = 10,
+    ) -> list[Tensor]:
+        chunk_size = self.max_batch_size or len(mask_samples)
 
-        mask = mask[0][:, 0, :, :]
+        predicted_masks = []
+        for i in range(0, len(mask_samples), chunk_size):
+            chunk = mask_samples[i:i + chunk_size]
+            mask = self.__run([mask_sample.model_input for mask_sample in chunk])
 
-        ma = np.max(mask)
-        mi = np.min(mask)
+            mask = mask[:, 0, :, :]
 
-        mask = (mask - mi) / (ma - mi)
-        mask = np.squeeze(mask)
+            ma = mask.max(axis=(1, 2), keepdims=True)
+            mi = mask.min(axis=(1, 2), keepdims=True)
 
-        output = torch.from_numpy(mask).to(self.device)
+            mask = (mask - mi) / (ma - mi)
 
-        predicted_mask = self.__process_mask(output, mask_sample.height, mask_sample.width, threshold)
-        mask_sample.apply_mask(mode, predicted_mask, alpha, False)
+            output = torch.from_numpy(mask).to(self.device).unsqueeze(1)
+            predicted_masks.extend(self._process_masks(output, chunk, threshold, smooth_pixels, expand_pixels))
 
-        mask_sample.save_mask()
+        return predicted_masks
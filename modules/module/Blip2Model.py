@@ -4,6 +4,8 @@ import torch
 
 from transformers import AutoProcessor, Blip2ForConditionalGeneration
 
+from PIL import Image
+
 
 class Blip2Model(BaseImageCaptionModel):
     def __init__(self, device: torch.device, dtype: torch.dtype):
@@ -19,6 +21,11 @@ class Blip2Model(BaseImageCaptionModel):
         self.model.eval()
         self.model.to(self.device)
 
+    def prepare_image(self, image: Image) -> Image:
+        # resizing in the loading threads leaves only a same size resize for the processor
+        size = self.processor.image_processor.size
+        return image.resize((size["width"], size["height"]), Image.Resampling.BICUBIC)
+
     def generate_caption(
             self,
             caption_sample: CaptionSample,
@@ -26,11 +33,23 @@ class Blip2Model(BaseImageCaptionModel):
             caption_prefix: str = "",
             caption_postfix: str = "",
     ) -> str:
-        inputs = self.processor(caption_sample.get_image(), initial_caption, return_tensors="pt")
+        return self.generate_captions([caption_sample], initial_caption, caption_prefix, caption_postfix)[0]
+
+    def generate_captions(
+            self,
+            caption_samples: list[CaptionSample],
+            initial_caption: str = "",
+            caption_prefix: str = "",
+            caption_postfix: str = "",
+    ) -> list[str]:
+        images = [caption_sample.get_image() for caption_sample in caption_samples]
+        inputs = self.processor(images, [initial_caption] * len(images), return_tensors="pt")
         inputs = inputs.to(self.device, self.dtype)
         with torch.no_grad():
             outputs = self.model.generate(**inputs)
-        predicted_caption = self.processor.decode(outputs[0], skip_special_tokens=True)
-        predicted_caption = (caption_prefix + initial_caption + predicted_caption + caption_postfix).strip()
+        predicted_captions = self.processor.batch_decode(outputs, skip_special_tokens=True)
 
-        return predicted_caption
+        return [
+            (caption_prefix + initial_caption + predicted_caption + caption_postfix).strip()
+            for predicted_caption in predicted_captions
+        ]
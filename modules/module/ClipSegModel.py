@@ -1,9 +1,7 @@
-
 from modules.module.BaseImageMaskModel import BaseImageMaskModel, MaskSample
 
 import torch
-from torch import Tensor, nn
-from torchvision.transforms import functional
+from torch import Tensor
 
 from transformers import CLIPSegForImageSegmentation, CLIPSegProcessor
 
@@ -19,72 +17,44 @@ class ClipSegModel(BaseImageMaskModel):
         self.model.eval()
         self.model.to(self.device)
 
-        self.smoothing_kernel_radius = None
-        self.smoothing_kernel = self.__create_average_kernel(self.smoothing_kernel_radius)
-
-        self.expand_kernel_radius = None
-        self.expand_kernel = self.__create_average_kernel(self.expand_kernel_radius)
-
-    def __create_average_kernel(self, kernel_radius: int | None):
-        if kernel_radius is None:
-            return None
-
-        kernel_size = kernel_radius * 2 + 1
-        kernel_weights = torch.ones(1, 1, kernel_size, kernel_size) / (kernel_size * kernel_size)
-        kernel = nn.Conv2d(
-            in_channels=1, out_channels=1, kernel_size=kernel_size, bias=False, padding_mode='replicate',
-            padding=kernel_radius
-        )
-        kernel.weight.data = kernel_weights
-        kernel.requires_grad_(False)
-        kernel.to(self.device)
-        return kernel
+        self.text_inputs_prompts = None
+        self.text_inputs = None
 
-    def __process_mask(self, mask: Tensor, target_height: int, target_width: int, threshold: float) -> Tensor:
-        while len(mask.shape) < 4:
-            mask = mask.unsqueeze(0)
+    def __get_text_inputs(self, prompts: list[str]):
+        # prompts are the same for every batch, they are only tokenized once
+        if self.text_inputs_prompts != prompts:
+            self.text_inputs = self.processor.tokenizer(prompts, padding="max_length", return_tensors="pt")
+            self.text_inputs = self.text_inputs.to(self.device)
+            self.text_inputs_prompts = list(prompts)
 
-        mask = torch.sigmoid(mask)
-        mask = mask.mean(1).unsqueeze(1)
-        if self.smoothing_kernel is not None:
-            mask = self.smoothing_kernel(mask)
-        mask = functional.resize(mask, [target_height, target_width])
-        mask = (mask > threshold).float()
-        if self.expand_kernel is not None:
-            mask = self.expand_kernel(mask)
-        mask = (mask > 0).float()
+        return self.text_inputs
 
-        return mask
+    def prepare_sample(self, mask_sample: MaskSample):
+        mask_sample.model_input = self.processor.image_processor(
+            images=mask_sample.get_image(), return_tensors="pt"
+        ).pixel_values
 
-    def mask_image(
+    def generate_masks(
             self,
-            filename: str,
+            mask_samples: list[MaskSample],
             prompts: list[str],
-            mode: str = 'fill',
-            alpha: float = 1.0,
             threshold: float = 0.3,
             smooth_pixels: int = 5,
-            expand_pixels: int = 10
-    ):
-        mask_sample = MaskSample(filename, self.device)
-
-        if mode == 'fill' and mask_sample.get_mask_tensor() is not None:
-            return
-
-        if self.smoothing_kernel_radius != smooth_pixels:
-            self.smoothing_kernel = self.__create_average_kernel(smooth_pixels)
-            self.smoothing_kernel_radius = smooth_pixels
-
-        if self.expand_kernel_radius != expand_pixels:
-            self.expand_kernel = self.__create_average_kernel(expand_pixels)
-            self.expand_kernel_radius = expand_pixels
-
-        inputs = self.processor(text=prompts, images=[mask_sample.get_image()] * len(prompts), padding="max_length",
-                                return_tensors="pt")
-        inputs = inputs.to(self.device)
-        with torch.no_grad():
-            outputs = self.model(**inputs)
-        predicted_mask = self.__process_mask(outputs.logits, mask_sample.height, mask_sample.width, threshold)
-        mask_sample.apply_mask(mode, predicted_mask, alpha, False)
+            expand_pixels: int = 10,
+    ) -> list[Tensor]:
+        text_inputs = self.__get_text_inputs(prompts)
+
+        # every image is paired with every prompt, ordered by image
+        pixel_values = torch.cat([mask_sample.model_input for mask_sample in mask_samples])
+        pixel_values = pixel_values.to(self.device, non_blocking=True)
+        pixel_values = pixel_values.repeat_interleave(len(prompts), dim=0)
+
+        outputs = self.model(
+            input_ids=text_inputs.input_ids.repeat(len(mask_samples), 1),
+            attention_mask=text_inputs.attention_mask.repeat(len(mask_samples), 1),
+            pixel_values=pixel_values,
+        )
 
-        mask_sample.save_mask()
+        logits = outputs.logits
+        logits = logits.reshape(len(mask_samples), len(prompts), logits.shape[-2], logits.shape[-1])
+        return self._process_masks(torch.sigmoid(logits), mask_samples, threshold, smooth_pixels, expand_pixels)
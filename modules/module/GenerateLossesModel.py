@@ -1,11 +1,16 @@
+import hashlib
 import json
+import os
+import statistics
 
 from modules.dataLoader import StableDiffusionFineTuneDataLoader
 from modules.model.BaseModel import BaseModel
 from modules.modelLoader.BaseModelLoader import BaseModelLoader
 from modules.modelSetup.BaseModelSetup import BaseModelSetup
+from modules.modelSetup.mixin.ModelSetupNoiseMixin import ModelSetupNoiseMixin
 from modules.util import create
 from modules.util.config.TrainConfig import TrainConfig
+from modules.util.enum.LossScaler import LossScaler
 from modules.util.torch_util import torch_gc
 from modules.util.TrainProgress import TrainProgress
 
@@ -16,7 +21,13 @@ from tqdm import tqdm
 
 class GenerateLossesModel:
     """Based on train args, writes a JSON instead of a model with filenames mapped to losses,
-    in order of decreasing loss."""
+    in order of decreasing loss.
+
+    Every sample is evaluated once for each combination of the given seeds and timesteps, the reported loss is
+    the mean of those evaluations. The noise of a sample is derived from the seed and its path, so its loss doesn't
+    depend on the batch it is evaluated in. Results are streamed to a JSONL file next to the output file after every batch.
+    If that file already exists, samples it contains are skipped, so an interrupted run resumes where it stopped.
+    Per-concept statistics are written to a second file next to the output file."""
     config: TrainConfig
     train_device: torch.device
     temp_device: torch.device
@@ -25,18 +36,74 @@ class GenerateLossesModel:
     data_loader: StableDiffusionFineTuneDataLoader
     model: BaseModel
 
-    def __init__(self, config: TrainConfig, output_path: str):
+    def __init__(
+            self,
+            config: TrainConfig,
+            output_path: str,
+            batch_size: int | None = None,
+            timesteps: list[float] | None = None,
+            seeds: list[int] | None = None,
+    ):
         # Create a copy of args because we will mutate
-        # the batch size and gradient accumulation steps.
+        # the batch size, gradient accumulation steps and loss scaler.
         config = TrainConfig.default_values().from_dict(config.to_dict())
-        config.batch_size = 1
+        config.batch_size = batch_size if batch_size is not None else config.batch_size
         config.gradient_accumulation_steps = 1
+        # losses are compared between samples, they should not depend on the batch size
+        config.loss_scaler = LossScaler.NONE
+        # caption dropout is drawn for the whole batch, it would make the loss depend on the batch layout
+        for part in [config.text_encoder, config.text_encoder_2, config.text_encoder_3, config.text_encoder_4,
+                     config.decoder_text_encoder]:
+            part.dropout_probability = 0.0
 
         self.config = config
         self.output_path = output_path
+        self.stream_path = os.path.splitext(output_path)[0] + ".jsonl"
+        self.statistics_path = os.path.splitext(output_path)[0] + "-statistics.json"
+        self.timesteps = timesteps if timesteps else [0.5]
+        self.seeds = seeds if seeds else [0]
         self.train_device = torch.device(self.config.train_device)
         self.temp_device = torch.device(self.config.temp_device)
 
+    def __load_results(self) -> dict[str, dict]:
+        results = {}
+        if os.path.exists(self.stream_path):
+            with open(self.stream_path, "r") as f:
+                for line in f:
+                    try:
+                        result = json.loads(line)
+                        results[result['path']] = result
+                    except json.JSONDecodeError:  # noqa: PERF203
+                        # the last line can be incomplete if the previous run was interrupted while writing it
+                        pass
+        return results
+
+    @staticmethod
+    def __sample_seed(seed: int, path: str) -> int:
+        """The noise seed of a single sample. It only depends on the seed and the sample, not on the batch."""
+        return int.from_bytes(hashlib.sha256(f"{seed}:{path}".encode()).digest()[:7], "little")
+
+    def __write_statistics(self, results: dict[str, dict]):
+        concept_losses: dict[str, list[float]] = {}
+        for result in results.values():
+            concept_losses.setdefault(result['concept'], []).append(result['loss'])
+
+        concept_statistics = {}
+        for concept, losses in sorted(concept_losses.items()):
+            losses.sort()
+            concept_statistics[concept] = {
+                'count': len(losses),
+                'mean': statistics.fmean(losses),
+                'std': statistics.pstdev(losses),
+                'min': losses[0],
+                'median': statistics.median(losses),
+                'p90': losses[min(int(len(losses) * 0.9), len(losses) - 1)],
+                'max': losses[-1],
+            }
+
+        with open(self.statistics_path, "w") as f:
+            json.dump(concept_statistics, f, indent=4)
+
     def start(self):
         if self.config.train_dtype.enable_tf():
             torch.backends.cuda.matmul.allow_tf32 = True
@@ -76,15 +143,35 @@ class GenerateLossesModel:
             self.model.train_progress,
         )
 
+        results = self.__load_results()
+        if results:
+            print(f"Resuming from {self.stream_path}, skipping {len(results)} already evaluated samples")
+
+        # setups without noise, like the VAE fine tune setup, only need a single evaluation
+        if isinstance(self.model_setup, ModelSetupNoiseMixin):
+            evaluations = [(seed, timestep) for seed in self.seeds for timestep in self.timesteps]
+        else:
+            evaluations = [(0, 0.5)]
+
         self.data_loader.get_data_set().start_next_epoch()
         step_tqdm = tqdm(self.data_loader.get_data_loader(), desc="step")
 
         self.model_setup.setup_train_device(self.model, self.config)
 
-        filename_loss_list: list[tuple[str, float]] = []
         # Don't really need a backward pass here, so we can make the calculation MUCH faster.
-        with torch.inference_mode():
+        with torch.inference_mode(), open(self.stream_path, "a") as stream_file:
             for batch in step_tqdm:
+                paths = batch['image_path']
+                batch_size = len(paths)
+                if all(path in results for path in paths):
+                    continue
+
+                sample_losses = [[] for _ in range(batch_size)]
+                for seed, timestep in evaluations:
+                    if isinstance(self.model_setup, ModelSetupNoiseMixin):
+                        self.model_setup.set_deterministic_noise(
+                            seed, timestep, [self.__sample_seed(seed, path) for path in paths])
+
                     model_output_data = self.model_setup.predict(
                         self.model,
                         batch,
@@ -92,16 +179,41 @@ class GenerateLossesModel:
                         self.model.train_progress,
                         deterministic=True,
                     )
-                    loss = self.model_setup.calculate_loss(
+
+                    losses = self.model_setup.calculate_losses(
                         self.model,
                         batch,
                         model_output_data,
                         self.config,
                     )
-                    filename_loss_list.append((batch['image_path'][0], float(loss)))
+                    for i, loss in enumerate(losses.tolist()):
+                        sample_losses[i].append(loss)
+
+                for path, concept, losses in zip(paths, batch['concept_name'], sample_losses, strict=True):
+                    if path in results:
+                        continue
+
+                    result = {
+                        'path': path,
+                        'concept': concept,
+                        'loss': statistics.fmean(losses),
+                        'losses': losses,
+                    }
+                    results[path] = result
+                    stream_file.write(json.dumps(result) + "\n")
+                stream_file.flush()
+
+        if isinstance(self.model_setup, ModelSetupNoiseMixin):
+            self.model_setup.set_deterministic_noise()
 
         # Sort such that highest loss comes first
-        filename_loss_list.sort(key=lambda x: x[1], reverse=True)
+        filename_loss_list = sorted(
+            ((result['path'], result['loss']) for result in results.values()),
+            key=lambda x: x[1],
+            reverse=True,
+        )
         filename_to_loss: dict[str, float] = {x[0]: x[1] for x in filename_loss_list}
         with open(self.output_path, "w") as f:
             json.dump(filename_to_loss, f, indent=4)
+
+        self.__write_statistics(results)
@@ -23,6 +23,7 @@ class PeftBase(nn.Module):
     prefix: str
     layer_kwargs: dict  # Applied during the forward op() call.
     _initialized: bool  # Tracks whether we've created the layers or not.
+    sample_scale: Tensor | None  # Per-sample scale of the adapter output, broadcast over the batch dimension.
 
     def __init__(self, prefix: str, orig_module: nn.Module | None):
         super().__init__()
@@ -31,6 +32,7 @@ class PeftBase(nn.Module):
         self.is_applied = False
         self.layer_kwargs = {}
         self._initialized = False
+        self.sample_scale = None
 
         if orig_module is not None:
             match orig_module:
@@ -65,6 +67,18 @@ class PeftBase(nn.Module):
             self.orig_module.eval = self.orig_eval
             self.is_applied = False
 
+    def _scale_per_sample(self, x: Tensor) -> Tensor:
+        """Scales the adapter output of each sample in the batch by sample_scale."""
+        if self.sample_scale is None:
+            return x
+
+        if x.shape[0] != self.sample_scale.shape[0]:
+            raise RuntimeError(
+                f"Module {self.prefix} got a batch of {x.shape[0]}, but {self.sample_scale.shape[0]} sample scales."
+            )
+
+        return x * self.sample_scale.to(dtype=x.dtype, device=x.device).view(-1, *[1] * (x.dim() - 1))
+
     def _wrap_train(self, mode=True):
         self.orig_train(mode)
         self.train(mode)
@@ -269,7 +283,7 @@ class LoHaModule(PeftBase):
         W2 = self.make_weight(self.dropout(self.hada_w2_b),
                               self.dropout(self.hada_w2_a))
         W = (W1 * W2) * (self.alpha / self.rank)
-        return self.orig_forward(x) + self.op(x, W, bias=None, **self.layer_kwargs)
+        return self.orig_forward(x) + self._scale_per_sample(self.op(x, W, bias=None, **self.layer_kwargs))
 
     def apply_to_module(self):
         # TODO
@@ -320,7 +334,7 @@ class LoRAModule(PeftBase):
         self.check_initialized()
 
         ld = self.lora_up(self.dropout(self.lora_down(x)))
-        return self.orig_forward(x) + ld * (self.alpha / self.rank)
+        return self.orig_forward(x) + self._scale_per_sample(ld) * (self.alpha / self.rank)
 
     def apply_to_module(self):
         # TODO
@@ -413,10 +427,18 @@ class DoRAModule(LoRAModule):
         # In the DoRA codebase (and thus the paper results), they perform
         # dropout on the *input*, rather than between layers, so we duplicate
         # that here.
-        return self.op(self.dropout(x),
-                       WP,
-                       self.orig_module.bias,
-                       **self.layer_kwargs)
+        output = self.op(self.dropout(x),
+                         WP,
+                         self.orig_module.bias,
+                         **self.layer_kwargs)
+
+        # DoRA replaces the whole weight, so per-sample scaling needs the
+        # output of the original module to interpolate between the two.
+        if self.sample_scale is not None:
+            orig_output = self.orig_forward(x)
+            output = orig_output + self._scale_per_sample(output - orig_output)
+
+        return output
 
 
 DummyLoRAModule = LoRAModule.make_dummy()
@@ -577,6 +599,14 @@ class LoRAModuleWrapper:
         """
         self.lora_modules = {k: v for (k, v) in self.lora_modules.items() if not isinstance(v, self.dummy_klass)}
 
+    def set_sample_scale(self, sample_scale: Tensor | None):
+        """
+        Sets a per-sample scale of the adapter output. A scale of 0 disables the
+        adapter for that sample, None disables per-sample scaling
+        """
+        for module in self.lora_modules.values():
+            module.sample_scale = sample_scale
+
     def set_dropout(self, dropout_probability: float):
         """
         Sets the dropout probability
@@ -7,6 +7,7 @@ import torch
 import huggingface_hub
 import numpy as np
 import onnxruntime
+from PIL import Image
 
 
 class WDModel(BaseImageCaptionModel):
@@ -42,6 +43,10 @@ class WDModel(BaseImageCaptionModel):
 
                 self.tag_names.append(row["name"])
 
+    def prepare_image(self, image: Image) -> Image:
+        _, height, width, _ = self.model.get_inputs()[0].shape
+        return image.resize((width, height))
+
     def generate_caption(
             self,
             caption_sample: CaptionSample,
@@ -49,28 +54,41 @@ class WDModel(BaseImageCaptionModel):
             caption_prefix: str = "",
             caption_postfix: str = "",
     ):
+        return self.generate_captions([caption_sample], initial_caption, caption_prefix, caption_postfix)[0]
+
+    def generate_captions(
+            self,
+            caption_samples: list[CaptionSample],
+            initial_caption: str = "",
+            caption_prefix: str = "",
+            caption_postfix: str = "",
+    ) -> list[str]:
         _, height, width, _ = self.model.get_inputs()[0].shape
 
-        image = caption_sample.get_image()
-        image = image.resize((width, height))
-        image = np.asarray(image)
-        image = image[:, :, ::-1]  # RGB to BGR
-        image = image.astype(np.float32)
-        image = np.expand_dims(image, 0)
+        images = []
+        for caption_sample in caption_samples:
+            image = caption_sample.get_image()
+            if image.size != (width, height):
+                image = image.resize((width, height))
+            image = np.asarray(image)
+            image = image[:, :, ::-1]  # RGB to BGR
+            images.append(image.astype(np.float32))
+        images = np.stack(images)
 
         input_name = self.model.get_inputs()[0].name
         label_name = self.model.get_outputs()[0].name
-        probs = self.model.run([label_name], {input_name: image})[0]
-        probs = probs[0].astype(float)
+        batch_probs = self.model.run([label_name], {input_name: images})[0]
 
-        general_labels = [(self.tag_names[i], probs[i]) for i in self.general_indexes if probs[i] > 0.35]
+        predicted_captions = []
+        for probs in batch_probs.astype(float):
+            general_labels = [(self.tag_names[i], probs[i]) for i in self.general_indexes if probs[i] > 0.35]
 
-        sorted_general_labels = sorted(general_labels, key=lambda label: label[1], reverse=True)
-        predicted_caption = ", ".join([
-            label[0].replace("_", " ")
-            for label
-            in sorted_general_labels
-        ])
-        predicted_caption = (caption_prefix + predicted_caption + caption_postfix).strip()
+            sorted_general_labels = sorted(general_labels, key=lambda label: label[1], reverse=True)
+            predicted_caption = ", ".join([
+                label[0].replace("_", " ")
+                for label
+                in sorted_general_labels
+            ])
+            predicted_captions.append((caption_prefix + predicted_caption + caption_postfix).strip())
 
-        return predicted_caption
+        return predicted_captions
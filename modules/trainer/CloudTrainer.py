@@ -23,6 +23,7 @@ class CloudTrainer(BaseTrainer):
         self.error_caught=False
         self.callback_thread=None
         self.sync_thread=None
+        self.upload_thread=None
         self.stop_event=None
         self.cloud=None
         self.reattach=reattach
@@ -51,15 +52,13 @@ class CloudTrainer(BaseTrainer):
                 if self.cloud.can_reattach():
                     raise ValueError(f"a detached trainer with id {self.config.cloud.run_id} is still running. Use \"Reattach now\" to reattach to this trainer!")
                 self.callbacks.on_update_status("uploading config")
-                self.cloud.upload_config(self.commands)
+                self.cloud.upload_config(self.commands,upload_concepts=not self.config.cloud.stream_concept_upload)
         except:
             self.error_caught=True
             raise
 
         def on_command(commands : TrainCommands):
-            backup_on_command = commands.get_and_reset_on_command() #don't pickle a Callable
             self.cloud.send_commands(commands)
-            commands.set_on_command(backup_on_command)
         self.commands.set_on_command(on_command)
 
         self.stop_event=threading.Event()
@@ -67,11 +66,13 @@ class CloudTrainer(BaseTrainer):
         def callback():
             while not self.stop_event.is_set():
                 try:
-                    self.cloud.exec_callback(self.callbacks)
+                    if self.cloud.exec_callback(self.callbacks,self.stop_event):
+                        break
                 except Exception:
                     traceback.print_exc()
                     self.callbacks.on_update_status("error: check the console for more information")
-                time.sleep(1)
+                #reconnect after a lost connection:
+                self.stop_event.wait(1)
 
         self.callback_thread = threading.Thread(target=callback)
         self.callback_thread.start()
@@ -96,6 +97,18 @@ class CloudTrainer(BaseTrainer):
             if self.commands.get_stop_command():
                 return
 
+            if self.config.cloud.stream_concept_upload and not self.reattach:
+                #upload concepts while the remote trainer is loading the model:
+                def upload():
+                    try:
+                        self.cloud.upload_concepts(self.commands,streaming=True)
+                    except Exception:
+                        traceback.print_exc()
+                        self.callbacks.on_update_status("error: check the console for more information")
+
+                self.upload_thread=threading.Thread(target=upload)
+                self.upload_thread.start()
+
             self.callbacks.on_update_status("starting trainer on cloud")
             self.cloud.run_trainer()
 
@@ -107,6 +120,8 @@ class CloudTrainer(BaseTrainer):
             raise
         finally:
             self.stop_event.set()
+            if self.upload_thread is not None:
+                self.upload_thread.join()
             self.callback_thread.join()
             self.callbacks.on_update_status("waiting for downloads")
             self.sync_thread.join()
@@ -8,24 +8,32 @@ from collections.abc import Callable
 from pathlib import Path
 
 from modules.dataLoader.BaseDataLoader import BaseDataLoader
+from modules.dataLoader.LazyEpochDataSet import LazyEpochDataSet
 from modules.model.BaseModel import BaseModel
 from modules.modelLoader.BaseModelLoader import BaseModelLoader
 from modules.modelSampler.BaseModelSampler import BaseModelSampler, ModelSamplerOutput
 from modules.modelSaver.BaseModelSaver import BaseModelSaver
 from modules.modelSetup.BaseModelSetup import BaseModelSetup
 from modules.trainer.BaseTrainer import BaseTrainer
-from modules.util import create, path_util
+from modules.util import create, distributed_util, path_util
+from modules.util.AsyncSampler import AsyncSampler, SampleJob
+from modules.util.BatchPrefetcher import BatchPrefetcher
 from modules.util.callbacks.TrainCallbacks import TrainCallbacks
 from modules.util.commands.TrainCommands import TrainCommands
+from modules.util.compile_util import compile_statistics, print_compile_statistics
 from modules.util.config.SampleConfig import SampleConfig
 from modules.util.config.TrainConfig import TrainConfig
 from modules.util.dtype_util import create_grad_scaler, enable_grad_scaling
 from modules.util.enum.ConceptType import ConceptType
+from modules.util.enum.EMAMode import EMAMode
 from modules.util.enum.FileType import FileType
+from modules.util.enum.LearningRateScaler import LearningRateScaler
 from modules.util.enum.ModelFormat import ModelFormat
 from modules.util.enum.TimeUnit import TimeUnit
 from modules.util.enum.TrainingMethod import TrainingMethod
 from modules.util.memory_util import TorchMemoryRecorder
+from modules.util.MemoryPolicy import memory_policy
+from modules.util.ModelNames import ModelNames
 from modules.util.time_util import get_string_timestamp
 from modules.util.torch_util import torch_gc
 from modules.util.TrainProgress import TrainProgress
@@ -50,6 +58,8 @@ class GenericTrainer(BaseTrainer):
     model_sampler: BaseModelSampler
     model: BaseModel | None
     validation_data_loader: BaseDataLoader
+    async_sampler: AsyncSampler | None
+    batch_prefetcher: BatchPrefetcher | None
 
     previous_sample_time: float
     sample_queue: list[Callable]
@@ -60,25 +70,43 @@ class GenericTrainer(BaseTrainer):
 
     grad_hook_handles: list[RemovableHandle]
 
-    def __init__(self, config: TrainConfig, callbacks: TrainCallbacks, commands: TrainCommands):
+    def __init__(
+            self,
+            config: TrainConfig,
+            callbacks: TrainCallbacks,
+            commands: TrainCommands,
+            wait_for_data: Callable[[], None] | None = None,
+    ):
         super().__init__(config, callbacks, commands)
 
-        tensorboard_log_dir = os.path.join(config.workspace_dir, "tensorboard")
-        os.makedirs(Path(tensorboard_log_dir).absolute(), exist_ok=True)
-        self.tensorboard = SummaryWriter(os.path.join(tensorboard_log_dir, f"{config.save_filename_prefix}{get_string_timestamp()}"))
-        if config.tensorboard and not config.tensorboard_always_on:
-            super()._start_tensorboard()
+        # called before the data loader is created, if the training data is still being transferred
+        self.wait_for_data = wait_for_data
+
+        # in distributed training, only the main process logs, samples and saves
+        self.is_main_process = distributed_util.is_main_process()
+
+        if self.is_main_process:
+            tensorboard_log_dir = os.path.join(config.workspace_dir, "tensorboard")
+            os.makedirs(Path(tensorboard_log_dir).absolute(), exist_ok=True)
+            self.tensorboard = SummaryWriter(os.path.join(tensorboard_log_dir, f"{config.save_filename_prefix}{get_string_timestamp()}"))
+            if config.tensorboard and not config.tensorboard_always_on:
+                super()._start_tensorboard()
+        else:
+            self.tensorboard = distributed_util.NullSummaryWriter()
 
         self.model = None
+        self.async_sampler = None
+        self.batch_prefetcher = None
         self.one_step_trained = False
 
         self.grad_hook_handles = []
 
     def start(self):
-        self.__save_config_to_workspace()
+        if self.is_main_process:
+            self.__save_config_to_workspace()
 
-        if self.config.clear_cache_before_training and self.config.latent_caching:
-            self.__clear_cache()
+            if self.config.clear_cache_before_training and self.config.latent_caching:
+                self.__clear_cache()
 
         if self.config.train_dtype.enable_tf():
             torch.backends.cuda.matmul.allow_tf32 = True
@@ -132,6 +160,16 @@ class GenericTrainer(BaseTrainer):
         self.model.eval()
         torch_gc()
 
+        if self.config.async_sampling and self.is_main_process:
+            if distributed_util.is_enabled():
+                print("Async sampling is not supported in distributed training, sampling during training instead")
+            else:
+                # the model copy is loaded in the background, while the data loader is created
+                self.async_sampler = AsyncSampler(lambda: self.__create_async_sampling_model(model_names))
+
+        if self.wait_for_data is not None:
+            self.wait_for_data()
+
         self.callbacks.on_update_status("creating the data loader/caching")
 
         self.data_loader = self.create_data_loader(
@@ -144,7 +182,7 @@ class GenericTrainer(BaseTrainer):
         self.sample_queue = []
 
         self.parameters = self.model.parameters.parameters()
-        if self.config.validation:
+        if self.config.validation and self.is_main_process:
             self.validation_data_loader = self.create_data_loader(
                 self.model, self.model.train_progress, is_validation=True
             )
@@ -188,10 +226,52 @@ class GenericTrainer(BaseTrainer):
     def __enqueue_sample_during_training(self, fun: Callable):
         self.sample_queue.append(fun)
 
-    def __execute_sample_during_training(self):
+    def __execute_sample_during_training(self) -> bool:
+        # returns True if the model was used for sampling. The train device setup is not restored afterwards
+        transferred_to_temp_device = False
         for fun in self.sample_queue:
-            fun()
+            transferred_to_temp_device |= fun()
         self.sample_queue = []
+        return transferred_to_temp_device
+
+    def __create_async_sampling_model(self, model_names: ModelNames) -> tuple[BaseModel, BaseModelSampler]:
+        sampling_device = torch.device(self.config.async_sampling_device)
+
+        config = TrainConfig.default_values().from_dict(self.config.to_dict())
+        config.train_device = self.config.async_sampling_device
+        config.temp_device = self.config.async_sampling_device
+        # the copy is never trained, the ema weights are part of each snapshot
+        config.ema = EMAMode.OFF
+
+        model = self.model_loader.load(
+            model_type=config.model_type,
+            model_names=model_names,
+            weight_dtypes=config.weight_dtypes(),
+        )
+        model.train_config = config
+        # only the adapters and embeddings are set up, the copy doesn't need an optimizer
+        model.inference_only = True
+
+        model_setup = create.create_model_setup(
+            config.model_type,
+            sampling_device,
+            sampling_device,
+            config.training_method,
+            config.debug_mode,
+        )
+        model_setup.setup_optimizations(model, config)
+        model_setup.setup_model(model, config)
+        model.eval()
+
+        model_sampler = create.create_model_sampler(
+            sampling_device,
+            sampling_device,
+            model,
+            config.model_type,
+            config.training_method,
+        )
+
+        return model, model_sampler
 
     def __sample_loop(
             self,
@@ -200,7 +280,14 @@ class GenericTrainer(BaseTrainer):
             sample_config_list: list[SampleConfig],
             folder_postfix: str = "",
             is_custom_sample: bool = False,
+            model: BaseModel | None = None,
+            model_sampler: BaseModelSampler | None = None,
+            temp_device: torch.device | None = None,
     ):
+        model = model if model is not None else self.model
+        model_sampler = model_sampler if model_sampler is not None else self.model_sampler
+        temp_device = temp_device if temp_device is not None else self.temp_device
+
         for i, sample_config in enumerate(sample_config_list):
             if sample_config.enabled:
                 try:
@@ -238,13 +325,13 @@ class GenericTrainer(BaseTrainer):
                     on_sample = on_sample_custom if is_custom_sample else on_sample_default
                     on_update_progress = self.callbacks.on_update_sample_custom_progress if is_custom_sample else self.callbacks.on_update_sample_default_progress
 
-                    self.model.to(self.temp_device)
-                    self.model.eval()
+                    model.to(temp_device)
+                    model.eval()
 
                     sample_config = copy.copy(sample_config)
                     sample_config.from_train_config(self.config)
 
-                    self.model_sampler.sample(
+                    model_sampler.sample(
                         sample_config=sample_config,
                         destination=sample_path,
                         image_format=self.config.sample_image_format,
@@ -259,40 +346,72 @@ class GenericTrainer(BaseTrainer):
 
                 torch_gc()
 
+    def __sample_config_list(self, sample_params_list: list[SampleConfig] | None) -> tuple[list[SampleConfig], bool]:
+        # returns the sample configs, and whether they are custom samples
+        if sample_params_list:
+            return sample_params_list, True
+
+        if self.config.samples is not None:
+            return list(self.config.samples), False
+
+        with open(self.config.sample_definition_file_name, 'r') as f:
+            samples = json.load(f)
+            for i in range(len(samples)):
+                samples[i] = SampleConfig.default_values().from_dict(samples[i])
+            return samples, False
+
     def __sample_during_training(
             self,
             train_progress: TrainProgress,
             train_device: torch.device,
             sample_params_list: list[SampleConfig] = None,
-    ):
+    ) -> bool:
+        sample_config_list, is_custom_sample = self.__sample_config_list(sample_params_list)
+
         # Special case for schedule-free optimizers.
         if self.config.optimizer.optimizer.is_schedule_free:
             torch.clear_autocast_cache()
             self.model.optimizer.eval()
-        torch_gc()
 
-        self.callbacks.on_update_status("sampling")
+        if self.async_sampler is not None and not self.async_sampler.failed:
+            # if the model copy can't be created, the samples are rendered on the trained model instead
+            def fallback() -> bool:
+                return self.__sample_during_training(train_progress, train_device, sample_params_list)
 
-        is_custom_sample = False
-        if not sample_params_list:
-            if self.config.samples is not None:
-                sample_params_list = self.config.samples
-            else:
-                with open(self.config.sample_definition_file_name, 'r') as f:
-                    samples = json.load(f)
-                    for i in range(len(samples)):
-                        samples[i] = SampleConfig.default_values().from_dict(samples[i])
-                    sample_params_list = samples
+            self.__enqueue_async_samples(train_progress, sample_config_list, is_custom_sample, fallback)
+            transferred_to_temp_device = False
         else:
-            is_custom_sample = True
+            torch_gc()
+
+            self.callbacks.on_update_status("sampling")
+
+            with self.model.residency.phase("sampling"):
+                self.__sample_loops(train_progress, train_device, sample_config_list, is_custom_sample)
+            transferred_to_temp_device = True
 
+        # Special case for schedule-free optimizers.
+        if self.config.optimizer.optimizer.is_schedule_free:
+            torch.clear_autocast_cache()
+            self.model.optimizer.train()
+
+        torch_gc()
+
+        return transferred_to_temp_device
+
+    def __sample_loops(
+            self,
+            train_progress: TrainProgress,
+            train_device: torch.device,
+            sample_config_list: list[SampleConfig],
+            is_custom_sample: bool,
+    ):
         if self.model.ema:
             self.model.ema.copy_ema_to(self.parameters, store_temp=True)
 
         self.__sample_loop(
             train_progress=train_progress,
             train_device=train_device,
-            sample_config_list=sample_params_list,
+            sample_config_list=sample_config_list,
             is_custom_sample=is_custom_sample,
         )
 
@@ -304,17 +423,73 @@ class GenericTrainer(BaseTrainer):
             self.__sample_loop(
                 train_progress=train_progress,
                 train_device=train_device,
-                sample_config_list=sample_params_list,
+                sample_config_list=sample_config_list,
                 folder_postfix=" - no-ema",
             )
 
-        self.model_setup.setup_train_device(self.model, self.config)
-        # Special case for schedule-free optimizers.
-        if self.config.optimizer.optimizer.is_schedule_free:
-            torch.clear_autocast_cache()
-            self.model.optimizer.train()
+    def __async_sample_job(
+            self,
+            train_progress: TrainProgress,
+            sample_config_list: list[SampleConfig],
+            folder_postfix: str,
+            is_custom_sample: bool,
+    ) -> SampleJob:
+        sampling_device = torch.device(self.config.async_sampling_device)
 
-        torch_gc()
+        def sample(model: BaseModel, model_sampler: BaseModelSampler):
+            self.__sample_loop(
+                train_progress=train_progress,
+                train_device=sampling_device,
+                sample_config_list=sample_config_list,
+                folder_postfix=folder_postfix,
+                is_custom_sample=is_custom_sample,
+                model=model,
+                model_sampler=model_sampler,
+                temp_device=sampling_device,
+            )
+
+        return SampleJob(AsyncSampler.snapshot(self.parameters), sample)
+
+    def __enqueue_async_samples(
+            self,
+            train_progress: TrainProgress,
+            sample_config_list: list[SampleConfig],
+            is_custom_sample: bool,
+            fallback: Callable[[], bool],
+    ):
+        # the samples are rendered later, so they need their own copy of the progress
+        train_progress = copy.copy(train_progress)
+        jobs = []
+
+        if self.model.ema:
+            self.model.ema.copy_ema_to(self.parameters, store_temp=True)
+
+        jobs.append(self.__async_sample_job(train_progress, sample_config_list, "", is_custom_sample))
+
+        if self.model.ema:
+            self.model.ema.copy_temp_to(self.parameters)
+
+        # ema-less sampling, if an ema model exists
+        if self.model.ema and not is_custom_sample and self.config.non_ema_sampling:
+            jobs.append(self.__async_sample_job(train_progress, sample_config_list, " - no-ema", False))
+
+        self.async_sampler.enqueue(jobs, replaceable=not is_custom_sample, fallback=fallback)
+
+    def __prefetching_paused(self):
+        # models can't be moved or used for anything else while the prefetcher loads a batch
+        return self.batch_prefetcher.paused() if self.batch_prefetcher is not None else contextlib.nullcontext()
+
+    @staticmethod
+    def __report_loaded_batches(data_loader, data_set: LazyEpochDataSet):
+        # reported on the thread that loads the batches, which is the prefetcher thread if batches are prefetched
+        for batch in data_loader:
+            data_set.batch_loaded()
+            yield batch
+
+    def __close_batch_prefetcher(self):
+        if self.batch_prefetcher is not None:
+            self.batch_prefetcher.close()
+            self.batch_prefetcher = None
 
     def __validate(self, train_progress: TrainProgress):
         if self.__needs_validate(train_progress):
@@ -403,7 +578,13 @@ class GenericTrainer(BaseTrainer):
         if os.path.isfile(self.config.sample_definition_file_name):
             shutil.copy2(self.config.sample_definition_file_name, samples_path)
 
-    def backup(self, train_progress: TrainProgress, print_msg: bool = True, print_cb: Callable[[str], None] = print):
+    def backup(
+            self,
+            train_progress: TrainProgress,
+            print_msg: bool = True,
+            print_cb: Callable[[str], None] = print,
+            restore_train_device: bool = True,
+    ):
         torch_gc()
 
         self.callbacks.on_update_status("creating backup")
@@ -420,13 +601,14 @@ class GenericTrainer(BaseTrainer):
             if print_msg:
                 print_cb("Creating Backup " + backup_path)
 
-            self.model_saver.save(
-                self.model,
-                self.config.model_type,
-                ModelFormat.INTERNAL,
-                backup_path,
-                None,
-            )
+            with self.model.residency.phase("backup"):
+                self.model_saver.save(
+                    self.model,
+                    self.config.model_type,
+                    ModelFormat.INTERNAL,
+                    backup_path,
+                    None,
+                )
 
             self.__save_backup_config(backup_path)
         except Exception:
@@ -442,7 +624,8 @@ class GenericTrainer(BaseTrainer):
             if self.config.rolling_backup:
                 self.__prune_backups(self.config.rolling_backup_count)
 
-        self.model_setup.setup_train_device(self.model, self.config)
+        if restore_train_device:
+            self.model_setup.setup_train_device(self.model, self.config)
         # Special case for schedule-free optimizers.
         if self.config.optimizer.optimizer.is_schedule_free:
             torch.clear_autocast_cache()
@@ -471,13 +654,14 @@ class GenericTrainer(BaseTrainer):
             if self.config.optimizer.optimizer.is_schedule_free:
                 torch.clear_autocast_cache()
                 self.model.optimizer.eval()
-            self.model_saver.save(
-                model=self.model,
-                model_type=self.config.model_type,
-                output_model_format=self.config.output_model_format,
-                output_model_destination=save_path,
-                dtype=self.config.output_dtype.torch_dtype()
-            )
+            with self.model.residency.phase("save"):
+                self.model_saver.save(
+                    model=self.model,
+                    model_type=self.config.model_type,
+                    output_model_format=self.config.output_model_format,
+                    output_model_destination=save_path,
+                    dtype=self.config.output_dtype.torch_dtype()
+                )
             if self.config.optimizer.optimizer.is_schedule_free:
                 torch.clear_autocast_cache()
                 self.model.optimizer.train()
@@ -528,6 +712,22 @@ class GenericTrainer(BaseTrainer):
             "update_step", self.config.gradient_accumulation_steps, TimeUnit.STEP, train_progress, start_at_zero=False
         )
 
+    def __learning_rate_factor(self, accumulated_samples: int) -> float:
+        # with token budget batching, the batch size changes from step to step. The learning rate
+        # scaler is applied to the actual number of samples instead of the configured batch size
+        if not self.config.token_budget_batching or self.config.learning_rate_scaler not in [
+            LearningRateScaler.BATCH,
+            LearningRateScaler.BOTH,
+        ]:
+            return 1.0
+
+        configured_samples = self.config.batch_size * self.config.gradient_accumulation_steps * distributed_util.world_size()
+        return (accumulated_samples / configured_samples) ** 0.5
+
+    def __scale_learning_rates(self, factor: float):
+        for param_group in self.model.optimizer.param_groups:
+            param_group['lr'] *= factor
+
     def __apply_fused_back_pass(self, scaler):
         if self.config.optimizer.optimizer.supports_fused_back_pass() and self.config.optimizer.fused_back_pass:
             if self.config.gradient_accumulation_steps > 1:
@@ -541,6 +741,7 @@ class GenericTrainer(BaseTrainer):
                         if scaler:
                             def __grad_hook(tensor: Tensor, param_group=param_group, i=i):
                                 if self.__is_update_step(self.model.train_progress):
+                                    distributed_util.all_reduce_gradient(tensor)
                                     scaler.unscale_parameter_(tensor, self.model.optimizer)
                                     if self.config.clip_grad_norm is not None:
                                         nn.utils.clip_grad_norm_(tensor, self.config.clip_grad_norm)
@@ -549,6 +750,7 @@ class GenericTrainer(BaseTrainer):
                         else:
                             def __grad_hook(tensor: Tensor, param_group=param_group, i=i):
                                 if self.__is_update_step(self.model.train_progress):
+                                    distributed_util.all_reduce_gradient(tensor)
                                     if self.config.clip_grad_norm is not None:
                                         nn.utils.clip_grad_norm_(tensor, self.config.clip_grad_norm)
                                     self.model.optimizer.step_parameter(tensor, param_group, i)
@@ -586,17 +788,20 @@ class GenericTrainer(BaseTrainer):
 
         lr_scheduler = None
         accumulated_loss = 0.0
+        accumulated_samples = 0
         ema_loss = None
         ema_loss_steps = 0
         for _epoch in tqdm(range(train_progress.epoch, self.config.epochs, 1), desc="epoch"):
             self.callbacks.on_update_status("starting epoch/caching")
 
             if self.config.latent_caching:
-                self.data_loader.get_data_set().start_next_epoch()
+                with self.model.residency.phase("caching"):
+                    self.data_loader.get_data_set().start_next_epoch()
                 self.model_setup.setup_train_device(self.model, self.config)
             else:
                 self.model_setup.setup_train_device(self.model, self.config)
-                self.data_loader.get_data_set().start_next_epoch()
+                with self.model.residency.phase("caching"):
+                    self.data_loader.get_data_set().start_next_epoch()
 
             # Special case for schedule-free optimizers, which need train()
             # called before training. Can and should move this to a callback
@@ -623,82 +828,140 @@ class GenericTrainer(BaseTrainer):
                 )
 
             current_epoch_length = self.data_loader.get_data_set().approximate_length()
-            step_tqdm = tqdm(self.data_loader.get_data_loader(), desc="step", total=current_epoch_length,
+            if isinstance(self.data_loader.get_data_set(), LazyEpochDataSet):
+                # the next epoch is started while the last batches are trained. Caching and masked latent removal
+                # need the model to start an epoch, so they are excluded
+                self.data_loader.get_data_set().start_next_epoch_in_background = \
+                    _epoch + 1 < self.config.epochs \
+                    and not self.config.latent_caching \
+                    and not self.config.model_type.has_mask_input()
+            data_loader = self.data_loader.get_data_loader()
+            if isinstance(self.data_loader.get_data_set(), LazyEpochDataSet):
+                data_loader = self.__report_loaded_batches(data_loader, self.data_loader.get_data_set())
+            if self.config.dataloader_prefetch_batches > 0:
+                # upcoming batches, including their text encoder outputs, are loaded during the training step
+                self.batch_prefetcher = BatchPrefetcher(data_loader, self.config.dataloader_prefetch_batches, train_device)
+                data_loader = self.batch_prefetcher
+            step_tqdm = tqdm(data_loader, desc="step", total=current_epoch_length,
                              initial=train_progress.epoch_step)
             for batch in step_tqdm:
-                if self.__needs_sample(train_progress) or self.commands.get_and_reset_sample_default_command():
+                if self.is_main_process and (self.__needs_sample(train_progress)
+                                             or self.commands.get_and_reset_sample_default_command()):
                     self.__enqueue_sample_during_training(
                         lambda: self.__sample_during_training(train_progress, train_device)
                     )
 
-                if self.__needs_backup(train_progress):
+                if self.is_main_process and self.__needs_backup(train_progress):
                     self.commands.backup()
 
-                if self.__needs_save(train_progress):
+                if self.is_main_process and self.__needs_save(train_progress):
                     self.commands.save()
 
                 sample_commands = self.commands.get_and_reset_sample_custom_commands()
-                if sample_commands:
+                if sample_commands and self.is_main_process:
                     def create_sample_commands_fun(sample_commands):
                         def sample_commands_fun():
-                            self.__sample_during_training(train_progress, train_device, sample_commands)
+                            return self.__sample_during_training(train_progress, train_device, sample_commands)
 
                         return sample_commands_fun
 
                     self.__enqueue_sample_during_training(create_sample_commands_fun(sample_commands))
 
+                if self.async_sampler is not None:
+                    # samples that were queued while the async sampling model failed to load
+                    for fallback in self.async_sampler.take_fallbacks():
+                        self.__enqueue_sample_during_training(fallback)
+
                 if self.__needs_gc(train_progress):
                     torch_gc()
 
                 if not has_gradient:
-                    self.__execute_sample_during_training()
-                    transferred_to_temp_device = False
+                    with self.__prefetching_paused():
+                        # the train device setup is only restored once, after sampling, backup and saving
+                        transferred_to_temp_device = self.__execute_sample_during_training()
 
-                    if self.commands.get_and_reset_backup_command():
-                        self.model.to(self.temp_device)
-                        self.backup(train_progress, True, step_tqdm.write)
-                        transferred_to_temp_device = True
+                        if self.commands.get_and_reset_backup_command():
+                            self.model.to(self.temp_device)
+                            self.backup(train_progress, True, step_tqdm.write, restore_train_device=False)
+                            transferred_to_temp_device = True
 
-                    if self.commands.get_and_reset_save_command():
-                        self.model.to(self.temp_device)
-                        self.save(train_progress, True, step_tqdm.write)
-                        transferred_to_temp_device = True
+                        if self.commands.get_and_reset_save_command():
+                            self.model.to(self.temp_device)
+                            self.save(train_progress, True, step_tqdm.write)
+                            transferred_to_temp_device = True
 
-                    if transferred_to_temp_device:
-                        self.model_setup.setup_train_device(self.model, self.config)
+                        if transferred_to_temp_device:
+                            self.model_setup.setup_train_device(self.model, self.config)
 
                 self.callbacks.on_update_status("training")
 
+                batch_size = len(batch['concept_type'])
+                if self.config.token_budget_batching:
+                    # every process can have a different batch size, all of them count the samples of the whole step
+                    global_batch_size = distributed_util.all_reduce_sum(batch_size)
+                else:
+                    global_batch_size = batch_size * distributed_util.world_size()
+                accumulated_samples += global_batch_size
+
+                # applied before the forward pass, because the fused back pass updates parameters during backward()
+                learning_rate_factor = 1.0
+                if self.__is_update_step(train_progress):
+                    learning_rate_factor = self.__learning_rate_factor(accumulated_samples)
+                    self.__scale_learning_rates(learning_rate_factor)
+
                 with TorchMemoryRecorder(enabled=False):
-                    prior_pred_indices = [i for i in range(self.config.batch_size)
+                    prior_pred_indices = [i for i in range(batch_size)
                                           if ConceptType(batch['concept_type'][i]) == ConceptType.PRIOR_PREDICTION]
-                    if len(prior_pred_indices) > 0 \
-                            or (self.config.masked_training
-                                and self.config.masked_prior_preservation_weight > 0
-                                and self.config.training_method == TrainingMethod.LORA):
-                        with self.model_setup.prior_model(self.model, self.config), torch.no_grad():
-                            #do NOT create a subbatch using the indices, even though it would be more efficient:
-                            #different timesteps are used for a smaller subbatch by predict(), but the conditioning must match exactly:
-                            prior_model_output_data = self.model_setup.predict(self.model, batch, self.config, train_progress)
-                        model_output_data = self.model_setup.predict(self.model, batch, self.config, train_progress)
-                        prior_model_prediction = prior_model_output_data['predicted'].to(dtype=model_output_data['target'].dtype)
-                        model_output_data['target'][prior_pred_indices] = prior_model_prediction[prior_pred_indices]
-                        model_output_data['prior_target'] = prior_model_prediction
-                    else:
-                        model_output_data = self.model_setup.predict(self.model, batch, self.config, train_progress)
+                    needs_prior_prediction = len(prior_pred_indices) > 0 \
+                        or (self.config.masked_training
+                            and self.config.masked_prior_preservation_weight > 0
+                            and self.config.training_method == TrainingMethod.LORA)
+                    single_pass_prior_prediction = needs_prior_prediction \
+                        and self.config.single_pass_prior_prediction \
+                        and self.model_setup.supports_single_pass_prior_model(self.model)
+
+                    # the single pass context stays open until backward() is done, checkpointed layers need it
+                    with (self.model_setup.single_pass_prior_model(self.model, self.config, batch_size)
+                          if single_pass_prior_prediction else contextlib.nullcontext()) as replay_prior_model:
+                        if single_pass_prior_prediction:
+                            model_output_data = self.model_setup.predict(self.model, batch, self.config, train_progress)
+                            with replay_prior_model(), torch.no_grad():
+                                prior_model_output_data = self.model_setup.predict(self.model, batch, self.config, train_progress)
+                        elif needs_prior_prediction:
+                            with self.model_setup.prior_model(self.model, self.config), torch.no_grad():
+                                #do NOT create a subbatch using the indices, even though it would be more efficient:
+                                #different timesteps are used for a smaller subbatch by predict(), but the conditioning must match exactly:
+                                prior_model_output_data = self.model_setup.predict(self.model, batch, self.config, train_progress)
+                            model_output_data = self.model_setup.predict(self.model, batch, self.config, train_progress)
+                        else:
+                            model_output_data = self.model_setup.predict(self.model, batch, self.config, train_progress)
 
-                    loss = self.model_setup.calculate_loss(self.model, batch, model_output_data, self.config)
+                        if needs_prior_prediction:
+                            prior_model_prediction = prior_model_output_data['predicted'].to(dtype=model_output_data['target'].dtype)
+                            model_output_data['target'][prior_pred_indices] = prior_model_prediction[prior_pred_indices]
+                            model_output_data['prior_target'] = prior_model_prediction
 
-                    loss = loss / self.config.gradient_accumulation_steps
-                    if scaler:
-                        scaler.scale(loss).backward()
-                    else:
-                        loss.backward()
+                        loss = self.model_setup.calculate_loss(self.model, batch, model_output_data, self.config)
+
+                        loss = loss / self.config.gradient_accumulation_steps
+                        if global_batch_size != batch_size * distributed_util.world_size():
+                            # gradients are averaged across processes. Weighting each process by its share of
+                            # the samples turns that average into the mean over all samples of the step
+                            loss = loss * (batch_size * distributed_util.world_size() / global_batch_size)
+                        if scaler:
+                            scaler.scale(loss).backward()
+                        else:
+                            loss.backward()
 
                     has_gradient = True
                     accumulated_loss += loss.item()
 
                     if self.__is_update_step(train_progress):
+                        if not (self.config.optimizer.optimizer.supports_fused_back_pass()
+                                and self.config.optimizer.fused_back_pass):
+                            distributed_util.all_reduce_gradients(self.parameters)
+                        accumulated_loss = distributed_util.all_reduce_mean(accumulated_loss)
+
                         if scaler and self.config.optimizer.optimizer.supports_fused_back_pass() and self.config.optimizer.fused_back_pass:
                             scaler.step_after_unscale_parameter_(self.model.optimizer)
                             scaler.update()
@@ -713,6 +976,7 @@ class GenericTrainer(BaseTrainer):
                                 nn.utils.clip_grad_norm_(self.parameters, self.config.clip_grad_norm)
                             self.model.optimizer.step()
 
+                        self.__scale_learning_rates(1 / learning_rate_factor)
                         lr_scheduler.step()  # done before zero_grad, because some lr schedulers need gradients
                         self.model.optimizer.zero_grad(set_to_none=True)
                         has_gradient = False
@@ -731,7 +995,11 @@ class GenericTrainer(BaseTrainer):
                             'smooth loss': ema_loss,
                         })
                         self.tensorboard.add_scalar("smooth_loss/train_step", ema_loss, train_progress.global_step)
+                        if self.config.compile:
+                            for name, value in compile_statistics().items():
+                                self.tensorboard.add_scalar(f"compile/{name}", value, train_progress.global_step)
                         accumulated_loss = 0.0
+                        accumulated_samples = 0
 
                         self.model_setup.after_optimizer_step(self.model, self.config, train_progress)
                         if self.model.ema:
@@ -748,27 +1016,36 @@ class GenericTrainer(BaseTrainer):
 
                         self.one_step_trained = True
 
-                if self.config.validation:
-                    self.__validate(train_progress)
+                if self.config.validation and self.is_main_process:
+                    with self.__prefetching_paused():
+                        self.__validate(train_progress)
 
-                train_progress.next_step(self.config.batch_size)
+                train_progress.next_step(global_batch_size)
                 self.callbacks.on_update_train_progress(train_progress, current_epoch_length, self.config.epochs)
 
-                if self.commands.get_stop_command():
+                if distributed_util.broadcast_flag(self.commands.get_stop_command()):
                     return
 
+            self.__close_batch_prefetcher()
             train_progress.next_epoch()
             self.callbacks.on_update_train_progress(train_progress, current_epoch_length, self.config.epochs)
 
-            if self.commands.get_stop_command():
+            if distributed_util.broadcast_flag(self.commands.get_stop_command()):
                 return
 
     def end(self):
-        if self.one_step_trained:
+        self.__close_batch_prefetcher()
+
+        if self.async_sampler is not None:
+            # pending samples are dropped if the training was stopped
+            self.async_sampler.close(wait=not self.commands.get_stop_command())
+            self.async_sampler = None
+
+        if self.one_step_trained and self.is_main_process:
             self.model.to(self.temp_device)
 
             if self.config.backup_before_save:
-                self.backup(self.model.train_progress)
+                self.backup(self.model.train_progress, restore_train_device=False)
             # Special case for schedule-free optimizers.
             if self.config.optimizer.optimizer.is_schedule_free:
                 torch.clear_autocast_cache()
@@ -797,9 +1074,15 @@ class GenericTrainer(BaseTrainer):
 
         self.model.to(self.temp_device)
 
+        self.model.residency.print_statistics()
+        memory_policy.print_statistics()
+
+        if self.config.compile:
+            print_compile_statistics()
+
         self.tensorboard.close()
 
-        if self.config.tensorboard and not self.config.tensorboard_always_on:
+        if self.config.tensorboard and not self.config.tensorboard_always_on and self.is_main_process:
             super()._stop_tensorboard()
 
         for handle in self.grad_hook_handles:
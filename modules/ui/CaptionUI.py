@@ -13,8 +13,9 @@ from modules.module.RembgModel import RembgModel
 from modules.module.WDModel import WDModel
 from modules.ui.GenerateCaptionsWindow import GenerateCaptionsWindow
 from modules.ui.GenerateMasksWindow import GenerateMasksWindow
-from modules.util import path_util
-from modules.util.image_util import load_image
+from modules.util.DirectoryIndex import DirectoryIndex
+from modules.util.image_util import load_image, read_image_size
+from modules.util.ThumbnailCache import thumbnail_cache
 from modules.util.torch_util import default_device
 from modules.util.ui import components
 from modules.util.ui.ui_utils import bind_mousewheel, set_window_icon
@@ -223,28 +224,7 @@ class CaptionUI(ctk.CTkToplevel):
         self.prompt_component.focus_set()
 
     def scan_directory(self, include_subdirectories: bool = False):
-        def __is_supported_image_extension(filename):
-            name, ext = os.path.splitext(filename)
-            return path_util.is_supported_image_extension(ext) and not name.endswith("-masklabel") and not name.endswith("-condlabel")
-
-        self.image_rel_paths = []
-
-        if not self.dir or not os.path.isdir(self.dir):
-            return
-
-        if include_subdirectories:
-            for root, _, files in os.walk(self.dir):
-                for filename in files:
-                    if __is_supported_image_extension(filename):
-                        self.image_rel_paths.append(
-                            os.path.relpath(os.path.join(root, filename), self.dir)
-                        )
-        else:
-            for _, filename in enumerate(os.listdir(self.dir)):
-                if __is_supported_image_extension(filename):
-                    self.image_rel_paths.append(
-                        os.path.relpath(os.path.join(self.dir, filename), self.dir)
-                    )
+        self.image_rel_paths = DirectoryIndex(self.dir, include_subdirectories).rel_paths()
 
     def load_image(self):
         image_name = "resources/icons/icon.png"
@@ -253,8 +233,15 @@ class CaptionUI(ctk.CTkToplevel):
             image_name = self.image_rel_paths[self.current_image_index]
             image_name = os.path.join(self.dir, image_name)
 
+            # the neighbours are prepared in the background, so switching images doesn't wait for a decode
+            neighbours = [self.current_image_index + offset for offset in [1, -1, 2]]
+            thumbnail_cache.prefetch([
+                os.path.join(self.dir, self.image_rel_paths[index])
+                for index in neighbours if 0 <= index < len(self.image_rel_paths)
+            ], self.image_size)
+
         try:
-            return load_image(image_name, convert_mode="RGB")
+            return thumbnail_cache.get(image_name, self.image_size), read_image_size(image_name)
         except Exception:
             print(f'Could not open image {image_name}')
 
@@ -302,15 +289,14 @@ class CaptionUI(ctk.CTkToplevel):
         if index >= 0:
             self.image_labels[index].configure(text_color="#FF0000")
 
-            self.pil_image = self.load_image()
+            self.pil_image, (self.image_width, self.image_height) = self.load_image()
             self.pil_mask = self.load_mask()
             prompt = self.load_prompt()
 
-            self.image_width = self.pil_image.width
-            self.image_height = self.pil_image.height
-            scale = self.image_size / max(self.pil_image.height, self.pil_image.width)
-            height = int(self.pil_image.height * scale)
-            width = int(self.pil_image.width * scale)
+            # the preview is a cached thumbnail, masks are edited at the size of the original image
+            scale = self.image_size / max(self.image_height, self.image_width)
+            height = int(self.image_height * scale)
+            width = int(self.image_width * scale)
 
             self.pil_image = self.pil_image.resize((width, height), Image.Resampling.LANCZOS)
 
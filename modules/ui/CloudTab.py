@@ -72,6 +72,14 @@ class CloudTab:
                          tooltip="Instead of starting tensorboard locally, make a TCP tunnel to a tensorboard on the cloud")
         components.switch(self.frame, 8, 1, self.ui_state, "cloud.tensorboard_tunnel")
 
+        components.label(self.frame, 9, 0, "Compress file sync",
+                         tooltip="Compress files while they are transferred. Speeds up slow connections, but uses more CPU time on both sides")
+        components.switch(self.frame, 9, 1, self.ui_state, "cloud.sync_compression")
+
+        components.label(self.frame, 10, 0, "Upload data during model loading",
+                         tooltip="Start the remote trainer before the concept data is uploaded. The model is loaded while the upload continues, and the trainer waits for the upload to finish before it creates the data loader.")
+        components.switch(self.frame, 10, 1, self.ui_state, "cloud.stream_concept_upload")
+
 
 
         components.label(self.frame, 1, 2, "Remote Directory",
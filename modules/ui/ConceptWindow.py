@@ -1,15 +1,16 @@
 import math
 import os
-import pathlib
 import random
 import threading
 import time
 
 from modules.util import concept_stats, path_util
 from modules.util.config.ConceptConfig import ConceptConfig
+from modules.util.DirectoryIndex import DirectoryIndex
 from modules.util.enum.BalancingStrategy import BalancingStrategy
 from modules.util.enum.ConceptType import ConceptType
-from modules.util.image_util import load_image
+from modules.util.image_util import read_image_size
+from modules.util.ThumbnailCache import thumbnail_cache
 from modules.util.ui import components
 from modules.util.ui.ui_utils import set_window_icon
 from modules.util.ui.UIState import UIState
@@ -66,6 +67,8 @@ class InputPipelineModule(
 
 
 class ConceptWindow(ctk.CTkToplevel):
+    PREVIEW_SIZE = 300
+
     def __init__(
             self,
             parent,
@@ -82,6 +85,7 @@ class ConceptWindow(ctk.CTkToplevel):
         self.image_ui_state = image_ui_state
         self.text_ui_state = text_ui_state
         self.image_preview_file_index = 0
+        self.preview_directory_index = None
         self.preview_augmentations = ctk.BooleanVar(self, True)
 
         self.title("Concept")
@@ -549,31 +553,45 @@ class ConceptWindow(ctk.CTkToplevel):
         self.caption_preview.insert(index="1.0", text=caption_preview)
         self.caption_preview.configure(state="disabled")
 
+    def __preview_directory_index(self) -> DirectoryIndex:
+        index = self.preview_directory_index
+        if index is None or index.path != self.concept.path \
+                or index.include_subdirectories != self.concept.include_subdirectories:
+            index = DirectoryIndex(self.concept.path, self.concept.include_subdirectories)
+            self.preview_directory_index = index
+        else:
+            index.refresh()
+        return index
+
     def __get_preview_image(self):
         preview_image_path = "resources/icons/icon.png"
-        file_index = -1
-        glob_pattern = "**/*.*" if self.concept.include_subdirectories else "*.*"
-
-        if os.path.isdir(self.concept.path):
-            for path in pathlib.Path(self.concept.path).glob(glob_pattern):
-                extension = os.path.splitext(path)[1]
-                if path.is_file() and path_util.is_supported_image_extension(extension) \
-                        and not path.name.endswith("-masklabel.png") and not path.name.endswith("-condlabel.png"):
-                    preview_image_path = path_util.canonical_join(self.concept.path, path)
-                    file_index += 1
-                    if file_index == self.image_preview_file_index:
-                        break
-
-        image = load_image(preview_image_path, 'RGB')
+
+        directory_index = self.__preview_directory_index()
+        if len(directory_index) > 0:
+            self.image_preview_file_index = min(self.image_preview_file_index, len(directory_index) - 1)
+            preview_image_path = directory_index.absolute_path(self.image_preview_file_index)
+
+            # the neighbours are prepared in the background, so the next click doesn't wait for a decode
+            neighbours = [self.image_preview_file_index + offset for offset in [1, -1, 2]]
+            thumbnail_cache.prefetch([
+                directory_index.absolute_path(index) for index in neighbours if 0 <= index < len(directory_index)
+            ], self.PREVIEW_SIZE)
+
+        image = thumbnail_cache.get(preview_image_path, self.PREVIEW_SIZE)
         image_tensor = functional.to_tensor(image)
 
+        # augmentations with absolute sizes are scaled to the preview
+        preview_scale = image.width / read_image_size(preview_image_path)[0]
+
         splitext = os.path.splitext(preview_image_path)
         preview_mask_path = path_util.canonical_join(splitext[0] + "-masklabel.png")
         if not os.path.isfile(preview_mask_path):
             preview_mask_path = None
 
         if preview_mask_path:
-            mask = Image.open(preview_mask_path).convert("L")
+            mask = thumbnail_cache.get(preview_mask_path, self.PREVIEW_SIZE, mode="L")
+            if mask.size != image.size:
+                mask = mask.resize(image.size, Image.Resampling.NEAREST)
             mask_tensor = functional.to_tensor(mask)
         else:
             mask_tensor = torch.ones((1, image_tensor.shape[1], image_tensor.shape[2]))
@@ -641,7 +659,7 @@ class ConceptWindow(ctk.CTkToplevel):
             })
 
             circular_mask_shrink = RandomCircularMaskShrink(mask_name='mask', shrink_probability=1.0, shrink_factor_min=0.2, shrink_factor_max=1.0, enabled_in_name='enable_random_circular_mask_shrink')
-            random_mask_rotate_crop = RandomMaskRotateCrop(mask_name='mask', additional_names=['image'], min_size=512, min_padding_percent=10, max_padding_percent=30, max_rotate_angle=20, enabled_in_name='enable_random_mask_rotate_crop')
+            random_mask_rotate_crop = RandomMaskRotateCrop(mask_name='mask', additional_names=['image'], min_size=max(1, round(512 * preview_scale)), min_padding_percent=10, max_padding_percent=30, max_rotate_angle=20, enabled_in_name='enable_random_mask_rotate_crop')
             random_flip = RandomFlip(names=['image', 'mask'], enabled_in_name='enable_random_flip', fixed_enabled_in_name='enable_fixed_flip')
             random_rotate = RandomRotate(names=['image', 'mask'], enabled_in_name='enable_random_rotate', fixed_enabled_in_name='enable_fixed_rotate', max_angle_in_name='random_rotate_max_angle')
             random_brightness = RandomBrightness(names=['image'], enabled_in_name='enable_random_brightness', fixed_enabled_in_name='enable_fixed_brightness', max_strength_in_name='random_brightness_max_strength')
@@ -806,32 +824,22 @@ class ConceptWindow(ctk.CTkToplevel):
             print(f"Unable to get statistics for invalid concept path: {self.concept.path}")
             return
         start_time = time.perf_counter()
-        last_update = time.perf_counter()
         self.cancel_scan_flag.clear()
         self.concept_stats_tab.after(0, self.__disable_scan_buttons)
-        subfolders = [self.concept.path]
 
-        stats_dict = concept_stats.init_concept_stats(self.concept, advanced_checks)
-        for path in subfolders:
-            stats_dict = concept_stats.folder_scan(path, stats_dict, advanced_checks, self.concept)
+        def on_progress(stats_dict: dict):
+            #partial stats, called approx every half second
             stats_dict["processing_time"] = time.perf_counter() - start_time
-            if self.concept.include_subdirectories:     #add all subfolders of current directory to for loop
-                subfolders.extend([f for f in os.scandir(path) if f.is_dir()])
             self.concept.concept_stats = stats_dict
-            #cancel and set init stats if longer than waiting time or cancel flag set
-            if (time.perf_counter() - start_time) > waittime or self.cancel_scan_flag.is_set():
-                stats_dict = concept_stats.init_concept_stats(self.concept, advanced_checks)
-                stats_dict["processing_time"] = time.perf_counter() - start_time
-                self.concept.concept_stats = stats_dict
-                self.cancel_scan_flag.clear()
-                self.concept_stats_tab.after(0, self.__enable_scan_buttons)
-                break
-            #update GUI approx every half second
-            if time.perf_counter() > (last_update + 0.5):
-                last_update = time.perf_counter()
-                self.concept_stats_tab.after(0, self.__update_concept_stats)
-                # self.__update_concept_stats()
-                # self.concept_stats_tab.update()
+            self.concept_stats_tab.after(0, self.__update_concept_stats)
+
+        stats_dict = concept_stats.scan_concept(self.concept, advanced_checks, self.cancel_scan_flag, on_progress,
+                                                deadline=start_time + waittime)
+        #set init stats if cancelled or longer than waiting time, files read until then are kept in the index
+        if stats_dict is None:
+            stats_dict = concept_stats.init_concept_stats(self.concept, advanced_checks)
+        stats_dict["processing_time"] = time.perf_counter() - start_time
+        self.concept.concept_stats = stats_dict
 
         self.cancel_scan_flag.clear()
         self.concept_stats_tab.after(0, self.__enable_scan_buttons)
@@ -46,6 +46,7 @@ class ConfigList(metaclass=ABCMeta):
         self.show_toggle_button = show_toggle_button
         self.is_opening_window = False
         self._is_current_item_enabled = False
+        self.saved_data = None
 
         self.master.grid_rowconfigure(0, weight=0)
         self.master.grid_rowconfigure(1, weight=1)
@@ -247,10 +248,14 @@ class ConfigList(metaclass=ABCMeta):
                 if not os.path.exists(self.config_dir):
                     os.mkdir(self.config_dir)
 
-                write_json_atomic(
-                    getattr(self.train_config, self.attr_name),
-                    [element.to_dict() for element in self.current_config]
-                )
+                # only write the file if an element has changed since the last save. The serialized data is
+                # compared, because to_dict doesn't copy mutable values like concept_stats
+                path = getattr(self.train_config, self.attr_name)
+                data = [element.to_dict() for element in self.current_config]
+                serialized = json.dumps(data)
+                if (path, serialized) != self.saved_data:
+                    write_json_atomic(path, data)
+                    self.saved_data = (path, serialized)
         self._update_toggle_button_text()
 
     def __open_element_window(self, i, ui_state):
@@ -154,5 +154,5 @@ class ConvertModelUI(ctk.CTkToplevel):
         except Exception:
             traceback.print_exc()
 
-        torch_gc()
+        torch_gc(force=True)
         self.button.configure(state="normal")
@@ -27,7 +27,7 @@ class GenerateCaptionsWindow(ctk.CTkToplevel):
         self.models = ["Blip", "Blip2", "WD14 VIT v2"]
 
         self.title("Batch generate captions")
-        self.geometry("360x360")
+        self.geometry("360x400")
         self.resizable(True, True)
 
         self.frame = ctk.CTkFrame(self, width=600, height=300)
@@ -72,13 +72,19 @@ class GenerateCaptionsWindow(ctk.CTkToplevel):
         self.include_subdirectories_switch = ctk.CTkSwitch(self.frame, text="", variable=self.include_subdirectories_var)
         self.include_subdirectories_switch.grid(row=6, column=1, sticky="w", padx=5, pady=5)
 
+        self.batch_size_label = ctk.CTkLabel(self.frame, text="Batch Size", width=100)
+        self.batch_size_label.grid(row=7, column=0, sticky="w", padx=5, pady=5)
+        self.batch_size_entry = ctk.CTkEntry(self.frame, width=200)
+        self.batch_size_entry.insert(0, "1")
+        self.batch_size_entry.grid(row=7, column=1, sticky="w", padx=5, pady=5)
+
         self.progress_label = ctk.CTkLabel(self.frame, text="Progress: 0/0", width=100)
-        self.progress_label.grid(row=7, column=0, sticky="w", padx=5, pady=5)
+        self.progress_label.grid(row=8, column=0, sticky="w", padx=5, pady=5)
         self.progress = ctk.CTkProgressBar(self.frame, orientation="horizontal", mode="determinate", width=200)
-        self.progress.grid(row=7, column=1, sticky="w", padx=5, pady=5)
+        self.progress.grid(row=8, column=1, sticky="w", padx=5, pady=5)
 
         self.create_captions_button = ctk.CTkButton(self.frame, text="Create Captions", width=310, command=self.create_captions)
-        self.create_captions_button.grid(row=8, column=0, columnspan=2, sticky="w", padx=5, pady=5)
+        self.create_captions_button.grid(row=9, column=0, columnspan=2, sticky="w", padx=5, pady=5)
 
         self.frame.pack(fill="both", expand=True)
 
@@ -113,6 +119,11 @@ class GenerateCaptionsWindow(ctk.CTkToplevel):
             "Add as new line": "add",
         }[self.mode_var.get()]
 
+        try:
+            batch_size = max(1, int(self.batch_size_entry.get()))
+        except ValueError:
+            batch_size = 1
+
         self.parent.captioning_model.caption_folder(
             sample_dir=self.path_entry.get(),
             initial_caption=self.caption_entry.get(),
@@ -121,5 +132,6 @@ class GenerateCaptionsWindow(ctk.CTkToplevel):
             mode=mode,
             progress_callback=self.set_progress,
             include_subdirectories=self.include_subdirectories_var.get(),
+            batch_size=batch_size,
         )
         self.parent.load_image()
@@ -27,7 +27,7 @@ class GenerateMasksWindow(ctk.CTkToplevel):
         self.models = ["ClipSeg", "Rembg", "Rembg-Human", "Hex Color"]
 
         self.title("Batch generate masks")
-        self.geometry("360x430")
+        self.geometry("360x470")
         self.resizable(True, True)
 
         self.frame = ctk.CTkFrame(self, width=600, height=300)
@@ -86,13 +86,19 @@ class GenerateMasksWindow(ctk.CTkToplevel):
         self.include_subdirectories_switch = ctk.CTkSwitch(self.frame, text="", variable=self.include_subdirectories_var)
         self.include_subdirectories_switch.grid(row=8, column=1, sticky="w", padx=5, pady=5)
 
+        self.batch_size_label = ctk.CTkLabel(self.frame, text="Batch Size", width=100)
+        self.batch_size_label.grid(row=9, column=0, sticky="w", padx=5, pady=5)
+        self.batch_size_entry = ctk.CTkEntry(self.frame, width=200, placeholder_text="1")
+        self.batch_size_entry.insert(0, 1)
+        self.batch_size_entry.grid(row=9, column=1, sticky="w", padx=5, pady=5)
+
         self.progress_label = ctk.CTkLabel(self.frame, text="Progress: 0/0", width=100)
-        self.progress_label.grid(row=9, column=0, sticky="w", padx=5, pady=5)
+        self.progress_label.grid(row=10, column=0, sticky="w", padx=5, pady=5)
         self.progress = ctk.CTkProgressBar(self.frame, orientation="horizontal", mode="determinate", width=200)
-        self.progress.grid(row=9, column=1, sticky="w", padx=5, pady=5)
+        self.progress.grid(row=10, column=1, sticky="w", padx=5, pady=5)
 
         self.create_masks_button = ctk.CTkButton(self.frame, text="Create Masks", width=310, command=self.create_masks)
-        self.create_masks_button.grid(row=10, column=0, columnspan=2, sticky="w", padx=5, pady=5)
+        self.create_masks_button.grid(row=11, column=0, columnspan=2, sticky="w", padx=5, pady=5)
 
         self.frame.pack(fill="both", expand=True)
 
@@ -139,5 +145,6 @@ class GenerateMasksWindow(ctk.CTkToplevel):
             expand_pixels=int(self.expand_entry.get()),
             progress_callback=self.set_progress,
             include_subdirectories=self.include_subdirectories_var.get(),
+            batch_size=max(1, int(self.batch_size_entry.get())),
         )
         self.parent.load_image()
@@ -240,13 +240,21 @@ class TrainUI(ctk.CTk):
                          tooltip="Number of threads used for the data loader. Increase if your GPU has room during caching, decrease if it's going out of memory during caching.")
         components.entry(frame, 11, 1, self.ui_state, "dataloader_threads")
 
-        components.label(frame, 12, 0, "Train Device",
+        components.label(frame, 12, 0, "Prefetch Batches",
+                         tooltip="Number of batches that are loaded in the background while the current step is trained. This includes encoding prompts with frozen text encoders if their outputs are not cached. Uses additional memory. 0 disables prefetching")
+        components.entry(frame, 12, 1, self.ui_state, "dataloader_prefetch_batches")
+
+        components.label(frame, 13, 0, "Train Device",
                          tooltip="The device used for training. Can be \"cuda\", \"cuda:0\", \"cuda:1\" etc. Default:\"cuda\"")
-        components.entry(frame, 12, 1, self.ui_state, "train_device")
+        components.entry(frame, 13, 1, self.ui_state, "train_device")
 
-        components.label(frame, 13, 0, "Temp Device",
+        components.label(frame, 14, 0, "Temp Device",
                          tooltip="The device used to temporarily offload models while they are not used. Default:\"cpu\"")
-        components.entry(frame, 13, 1, self.ui_state, "temp_device")
+        components.entry(frame, 14, 1, self.ui_state, "temp_device")
+
+        components.label(frame, 15, 0, "Text Encoder Device",
+                         tooltip="The device of frozen text encoders if their outputs are not cached, for example \"cpu\" or \"cuda:1\". Prompts are encoded there, only the outputs are moved to the train device. Combine with batch prefetching to encode the next batches during the training step. Empty uses the train device. Default:\"\"")
+        components.entry(frame, 15, 1, self.ui_state, "text_encoder_device")
 
         frame.pack(fill="both", expand=1)
         return frame
@@ -272,10 +280,25 @@ class TrainUI(ctk.CTk):
                          tooltip="Caching of intermediate training data that can be re-used between epochs")
         components.switch(frame, 1, 1, self.ui_state, "latent_caching")
 
+        # source cache
+        components.label(frame, 2, 0, "Source Caching",
+                         tooltip="Only used without latent caching. Caches downscaled copies of large source images, so they don't need to be decoded at full resolution in every epoch. Cropping and augmentations still run on every epoch")
+        components.switch(frame, 2, 1, self.ui_state, "source_cache")
+
+        # caching batch size
+        components.label(frame, 3, 0, "Caching Batch Size",
+                         tooltip="Only used with latent caching. The maximum number of images of the same resolution that are encoded together while caching. It's reduced automatically if a batch doesn't fit into memory")
+        components.entry(frame, 3, 1, self.ui_state, "caching_batch_size")
+
+        # lazy epoch planning
+        components.label(frame, 4, 0, "Lazy Epoch Planning",
+                         tooltip="Sorts the samples of an epoch into aspect ratio batches in the background. Training starts as soon as the first batches are filled, instead of after the whole epoch is sorted. Without latent caching, the next epoch is prepared during the last step of the current one, or the last steps if batches are prefetched. Not used with token budget batching")
+        components.switch(frame, 4, 1, self.ui_state, "lazy_epoch_planning")
+
         # clear cache before training
-        components.label(frame, 2, 0, "Clear cache before training",
+        components.label(frame, 5, 0, "Clear cache before training",
                          tooltip="Clears the cache directory before starting to train. Only disable this if you want to continue using the same cached data. Disabling this can lead to errors, if other settings are changed during a restart")
-        components.switch(frame, 2, 1, self.ui_state, "clear_cache_before_training")
+        components.switch(frame, 5, 1, self.ui_state, "clear_cache_before_training")
 
         frame.pack(fill="both", expand=1)
         return frame
@@ -327,6 +350,16 @@ class TrainUI(ctk.CTk):
                          tooltip="Whether to include sample images in the Tensorboard output.")
         components.switch(sub_frame, 0, 3, self.ui_state, "samples_to_tensorboard")
 
+        components.label(sub_frame, 0, 4, "Async Sampling",
+                         tooltip="Renders samples from a snapshot of the trained weights while training continues. "
+                                 "This loads a second copy of the model on the sampling device.")
+        components.switch(sub_frame, 0, 5, self.ui_state, "async_sampling")
+
+        components.label(sub_frame, 0, 6, "Sampling Device",
+                         tooltip="The device used for async sampling, for example a second GPU (cuda:1). "
+                                 "cpu is only practical for small models.")
+        components.entry(sub_frame, 0, 7, self.ui_state, "async_sampling_device", width=80, sticky="nw")
+
         # table
         frame = ctk.CTkFrame(master=master, corner_radius=0)
         frame.grid(row=1, column=0, sticky="nsew")
@@ -581,7 +614,7 @@ class TrainUI(ctk.CTk):
                 train_config=self.train_config,
             )
             self.wait_window(window)
-            torch_gc()
+            torch_gc(force=True)
 
     def open_profiling_tool(self):
         self.profiling_window.deiconify()
@@ -632,7 +665,7 @@ class TrainUI(ctk.CTk):
         self.training_thread = None
         self.training_commands = None
         torch.clear_autocast_cache()
-        torch_gc()
+        torch_gc(force=True)
 
         if error_caught:
             self.on_update_status("error: check the console for more information")
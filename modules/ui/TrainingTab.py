@@ -249,21 +249,26 @@ class TrainingTab:
                          tooltip="The batch size of one training step")
         components.entry(frame, 7, 1, self.ui_state, "batch_size")
 
+        # token budget batching
+        components.label(frame, 8, 0, "Token Budget Batching",
+                         tooltip="Scales the batch size of each aspect ratio bucket with its resolution, so every batch contains the same number of pixels. The batch size applies to the highest training resolution. With a batch learning rate scaler, the learning rate follows the actual batch size of each step")
+        components.switch(frame, 8, 1, self.ui_state, "token_budget_batching")
+
         # accumulation steps
-        components.label(frame, 8, 0, "Accumulation Steps",
+        components.label(frame, 9, 0, "Accumulation Steps",
                          tooltip="Number of accumulation steps. Increase this number to trade batch size for training speed")
-        components.entry(frame, 8, 1, self.ui_state, "gradient_accumulation_steps")
+        components.entry(frame, 9, 1, self.ui_state, "gradient_accumulation_steps")
 
         # Learning Rate Scaler
-        components.label(frame, 9, 0, "Learning Rate Scaler",
+        components.label(frame, 10, 0, "Learning Rate Scaler",
                          tooltip="Selects the type of learning rate scaling to use during training. Functionally equated as: LR * SQRT(selection)")
-        components.options(frame, 9, 1, [str(x) for x in list(LearningRateScaler)], self.ui_state,
+        components.options(frame, 10, 1, [str(x) for x in list(LearningRateScaler)], self.ui_state,
                            "learning_rate_scaler")
 
         # clip grad norm
-        components.label(frame, 10, 0, "Clip Grad Norm",
+        components.label(frame, 11, 0, "Clip Grad Norm",
                          tooltip="Clips the gradient norm. Leave empty to disable gradient clipping.")
-        components.entry(frame, 10, 1, self.ui_state, "clip_grad_norm")
+        components.entry(frame, 11, 1, self.ui_state, "clip_grad_norm")
 
     def __create_base2_frame(self, master, row, video_training_enabled: bool = False):
         frame = ctk.CTkFrame(master=master, corner_radius=5)
@@ -328,6 +333,12 @@ class TrainingTab:
         components.switch(frame, row, 1, self.ui_state, "enable_autocast_cache")
         row += 1
 
+        # compile
+        components.label(frame, row, 0, "Compile Transformer Blocks",
+                         tooltip="Compiles the transformer blocks with torch.compile. Requires gradient checkpointing. The first steps of each new resolution are slower, but long training runs are faster")
+        components.switch(frame, row, 1, self.ui_state, "compile")
+        row += 1
+
         # resolution
         components.label(frame, row, 0, "Resolution",
                          tooltip="The resolution used for training. Optionally specify multiple resolutions separated by a comma, or a single exact resolution in the format <width>x<height>")
@@ -614,10 +625,15 @@ class TrainingTab:
                          tooltip="Preserves regions outside the mask using the original untrained model output as a target. Only available for LoRA training. If enabled, use a low unmasked weight.")
         components.entry(frame, 4, 1, self.ui_state, "masked_prior_preservation_weight")
 
+        # single pass prior prediction
+        components.label(frame, 5, 0, "Single Pass Prior Prediction",
+                         tooltip="Calculates the prior prediction and the training prediction in a single forward pass of the denoiser with a doubled batch. Faster than two separate passes, but uses more memory. Only used when LoRA is trained on the denoiser only.")
+        components.switch(frame, 5, 1, self.ui_state, "single_pass_prior_prediction")
+
         # use custom conditioning image
-        components.label(frame, 5, 0, "Custom Conditioning Image",
+        components.label(frame, 6, 0, "Custom Conditioning Image",
                          tooltip="When custom conditioning image is enabled, will use png postfix with -condlabel instead of automatically generated.It's suitable for special scenarios, such as object removal, allowing the model to learn a certain behavior concept")
-        components.switch(frame, 5, 1, self.ui_state, "custom_conditioning_image")
+        components.switch(frame, 6, 1, self.ui_state, "custom_conditioning_image")
 
     def __create_loss_frame(self, master, row, supports_vb_loss: bool = False):
         frame = ctk.CTkFrame(master=master, corner_radius=5)
@@ -1,5 +1,4 @@
 import concurrent.futures
-import math
 import os
 import pathlib
 import random
@@ -8,11 +7,11 @@ import threading
 import webbrowser
 from tkinter import filedialog
 
+from modules.util import video_util
 from modules.util.ui import components
 
 import customtkinter as ctk
 import cv2
-import scenedetect
 
 
 class VideoToolUI(ctk.CTkToplevel):
@@ -313,48 +312,13 @@ class VideoToolUI(ctk.CTkToplevel):
                 print("No file specified, or invalid file path!")
                 return []
         else:
-            input_videos = []
             if not pathlib.Path(input_path_dir).is_dir() or input_path_dir == "":
                 print("Invalid input directory!")
                 return []
-            for path in pathlib.Path(input_path_dir).glob("**/*.*"):    #check directory and subdirectories
-                if path.is_file():
-                    vid = cv2.VideoCapture(path)
-                    if vid.isOpened() and vid.read()[0]:    #check if valid video
-                        input_videos += [path]
-                    vid.release()
+            input_videos = video_util.find_videos(input_path_dir)    #check directory and subdirectories
             print(f'Found {len(input_videos)} videos to process')
             return input_videos
 
-    def __get_random_aspect(self, size: tuple[int, int], variation: float) -> tuple[int, int, int, int]:
-        if variation == 0:
-            return 0, size[0], 0, size[1]
-
-        old_aspect = size[0]/size[1]    #height, width
-        variation_scaled = old_aspect*variation
-        if old_aspect > 1.2:
-            new_aspect = max(1.0, random.triangular(old_aspect-(variation_scaled*1.5), old_aspect+(variation_scaled/2), old_aspect))
-        elif old_aspect < 0.85:
-            new_aspect = min(1.0, random.triangular(old_aspect-(variation_scaled/2), old_aspect+(variation_scaled*1.5), old_aspect))
-        else:
-            new_aspect = random.triangular(old_aspect-variation_scaled, old_aspect+variation_scaled)
-
-        new_aspect = round(new_aspect, 2)
-        if new_aspect > old_aspect:
-            new_height = int(size[0])
-            new_width = int(size[1]*(old_aspect/new_aspect))
-        elif new_aspect < old_aspect:
-            new_height = int(size[0]*(new_aspect/old_aspect))
-            new_width = int(size[1])
-        else:
-            new_height = int(size[0])
-            new_width = int(size[1])
-
-        position_x = random.randint(0, size[1]-new_width)
-        position_y = random.randint(0, size[0]-new_height)
-        #print(position_y, new_height, position_x, new_width)
-        return position_y, new_height, position_x, new_width
-
     def __extract_clips_button(self, batch_mode: bool):
         t = threading.Thread(target = self.__extract_clips_multi, args = [batch_mode])
         t.daemon = True
@@ -393,72 +357,16 @@ class VideoToolUI(ctk.CTkToplevel):
 
     def __extract_clips(self, video_path: str, timestamp_min: str, timestamp_max: str, max_length: float,
                         split_at_cuts: bool, crop_variation: float, target_fps: int, output_dir: str):
-        video = cv2.VideoCapture(video_path)
-        fps = video.get(cv2.CAP_PROP_FPS)
-        max_length_frames = int(max_length * fps)   #convert max length from seconds to frames
-        min_length_frames = int(0.25*fps)           #minimum clip length of 1/4 second
-        timestamp_max_frame = int(sum(int(x) * 60 ** i for i, x in enumerate(reversed(timestamp_max.split(':')))) * fps)
-        timestamp_max_frame = min(timestamp_max_frame, int(video.get(cv2.CAP_PROP_FRAME_COUNT)))
-        timestamp_min_frame = int(sum(int(x) * 60 ** i for i, x in enumerate(reversed(timestamp_min.split(':')))) * fps)
-        timestamp_min_frame = min(timestamp_min_frame, timestamp_max_frame)
-
-
-        if split_at_cuts:
-            timecode_list = scenedetect.detect(str(video_path), scenedetect.AdaptiveDetector(), start_time=timestamp_min_frame, end_time=timestamp_max_frame) #detect scene transitions
-            scene_list = [(x[0].get_frames(), x[1].get_frames()) for x in timecode_list]
-            if len(scene_list) == 0:
-                scene_list = [(timestamp_min_frame,timestamp_max_frame)]     #use start/end frames if no scenes detected
-        else:
-            scene_list = [(timestamp_min_frame,timestamp_max_frame)]  #default if not using cuts, start and end of time range
-
-        scene_list_split = []
-        for scene in scene_list:
-            length = scene[1]-scene[0]
-            if length > max_length_frames:  #check for any scenes longer than max length
-                n = math.ceil(length/max_length_frames) #divide into n new scenes
-                new_length = int(length/n)
-                new_splits = range(scene[0], scene[1]+min_length_frames, new_length)   #divide clip into closest chunks to max_length
-                for i, _n in enumerate(new_splits[:-1]):
-                    if new_splits[i+1] - new_splits[i] > min_length_frames:
-                        scene_list_split += [(new_splits[i], new_splits[i+1])]
-            else:
-                if length > (min_length_frames+2):
-                    scene_list_split += [(scene[0]+1, scene[1]-1)]      #trim first and last frame from detected scenes to avoid transition artifacts
-
-        print(f'Video "{os.path.basename(video_path)}" being split into {len(scene_list_split)} clips in {output_dir}...')
-
-        with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
-            for scene in scene_list_split:
-                executor.submit(self.__save_clip, scene, video_path, target_fps, crop_variation, output_dir)
-
-        video.release()
-
-    def __save_clip(self, scene : tuple[int, int], video_path : str, target_fps : int, crop_variation : float, output_dir : str):
-        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-        basename, ext = os.path.splitext(os.path.basename(video_path))
-        video = cv2.VideoCapture(video_path)
-        size = (int(video.get(cv2.CAP_PROP_FRAME_WIDTH)), int(video.get(cv2.CAP_PROP_FRAME_HEIGHT)))
-        fps = video.get(cv2.CAP_PROP_FPS)
-        y, h, x, w = self.__get_random_aspect((size[1], size[0]), crop_variation)
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
-        output_name = f'{output_dir}{os.sep}{basename}_{scene[0]}-{scene[1]}'
-        output_ext = ".mp4"
-        writer = cv2.VideoWriter(output_name+output_ext,fourcc,fps,(w,h))
-        video.set(cv2.CAP_PROP_POS_FRAMES, scene[0])
-        frame_number = video.get(cv2.CAP_PROP_POS_FRAMES)
-        success, frame = video.read()
-        while success and (frame_number < scene[1]):    #loop through frames within each scene
-            writer.write(frame[y:y+h, x:x+w])
-            #writer.write(frame)
-            success, frame = video.read()
-            frame_number += 1
-        writer.release()
-        video.release()
-
-        if target_fps > 0:
-            subprocess.run(f'ffmpeg -y -i "{output_name}{output_ext}" -c:a copy -r {target_fps} "{output_name}_{target_fps}fps{output_ext}"',shell=True,stderr=subprocess.DEVNULL,stdout=subprocess.DEVNULL)
-            os.remove(output_name+output_ext)
+        video_util.extract_clips(
+            video_path=video_path,
+            output_dir=output_dir,
+            timestamp_min=timestamp_min,
+            timestamp_max=timestamp_max,
+            max_length=max_length,
+            split_at_cuts=split_at_cuts,
+            crop_variation=crop_variation,
+            target_fps=target_fps,
+        )
 
     def __extract_images_button(self, batch_mode : bool):
         t = threading.Thread(target = self.__extract_images_multi, args = [batch_mode])
@@ -501,9 +409,9 @@ class VideoToolUI(ctk.CTkToplevel):
         video = cv2.VideoCapture(video_path)
         fps = video.get(cv2.CAP_PROP_FPS)
         image_rate = int(fps / capture_rate)   #convert capture rate from seconds to frames
-        timestamp_max_frame = int(sum(int(x) * 60 ** i for i, x in enumerate(reversed(timestamp_max.split(':')))) * fps)
+        timestamp_max_frame = video_util.timestamp_to_frame(timestamp_max, fps)
         timestamp_max_frame = min(timestamp_max_frame, int(video.get(cv2.CAP_PROP_FRAME_COUNT)))
-        timestamp_min_frame = int(sum(int(x) * 60 ** i for i, x in enumerate(reversed(timestamp_min.split(':')))) * fps)
+        timestamp_min_frame = video_util.timestamp_to_frame(timestamp_min, fps)
         timestamp_min_frame = min(timestamp_min_frame, timestamp_max_frame)
         frame_range = range(timestamp_min_frame, timestamp_max_frame, image_rate)
         frame_list = []
@@ -535,7 +443,7 @@ class VideoToolUI(ctk.CTkToplevel):
 
         for f in output_list_cut:
             filename = f'{output_dir}{os.sep}{basename}_{f[0]}.jpg'
-            y, h, x, w = self.__get_random_aspect((size[1], size[0]), crop_variation)
+            y, h, x, w = video_util.get_random_aspect((size[1], size[0]), crop_variation)
             video.set(cv2.CAP_PROP_POS_FRAMES, f[0])
             success, frame = video.read()
             if success:
@@ -0,0 +1,137 @@
+import threading
+import traceback
+from collections.abc import Callable
+
+from modules.model.BaseModel import BaseModel
+from modules.modelSampler.BaseModelSampler import BaseModelSampler
+
+import torch
+from torch import Tensor
+
+
+class SampleJob:
+    def __init__(
+            self,
+            parameters: list[Tensor],
+            sample: Callable[[BaseModel, BaseModelSampler], None],
+    ):
+        self.parameters = parameters
+        self.sample = sample
+
+
+class AsyncSampler:
+    """
+    Renders samples on a separate copy of the model while training continues. The copy is created once by
+    create_model, in the background. Each job contains a host memory snapshot of the trainable parameters,
+    which is copied into the model copy before the job is sampled.
+
+    If the copy can't be created, failed is set. Jobs are then kept, and their fallbacks can be taken with
+    take_fallbacks() to sample them on the trained model instead.
+    """
+
+    def __init__(
+            self,
+            create_model: Callable[[], tuple[BaseModel, BaseModelSampler]],
+    ):
+        self.__create_model = create_model
+        self.__model = None
+        self.__model_sampler = None
+
+        self.__pending: list[tuple[list[SampleJob], bool, Callable[[], bool] | None]] = []
+        self.__condition = threading.Condition()
+        self.__closed = False
+        self.failed = False
+
+        self.__thread = threading.Thread(target=self.__run, daemon=True)
+        self.__thread.start()
+
+    @staticmethod
+    def snapshot(parameters: list[Tensor]) -> list[Tensor]:
+        """
+        Copies the parameters to host memory.
+        """
+        with torch.no_grad():
+            return [parameter.detach().to(device="cpu", copy=True) for parameter in parameters]
+
+    def enqueue(self, jobs: list[SampleJob], replaceable: bool, fallback: Callable[[], bool] | None = None):
+        """
+        Adds jobs to the queue. If replaceable is set, they replace all replaceable jobs that haven't started yet,
+        so regular samples don't pile up if sampling is slower than the sample interval. fallback renders the same
+        samples without the model copy, it's used if the copy can't be created.
+        """
+        with self.__condition:
+            if replaceable:
+                num_pending = len(self.__pending)
+                self.__pending = [entry for entry in self.__pending if not entry[1]]
+                if len(self.__pending) != num_pending:
+                    print("Skipping outdated samples, sampling is slower than the sample interval")
+            self.__pending.append((jobs, replaceable, fallback))
+            self.__condition.notify_all()
+
+    def take_fallbacks(self) -> list[Callable[[], bool]]:
+        """
+        Returns the fallbacks of all jobs that were not sampled because the model copy could not be created,
+        and removes those jobs from the queue.
+        """
+        with self.__condition:
+            if not self.failed:
+                return []
+            fallbacks = [fallback for _, _, fallback in self.__pending if fallback is not None]
+            self.__pending.clear()
+            return fallbacks
+
+    def has_pending(self) -> bool:
+        with self.__condition:
+            return len(self.__pending) > 0
+
+    def close(self, wait: bool = True):
+        """
+        Stops the worker. If wait is set, all pending jobs are sampled first.
+        """
+        with self.__condition:
+            if not wait:
+                self.__pending.clear()
+            self.__closed = True
+            self.__condition.notify_all()
+        self.__thread.join()
+
+        self.__model = None
+        self.__model_sampler = None
+
+    def __apply_parameters(self, parameters: list[Tensor]):
+        target_parameters = self.__model.parameters.parameters()
+        if len(target_parameters) != len(parameters):
+            raise RuntimeError(f"snapshot has {len(parameters)} parameters, expected {len(target_parameters)}")
+
+        with torch.no_grad():
+            for target, source in zip(target_parameters, parameters, strict=True):
+                if target.shape != source.shape:
+                    raise RuntimeError(f"snapshot parameter shape {source.shape} doesn't match {target.shape}")
+                target.copy_(source)
+
+    def __run(self):
+        try:
+            self.__model, self.__model_sampler = self.__create_model()
+        except Exception:
+            traceback.print_exc()
+            print("Could not create the model for async sampling, falling back to sampling during training")
+            with self.__condition:
+                # pending jobs are kept, the trainer samples them with take_fallbacks()
+                self.failed = True
+            return
+
+        while True:
+            with self.__condition:
+                while not self.__pending and not self.__closed:
+                    self.__condition.wait()
+                if not self.__pending:
+                    return
+                jobs, _, _ = self.__pending.pop(0)
+
+            for job in jobs:
+                try:
+                    self.__apply_parameters(job.parameters)
+                    job.sample(self.__model, self.__model_sampler)
+                except Exception:  # noqa: PERF203
+                    traceback.print_exc()
+                    print("Error during async sampling, proceeding without sampling")
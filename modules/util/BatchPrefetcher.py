@@ -0,0 +1,136 @@
+import threading
+from collections import deque
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager, nullcontext
+
+import torch
+
+
+class BatchPrefetcher:
+    """
+    Iterates a data loader on a background thread, so the next batches are loaded while the current training step
+    runs. This overlaps all per sample work of the data loader with the training step, including prompt encoding
+    with frozen text encoders if their outputs are not cached. Those encoders can run on a separate device, see
+    BaseModelSetup._text_encoder_device.
+
+    On CUDA devices, the background thread uses a separate stream, so its kernels can run concurrently with the
+    training step. Models must not be moved while a batch is loaded, paused() waits for the current batch and stops
+    loading until the context is left.
+    """
+
+    def __init__(
+            self,
+            data_loader: Iterable[dict],
+            num_batches: int,
+            device: torch.device,
+    ):
+        self.__iterator = iter(data_loader)
+        self.__num_batches = max(1, num_batches)
+        self.__device = torch.device(device)
+        self.__stream = torch.cuda.Stream(self.__device) if self.__device.type == 'cuda' else None
+
+        self.__batches: deque[dict] = deque()
+        self.__condition = threading.Condition()
+        self.__pause_depth = 0
+        self.__loading = False
+        self.__finished = False
+        self.__closed = False
+        self.__exception = None
+
+        self.__thread = threading.Thread(target=self.__run, daemon=True)
+        self.__thread.start()
+
+    def __iter__(self) -> Iterator[dict]:
+        return self
+
+    def __next__(self) -> dict:
+        with self.__condition:
+            while not self.__batches and not self.__finished:
+                self.__condition.wait()
+
+            if not self.__batches:
+                if self.__exception is not None:
+                    raise self.__exception
+                raise StopIteration
+
+            batch = self.__batches.popleft()
+            self.__condition.notify_all()
+
+        if self.__stream is not None:
+            # the memory of the batch was allocated on the prefetch stream, but is now used on the current stream
+            self.__record_stream(batch, torch.cuda.current_stream(self.__device))
+
+        return batch
+
+    @staticmethod
+    def __record_stream(data: torch.Tensor | list | tuple | dict, stream: torch.cuda.Stream):
+        if isinstance(data, torch.Tensor):
+            if data.device.type == 'cuda':
+                data.record_stream(stream)
+        elif isinstance(data, list | tuple):
+            for elem in data:
+                BatchPrefetcher.__record_stream(elem, stream)
+        elif isinstance(data, dict):
+            for elem in data.values():
+                BatchPrefetcher.__record_stream(elem, stream)
+
+    @contextmanager
+    def paused(self):
+        """
+        Waits until the batch that is currently loaded is done, and doesn't start loading new batches inside the
+        context.
+        """
+        with self.__condition:
+            self.__pause_depth += 1
+            while self.__loading:
+                self.__condition.wait()
+        try:
+            yield
+        finally:
+            with self.__condition:
+                self.__pause_depth -= 1
+                self.__condition.notify_all()
+
+    def close(self):
+        """
+        Stops loading and discards all prefetched batches.
+        """
+        with self.__condition:
+            self.__closed = True
+            self.__condition.notify_all()
+        self.__thread.join()
+        self.__batches.clear()
+
+    def __run(self):
+        while True:
+            with self.__condition:
+                while not self.__closed and (self.__pause_depth > 0 or len(self.__batches) >= self.__num_batches):
+                    self.__condition.wait()
+                if self.__closed:
+                    return
+                self.__loading = True
+
+            batch = None
+            finished = False
+            exception = None
+            try:
+                with torch.cuda.stream(self.__stream) if self.__stream is not None else nullcontext(), torch.no_grad():
+                    batch = next(self.__iterator)
+                if self.__stream is not None:
+                    self.__stream.synchronize()
+            except StopIteration:
+                finished = True
+            except Exception as e:
+                finished = True
+                exception = e
+
+            with self.__condition:
+                self.__loading = False
+                if batch is not None:
+                    self.__batches.append(batch)
+                self.__finished = finished
+                self.__exception = exception
+                self.__condition.notify_all()
+
+            if finished:
+                return
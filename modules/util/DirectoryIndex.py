@@ -0,0 +1,74 @@
+import os
+
+from modules.util import path_util
+
+
+class DirectoryIndex:
+    """
+    Sorted index of the images of a concept directory, without masks and conditioning images. The directory is
+    scanned once, after that, looking up an image by its index doesn't touch the file system. refresh() scans the
+    directory again if the directory itself was modified.
+    """
+
+    def __init__(self, path: str, include_subdirectories: bool):
+        self.path = path
+        self.include_subdirectories = include_subdirectories
+
+        self.__rel_paths: list[str] = []
+        self.__scanned_mtime = None
+        self.refresh(force=True)
+
+    @staticmethod
+    def is_sample_image(filename: str) -> bool:
+        name, extension = os.path.splitext(filename)
+        return path_util.is_supported_image_extension(extension) \
+            and not name.endswith("-masklabel") and not name.endswith("-condlabel")
+
+    def __directory_mtime(self) -> float | None:
+        try:
+            return os.stat(self.path).st_mtime
+        except OSError:
+            return None
+
+    def __scan(self) -> list[str]:
+        rel_paths = []
+        if not self.path or not os.path.isdir(self.path):
+            return rel_paths
+
+        directories = [self.path]
+        while directories:
+            with os.scandir(directories.pop()) as entries:
+                for entry in entries:
+                    if entry.is_dir():
+                        if self.include_subdirectories:
+                            directories.append(entry.path)
+                    elif entry.is_file() and self.is_sample_image(entry.name):
+                        rel_paths.append(os.path.relpath(entry.path, self.path))
+
+        rel_paths.sort()
+        return rel_paths
+
+    def refresh(self, force: bool = False) -> bool:
+        """
+        Scans the directory again if it was modified, or if force is set. Returns True if it was scanned.
+        Changes inside subdirectories don't modify the directory, they are only picked up by a forced refresh.
+        """
+        mtime = self.__directory_mtime()
+        if not force and mtime == self.__scanned_mtime:
+            return False
+
+        self.__rel_paths = self.__scan()
+        self.__scanned_mtime = mtime
+        return True
+
+    def rel_paths(self) -> list[str]:
+        return list(self.__rel_paths)
+
+    def absolute_path(self, index: int) -> str:
+        return os.path.join(self.path, self.__rel_paths[index])
+
+    def __len__(self) -> int:
+        return len(self.__rel_paths)
+
+    def __getitem__(self, index: int) -> str:
+        return self.__rel_paths[index]
@@ -186,7 +186,7 @@ class StaticLayerAllocator:
 
     def ensure_allocation(self, cache_tensor_index: int):
         if self.cache_tensors[cache_tensor_index] is None:
-            torch_gc()
+            torch_gc(required_bytes=self.cache_tensor_size, device=self.device)
 
             self.cache_tensors[cache_tensor_index] = \
                 torch.zeros((self.cache_tensor_size,), dtype=torch.int8, device=self.device)
@@ -267,7 +267,7 @@ class StaticActivationAllocator:
             self.__current_cache_tensor_offset = 0
 
         if not cache_found:
-            torch_gc()
+            torch_gc(required_bytes=num_bytes, device=self.__device)
             cache_tensor = torch.zeros((num_bytes,), dtype=torch.int8, device=self.__device)
             log(f"{self.__device}/allocating activations cache {num_bytes:_}, total: {self.__allocated_bytes:_}, max: {self.__max_allocated_bytes:_}")
 
@@ -296,10 +296,10 @@ class StaticActivationAllocator:
                     unpin_tensor_(cache_tensor)
 
             self.__cache_tensors = []
-            torch_gc()
 
             # add 4kb for the alignment overhead
             num_bytes = self.__allocated_bytes + 4096
+            torch_gc(required_bytes=num_bytes, device=self.__device)
             cache_tensor = torch.zeros((num_bytes,), dtype=torch.int8, device=self.__device)
             log(f"{self.__device}/condensing activations cache {num_bytes:_}, total: {self.__allocated_bytes:_}, max: {self.__max_allocated_bytes:_}")
 
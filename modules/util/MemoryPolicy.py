@@ -0,0 +1,109 @@
+import torch
+
+import psutil
+
+GIB = 1024 ** 3
+
+
+class MemoryPolicy:
+    """
+    Decides when a garbage collection and emptying the allocator caches is worth its cost. Calls to torch_gc()
+    are only hints, a collection is done if memory is actually scarce:
+
+    - the python garbage collector runs if the allocated memory is above the high watermark, because
+      unreachable tensors can only be freed by the garbage collector
+    - the allocator caches are emptied if the free memory is below the low watermark and the allocator holds
+      enough unused cached memory to make a difference
+    - if the caller needs a number of bytes, memory is collected if they don't fit into the free memory
+
+    Without an accelerator, the same rules are applied to the system memory and the RSS of the process.
+    """
+
+    def __init__(
+            self,
+            high_watermark: float = 0.85,
+            low_watermark: float = 0.15,
+            min_cached_bytes: int = GIB,
+            rss_growth_bytes: int = 4 * GIB,
+    ):
+        self.high_watermark = high_watermark
+        self.low_watermark = low_watermark
+        self.min_cached_bytes = min_cached_bytes
+        self.rss_growth_bytes = rss_growth_bytes
+
+        self.collections = 0
+        self.cache_clears = 0
+        self.avoided_collections = 0
+        self.collection_time = 0.0
+
+        self.__process = psutil.Process()
+        self.__rss_after_collection = None
+
+    @staticmethod
+    def __accelerator_memory() -> tuple[int, int, int, int] | None:
+        # returns (free, total, allocated, cached) bytes of the current accelerator
+        if torch.cuda.is_available():
+            free, total = torch.cuda.mem_get_info()
+            allocated = torch.cuda.memory_allocated()
+            cached = torch.cuda.memory_reserved() - allocated
+            return free, total, allocated, cached
+        if torch.backends.mps.is_available():
+            total = torch.mps.recommended_max_memory()
+            allocated = torch.mps.current_allocated_memory()
+            driver_allocated = torch.mps.driver_allocated_memory()
+            return max(0, total - driver_allocated), total, allocated, driver_allocated - allocated
+        return None
+
+    def __host_decision(self, required_bytes: int) -> tuple[bool, bool]:
+        memory = psutil.virtual_memory()
+        if required_bytes > 0 and memory.available - required_bytes < memory.total * self.low_watermark:
+            return True, True
+
+        rss = self.__process.memory_info().rss
+        if self.__rss_after_collection is None:
+            self.__rss_after_collection = rss
+
+        collect = memory.available < memory.total * (1.0 - self.high_watermark) \
+                  or rss - self.__rss_after_collection > self.rss_growth_bytes
+        return collect, collect
+
+    def decide(self, required_bytes: int = 0, device: torch.device | None = None) -> tuple[bool, bool]:
+        """
+        Returns a tuple (collect garbage, empty caches).
+
+        Args:
+            required_bytes: number of bytes the caller is about to allocate
+            device: the device of that allocation. Host allocations are checked against the system memory
+        """
+        accelerator_memory = None
+        if device is None or torch.device(device).type != 'cpu':
+            accelerator_memory = self.__accelerator_memory()
+        if accelerator_memory is None:
+            return self.__host_decision(required_bytes)
+
+        free, total, allocated, cached = accelerator_memory
+
+        if required_bytes > 0 and free + cached < required_bytes + total * (1.0 - self.high_watermark):
+            return True, True
+
+        collect = allocated > total * self.high_watermark
+        empty_cache = free < total * self.low_watermark and cached >= self.min_cached_bytes
+        return collect, empty_cache
+
+    def collected(self, collect: bool, empty_cache: bool, duration: float):
+        self.collection_time += duration
+        if collect:
+            self.collections += 1
+            self.__rss_after_collection = self.__process.memory_info().rss
+        if empty_cache:
+            self.cache_clears += 1
+
+    def avoided(self):
+        self.avoided_collections += 1
+
+    def print_statistics(self):
+        print(f"memory policy: {self.collections} collections and {self.cache_clears} cache clears "
+              f"in {self.collection_time:.1f}s, {self.avoided_collections} collections avoided")
+
+
+memory_policy = MemoryPolicy()
@@ -0,0 +1,157 @@
+import functools
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from typing import Any
+
+from modules.util.torch_util import device_equals
+
+import torch
+from torch import nn
+
+
+class ModelResidency:
+    """
+    Keeps track of the device each component of a model (vae, text encoders, transformer/unet, their LoRA
+    adapters and offload conductors) resides on. Moves to the device a component is already on are skipped.
+    The number of bytes moved is recorded per phase (sampling, backup, save, ...).
+    """
+
+    def __init__(self):
+        self.__devices: dict[str, torch.device] = {}
+        self.__phase = "other"
+        self.__bytes_moved: dict[str, int] = {}
+        self.__moves: dict[str, int] = {}
+        self.__skipped_moves: dict[str, int] = {}
+
+    @staticmethod
+    def __tensors(components: list[Any]) -> Iterator[torch.Tensor]:
+        for component in components:
+            if isinstance(component, nn.Module):
+                yield from component.parameters()
+                yield from component.buffers()
+            elif component is not None:
+                # LoRA wrappers only expose their parameters
+                yield from component.parameters()
+
+    @staticmethod
+    def __first_tensor(component: Any) -> torch.Tensor | None:
+        if isinstance(component, nn.Module):
+            return next(component.parameters(), None)
+        elif component is not None:
+            parameters = component.parameters()
+            return parameters[0] if parameters else None
+        return None
+
+    def device(self, name: str) -> torch.device | None:
+        return self.__devices.get(name)
+
+    def is_resident(self, name: str, device: torch.device, components: list[Any]) -> bool:
+        """
+        Returns True if the component was last moved to device, and it wasn't moved away in the meantime.
+        Components can still be moved by code that doesn't go through this class, so the first tensor of
+        each part is checked as well.
+        """
+        if not device_equals(self.__devices.get(name), device):
+            return False
+
+        for component in components:
+            tensor = self.__first_tensor(component)
+            if tensor is not None and not device_equals(tensor.device, device):
+                return False
+
+        return True
+
+    def move(
+            self,
+            name: str,
+            device: torch.device,
+            components: list[Any],
+            move_fun: Callable[[], None],
+    ):
+        """
+        Calls move_fun to move the component to device, unless it's already there.
+
+        Args:
+            name: name of the component
+            device: the target device
+            components: all modules and LoRA wrappers that are moved by move_fun
+            move_fun: function that moves the component
+        """
+        device = torch.device(device)
+
+        if self.is_resident(name, device, components):
+            self.__skipped_moves[self.__phase] = self.__skipped_moves.get(self.__phase, 0) + 1
+            return
+
+        num_bytes = sum(
+            tensor.numel() * tensor.element_size()
+            for tensor in self.__tensors(components)
+            if not device_equals(tensor.device, device)
+        )
+
+        # forget the old device first, in case move_fun fails halfway through
+        self.__devices.pop(name, None)
+        move_fun()
+        self.__devices[name] = device
+
+        self.__bytes_moved[self.__phase] = self.__bytes_moved.get(self.__phase, 0) + num_bytes
+        self.__moves[self.__phase] = self.__moves.get(self.__phase, 0) + 1
+
+    def invalidate(self, name: str | None = None):
+        """
+        Forgets the device of a component, or of all components if name is None.
+        """
+        if name is None:
+            self.__devices.clear()
+        else:
+            self.__devices.pop(name, None)
+
+    @contextmanager
+    def phase(self, name: str):
+        """
+        Attributes all moves inside the context to the named phase.
+        """
+        previous_phase = self.__phase
+        self.__phase = name
+        try:
+            yield
+        finally:
+            self.__phase = previous_phase
+
+    def statistics(self) -> dict[str, dict[str, int]]:
+        phases = self.__bytes_moved.keys() | self.__skipped_moves.keys()
+        return {
+            phase: {
+                'bytes_moved': self.__bytes_moved.get(phase, 0),
+                'moves': self.__moves.get(phase, 0),
+                'skipped_moves': self.__skipped_moves.get(phase, 0),
+            } for phase in sorted(phases)
+        }
+
+    def print_statistics(self):
+        statistics = self.statistics()
+        if not statistics:
+            return
+
+        print("model transfers per phase:")
+        for phase, phase_statistics in statistics.items():
+            print(f"  {phase}: {phase_statistics['bytes_moved'] / (1024 ** 3):.2f} GiB in "
+                  f"{phase_statistics['moves']} moves, {phase_statistics['skipped_moves']} moves skipped")
+
+
+def tracked_component_to(name: str):
+    """
+    Decorator for the <component>_to(device) methods of a model. Moves are routed through the model's
+    ModelResidency. The moved modules are the attribute with the same name as the component, and its
+    LoRA adapter <name>_lora if it exists.
+    """
+
+    def decorator(fun: Callable[[Any, torch.device], None]):
+        @functools.wraps(fun)
+        def wrapper(self, device: torch.device):
+            components = [getattr(self, name, None), getattr(self, name + "_lora", None)]
+            self.residency.move(name, device, components, lambda: fun(self, device))
+
+        return wrapper
+
+    return decorator
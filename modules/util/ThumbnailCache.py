@@ -0,0 +1,131 @@
+import contextlib
+import hashlib
+import math
+import os
+import threading
+from collections import OrderedDict, deque
+
+from PIL import Image, ImageOps
+
+
+class ThumbnailCache:
+    """
+    Persistent cache of downscaled previews for the UI. Previews are keyed by the absolute path, size and mtime of
+    the source file, and the preview size, so changed files get a new preview. The most recently used previews are
+    also kept in memory. prefetch() generates previews in the background, for example for the neighbours of the
+    currently shown image.
+    """
+
+    def __init__(
+            self,
+            cache_dir: str,
+            memory_entries: int = 64,
+    ):
+        self.cache_dir = cache_dir
+        self.memory_entries = memory_entries
+
+        self.__memory: OrderedDict[str, Image.Image] = OrderedDict()
+        self.__condition = threading.Condition()
+        self.__in_progress: set[str] = set()
+
+        self.__prefetch_queue: deque[tuple[str, int, str]] = deque()
+        self.__prefetch_thread = None
+
+    def __key(self, path: str, max_size: int) -> str:
+        stat = os.stat(path)
+        key = f"{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}|{max_size}"
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()[:32]
+
+    def __cache_path(self, key: str, mode: str) -> str:
+        # single channel previews, like masks, are stored losslessly
+        return os.path.join(self.cache_dir, key + (".png" if mode == "L" else ".jpg"))
+
+    def __remember(self, key: str, image: Image.Image):
+        # called with the lock held
+        self.__memory[key] = image
+        self.__memory.move_to_end(key)
+        while len(self.__memory) > self.memory_entries:
+            self.__memory.popitem(last=False)
+
+    def __generate(self, path: str, max_size: int, mode: str, cache_path: str) -> Image.Image:
+        with Image.open(path) as image:
+            # JPEG sources can be decoded at a reduced size, which is much faster than a full decode
+            scale = min(1.0, max_size / max(image.size))
+            image.draft(image.mode, (math.ceil(image.size[0] * scale), math.ceil(image.size[1] * scale)))
+            image = ImageOps.exif_transpose(image)
+            image = image.convert(mode)
+            image.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # write to a temporary file first, another thread could read the same path
+        temp_path = f"{cache_path}.{threading.get_ident()}.write"
+        if mode == "L":
+            image.save(temp_path, format="PNG", compress_level=1)
+        else:
+            image.save(temp_path, format="JPEG", quality=90)
+        os.replace(temp_path, cache_path)
+
+        return image
+
+    def get(self, path: str, max_size: int, mode: str = "RGB") -> Image.Image:
+        """
+        Returns a preview of the image at path, that fits into max_size x max_size pixels.
+        """
+        key = self.__key(path, max_size) + mode
+
+        with self.__condition:
+            while key in self.__in_progress:
+                self.__condition.wait()
+            image = self.__memory.get(key)
+            if image is not None:
+                self.__memory.move_to_end(key)
+                return image
+            self.__in_progress.add(key)
+
+        try:
+            cache_path = self.__cache_path(key, mode)
+            image = None
+            if os.path.isfile(cache_path):
+                try:
+                    with Image.open(cache_path) as cached_image:
+                        image = cached_image.convert(mode)
+                except OSError:
+                    image = None
+            if image is None:
+                image = self.__generate(path, max_size, mode, cache_path)
+
+            with self.__condition:
+                self.__remember(key, image)
+            return image
+        finally:
+            with self.__condition:
+                self.__in_progress.discard(key)
+                self.__condition.notify_all()
+
+    def prefetch(self, paths: list[str], max_size: int, mode: str = "RGB"):
+        """
+        Generates previews of paths in the background. Replaces all previews that are still waiting to be
+        prefetched.
+        """
+        with self.__condition:
+            self.__prefetch_queue.clear()
+            self.__prefetch_queue.extend((path, max_size, mode) for path in paths)
+
+            if self.__prefetch_thread is None:
+                self.__prefetch_thread = threading.Thread(target=self.__prefetch_loop, daemon=True)
+                self.__prefetch_thread.start()
+            self.__condition.notify_all()
+
+    def __prefetch_loop(self):
+        while True:
+            with self.__condition:
+                while not self.__prefetch_queue:
+                    self.__condition.wait()
+                path, max_size, mode = self.__prefetch_queue.popleft()
+
+            # files that can't be read are reported when they are shown
+            with contextlib.suppress(Exception):
+                self.get(path, max_size, mode)
+
+
+thumbnail_cache = ThumbnailCache(os.path.join("workspace-cache", "thumbnails"))
@@ -7,6 +7,9 @@ from modules.util.args.BaseArgs import BaseArgs
 class CalculateLossArgs(BaseArgs):
     config_path: str
     output_path: str
+    batch_size: int
+    timesteps: list[float]
+    seeds: list[int]
 
     def __init__(self, data: list[(str, Any, type, bool)]):
         super().__init__(data)
@@ -19,6 +22,9 @@ class CalculateLossArgs(BaseArgs):
 
         parser.add_argument("--config-path", type=str, required=True, dest="config_path", help="The path to the config file")
         parser.add_argument("--output-path", type=str, required=True, dest="output_path", help="The path to the output file")
+        parser.add_argument("--batch-size", type=int, required=False, default=None, dest="batch_size", help="The batch size. Defaults to the batch size of the config")
+        parser.add_argument("--timesteps", type=float, nargs="+", required=False, default=[0.5], dest="timesteps", help="The timesteps to evaluate each sample at, as a fraction of the noise schedule")
+        parser.add_argument("--seeds", type=int, nargs="+", required=False, default=[0], dest="seeds", help="The noise seeds to evaluate each sample with")
 
         # @formatter:on
 
@@ -33,5 +39,8 @@ class CalculateLossArgs(BaseArgs):
         # name, default value, data type, nullable
         data.append(("config_path", None, str, True))
         data.append(("output_path", "losses.json", str, False))
+        data.append(("batch_size", None, int, True))
+        data.append(("timesteps", [0.5], list[float], False))
+        data.append(("seeds", [0], list[int], False))
 
         return CalculateLossArgs(data)
@@ -0,0 +1,42 @@
+import argparse
+from typing import Any
+
+from modules.util.args.BaseArgs import BaseArgs
+
+
+class CreateConceptArchiveArgs(BaseArgs):
+    input_dir: str
+    output_dir: str
+    shard_size_mb: int
+    include_subdirectories: bool
+
+    def __init__(self, data: list[(str, Any, type, bool)]):
+        super().__init__(data)
+
+    @staticmethod
+    def parse_args() -> 'CreateConceptArchiveArgs':
+        parser = argparse.ArgumentParser(description="One Trainer Create Concept Archive Script.")
+
+        # @formatter:off
+
+        parser.add_argument("--input-dir", type=str, required=True, dest="input_dir", help="The concept directory to convert")
+        parser.add_argument("--output-dir", type=str, required=True, dest="output_dir", help="Directory to write the shards and the index to. It can be used as the path of a concept")
+        parser.add_argument("--shard-size-mb", type=int, default=1024, required=False, dest="shard_size_mb", help="The approximate size of each shard in MiB")
+        parser.add_argument("--include-subdirectories", action="store_true", required=False, default=False, dest="include_subdirectories", help="Whether to include files in subdirectories")
+
+        # @formatter:on
+
+        args = CreateConceptArchiveArgs.default_values()
+        args.from_dict(vars(parser.parse_args()))
+        return args
+
+    @staticmethod
+    def default_values():
+        data = []
+
+        data.append(("input_dir", "", str, False))
+        data.append(("output_dir", "", str, False))
+        data.append(("shard_size_mb", 1024, int, False))
+        data.append(("include_subdirectories", False, bool, False))
+
+        return CreateConceptArchiveArgs(data)
@@ -0,0 +1,57 @@
+import argparse
+from typing import Any
+
+from modules.util.args.BaseArgs import BaseArgs
+
+
+class ExtractVideoClipsArgs(BaseArgs):
+    input_path: str
+    output_dir: str
+    timestamp_min: str
+    timestamp_max: str
+    max_length: float
+    split_at_cuts: bool
+    crop_variation: float
+    target_fps: int
+    output_subdirectories: bool
+
+    def __init__(self, data: list[(str, Any, type, bool)]):
+        super().__init__(data)
+
+    @staticmethod
+    def parse_args() -> 'ExtractVideoClipsArgs':
+        parser = argparse.ArgumentParser(description="One Trainer Extract Video Clips Script.")
+
+        # @formatter:off
+
+        parser.add_argument("--input", type=str, required=True, dest="input_path", help="A video file, or a directory that is searched for videos including subdirectories")
+        parser.add_argument("--output-dir", type=str, required=True, dest="output_dir", help="Directory to write the clips to")
+        parser.add_argument("--timestamp-min", type=str, default="00:00:00", required=False, dest="timestamp_min", help="Start of the range to extract from each video, in the format hh:mm:ss")
+        parser.add_argument("--timestamp-max", type=str, default="99:99:99", required=False, dest="timestamp_max", help="End of the range to extract from each video, in the format hh:mm:ss")
+        parser.add_argument("--max-length", type=float, default=3.0, required=False, dest="max_length", help="The maximum length of a clip in seconds")
+        parser.add_argument("--split-at-cuts", action="store_true", required=False, default=False, dest="split_at_cuts", help="Whether to split clips at detected scene cuts")
+        parser.add_argument("--crop-variation", type=float, default=0.0, required=False, dest="crop_variation", help="Amount of random aspect ratio variation of the crop of each clip")
+        parser.add_argument("--target-fps", type=int, default=0, required=False, dest="target_fps", help="The frame rate of the clips. 0 keeps the frame rate of the video")
+        parser.add_argument("--output-subdirectories", action="store_true", required=False, default=False, dest="output_subdirectories", help="Whether to write the clips of each video to a separate subdirectory")
+
+        # @formatter:on
+
+        args = ExtractVideoClipsArgs.default_values()
+        args.from_dict(vars(parser.parse_args()))
+        return args
+
+    @staticmethod
+    def default_values():
+        data = []
+
+        data.append(("input_path", "", str, False))
+        data.append(("output_dir", "", str, False))
+        data.append(("timestamp_min", "00:00:00", str, False))
+        data.append(("timestamp_max", "99:99:99", str, False))
+        data.append(("max_length", 3.0, float, False))
+        data.append(("split_at_cuts", False, bool, False))
+        data.append(("crop_variation", 0.0, float, False))
+        data.append(("target_fps", 0, int, False))
+        data.append(("output_subdirectories", False, bool, False))
+
+        return ExtractVideoClipsArgs(data)
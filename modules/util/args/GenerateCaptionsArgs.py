@@ -17,6 +17,7 @@ class GenerateCaptionsArgs(BaseArgs):
     device: str
     dtype: DataType
     include_subdirectories: bool
+    batch_size: int
 
     def __init__(self, data: list[(str, Any, type, bool)]):
         super().__init__(data)
@@ -36,6 +37,7 @@ class GenerateCaptionsArgs(BaseArgs):
         parser.add_argument("--device", type=str, required=False, default=default_device.type, dest="device", help="The device to use for calculations")
         parser.add_argument("--dtype", type=DataType, required=False, default=DataType.FLOAT_16, dest="dtype", help="The data type to use for weights during calculations", choices=list(DataType))
         parser.add_argument("--include-subdirectories", action="store_true", required=False, default=False, dest="include_subdirectories", help="Whether to include subdirectories when processing samples")
+        parser.add_argument("--batch-size", type=int, required=False, default=1, dest="batch_size", help="The number of images captioned in a single forward pass")
 
         # @formatter:on
 
@@ -56,5 +58,6 @@ class GenerateCaptionsArgs(BaseArgs):
         data.append(("device", default_device.type, str, False))
         data.append(("dtype", DataType.FLOAT_16, DataType, False))
         data.append(("include_subdirectories", False, bool, False))
+        data.append(("batch_size", 1, int, False))
 
         return GenerateCaptionsArgs(data)
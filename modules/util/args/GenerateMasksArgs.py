@@ -19,6 +19,7 @@ class GenerateMasksArgs(BaseArgs):
     dtype: DataType
     alpha: float
     include_subdirectories: bool
+    batch_size: int
 
     def __init__(self, data: list[(str, Any, type, bool)]):
         super().__init__(data)
@@ -40,6 +41,7 @@ class GenerateMasksArgs(BaseArgs):
         parser.add_argument("--dtype", type=DataType, required=False, default=DataType.FLOAT_32, dest="dtype", help="The data type to use for weights during calculations", choices=list(DataType))
         parser.add_argument("--alpha", type=float, required=False, default=1.0, dest="alpha", help="The factor to weight the mask by. Default is 1.")
         parser.add_argument("--include-subdirectories", action="store_true", required=False, default=False, dest="include_subdirectories", help="Whether to include subdirectories when processing samples")
+        parser.add_argument("--batch-size", type=int, required=False, default=1, dest="batch_size", help="The number of images masked in a single forward pass")
 
         # @formatter:on
 
@@ -62,5 +64,6 @@ class GenerateMasksArgs(BaseArgs):
         data.append(("dtype", DataType.FLOAT_16, DataType, False))
         data.append(("alpha", 1.0, float, False))
         data.append(("include_subdirectories", False, bool, False))
+        data.append(("batch_size", 1, int, False))
 
         return GenerateMasksArgs(data)
@@ -7,6 +7,14 @@ from modules.util.args.BaseArgs import BaseArgs
 class TrainArgs(BaseArgs):
     config_path: str
     secrets_path: str
+    callback_path: str
+    command_path: str
+    upload_manifest_path: str
+    num_processes: int
+    num_nodes: int
+    node_rank: int
+    master_address: str
+    master_port: int
 
     def __init__(self, data: list[(str, Any, type, bool)]):
         super().__init__(data)
@@ -19,8 +27,14 @@ class TrainArgs(BaseArgs):
 
         parser.add_argument("--config-path", type=str, required=True, dest="config_path", help="The path to the config file")
         parser.add_argument("--secrets-path", type=str, required=False, dest="secrets_path", help="The path to the secrets file")
-        parser.add_argument("--callback-path", type=str, required=False, dest="callback_path", help="The path to the callback pickle file")
-        parser.add_argument("--command-path", type=str, required=False, dest="command_path", help="The path to the command pickle file")
+        parser.add_argument("--callback-path", type=str, required=False, dest="callback_path", help="The path to the callback event file")
+        parser.add_argument("--command-path", type=str, required=False, dest="command_path", help="The path to the command pipe")
+        parser.add_argument("--upload-manifest-path", type=str, required=False, dest="upload_manifest_path", help="The path to the manifest of a concept upload that is still running. The data loader is created after the upload is complete")
+        parser.add_argument("--num-processes", type=int, required=False, default=1, dest="num_processes", help="The number of training processes on this node. Each process uses one device")
+        parser.add_argument("--num-nodes", type=int, required=False, default=1, dest="num_nodes", help="The number of nodes in a multi-node training run")
+        parser.add_argument("--node-rank", type=int, required=False, default=0, dest="node_rank", help="The rank of this node in a multi-node training run")
+        parser.add_argument("--master-address", type=str, required=False, default="127.0.0.1", dest="master_address", help="The address of the node with rank 0")
+        parser.add_argument("--master-port", type=int, required=False, default=29500, dest="master_port", help="A free port on the node with rank 0")
 
         # @formatter:on
 
@@ -37,5 +51,11 @@ class TrainArgs(BaseArgs):
         data.append(("secrets_path", None, str, True))
         data.append(("callback_path", None, str, True))
         data.append(("command_path", None, str, True))
+        data.append(("upload_manifest_path", None, str, True))
+        data.append(("num_processes", 1, int, False))
+        data.append(("num_nodes", 1, int, False))
+        data.append(("node_rank", 0, int, False))
+        data.append(("master_address", "127.0.0.1", str, False))
+        data.append(("master_port", 29500, int, False))
 
         return TrainArgs(data)
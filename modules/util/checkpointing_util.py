@@ -2,6 +2,7 @@ import inspect
 from collections.abc import Callable
 from typing import Any
 
+from modules.util.compile_util import compile_forward
 from modules.util.config.TrainConfig import TrainConfig
 from modules.util.LayerOffloadConductor import LayerOffloadConductor
 from modules.util.torch_util import add_dummy_grad_fn_, has_grad_fn
@@ -70,12 +71,16 @@ def create_checkpointed_forward(
         include_from_offload_param_names: list[str] = None,
         conductor: LayerOffloadConductor | None = None,
         layer_index: int = 0,
+        compile: bool = False,
 ) -> Callable:
     orig_forward = orig_module.forward
     if include_from_offload_param_names is None:
         include_from_offload_param_names = []
     included_offload_param_indices = __get_args_indices(orig_forward, include_from_offload_param_names)
 
+    # only the block itself is compiled. Offloading and checkpointing stay outside the compiled graph
+    block_forward = compile_forward(orig_forward) if compile else orig_forward
+
     bound_conductor = conductor
     bound_layer_index = layer_index
     if conductor is not None:
@@ -92,7 +97,7 @@ def create_checkpointed_forward(
                 bound_conductor.start_forward(True)
 
             args = bound_conductor.before_layer(bound_layer_index, call_id, args)
-            output = orig_forward(*args)
+            output = block_forward(*args)
             bound_conductor.after_layer(bound_layer_index, call_id, args)
 
             # make sure at least one of the output tensors has a grad_fn so the output of the checkpoint has a grad_fn
@@ -109,7 +114,7 @@ def create_checkpointed_forward(
                 bound_conductor.start_forward(False)
 
             args = bound_conductor.before_layer(bound_layer_index, call_index, args)
-            output = orig_forward(*args)
+            output = block_forward(*args)
             bound_conductor.after_layer(bound_layer_index, call_index, args)
             return output
 
@@ -142,7 +147,7 @@ def create_checkpointed_forward(
                 *args,
                 **kwargs,
         ):
-            return orig_forward(
+            return block_forward(
                 *args,
                 **kwargs,
             )
@@ -183,11 +188,13 @@ def enable_checkpointing_for_basic_transformer_blocks(
                     child_module, torch.device(config.train_device),
                     [],
                     conductor, layer_index,
+                    compile=config.compile,
                 )
             else:
                 child_module.forward = create_checkpointed_forward(
                     child_module, torch.device(config.train_device),
                     [],
+                    compile=config.compile,
                 )
             layer_index += 1
 
@@ -219,6 +226,7 @@ def enable_checkpointing_for_stable_cascade_blocks(
                 child_module, torch.device(config.train_device),
                 [],
                 conductor, layer_index,
+                compile=config.compile,
             )
             layer_index += 1
         if isinstance(child_module, SDCascadeAttnBlock):
@@ -226,6 +234,7 @@ def enable_checkpointing_for_stable_cascade_blocks(
                 child_module, torch.device(config.train_device),
                 [],
                 conductor, layer_index,
+                compile=config.compile,
             )
             layer_index += 1
         if isinstance(child_module, SDCascadeTimestepBlock):
@@ -233,6 +242,7 @@ def enable_checkpointing_for_stable_cascade_blocks(
                 child_module, torch.device(config.train_device),
                 [],
                 conductor, layer_index,
+                compile=config.compile,
             )
             layer_index += 1
 
@@ -309,6 +319,7 @@ def enable_checkpointing_for_stable_diffusion_3_transformer(
                 child_module, torch.device(config.train_device),
                 ["hidden_states", "encoder_hidden_states"],
                 conductor, layer_index,
+                compile=config.compile,
             )
             layer_index += 1
 
@@ -328,6 +339,7 @@ def enable_checkpointing_for_flux_transformer(
                 child_module, torch.device(config.train_device),
                 ["hidden_states", "encoder_hidden_states"],
                 conductor, layer_index,
+                compile=config.compile,
             )
             layer_index += 1
 
@@ -337,6 +349,7 @@ def enable_checkpointing_for_flux_transformer(
                 child_module, torch.device(config.train_device),
                 ["hidden_states"],
                 conductor, layer_index,
+                compile=config.compile,
             )
             layer_index += 1
 
@@ -355,6 +368,7 @@ def enable_checkpointing_for_sana_transformer(
                 child_module, torch.device(config.train_device),
                 ["hidden_states"],
                 conductor, layer_index,
+                compile=config.compile,
             )
             layer_index += 1
 
@@ -373,6 +387,7 @@ def enable_checkpointing_for_hunyuan_video_transformer(
                 child_module, torch.device(config.train_device),
                 ["hidden_states"],
                 conductor, layer_index,
+                compile=config.compile,
             )
             layer_index += 1
 
@@ -382,6 +397,7 @@ def enable_checkpointing_for_hunyuan_video_transformer(
                 child_module, torch.device(config.train_device),
                 ["hidden_states", "encoder_hidden_states"],
                 conductor, layer_index,
+                compile=config.compile,
             )
             layer_index += 1
 
@@ -391,6 +407,7 @@ def enable_checkpointing_for_hunyuan_video_transformer(
                 child_module, torch.device(config.train_device),
                 ["hidden_states"],
                 conductor, layer_index,
+                compile=config.compile,
             )
             layer_index += 1
 
@@ -409,6 +426,7 @@ def enable_checkpointing_for_hi_dream_transformer(
                 child_module, torch.device(config.train_device),
                 ["hidden_states", "encoder_hidden_states"],
                 conductor, layer_index,
+                compile=config.compile,
             )
             layer_index += 1
 
@@ -418,6 +436,7 @@ def enable_checkpointing_for_hi_dream_transformer(
                 child_module, torch.device(config.train_device),
                 ["hidden_states"],
                 conductor, layer_index,
+                compile=config.compile,
             )
             layer_index += 1
 
@@ -0,0 +1,89 @@
+from collections.abc import Callable
+
+import torch
+from torch import Tensor
+
+# every block class is compiled once, but each aspect ratio bucket can add an entry to the dynamo cache
+# until the bucket dimensions are marked as dynamic. The default limit of 8 is too low for that.
+__MIN_CACHE_SIZE_LIMIT = 64
+
+
+def __iter_tensors(data: Tensor | list | tuple | dict):
+    if isinstance(data, Tensor):
+        yield data
+    elif isinstance(data, list | tuple):
+        for elem in data:
+            yield from __iter_tensors(elem)
+    elif isinstance(data, dict):
+        for elem in data.values():
+            yield from __iter_tensors(elem)
+
+
+def __mark_bucket_dims_dynamic(data: Tensor | list | tuple | dict):
+    tensors = list(__iter_tensors(data))
+
+    # 2D tensors don't have a fixed layout. The batch size and token lengths of the other inputs are used to tell
+    # them apart, a mask or a token sequence can also cover the concatenation of all token inputs
+    batch_sizes = {tensor.shape[0] for tensor in tensors if tensor.ndim >= 3}
+    token_lengths = {tensor.shape[1] for tensor in tensors if tensor.ndim == 3}
+    token_lengths.add(sum(token_lengths))
+
+    for tensor in tensors:
+        # batch and channel dimensions stay static. Everything in between depends on the bucket resolution:
+        # (B, L, C) for transformer tokens, (B, C, H, W) for images and (B, C, F, H, W) for videos
+        if tensor.ndim == 2:
+            if tensor.shape[0] not in batch_sizes:
+                # (L, D) rotary embeddings or position ids
+                torch._dynamo.maybe_mark_dynamic(tensor, 0)
+            elif tensor.shape[1] in token_lengths:
+                # (B, L) attention masks. (B, C) embeddings stay static
+                torch._dynamo.maybe_mark_dynamic(tensor, 1)
+        elif tensor.ndim == 3:
+            torch._dynamo.maybe_mark_dynamic(tensor, 1)
+        elif tensor.ndim >= 4:
+            for dim in range(2, tensor.ndim):
+                torch._dynamo.maybe_mark_dynamic(tensor, dim)
+
+
+def init_compile():
+    torch._dynamo.config.cache_size_limit = max(torch._dynamo.config.cache_size_limit, __MIN_CACHE_SIZE_LIMIT)
+    if hasattr(torch._dynamo.config, "accumulated_cache_size_limit"):
+        torch._dynamo.config.accumulated_cache_size_limit = \
+            max(torch._dynamo.config.accumulated_cache_size_limit, __MIN_CACHE_SIZE_LIMIT * 8)
+
+
+def compile_forward(orig_forward: Callable) -> Callable:
+    """
+    Compiles a single block forward function. Graph breaks are allowed, so that LoRA hooks and quantized
+    linear layers that can't be traced still work. The bucket dependent dimensions of all tensor inputs are marked
+    as dynamic, so switching between aspect ratio buckets doesn't trigger a recompilation.
+    """
+    init_compile()
+    compiled_forward = torch.compile(orig_forward, fullgraph=False, dynamic=None)
+
+    def forward(*args, **kwargs):
+        __mark_bucket_dims_dynamic((args, kwargs))
+        return compiled_forward(*args, **kwargs)
+
+    return forward
+
+
+def compile_statistics() -> dict[str, int]:
+    counters = torch._dynamo.utils.counters
+    return {
+        "graphs": counters["stats"]["unique_graphs"],
+        "graph_breaks": sum(counters["graph_break"].values()),
+        "recompiles": sum(counters["recompiles"].values()),
+    }
+
+
+def print_compile_statistics():
+    statistics = compile_statistics()
+    print(
+        f"torch.compile: {statistics['graphs']} graphs, {statistics['graph_breaks']} graph breaks, "
+        f"{statistics['recompiles']} recompiles"
+    )
+
+    graph_breaks = torch._dynamo.utils.counters["graph_break"]
+    for reason, count in sorted(graph_breaks.items(), key=lambda x: x[1], reverse=True):
+        print(f"    {count}x {reason}")
@@ -0,0 +1,184 @@
+import io
+import json
+import os
+import tarfile
+import threading
+from typing import BinaryIO
+
+from modules.util import path_util
+
+from tqdm import tqdm
+
+# A concept archive is a directory of uncompressed tar shards, together with an index file. Each sample is stored
+# with the same member names it would have in a concept directory (image or video, caption .txt, -masklabel.png
+# and -condlabel.png), and all files of a sample are in the same shard. The index stores the offset of each member,
+# so single members can be read without scanning a shard.
+#
+# Archives are not extracted. Each member is addressed by the path it would have if the archive directory was the
+# concept directory, registered archives resolve these paths to their location in a shard.
+
+INDEX_FILE_NAME = "archive_index.json"
+INDEX_VERSION = 1
+
+SIDECAR_POSTFIXES = ['-masklabel', '-condlabel']
+
+# members of all registered archives, by member path: (shard path, offset, size)
+__members: dict[str, tuple[str, int, int]] = {}
+__members_lock = threading.Lock()
+
+
+def is_concept_archive(path: str) -> bool:
+    return os.path.isfile(os.path.join(path, INDEX_FILE_NAME))
+
+
+def load_index(archive_path: str) -> dict:
+    with open(os.path.join(archive_path, INDEX_FILE_NAME), "r") as f:
+        index = json.load(f)
+    if index.get("version") != INDEX_VERSION:
+        raise ValueError(f"unsupported concept archive version {index.get('version')} in {archive_path}")
+    return index
+
+
+def member_path(archive_path: str, member_name: str) -> str:
+    return os.path.join(archive_path, member_name)
+
+
+def register_archive(archive_path: str) -> list[dict]:
+    """
+    Makes the members of a concept archive readable through their member paths. Returns the shards of the index.
+    """
+    shards = load_index(archive_path)["shards"]
+    with __members_lock:
+        for shard in shards:
+            shard_path = os.path.join(archive_path, shard["name"])
+            for name, (offset, size) in shard["members"].items():
+                __members[member_path(archive_path, name)] = (shard_path, offset, size)
+    return shards
+
+
+def is_member(path: str) -> bool:
+    return path in __members
+
+
+def read_member(path: str) -> bytes:
+    """
+    Reads a single member of a registered archive without scanning the shard.
+    """
+    shard_path, offset, size = __members[path]
+    with open(shard_path, "rb") as f:
+        f.seek(offset)
+        return f.read(size)
+
+
+def is_file(path: str) -> bool:
+    return is_member(path) or os.path.isfile(path)
+
+
+def file_stat(path: str) -> tuple[int, float]:
+    """
+    Returns the size and modification time of a file or archive member. Members use the time of their shard.
+    """
+    if is_member(path):
+        shard_path, _, size = __members[path]
+        return size, os.stat(shard_path).st_mtime
+
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime
+
+
+def file_source(path: str) -> str | BinaryIO:
+    """
+    Returns the path of a file, or an in-memory copy of an archive member. Image.open and av.open accept both.
+    """
+    if is_member(path):
+        return io.BytesIO(read_member(path))
+    return path
+
+
+def __sample_key(relative_path: str) -> str | None:
+    # returns the sample key of a primary file or sidecar, or None if the file doesn't belong to any sample
+    name, extension = os.path.splitext(relative_path)
+    extension = extension.lower()
+
+    for postfix in SIDECAR_POSTFIXES:
+        if name.endswith(postfix) and extension == ".png":
+            return name.removesuffix(postfix)
+    if extension == ".txt" \
+            or path_util.is_supported_image_extension(extension) \
+            or path_util.is_supported_video_extension(extension):
+        return name
+    return None
+
+
+def __is_primary_file(relative_path: str) -> bool:
+    name, extension = os.path.splitext(relative_path)
+    if any(name.endswith(postfix) for postfix in SIDECAR_POSTFIXES):
+        return False
+    return path_util.is_supported_image_extension(extension) or path_util.is_supported_video_extension(extension)
+
+
+def __read_shard_index(shard_path: str) -> dict[str, list[int]]:
+    members = {}
+    with tarfile.open(shard_path, mode="r:") as tar:
+        for member in tar:
+            if member.isfile():
+                members[member.name] = [member.offset_data, member.size]
+    return members
+
+
+def create_archive(
+        input_dir: str,
+        output_dir: str,
+        shard_size: int = 1024 * 1024 * 1024,
+        include_subdirectories: bool = False,
+):
+    """
+    Converts a concept directory into a concept archive. Samples are written in sorted order, a new shard is
+    started when the current shard reaches shard_size bytes.
+    """
+    samples = {}
+    for dir_path, dir_names, file_names in os.walk(input_dir):
+        if not include_subdirectories:
+            dir_names.clear()
+        for file_name in file_names:
+            relative_path = os.path.relpath(os.path.join(dir_path, file_name), input_dir).replace("\\", "/")
+            key = __sample_key(relative_path)
+            if key is not None:
+                samples.setdefault(key, []).append(relative_path)
+
+    # only keep samples that have an image or video, captions and masks can't be trained on their own
+    samples = {key: sorted(files) for key, files in samples.items() if any(__is_primary_file(f) for f in files)}
+
+    # split the samples into shards, all files of a sample go into the same shard
+    shard_keys = []
+    shard_bytes = shard_size
+    for key in sorted(samples.keys()):
+        if shard_bytes >= shard_size:
+            shard_keys.append([])
+            shard_bytes = 0
+        shard_keys[-1].append(key)
+        shard_bytes += sum(os.path.getsize(os.path.join(input_dir, f)) for f in samples[key])
+
+    os.makedirs(output_dir, exist_ok=True)
+    shards = []
+    for keys in tqdm(shard_keys, desc="writing shards"):
+        name = f"shard-{len(shards):06d}.tar"
+        shard_path = os.path.join(output_dir, name)
+        with tarfile.open(shard_path, mode="w", format=tarfile.PAX_FORMAT) as tar:
+            for key in keys:
+                for relative_path in samples[key]:
+                    tar.add(os.path.join(input_dir, relative_path), arcname=relative_path, recursive=False)
+
+        shards.append({
+            "name": name,
+            "size": os.path.getsize(shard_path),
+            "samples": len(keys),
+            "members": __read_shard_index(shard_path),
+        })
+
+    path_util.write_json_atomic(os.path.join(output_dir, INDEX_FILE_NAME), {
+        "version": INDEX_VERSION,
+        "shards": shards,
+    })
+
+    print(f"Wrote {len(samples)} samples to {len(shards)} shards")
@@ -1,4 +1,10 @@
+import hashlib
+import json
 import os
+import threading
+import time
+from collections.abc import Callable
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 
 from modules.util import path_util
 from modules.util.config.ConceptConfig import ConceptConfig
@@ -82,125 +88,332 @@ def init_concept_stats(conceptconfig : ConceptConfig, advanced_checks : bool):
 
     return stats_dict
 
-def folder_scan(dir, stats_dict : dict, advanced_checks : bool, conceptconfig : ConceptConfig):
-    img_extensions_list = path_util.SUPPORTED_IMAGE_EXTENSIONS
-    vid_extensions_list = path_util.SUPPORTED_VIDEO_EXTENSIONS
-    aspect_ratio_list = list(stats_dict["aspect_buckets"].keys())
-    file_list = [f for f in os.scandir(dir) if f.is_file()]
-    file_list_str = [x.path for x in file_list]     #seems faster to check list of strings for matching files than list of path objects
-
-    for path in file_list:
-        basename, extension = os.path.splitext(path)
-        if extension.lower() in img_extensions_list and not path.name.endswith("-masklabel.png") and not path.name.endswith("-condlabel.png"):
-            stats_dict["image_count"] += 1
-            stats_dict["file_size"] += path.stat().st_size
-            if advanced_checks:
-                #check if image has a corresponding mask/caption in the same directory
-                if (basename + "-masklabel.png") in file_list_str:
-                    stats_dict["paired_masks"] += 1
-                    stats_dict["image_with_mask_count"] += 1
-                if (basename + ".txt") in file_list_str:
-                    stats_dict["paired_captions"] += 1
-                    stats_dict["image_with_caption_count"] += 1
-                    with open(basename + ".txt", "r") as captionfile:
-                        captionlist = captionfile.read().splitlines()
-                        #get character/word count of captions, split by newlines in each text file
-                        for caption in captionlist:
-                            char_count = len(caption)
-                            word_count = len(caption.split())
-                            if char_count > stats_dict["max_caption_length"][0]:
-                                stats_dict["max_caption_length"] = [char_count, os.path.relpath(path, conceptconfig.path), word_count]
-                            if char_count < stats_dict["min_caption_length"][0]:
-                                stats_dict["min_caption_length"] = [char_count, os.path.relpath(path, conceptconfig.path), word_count]
-                            stats_dict["avg_caption_length"][0] += (char_count - stats_dict["avg_caption_length"][0])/(stats_dict["image_count"] + stats_dict["video_count"])
-                            stats_dict["avg_caption_length"][1] += (word_count - stats_dict["avg_caption_length"][1])/(stats_dict["image_count"] + stats_dict["video_count"])
-
-                #get image resolution info
-                try:    #use imagesize if possible due to better speed
-                    width, height = imagesize.get(path.path)
-                    if width == -1:     #if imagesize doesn't recognize format it returns (-1, -1)
-                        raise ValueError
-                except ValueError:     #use PIL if not supported by imagesize
-                    img = load_image(path.path)
-                    width, height = img.size
-                    img.close()
-                pixels = width*height
-                true_aspect = height/width
-                nearest_aspect = min(aspect_ratio_list, key=lambda x:abs(x-true_aspect))    #try to match math used in aspect bucketing
-                stats_dict["aspect_buckets"][nearest_aspect] += 1
-
-                if pixels > stats_dict["max_pixels"][0]:
-                    stats_dict["max_pixels"] = [pixels, os.path.relpath(path, conceptconfig.path), f'{width}w x {height}h']
-                if pixels < stats_dict["min_pixels"][0]:
-                    stats_dict["min_pixels"] = [pixels, os.path.relpath(path, conceptconfig.path), f'{width}w x {height}h']
-                stats_dict["avg_pixels"] += (pixels - stats_dict["avg_pixels"])/(stats_dict["image_count"] + stats_dict["video_count"])
-
-        elif extension.lower() in vid_extensions_list:
-            stats_dict["video_count"] += 1
-            stats_dict["file_size"] += path.stat().st_size
-            if advanced_checks:
-                #check if video has a corresponding mask/caption in the same directory
-                # if (basename + "-masklabel.png") in file_list_str:
-                #     stats_dict["paired_masks"] += 1
-                #     stats_dict["video_with_mask_count"] += 1
-                if (basename + ".txt") in file_list_str:
-                    stats_dict["paired_captions"] += 1
-                    stats_dict["video_with_caption_count"] += 1
-                    with open(basename + ".txt", "r") as captionfile:
-                        captionlist = captionfile.read().splitlines()
-                        #get character/word count of captions, split by newlines in each text file
-                        for caption in captionlist:
-                            char_count = len(caption)
-                            word_count = len(caption.split())
-                            if char_count > stats_dict["max_caption_length"][0]:
-                                stats_dict["max_caption_length"] = [char_count, os.path.relpath(path, conceptconfig.path), word_count]
-                            if char_count < stats_dict["min_caption_length"][0]:
-                                stats_dict["min_caption_length"] = [char_count, os.path.relpath(path, conceptconfig.path), word_count]
-                            stats_dict["avg_caption_length"][0] += (char_count - stats_dict["avg_caption_length"][0])/(stats_dict["image_count"] + stats_dict["video_count"])
-                            stats_dict["avg_caption_length"][1] += (word_count - stats_dict["avg_caption_length"][1])/(stats_dict["image_count"] + stats_dict["video_count"])
-
-                vid = cv2.VideoCapture(path)
-                width = vid.get(cv2.CAP_PROP_FRAME_WIDTH)
-                height = vid.get(cv2.CAP_PROP_FRAME_HEIGHT)
-                length = vid.get(cv2.CAP_PROP_FRAME_COUNT)
-                fps = vid.get(cv2.CAP_PROP_FPS)
-                vid.release()
-
-                pixels = width*height
-                true_aspect = height/width
-                nearest_aspect = min(aspect_ratio_list, key=lambda x:abs(x-true_aspect))
-                stats_dict["aspect_buckets"][nearest_aspect] += 1
-
-                if pixels > stats_dict["max_pixels"][0]:
-                    stats_dict["max_pixels"] = [pixels, os.path.relpath(path, conceptconfig.path), f'{width}w x {height}h']
-                if pixels < stats_dict["min_pixels"][0]:
-                    stats_dict["min_pixels"] = [pixels, os.path.relpath(path, conceptconfig.path), f'{width}w x {height}h']
-                stats_dict["avg_pixels"] += (pixels - stats_dict["avg_pixels"])/(stats_dict["image_count"] + stats_dict["video_count"])
-
-                if length > stats_dict["max_length"][0]:
-                    stats_dict["max_length"] = [length, os.path.relpath(path, conceptconfig.path)]
-                if length < stats_dict["min_length"][0]:
-                    stats_dict["min_length"] = [length, os.path.relpath(path, conceptconfig.path)]
-                stats_dict["avg_length"] += (length - stats_dict["avg_length"])/stats_dict["video_count"]
-
-                if fps > stats_dict["max_fps"][0]:
-                    stats_dict["max_fps"] = [fps, os.path.relpath(path, conceptconfig.path)]
-                if fps < stats_dict["min_fps"][0]:
-                    stats_dict["min_fps"] = [fps, os.path.relpath(path, conceptconfig.path)]
-                stats_dict["avg_fps"] += (fps - stats_dict["avg_fps"])/stats_dict["video_count"]
-
-        elif path.name.endswith("-masklabel.png"):
+# the index of each concept is stored in this directory, named by a hash of the concept path
+INDEX_DIR = "workspace-cache/concept_stats"
+INDEX_VERSION = 1
+
+# interval in seconds between two partial results passed to the progress callback
+PROGRESS_INTERVAL = 0.5
+
+
+def __index_path(concept_path: str) -> str:
+    concept_hash = hashlib.sha256(os.path.abspath(concept_path).encode("utf-8")).hexdigest()[:32]
+    return os.path.join(INDEX_DIR, concept_hash + ".json")
+
+
+def load_index(concept_path: str) -> dict[str, dict]:
+    """Loads the persistent file index of a concept. Maps paths relative to the concept path to file metadata."""
+    try:
+        with open(__index_path(concept_path), "r") as f:
+            index = json.load(f)
+        if index.get("version") == INDEX_VERSION:
+            return index["files"]
+    except (OSError, ValueError, KeyError):
+        pass
+    return {}
+
+
+def save_index(concept_path: str, files: dict[str, dict]):
+    os.makedirs(INDEX_DIR, exist_ok=True)
+    path_util.write_json_atomic(__index_path(concept_path), {
+        "version": INDEX_VERSION,
+        "files": files,
+    })
+
+
+def __file_kind(name: str) -> str | None:
+    extension = os.path.splitext(name)[1].lower()
+    if name.endswith("-masklabel.png"):
+        return "mask"
+    elif name.endswith("-condlabel.png"):
+        return None
+    elif extension in path_util.SUPPORTED_IMAGE_EXTENSIONS:
+        return "image"
+    elif extension in path_util.SUPPORTED_VIDEO_EXTENSIONS:
+        return "video"
+    elif extension == ".txt":
+        return "caption"
+    return None
+
+
+def __is_cancelled(cancel_event: threading.Event | None, deadline: float | None) -> bool:
+    return (cancel_event is not None and cancel_event.is_set()) \
+        or (deadline is not None and time.perf_counter() > deadline)
+
+
+def __list_files(
+        concept_path: str,
+        include_subdirectories: bool,
+        cancel_event: threading.Event | None,
+        deadline: float | None,
+) -> tuple[dict[str, os.stat_result], int] | None:
+    """Lists the files of a concept. Returns None if the scan was cancelled, which is checked after every directory."""
+    files = {}
+    directories = [concept_path]
+    for directory in directories:
+        if __is_cancelled(cancel_event, deadline):
+            return None
+        for entry in os.scandir(directory):
+            if entry.is_dir():
+                if include_subdirectories:
+                    directories.append(entry.path)
+            elif entry.is_file() and __file_kind(entry.name) is not None:
+                files[os.path.relpath(entry.path, concept_path).replace("\\", "/")] = entry.stat()
+    return files, len(directories)
+
+
+def __probe_file(path: str, kind: str) -> dict:
+    """Reads the metadata of a single file that is needed for the advanced statistics."""
+    if kind == "image":
+        try:    #use imagesize if possible due to better speed
+            width, height = imagesize.get(path)
+            if width == -1:     #if imagesize doesn't recognize format it returns (-1, -1)
+                raise ValueError
+        except ValueError:     #use PIL if not supported by imagesize
+            img = load_image(path)
+            width, height = img.size
+            img.close()
+        return {"width": width, "height": height}
+    elif kind == "video":
+        vid = cv2.VideoCapture(path)
+        metadata = {
+            "width": int(vid.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            "height": int(vid.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+            "frames": int(vid.get(cv2.CAP_PROP_FRAME_COUNT)),
+            "fps": vid.get(cv2.CAP_PROP_FPS),
+        }
+        vid.release()
+        return metadata
+    elif kind == "caption":
+        with open(path, "r", encoding="utf-8", errors="replace") as captionfile:
+            #character/word count of captions, split by newlines in each text file
+            return {"captions": [[len(caption), len(caption.split())] for caption in captionfile.read().splitlines()]}
+    return {}
+
+
+def __probe_entry(concept_path: str, relative_path: str, stat: os.stat_result, kind: str) -> dict:
+    entry = {"size": stat.st_size, "mtime": stat.st_mtime, "kind": kind, "probed": True}
+    try:
+        entry.update(__probe_file(os.path.join(concept_path, relative_path), kind))
+    except Exception as e:
+        print(f"Could not read {relative_path}: {e}")
+        entry["error"] = True
+    return entry
+
+
+class _StatsAccumulator:
+    """
+    Running aggregates of the concept statistics, updated once per file. Pairs are looked up in the listing of the
+    concept, so the files can be added in any order.
+    """
+
+    def __init__(
+            self,
+            conceptconfig: ConceptConfig,
+            advanced_checks: bool,
+            listed_paths: set[str],
+            directory_count: int,
+    ):
+        self.advanced_checks = advanced_checks
+        self.listed_paths = listed_paths
+
+        self.stats_dict = init_concept_stats(conceptconfig, advanced_checks)
+        self.stats_dict["directory_count"] = directory_count
+        self.aspect_ratio_list = list(self.stats_dict["aspect_buckets"].keys())
+
+        # captions and captioned images/videos added so far, by path without extension
+        self.caption_entries = {}
+        self.captioned_paths = {}
+
+        self.pixel_sum = 0
+        self.pixel_count = 0
+        self.frame_sum = 0
+        self.fps_sum = 0
+        self.video_count = 0
+        self.caption_char_sum = 0
+        self.caption_word_sum = 0
+        self.caption_length_count = 0
+
+    def __add_caption_lengths(self, relative_path: str, caption_entry: dict):
+        stats_dict = self.stats_dict
+        for char_count, word_count in caption_entry.get("captions", []):
+            if char_count > stats_dict["max_caption_length"][0]:
+                stats_dict["max_caption_length"] = [char_count, relative_path, word_count]
+            if char_count < stats_dict["min_caption_length"][0]:
+                stats_dict["min_caption_length"] = [char_count, relative_path, word_count]
+            self.caption_char_sum += char_count
+            self.caption_word_sum += word_count
+            self.caption_length_count += 1
+
+    def add(self, relative_path: str, entry: dict):
+        stats_dict = self.stats_dict
+        kind = entry["kind"]
+        stats_dict["file_size"] += entry["size"]
+        if kind == "mask":
             stats_dict["mask_count"] += 1
-            stats_dict["file_size"] += path.stat().st_size
-        elif extension == ".txt":
+            return
+        if kind == "caption":
             stats_dict["caption_count"] += 1
-            stats_dict["file_size"] += path.stat().st_size
+            if self.advanced_checks:
+                basename = os.path.splitext(relative_path)[0]
+                self.caption_entries[basename] = entry
+                for captioned_path in self.captioned_paths.get(basename, []):
+                    self.__add_caption_lengths(captioned_path, entry)
+            return
 
-    #update every directory loop
-    stats_dict["directory_count"] += 1
-    if advanced_checks:
-        #check for number of "orphaned" mask/caption files as the difference between the total count and the count of image/mask or image/caption pairs
-        stats_dict["unpaired_masks"] = stats_dict["mask_count"]-stats_dict["paired_masks"]
-        stats_dict["unpaired_captions"] = stats_dict["caption_count"]-stats_dict["paired_captions"]
+        stats_dict[f"{kind}_count"] += 1
+        if not self.advanced_checks:
+            return
 
-    return stats_dict
+        basename = os.path.splitext(relative_path)[0]
+        #check if image has a corresponding mask/caption in the same directory
+        if kind == "image" and (basename + "-masklabel.png") in self.listed_paths:
+            stats_dict["paired_masks"] += 1
+            stats_dict["image_with_mask_count"] += 1
+        if (basename + ".txt") in self.listed_paths:
+            stats_dict["paired_captions"] += 1
+            stats_dict[f"{kind}_with_caption_count"] += 1
+            self.captioned_paths.setdefault(basename, []).append(relative_path)
+            caption_entry = self.caption_entries.get(basename)
+            if caption_entry is not None:
+                self.__add_caption_lengths(relative_path, caption_entry)
+
+        if entry.get("error") or not entry.get("width") or not entry.get("height"):
+            return
+
+        width, height = entry["width"], entry["height"]
+        pixels = width * height
+        true_aspect = height / width
+        nearest_aspect = min(self.aspect_ratio_list, key=lambda x: abs(x - true_aspect))    #try to match math used in aspect bucketing
+        stats_dict["aspect_buckets"][nearest_aspect] += 1
+
+        if pixels > stats_dict["max_pixels"][0]:
+            stats_dict["max_pixels"] = [pixels, relative_path, f'{width}w x {height}h']
+        if pixels < stats_dict["min_pixels"][0]:
+            stats_dict["min_pixels"] = [pixels, relative_path, f'{width}w x {height}h']
+        self.pixel_sum += pixels
+        self.pixel_count += 1
+
+        if kind == "video":
+            length, fps = entry["frames"], entry["fps"]
+            if length > stats_dict["max_length"][0]:
+                stats_dict["max_length"] = [length, relative_path]
+            if length < stats_dict["min_length"][0]:
+                stats_dict["min_length"] = [length, relative_path]
+
+            if fps > stats_dict["max_fps"][0]:
+                stats_dict["max_fps"] = [fps, relative_path]
+            if fps < stats_dict["min_fps"][0]:
+                stats_dict["min_fps"] = [fps, relative_path]
+
+            self.frame_sum += length
+            self.fps_sum += fps
+            self.video_count += 1
+
+    def result(self) -> dict:
+        """Returns a copy of the current statistics, the accumulator can still be updated afterwards."""
+        stats_dict = dict(self.stats_dict)
+        stats_dict["aspect_buckets"] = dict(stats_dict["aspect_buckets"])
+
+        if self.advanced_checks:
+            if self.pixel_count:
+                stats_dict["avg_pixels"] = self.pixel_sum / self.pixel_count
+            if self.video_count:
+                stats_dict["avg_length"] = self.frame_sum / self.video_count
+                stats_dict["avg_fps"] = self.fps_sum / self.video_count
+            if self.caption_length_count:
+                stats_dict["avg_caption_length"] = [
+                    self.caption_char_sum / self.caption_length_count,
+                    self.caption_word_sum / self.caption_length_count,
+                ]
+
+            #check for number of "orphaned" mask/caption files as the difference between the total count and the count of image/mask or image/caption pairs
+            stats_dict["unpaired_masks"] = stats_dict["mask_count"] - stats_dict["paired_masks"]
+            stats_dict["unpaired_captions"] = stats_dict["caption_count"] - stats_dict["paired_captions"]
+
+        return stats_dict
+
+
+def scan_concept(
+        conceptconfig: ConceptConfig,
+        advanced_checks: bool,
+        cancel_event: threading.Event | None = None,
+        progress_callback: Callable[[dict], None] | None = None,
+        max_workers: int | None = None,
+        deadline: float | None = None,
+) -> dict | None:
+    """
+    Calculates the statistics of a concept. File metadata is stored in a persistent index, only new or changed files
+    are read again. For advanced checks, files are read in parallel, and partial statistics are passed to
+    progress_callback while the scan is running.
+
+    The scan is cancelled when cancel_event is set, or when time.perf_counter() passes deadline. Returns None if the
+    scan was cancelled. The files read until then are still stored in the index.
+    """
+    concept_path = conceptconfig.path
+    if not os.path.isdir(concept_path):
+        return init_concept_stats(conceptconfig, advanced_checks)
+
+    listing = __list_files(concept_path, conceptconfig.include_subdirectories, cancel_event, deadline)
+    if listing is None:
+        return None
+    stats, directory_count = listing
+
+    index = load_index(concept_path)
+
+    files = {}
+    to_probe = []
+    for relative_path, stat in stats.items():
+        entry = index.get(relative_path)
+        if entry is not None and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime \
+                and (entry["probed"] or not advanced_checks):
+            files[relative_path] = entry
+        elif advanced_checks:
+            to_probe.append((relative_path, stat))
+        else:
+            files[relative_path] = {
+                "size": stat.st_size, "mtime": stat.st_mtime, "kind": __file_kind(relative_path), "probed": False,
+            }
+
+    accumulator = _StatsAccumulator(conceptconfig, advanced_checks, set(stats.keys()), directory_count)
+    for relative_path, entry in files.items():
+        accumulator.add(relative_path, entry)
+
+    cancelled = False
+    if to_probe:
+        if max_workers is None:
+            max_workers = min(32, (os.cpu_count() or 1) * 4)
+
+        last_update = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            pending = {
+                executor.submit(__probe_entry, concept_path, relative_path, stat, __file_kind(relative_path)):
+                    relative_path for relative_path, stat in to_probe
+            }
+            while pending:
+                done, _ = wait(pending, timeout=PROGRESS_INTERVAL, return_when=FIRST_COMPLETED)
+                for future in done:
+                    relative_path = pending.pop(future)
+                    files[relative_path] = future.result()
+                    accumulator.add(relative_path, files[relative_path])
+
+                if __is_cancelled(cancel_event, deadline):
+                    executor.shutdown(wait=True, cancel_futures=True)
+                    cancelled = True
+                    break
+
+                if progress_callback is not None and time.perf_counter() > last_update + PROGRESS_INTERVAL:
+                    last_update = time.perf_counter()
+                    progress_callback(accumulator.result())
+
+    # entries in subdirectories are kept if subdirectories are currently excluded from the scan
+    index.update(files)
+    for relative_path in list(index.keys()):
+        if relative_path not in stats and (conceptconfig.include_subdirectories or "/" not in relative_path):
+            del index[relative_path]
+    save_index(concept_path, index)
+
+    if cancelled:
+        return None
+
+    return accumulator.result()
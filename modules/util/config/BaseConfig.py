@@ -27,42 +27,82 @@ class BaseConfig:
             self.nullables[name] = nullable
             self.default_values[name] = value
 
+    def __schema(self) -> dict[str, tuple[int, type | None]]:
+        # all instances of a config class are created by the same default_values() function,
+        # so the schema only needs to be computed once per class
+        schema = _schema_cache.get(type(self))
+        if schema is None:
+            schema = {name: _field_kind(var_type) for name, var_type in self.types.items()}
+            _schema_cache[type(self)] = schema
+        return schema
+
+    @staticmethod
+    def __to_value(kind: int, value: Any) -> Any:
+        if kind == _CONFIG:
+            return value.to_dict()
+        elif kind == _CONFIG_LIST:
+            return [le.to_dict() for le in value] if value is not None else None
+        elif kind == _CONFIG_DICT:
+            return {dict_key: dict_value.to_dict() for dict_key, dict_value in value.items()}
+        elif kind == _ENUM:
+            return None if value is None else str(value)
+        elif kind == _FLOAT and value in [float('inf'), float('-inf')]:
+            return str(value)
+        return value
+
     def to_dict(self) -> dict:
         data = {
             '__version': self.config_version,
         }
 
-        for name in self.types:
-            value = getattr(self, name)
-            if issubclass_safe(self.types[name], BaseConfig):
-                data[name] = value.to_dict()
-            elif self.types[name] is list or get_origin(self.types[name]) is list:
-                if len(get_args(self.types[name])) > 0 and issubclass_safe(get_args(self.types[name])[0], BaseConfig):
-                    data[name] = [le.to_dict() for le in value] if value is not None else None
-                else:
-                    data[name] = value
-            elif self.types[name] is dict or get_origin(self.types[name]) is dict:
-                if len(get_args(self.types[name])) > 0 and issubclass_safe(get_args(self.types[name])[1], BaseConfig):
-                    dict_data = {}
-                    for dict_key, dict_value in value.items():
-                        dict_data[dict_key] = dict_value.to_dict()
-                    data[name] = dict_data
-                else:
-                    data[name] = value
-            elif self.types[name] is str:
-                data[name] = value
-            elif issubclass_safe(self.types[name], Enum):
-                data[name] = None if value is None else str(value)
-            elif self.types[name] is bool or self.types[name] is int:
-                data[name] = value
-            elif self.types[name] is float:
-                if value in [float('inf'), float('-inf')]:
-                    data[name] = str(value)
-                else:
-                    data[name] = value
+        for name, (kind, _) in self.__schema().items():
+            if kind != _UNSUPPORTED:
+                data[name] = self.__to_value(kind, getattr(self, name))
 
         return data
 
+    def __set_value(self, name: str, kind: int, sub_type: type | None, value: Any):
+        if kind == _CONFIG:
+            getattr(self, name).from_dict(value)
+        elif kind == _CONFIG_LIST:
+            if value is not None:
+                old_value = getattr(self, name) if hasattr(self, name) and getattr(self, name) is not None else []
+                new_value = []
+                for i in range(len(value)):
+                    if i < len(old_value):
+                        new_value.append(old_value[i].from_dict(value[i]))
+                    else:
+                        new_value.append(sub_type.default_values().from_dict(value[i]))
+                value = new_value
+            setattr(self, name, value)
+        elif kind == _CONFIG_DICT:
+            setattr(self, name, {
+                dict_key: sub_type.default_values().from_dict(dict_value) for dict_key, dict_value in value.items()
+            })
+        elif kind == _STR:
+            if self.nullables[name]:
+                setattr(self, name, None if value is None else str(value))
+            else:
+                setattr(self, name, str(value))
+        elif kind == _ENUM:
+            if isinstance(value, str):
+                setattr(self, name, self.types[name][value])
+            else:
+                setattr(self, name, value)
+        elif kind == _INT:
+            if self.nullables[name]:
+                setattr(self, name, None if value is None else int(value))
+            else:
+                setattr(self, name, int(value))
+        elif kind == _FLOAT:
+            # float() also converts the strings 'inf' and '-inf' from dicts loaded from json
+            if self.nullables[name]:
+                setattr(self, name, None if value is None else float(value))
+            else:
+                setattr(self, name, float(value))
+        elif kind == _RAW:
+            setattr(self, name, value)
+
     def from_dict(self, data: dict) -> 'BaseConfig':
         version = 0
         if '__version' in data:
@@ -72,69 +112,106 @@ class BaseConfig:
             data = self.config_migrations[version](data)
             version += 1
 
-        for name in self.types:
+        for name, (kind, sub_type) in self.__schema().items():
+            if name not in data:
+                continue
             try:
-                if issubclass_safe(self.types[name], BaseConfig):
-                    getattr(self, name).from_dict(data[name])
-                elif self.types[name] is list or get_origin(self.types[name]) is list:
-                    if len(get_args(self.types[name])) > 0 and issubclass_safe(get_args(self.types[name])[0], BaseConfig):
-                        list_type = get_args(self.types[name])[0]
-                        if data[name] is not None:
-                            old_value = \
-                                getattr(self, name) if hasattr(self, name) and getattr(self, name) is not None else []
-                            value = []
-                            for i in range(len(data[name])):
-                                if i < len(old_value) and i < len(data[name]):
-                                    value.append(old_value[i].from_dict(data[name][i]))
-                                else:
-                                    value.append(list_type.default_values().from_dict(data[name][i]))
-                        else:
-                            value = None
-                        setattr(self, name, value)
-                    else:
-                        setattr(self, name, data[name])
-                elif self.types[name] is dict or get_origin(self.types[name]) is dict:
-                    if len(get_args(self.types[name])) > 0 and issubclass_safe(get_args(self.types[name])[1], BaseConfig):
-                        dict_type = get_args(self.types[name])[1]
-                        value = {}
-                        for dict_key, dict_value in data[name].items():
-                            value[dict_key] = dict_type.default_values().from_dict(dict_value)
-                        setattr(self, name, value)
-                    else:
-                        setattr(self, name, data[name])
-                elif self.types[name] is str:
-                    if self.nullables[name]:
-                        setattr(self, name, None if data[name] is None else str(data[name]))
-                    else:
-                        setattr(self, name, str(data[name]))
-                elif issubclass_safe(self.types[name], Enum):
-                    if isinstance(data[name], str):
-                        if self.nullables[name]:
-                            setattr(self, name, None if data[name] is None else self.types[name][data[name]])
-                        else:
-                            setattr(self, name, self.types[name][data[name]])
-                    else:
-                        setattr(self, name, data[name])
-                elif self.types[name] is bool:
-                    setattr(self, name, data[name])
-                elif self.types[name] is int:
-                    if self.nullables[name]:
-                        setattr(self, name, None if data[name] is None else int(data[name]))
-                    else:
-                        setattr(self, name, int(data[name]))
-                elif self.types[name] is float:
-                    # check for strings to support dicts loaded from json
-                    if data[name] in [float('inf'), float('-inf'), 'inf', '-inf']:
-                        setattr(self, name, float(data[name]))
-                    if self.nullables[name]:
-                        setattr(self, name, None if data[name] is None else float(data[name]))
-                    else:
-                        setattr(self, name, float(data[name]))
+                self.__set_value(name, kind, sub_type, data[name])
             except Exception:  # noqa: PERF203
-                if name in data:
-                    print(f"Could not set {name} as {str(data[name])}")
+                print(f"Could not set {name} as {str(data[name])}")
+
+        return self
+
+    def diff(self, base: 'BaseConfig') -> dict:
+        """
+        Returns all fields that are different from base, in the format of to_dict. Nested configs, and lists
+        of configs with the same length, only contain their changed fields. The result can be applied to
+        a copy of base with apply_diff.
+        """
+        data = {}
+
+        for name, (kind, _) in self.__schema().items():
+            value = getattr(self, name)
+            base_value = getattr(base, name)
+
+            if kind == _CONFIG:
+                config_diff = value.diff(base_value)
+                if config_diff:
+                    data[name] = config_diff
+            elif kind == _CONFIG_LIST and value is not None and base_value is not None \
+                    and len(value) == len(base_value):
+                items = {}
+                for i, (element, base_element) in enumerate(zip(value, base_value, strict=True)):
+                    element_diff = element.diff(base_element)
+                    if element_diff:
+                        items[str(i)] = element_diff
+                if items:
+                    data[name] = {'__items': items}
+            elif kind != _UNSUPPORTED:
+                serialized = self.__to_value(kind, value)
+                if serialized != self.__to_value(kind, base_value):
+                    data[name] = serialized
+
+        return data
+
+    def apply_diff(self, diff: dict) -> 'BaseConfig':
+        """
+        Applies the result of diff. Config versions are not migrated, both sides need to use the same version.
+        """
+        schema = self.__schema()
+
+        for name, value in diff.items():
+            if name not in schema:
+                continue
+            kind, sub_type = schema[name]
+            try:
+                if kind == _CONFIG:
+                    getattr(self, name).apply_diff(value)
+                elif kind == _CONFIG_LIST and isinstance(value, dict):
+                    elements = getattr(self, name)
+                    for i, element_diff in value['__items'].items():
+                        elements[int(i)].apply_diff(element_diff)
                 else:
-                    # print(f"Could not set {name}, not found.")
-                    pass
+                    self.__set_value(name, kind, sub_type, value)
+            except Exception:  # noqa: PERF203
+                print(f"Could not set {name} as {str(value)}")
 
         return self
+
+
+# field kinds of the cached config schema
+_CONFIG = 0
+_CONFIG_LIST = 1
+_CONFIG_DICT = 2
+_STR = 3
+_ENUM = 4
+_INT = 5
+_FLOAT = 6
+_RAW = 7
+_UNSUPPORTED = 8
+
+_schema_cache: dict[type, dict[str, tuple[int, type | None]]] = {}
+
+
+def _field_kind(var_type: type) -> tuple[int, type | None]:
+    if issubclass_safe(var_type, BaseConfig):
+        return _CONFIG, None
+    elif var_type is list or get_origin(var_type) is list:
+        if len(get_args(var_type)) > 0 and issubclass_safe(get_args(var_type)[0], BaseConfig):
+            return _CONFIG_LIST, get_args(var_type)[0]
+        return _RAW, None
+    elif var_type is dict or get_origin(var_type) is dict:
+        if len(get_args(var_type)) > 0 and issubclass_safe(get_args(var_type)[1], BaseConfig):
+            return _CONFIG_DICT, get_args(var_type)[1]
+        return _RAW, None
+    elif var_type is str:
+        return _STR, None
+    elif issubclass_safe(var_type, Enum):
+        return _ENUM, None
+    elif var_type is bool:
+        return _RAW, None
+    elif var_type is int:
+        return _INT, None
+    elif var_type is float:
+        return _FLOAT, None
+    return _UNSUPPORTED, None
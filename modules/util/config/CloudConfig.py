@@ -32,6 +32,8 @@ class CloudConfig(BaseConfig):
     enabled: bool
     type: CloudType
     file_sync : CloudFileSync
+    sync_compression : bool
+    stream_concept_upload : bool
     create : bool
     name: str
     tensorboard_tunnel: bool
@@ -68,6 +70,8 @@ class CloudConfig(BaseConfig):
         data.append(("enabled", False, bool, False))
         data.append(("type", CloudType.RUNPOD, CloudType, False))
         data.append(("file_sync", CloudFileSync.NATIVE_SCP, CloudFileSync, False))
+        data.append(("sync_compression", False, bool, False))
+        data.append(("stream_concept_upload", False, bool, False))
         data.append(("create", True, bool, False))
         data.append(("name", "OneTrainer", str, False))
         data.append(("tensorboard_tunnel", True, bool, False))
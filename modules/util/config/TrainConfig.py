@@ -290,12 +290,16 @@ class TrainConfig(BaseConfig):
     enable_activation_offloading: bool
     layer_offload_fraction: float
     force_circular_padding: bool
+    compile: bool
 
     # data settings
     concept_file_name: str
     concepts: list[ConceptConfig]
     aspect_ratio_bucketing: bool
     latent_caching: bool
+    source_cache: bool
+    caching_batch_size: int
+    lazy_epoch_planning: bool
     clear_cache_before_training: bool
 
     # training settings
@@ -310,13 +314,16 @@ class TrainConfig(BaseConfig):
     learning_rate_min_factor: float
     epochs: int
     batch_size: int
+    token_budget_batching: bool
     gradient_accumulation_steps: int
     ema: EMAMode
     ema_decay: float
     ema_update_step_interval: int
     dataloader_threads: int
+    dataloader_prefetch_batches: int
     train_device: str
     temp_device: str
+    text_encoder_device: str
     train_dtype: DataType
     fallback_train_dtype: DataType
     enable_autocast_cache: bool
@@ -393,6 +400,7 @@ class TrainConfig(BaseConfig):
     unmasked_weight: float
     normalize_masked_area_loss: bool
     masked_prior_preservation_weight: float
+    single_pass_prior_prediction: bool
 
     # custom conditioning image
     custom_conditioning_image: bool
@@ -432,6 +440,8 @@ class TrainConfig(BaseConfig):
     sample_audio_format: AudioFormat
     samples_to_tensorboard: bool
     non_ema_sampling: bool
+    async_sampling: bool
+    async_sampling_device: str
 
     # cloud settings
     cloud: CloudConfig
@@ -790,12 +800,16 @@ class TrainConfig(BaseConfig):
         data.append(("enable_activation_offloading", True, bool, False))
         data.append(("layer_offload_fraction", 0.0, float, False))
         data.append(("force_circular_padding", False, bool, False))
+        data.append(("compile", False, bool, False))
 
         # data settings
         data.append(("concept_file_name", "training_concepts/concepts.json", str, False))
         data.append(("concepts", None, list[ConceptConfig], True))
         data.append(("aspect_ratio_bucketing", True, bool, False))
         data.append(("latent_caching", True, bool, False))
+        data.append(("source_cache", False, bool, False))
+        data.append(("caching_batch_size", 8, int, False))
+        data.append(("lazy_epoch_planning", False, bool, False))
         data.append(("clear_cache_before_training", True, bool, False))
 
         # training settings
@@ -808,13 +822,16 @@ class TrainConfig(BaseConfig):
         data.append(("learning_rate_min_factor", 0.0, float, False))
         data.append(("epochs", 100, int, False))
         data.append(("batch_size", 1, int, False))
+        data.append(("token_budget_batching", False, bool, False))
         data.append(("gradient_accumulation_steps", 1, int, False))
         data.append(("ema", EMAMode.OFF, EMAMode, False))
         data.append(("ema_decay", 0.999, float, False))
         data.append(("ema_update_step_interval", 5, int, False))
         data.append(("dataloader_threads", 2, int, False))
+        data.append(("dataloader_prefetch_batches", 0, int, False))
         data.append(("train_device", default_device.type, str, False))
         data.append(("temp_device", "cpu", str, False))
+        data.append(("text_encoder_device", "", str, False))
         data.append(("train_dtype", DataType.FLOAT_16, DataType, False))
         data.append(("fallback_train_dtype", DataType.BFLOAT_16, DataType, False))
         data.append(("enable_autocast_cache", True, bool, False))
@@ -938,6 +955,7 @@ class TrainConfig(BaseConfig):
         data.append(("unmasked_weight", 0.1, float, False))
         data.append(("normalize_masked_area_loss", False, bool, False))
         data.append(("masked_prior_preservation_weight", 0.0, float, False))
+        data.append(("single_pass_prior_prediction", False, bool, False))
         data.append(("custom_conditioning_image", False, bool, False))
 
         # embedding
@@ -978,6 +996,8 @@ class TrainConfig(BaseConfig):
         data.append(("sample_audio_format", AudioFormat.MP3, AudioFormat, False))
         data.append(("samples_to_tensorboard", True, bool, False))
         data.append(("non_ema_sampling", True, bool, False))
+        data.append(("async_sampling", False, bool, False))
+        data.append(("async_sampling_device", "cpu", str, False))
 
         # backup settings
         data.append(("backup_after", 30, int, False))
@@ -1,35 +1,29 @@
 import modules.util.convert.convert_diffusers_to_ckpt_util as util
+import modules.util.convert.lazy_conversion as lazy
 
-import torch
-from torch import Tensor
-
-
-def __swap_chunks(tensor: Tensor) -> Tensor:
-    chunk_0, chunk_1 = tensor.chunk(2, dim=0)
-    return torch.cat([chunk_1, chunk_0], dim=0)
 
 def __map_double_transformer_block(in_states: dict, out_prefix: str, in_prefix: str, is_last:bool) -> dict:
     out_states = {}
 
-    out_states[util.combine(out_prefix, "img_attn.qkv.weight")] = torch.cat([
+    out_states[util.combine(out_prefix, "img_attn.qkv.weight")] = lazy.concat([
         in_states[util.combine(in_prefix, "attn.to_q.weight")],
         in_states[util.combine(in_prefix, "attn.to_k.weight")],
         in_states[util.combine(in_prefix, "attn.to_v.weight")],
     ], 0)
 
-    out_states[util.combine(out_prefix, "img_attn.qkv.bias")] = torch.cat([
+    out_states[util.combine(out_prefix, "img_attn.qkv.bias")] = lazy.concat([
         in_states[util.combine(in_prefix, "attn.to_q.bias")],
         in_states[util.combine(in_prefix, "attn.to_k.bias")],
         in_states[util.combine(in_prefix, "attn.to_v.bias")],
     ], 0)
 
-    out_states[util.combine(out_prefix, "txt_attn.qkv.weight")] = torch.cat([
+    out_states[util.combine(out_prefix, "txt_attn.qkv.weight")] = lazy.concat([
         in_states[util.combine(in_prefix, "attn.add_q_proj.weight")],
         in_states[util.combine(in_prefix, "attn.add_k_proj.weight")],
         in_states[util.combine(in_prefix, "attn.add_v_proj.weight")],
     ], 0)
 
-    out_states[util.combine(out_prefix, "txt_attn.qkv.bias")] = torch.cat([
+    out_states[util.combine(out_prefix, "txt_attn.qkv.bias")] = lazy.concat([
         in_states[util.combine(in_prefix, "attn.add_q_proj.bias")],
         in_states[util.combine(in_prefix, "attn.add_k_proj.bias")],
         in_states[util.combine(in_prefix, "attn.add_v_proj.bias")],
@@ -55,14 +49,14 @@ def __map_double_transformer_block(in_states: dict, out_prefix: str, in_prefix:
 def __map_single_transformer_block(in_states: dict, out_prefix: str, in_prefix: str, is_last:bool) -> dict:
     out_states = {}
 
-    out_states[util.combine(out_prefix, "linear1.weight")] = torch.cat([
+    out_states[util.combine(out_prefix, "linear1.weight")] = lazy.concat([
         in_states[util.combine(in_prefix, "attn.to_q.weight")],
         in_states[util.combine(in_prefix, "attn.to_k.weight")],
         in_states[util.combine(in_prefix, "attn.to_v.weight")],
         in_states[util.combine(in_prefix, "proj_mlp.weight")],
     ], 0)
 
-    out_states[util.combine(out_prefix, "linear1.bias")] = torch.cat([
+    out_states[util.combine(out_prefix, "linear1.bias")] = lazy.concat([
         in_states[util.combine(in_prefix, "attn.to_q.bias")],
         in_states[util.combine(in_prefix, "attn.to_k.bias")],
         in_states[util.combine(in_prefix, "attn.to_v.bias")],
@@ -87,8 +81,8 @@ def __map_transformer(in_states: dict, out_prefix: str, in_prefix: str) -> dict:
     out_states |= util.map_wb(in_states, util.combine(out_prefix, "vector_in.out_layer"), util.combine(in_prefix, "time_text_embed.text_embedder.linear_2"))
     out_states |= util.map_wb(in_states, util.combine(out_prefix, "time_in.in_layer"), util.combine(in_prefix, "time_text_embed.timestep_embedder.linear_1"))
     out_states |= util.map_wb(in_states, util.combine(out_prefix, "time_in.out_layer"), util.combine(in_prefix, "time_text_embed.timestep_embedder.linear_2"))
-    out_states[util.combine(out_prefix, "final_layer.adaLN_modulation.1.weight")] = __swap_chunks(in_states[util.combine(in_prefix, "norm_out.linear.weight")])
-    out_states[util.combine(out_prefix, "final_layer.adaLN_modulation.1.bias")] = __swap_chunks(in_states[util.combine(in_prefix, "norm_out.linear.bias")])
+    out_states[util.combine(out_prefix, "final_layer.adaLN_modulation.1.weight")] = lazy.swap_chunks(in_states[util.combine(in_prefix, "norm_out.linear.weight")])
+    out_states[util.combine(out_prefix, "final_layer.adaLN_modulation.1.bias")] = lazy.swap_chunks(in_states[util.combine(in_prefix, "norm_out.linear.bias")])
 
     out_states |= util.map_wb(in_states, util.combine(out_prefix, "final_layer.linear"), util.combine(in_prefix, "proj_out"))
     out_states |= util.map_wb(in_states, util.combine(out_prefix, "img_in"), util.combine(in_prefix, "x_embedder"))
@@ -110,9 +104,9 @@ def __map_transformer(in_states: dict, out_prefix: str, in_prefix: str) -> dict:
 
 def convert_flux_diffusers_to_ckpt(
         transformer_state_dict: dict,
-) -> dict:
-    state_dict = {}
+) -> lazy.LazyStateDict:
+    recipes = {}
 
-    state_dict |= __map_transformer(transformer_state_dict, "", "")
+    recipes |= __map_transformer(lazy.KeySource(transformer_state_dict.keys()), "", "")
 
-    return state_dict
+    return lazy.LazyStateDict(transformer_state_dict, recipes)
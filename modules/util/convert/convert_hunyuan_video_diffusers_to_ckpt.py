@@ -1,23 +1,17 @@
 import modules.util.convert.convert_diffusers_to_ckpt_util as util
+import modules.util.convert.lazy_conversion as lazy
 
-import torch
-from torch import Tensor
-
-
-def __swap_chunks(tensor: Tensor) -> Tensor:
-    chunk_0, chunk_1 = tensor.chunk(2, dim=0)
-    return torch.cat([chunk_1, chunk_0], dim=0)
 
 def __map_token_refiner_block(in_states: dict, out_prefix: str, in_prefix: str) -> dict:
     out_states = {}
 
-    out_states[util.combine(out_prefix, "self_attn.qkv.weight")] = torch.cat([
+    out_states[util.combine(out_prefix, "self_attn.qkv.weight")] = lazy.concat([
         in_states[util.combine(in_prefix, "attn.to_q.weight")],
         in_states[util.combine(in_prefix, "attn.to_k.weight")],
         in_states[util.combine(in_prefix, "attn.to_v.weight")],
     ], 0)
 
-    out_states[util.combine(out_prefix, "self_attn.qkv.bias")] = torch.cat([
+    out_states[util.combine(out_prefix, "self_attn.qkv.bias")] = lazy.concat([
         in_states[util.combine(in_prefix, "attn.to_q.bias")],
         in_states[util.combine(in_prefix, "attn.to_k.bias")],
         in_states[util.combine(in_prefix, "attn.to_v.bias")],
@@ -36,25 +30,25 @@ def __map_token_refiner_block(in_states: dict, out_prefix: str, in_prefix: str)
 def __map_double_transformer_block(in_states: dict, out_prefix: str, in_prefix: str) -> dict:
     out_states = {}
 
-    out_states[util.combine(out_prefix, "img_attn.qkv.weight")] = torch.cat([
+    out_states[util.combine(out_prefix, "img_attn.qkv.weight")] = lazy.concat([
         in_states[util.combine(in_prefix, "attn.to_q.weight")],
         in_states[util.combine(in_prefix, "attn.to_k.weight")],
         in_states[util.combine(in_prefix, "attn.to_v.weight")],
     ], 0)
 
-    out_states[util.combine(out_prefix, "img_attn.qkv.bias")] = torch.cat([
+    out_states[util.combine(out_prefix, "img_attn.qkv.bias")] = lazy.concat([
         in_states[util.combine(in_prefix, "attn.to_q.bias")],
         in_states[util.combine(in_prefix, "attn.to_k.bias")],
         in_states[util.combine(in_prefix, "attn.to_v.bias")],
     ], 0)
 
-    out_states[util.combine(out_prefix, "txt_attn.qkv.weight")] = torch.cat([
+    out_states[util.combine(out_prefix, "txt_attn.qkv.weight")] = lazy.concat([
         in_states[util.combine(in_prefix, "attn.add_q_proj.weight")],
         in_states[util.combine(in_prefix, "attn.add_k_proj.weight")],
         in_states[util.combine(in_prefix, "attn.add_v_proj.weight")],
     ], 0)
 
-    out_states[util.combine(out_prefix, "txt_attn.qkv.bias")] = torch.cat([
+    out_states[util.combine(out_prefix, "txt_attn.qkv.bias")] = lazy.concat([
         in_states[util.combine(in_prefix, "attn.add_q_proj.bias")],
         in_states[util.combine(in_prefix, "attn.add_k_proj.bias")],
         in_states[util.combine(in_prefix, "attn.add_v_proj.bias")],
@@ -80,14 +74,14 @@ def __map_double_transformer_block(in_states: dict, out_prefix: str, in_prefix:
 def __map_single_transformer_block(in_states: dict, out_prefix: str, in_prefix: str) -> dict:
     out_states = {}
 
-    out_states[util.combine(out_prefix, "linear1.weight")] = torch.cat([
+    out_states[util.combine(out_prefix, "linear1.weight")] = lazy.concat([
         in_states[util.combine(in_prefix, "attn.to_q.weight")],
         in_states[util.combine(in_prefix, "attn.to_k.weight")],
         in_states[util.combine(in_prefix, "attn.to_v.weight")],
         in_states[util.combine(in_prefix, "proj_mlp.weight")],
     ], 0)
 
-    out_states[util.combine(out_prefix, "linear1.bias")] = torch.cat([
+    out_states[util.combine(out_prefix, "linear1.bias")] = lazy.concat([
         in_states[util.combine(in_prefix, "attn.to_q.bias")],
         in_states[util.combine(in_prefix, "attn.to_k.bias")],
         in_states[util.combine(in_prefix, "attn.to_v.bias")],
@@ -110,8 +104,8 @@ def __map_transformer(in_states: dict, out_prefix: str, in_prefix: str) -> dict:
     out_states |= util.map_wb(in_states, util.combine(out_prefix, "txt_in.t_embedder.in_layer"), util.combine(in_prefix, "context_embedder.time_text_embed.timestep_embedder.linear_1"))
     out_states |= util.map_wb(in_states, util.combine(out_prefix, "txt_in.t_embedder.out_layer"), util.combine(in_prefix, "context_embedder.time_text_embed.timestep_embedder.linear_2"))
     out_states |= util.map_wb(in_states, util.combine(out_prefix, "txt_in.input_embedder"), util.combine(in_prefix, "context_embedder.proj_in"))
-    out_states[util.combine(out_prefix, "final_layer.adaLN_modulation.1.weight")] = __swap_chunks(in_states[util.combine(in_prefix, "norm_out.linear.weight")])
-    out_states[util.combine(out_prefix, "final_layer.adaLN_modulation.1.bias")] = __swap_chunks(in_states[util.combine(in_prefix, "norm_out.linear.bias")])
+    out_states[util.combine(out_prefix, "final_layer.adaLN_modulation.1.weight")] = lazy.swap_chunks(in_states[util.combine(in_prefix, "norm_out.linear.weight")])
+    out_states[util.combine(out_prefix, "final_layer.adaLN_modulation.1.bias")] = lazy.swap_chunks(in_states[util.combine(in_prefix, "norm_out.linear.bias")])
     out_states |= util.map_wb(in_states, util.combine(out_prefix, "final_layer.linear"), util.combine(in_prefix, "proj_out"))
     out_states |= util.map_wb(in_states, util.combine(out_prefix, "guidance_in.in_layer"), util.combine(in_prefix, "time_text_embed.guidance_embedder.linear_1"))
     out_states |= util.map_wb(in_states, util.combine(out_prefix, "guidance_in.out_layer"), util.combine(in_prefix, "time_text_embed.guidance_embedder.linear_2"))
@@ -141,9 +135,9 @@ def __map_transformer(in_states: dict, out_prefix: str, in_prefix: str) -> dict:
 
 def convert_hunyuan_video_diffusers_to_ckpt(
         transformer_state_dict: dict,
-) -> dict:
-    state_dict = {}
+) -> lazy.LazyStateDict:
+    recipes = {}
 
-    state_dict |= __map_transformer(transformer_state_dict, "model.model", "")
+    recipes |= __map_transformer(lazy.KeySource(transformer_state_dict.keys()), "model.model", "")
 
-    return state_dict
+    return lazy.LazyStateDict(transformer_state_dict, recipes)
@@ -1,4 +1,5 @@
 import modules.util.convert.convert_diffusers_to_ckpt_util as util
+import modules.util.convert.lazy_conversion as lazy
 
 
 def __map_unet_blocks(in_states: dict, out_prefix: str, in_prefix: str) -> dict:
@@ -32,10 +33,10 @@ def __map_unet_blocks(in_states: dict, out_prefix: str, in_prefix: str) -> dict:
             out_states[util.combine(out_prefix, f"{i}.attention.to_out.0.bias")] = in_states[util.combine(in_prefix, f"{i}.attention.attn.out_proj.bias")]
 
             qkv_weight = in_states[util.combine(in_prefix, f"{i}.attention.attn.in_proj_weight")]
-            q_weight, k_weight, v_weight = qkv_weight.chunk(3, dim=0)
+            q_weight, k_weight, v_weight = lazy.chunk(qkv_weight, 3, dim=0)
 
             qkv_bias = in_states[util.combine(in_prefix, f"{i}.attention.attn.in_proj_bias")]
-            q_bias, k_bias, v_bias = qkv_bias.chunk(3, dim=0)
+            q_bias, k_bias, v_bias = lazy.chunk(qkv_bias, 3, dim=0)
 
             out_states[util.combine(out_prefix, f"{i}.attention.to_q.weight")] = q_weight
             out_states[util.combine(out_prefix, f"{i}.attention.to_q.bias")] = q_bias
@@ -70,9 +71,9 @@ def __map_prior(in_states: dict, out_prefix: str, in_prefix: str) -> dict:
 
 def convert_stable_cascade_ckpt_to_diffusers(
         prior_state_dict: dict,
-) -> dict:
-    state_dict = {}
+) -> lazy.LazyStateDict:
+    recipes = {}
 
-    state_dict |= __map_prior(prior_state_dict, "", "")
+    recipes |= __map_prior(lazy.KeySource(prior_state_dict.keys()), "", "")
 
-    return state_dict
+    return lazy.LazyStateDict(prior_state_dict, recipes)
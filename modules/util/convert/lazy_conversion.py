@@ -0,0 +1,412 @@
+import hashlib
+import json
+import math
+import os
+import struct
+from abc import ABCMeta, abstractmethod
+from collections.abc import Callable, Iterator, Mapping, Sequence
+
+import torch
+from torch import Tensor
+
+from safetensors import safe_open
+
+# A lazy conversion describes every output tensor as a small recipe over source tensors. Recipes are only
+# evaluated when the output tensor is accessed, one tensor at a time. The converter functions build recipes
+# by indexing a KeySource instead of a state dict, so the usual map_wb/map_prefix helpers work unchanged.
+
+SAFETENSORS_DTYPES = {
+    torch.float64: "F64",
+    torch.float32: "F32",
+    torch.float16: "F16",
+    torch.bfloat16: "BF16",
+    torch.int64: "I64",
+    torch.int32: "I32",
+    torch.int16: "I16",
+    torch.int8: "I8",
+    torch.uint8: "U8",
+    torch.bool: "BOOL",
+    torch.float8_e4m3fn: "F8_E4M3",
+    torch.float8_e5m2: "F8_E5M2",
+}
+TORCH_DTYPES = {name: dtype for dtype, name in SAFETENSORS_DTYPES.items()}
+
+
+class Recipe(metaclass=ABCMeta):
+    @abstractmethod
+    def evaluate(self, source: Mapping[str, Tensor]) -> Tensor:
+        pass
+
+    @abstractmethod
+    def shape(self, source_shape: Callable[[str], Sequence[int]]) -> tuple[int, ...]:
+        pass
+
+    @abstractmethod
+    def source_key(self) -> str:
+        # the first source key, used to determine the dtype
+        pass
+
+    @abstractmethod
+    def invert(self, target: 'Recipe', source_shape: Callable[[str], Sequence[int]]) -> list[tuple]:
+        """
+        Given a recipe for the value of this recipe, returns recipes for its source tensors as (key, recipe) tuples.
+        Slices of a source tensor, like chunks, can only be inverted together, they return
+        (key, dim, start, length, recipe) tuples instead.
+        """
+
+
+class Source(Recipe):
+    def __init__(self, key: str):
+        self.key = key
+
+    def evaluate(self, source: Mapping[str, Tensor]) -> Tensor:
+        return source[self.key]
+
+    def shape(self, source_shape: Callable[[str], Sequence[int]]) -> tuple[int, ...]:
+        return tuple(source_shape(self.key))
+
+    def source_key(self) -> str:
+        return self.key
+
+    def invert(self, target: Recipe, source_shape: Callable[[str], Sequence[int]]) -> list[tuple]:
+        return [(self.key, target)]
+
+
+class Concat(Recipe):
+    def __init__(self, parts: list[Recipe], dim: int = 0):
+        self.parts = parts
+        self.dim = dim
+
+    def evaluate(self, source: Mapping[str, Tensor]) -> Tensor:
+        return torch.cat([part.evaluate(source) for part in self.parts], self.dim)
+
+    def shape(self, source_shape: Callable[[str], Sequence[int]]) -> tuple[int, ...]:
+        shapes = [part.shape(source_shape) for part in self.parts]
+        shape = list(shapes[0])
+        shape[self.dim] = sum(s[self.dim] for s in shapes)
+        return tuple(shape)
+
+    def source_key(self) -> str:
+        return self.parts[0].source_key()
+
+    def invert(self, target: Recipe, source_shape: Callable[[str], Sequence[int]]) -> list[tuple]:
+        inverted = []
+        offset = 0
+        for part in self.parts:
+            length = part.shape(source_shape)[self.dim]
+            inverted += part.invert(Narrow(target, self.dim, offset, length), source_shape)
+            offset += length
+        return inverted
+
+
+class Narrow(Recipe):
+    def __init__(self, part: Recipe, dim: int, start: int, length: int):
+        self.part = part
+        self.dim = dim
+        self.start = start
+        self.length = length
+
+    def evaluate(self, source: Mapping[str, Tensor]) -> Tensor:
+        return _narrow(source, self.part, self.dim, self.start, self.length)
+
+    def shape(self, source_shape: Callable[[str], Sequence[int]]) -> tuple[int, ...]:
+        shape = list(self.part.shape(source_shape))
+        shape[self.dim] = self.length
+        return tuple(shape)
+
+    def source_key(self) -> str:
+        return self.part.source_key()
+
+    def invert(self, target: Recipe, source_shape: Callable[[str], Sequence[int]]) -> list[tuple]:
+        if not isinstance(self.part, Source):
+            raise NotImplementedError("only slices of source tensors can be inverted")
+        return [(self.part.key, self.dim, self.start, self.length, target)]
+
+
+class Chunk(Recipe):
+    def __init__(self, part: Recipe, chunks: int, index: int, dim: int = 0):
+        self.part = part
+        self.chunks = chunks
+        self.index = index
+        self.dim = dim
+
+    def __range(self, source_shape: Callable[[str], Sequence[int]]) -> tuple[int, int]:
+        # same chunk sizes as torch.chunk
+        size = self.part.shape(source_shape)[self.dim]
+        chunk_size = math.ceil(size / self.chunks)
+        start = min(size, self.index * chunk_size)
+        return start, min(chunk_size, size - start)
+
+    def evaluate(self, source: Mapping[str, Tensor]) -> Tensor:
+        start, length = self.__range(_source_shape(source))
+        return _narrow(source, self.part, self.dim, start, length)
+
+    def shape(self, source_shape: Callable[[str], Sequence[int]]) -> tuple[int, ...]:
+        shape = list(self.part.shape(source_shape))
+        shape[self.dim] = self.__range(source_shape)[1]
+        return tuple(shape)
+
+    def source_key(self) -> str:
+        return self.part.source_key()
+
+    def invert(self, target: Recipe, source_shape: Callable[[str], Sequence[int]]) -> list[tuple]:
+        if not isinstance(self.part, Source):
+            raise NotImplementedError("only slices of source tensors can be inverted")
+        start, length = self.__range(source_shape)
+        return [(self.part.key, self.dim, start, length, target)]
+
+
+class Reshape(Recipe):
+    def __init__(self, part: Recipe, shape: Sequence[int]):
+        self.part = part
+        self.target_shape = tuple(shape)
+
+    def evaluate(self, source: Mapping[str, Tensor]) -> Tensor:
+        return torch.reshape(self.part.evaluate(source), self.target_shape)
+
+    def shape(self, source_shape: Callable[[str], Sequence[int]]) -> tuple[int, ...]:
+        return self.target_shape
+
+    def source_key(self) -> str:
+        return self.part.source_key()
+
+    def invert(self, target: Recipe, source_shape: Callable[[str], Sequence[int]]) -> list[tuple]:
+        return self.part.invert(Reshape(target, self.part.shape(source_shape)), source_shape)
+
+
+def concat(parts: list[Recipe], dim: int = 0) -> Recipe:
+    return Concat(parts, dim)
+
+
+def chunk(part: Recipe, chunks: int, dim: int = 0) -> list[Recipe]:
+    return [Chunk(part, chunks, i, dim) for i in range(chunks)]
+
+
+def swap_chunks(part: Recipe, dim: int = 0) -> Recipe:
+    chunk_0, chunk_1 = chunk(part, 2, dim)
+    return Concat([chunk_1, chunk_0], dim)
+
+
+def reshape(part: Recipe, shape: Sequence[int]) -> Recipe:
+    return Reshape(part, shape)
+
+
+class KeySource(Mapping[str, Recipe]):
+    """
+    Stands in for a state dict while recipes are built. Indexing returns a Source recipe for the key.
+    """
+
+    def __init__(self, keys: Iterator[str] | Sequence[str]):
+        self.keys_list = list(keys)
+        self.keys_set = set(self.keys_list)
+
+    def __getitem__(self, key: str) -> Recipe:
+        if key not in self.keys_set:
+            raise KeyError(key)
+        return Source(key)
+
+    def __contains__(self, key: object) -> bool:
+        return key in self.keys_set
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.keys_list)
+
+    def __len__(self) -> int:
+        return len(self.keys_list)
+
+
+class SafetensorsSource(Mapping[str, Tensor]):
+    """
+    Reads tensors on demand from one or more memory mapped safetensors files, for example the shards of a model.
+    """
+
+    def __init__(self, paths: str | list[str]):
+        self.files = [safe_open(path, framework="pt") for path in ([paths] if isinstance(paths, str) else paths)]
+        self.key_files = {}
+        for f in self.files:
+            for key in f.keys():  # noqa: SIM118
+                self.key_files[key] = f
+
+    def __getitem__(self, key: str) -> Tensor:
+        return self.key_files[key].get_tensor(key)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.key_files)
+
+    def __len__(self) -> int:
+        return len(self.key_files)
+
+    def narrow(self, key: str, dim: int, start: int, length: int) -> Tensor:
+        # only reads the slice, not the whole tensor
+        index = (slice(None),) * dim + (slice(start, start + length),)
+        return self.key_files[key].get_slice(key)[index]
+
+    def shape(self, key: str) -> Sequence[int]:
+        return self.key_files[key].get_slice(key).get_shape()
+
+    def dtype(self, key: str) -> torch.dtype:
+        return TORCH_DTYPES[self.key_files[key].get_slice(key).get_dtype()]
+
+
+def _narrow(source: Mapping[str, Tensor], part: Recipe, dim: int, start: int, length: int) -> Tensor:
+    # a view would keep the whole parent tensor alive, slices of safetensors files are read directly instead
+    if isinstance(part, Source) and isinstance(source, SafetensorsSource):
+        return source.narrow(part.key, dim, start, length)
+    return part.evaluate(source).narrow(dim, start, length).clone()
+
+
+def _source_shape(source: Mapping[str, Tensor]) -> Callable[[str], Sequence[int]]:
+    if isinstance(source, SafetensorsSource | LazyStateDict):
+        return source.shape
+    return lambda key: source[key].shape
+
+
+def _source_dtype(source: Mapping[str, Tensor], key: str) -> torch.dtype:
+    if isinstance(source, SafetensorsSource | LazyStateDict):
+        return source.dtype(key)
+    return source[key].dtype
+
+
+class LazyStateDict(Mapping[str, Tensor]):
+    """
+    A state dict that converts each tensor from the source when it is accessed. Shapes and dtypes are
+    known without evaluating any recipe.
+    """
+
+    def __init__(self, source: Mapping[str, Tensor], recipes: dict[str, Recipe]):
+        self.source = source
+        self.recipes = recipes
+
+    def __getitem__(self, key: str) -> Tensor:
+        return self.recipes[key].evaluate(self.source)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.recipes)
+
+    def __len__(self) -> int:
+        return len(self.recipes)
+
+    def shape(self, key: str) -> tuple[int, ...]:
+        return self.recipes[key].shape(_source_shape(self.source))
+
+    def dtype(self, key: str) -> torch.dtype:
+        return _source_dtype(self.source, self.recipes[key].source_key())
+
+    def inverse(self, converted: Mapping[str, Tensor]) -> 'LazyStateDict':
+        """
+        Returns the conversion in the other direction, from tensors with the keys of this state dict back
+        to the keys of the source.
+        """
+        return LazyStateDict(converted, invert_recipes(self.recipes, _source_shape(self.source)))
+
+
+def load_state_dict_lazy(module: torch.nn.Module, state_dict: Mapping[str, Tensor]):
+    """
+    Strict load_state_dict that copies one tensor at a time, so a LazyStateDict is never fully materialized.
+    """
+    targets = module.state_dict(keep_vars=True)
+    missing_keys = sorted(targets.keys() - state_dict.keys())
+    unexpected_keys = sorted(state_dict.keys() - targets.keys())
+    if missing_keys or unexpected_keys:
+        raise RuntimeError(f"error loading state dict, missing keys: {missing_keys}, unexpected keys: {unexpected_keys}")
+
+    with torch.no_grad():
+        for key, target in targets.items():
+            target.copy_(state_dict[key])
+
+
+def invert_recipes(
+        recipes: dict[str, Recipe],
+        source_shape: Callable[[str], Sequence[int]],
+) -> dict[str, Recipe]:
+    inverted = {}
+    slices = {}
+
+    for key, recipe in recipes.items():
+        for entry in recipe.invert(Source(key), source_shape):
+            if len(entry) == 2:
+                inverted[entry[0]] = entry[1]
+            else:
+                source_key, dim, start, length, target = entry
+                slices.setdefault((source_key, dim), []).append((start, length, target))
+
+    for (source_key, dim), parts in slices.items():
+        # the slices need to cover the whole source tensor without gaps or overlaps
+        parts.sort(key=lambda part: part[0])
+        end = 0
+        for start, length, _ in parts:
+            if start != end:
+                raise ValueError(f"can't invert {source_key}, the used slices don't cover it exactly")
+            end += length
+        if end != source_shape(source_key)[dim]:
+            raise ValueError(f"can't invert {source_key}, the used slices don't cover it exactly")
+
+        inverted[source_key] = parts[0][2] if len(parts) == 1 else Concat([part[2] for part in parts], dim)
+
+    return inverted
+
+
+def save_safetensors_streaming(
+        state_dict: Mapping[str, Tensor],
+        path: str,
+        metadata: dict[str, str] | None = None,
+        dtype: torch.dtype | None = None,
+        hash_key: str | None = None,
+):
+    """
+    Writes a state dict to a safetensors file, converting and writing one tensor at a time. If hash_key is set,
+    the sha256 hash of all tensors (sorted by key) is stored in that metadata field.
+    """
+    keys = sorted(state_dict.keys())
+    source_shape = _source_shape(state_dict)
+
+    header = {}
+    offset = 0
+    for key in keys:
+        shape = list(source_shape(key))
+        tensor_dtype = dtype if dtype is not None else _source_dtype(state_dict, key)
+        size = math.prod(shape) * tensor_dtype.itemsize
+        header[key] = {
+            "dtype": SAFETENSORS_DTYPES[tensor_dtype],
+            "shape": shape,
+            "data_offsets": [offset, offset + size],
+        }
+        offset += size
+
+    metadata = dict(metadata) if metadata is not None else {}
+    if hash_key is not None:
+        # placeholder with the same length as the final hash, the header is rewritten at the end
+        metadata[hash_key] = "0x" + "0" * 64
+
+    def encode_header() -> bytes:
+        header_bytes = json.dumps({"__metadata__": metadata} | header, separators=(",", ":")).encode("utf-8")
+        # the data needs to be aligned to 8 bytes
+        header_bytes += b" " * (-len(header_bytes) % 8)
+        return struct.pack("<Q", len(header_bytes)) + header_bytes
+
+    sha256_hash = hashlib.sha256()
+    temp_path = path + ".tmp"
+    try:
+        with open(temp_path, "wb") as f:
+            header_bytes = encode_header()
+            f.write(header_bytes)
+
+            for key in keys:
+                tensor = state_dict[key].to(device="cpu", dtype=dtype).contiguous()
+                data = tensor.reshape(-1).view(torch.uint8).numpy()
+                if hash_key is not None:
+                    sha256_hash.update(data)
+                f.write(data)
+                del tensor, data
+
+            if hash_key is not None:
+                metadata[hash_key] = f"0x{sha256_hash.hexdigest()}"
+                f.seek(0)
+                f.write(encode_header())
+
+        os.replace(temp_path, path)
+    except BaseException:
+        # an incomplete file is never left behind, even if the conversion was interrupted
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
@@ -0,0 +1,171 @@
+import os
+from contextlib import contextmanager
+from datetime import timedelta
+
+import torch
+import torch.distributed as dist
+from torch import Tensor
+from torch.nn import Parameter
+
+# the main process caches the dataset while all other processes wait in a barrier, which can take hours
+__TIMEOUT = timedelta(hours=12)
+
+# gradients are flattened into buckets of this size before reducing them
+__BUCKET_SIZE_BYTES = 32 * 1024 * 1024
+
+__collective_device = torch.device("cpu")
+
+
+def is_enabled() -> bool:
+    return dist.is_available() and dist.is_initialized()
+
+
+def rank() -> int:
+    return dist.get_rank() if is_enabled() else 0
+
+
+def local_rank() -> int:
+    return int(os.environ.get("LOCAL_RANK", 0))
+
+
+def world_size() -> int:
+    return dist.get_world_size() if is_enabled() else 1
+
+
+def is_main_process() -> bool:
+    return rank() == 0
+
+
+def init_process_group(train_device: str) -> str:
+    """
+    Initializes the process group from the environment variables set by the launcher (RANK, WORLD_SIZE,
+    LOCAL_RANK, MASTER_ADDR, MASTER_PORT). Uses NCCL for cuda devices and gloo otherwise.
+
+    Returns the train device of this process.
+    """
+    global __collective_device
+
+    device = torch.device(train_device)
+    if device.type == "cuda" and dist.is_nccl_available():
+        device = torch.device("cuda", local_rank())
+        torch.cuda.set_device(device)
+        backend = "nccl"
+        __collective_device = device
+    else:
+        backend = "gloo"
+        __collective_device = torch.device("cpu")
+
+    dist.init_process_group(backend=backend, timeout=__TIMEOUT)
+
+    return str(device)
+
+
+def destroy_process_group():
+    if is_enabled():
+        dist.destroy_process_group()
+
+
+def barrier():
+    if is_enabled():
+        dist.barrier()
+
+
+@contextmanager
+def main_process_first():
+    """Runs the enclosed block on the main process first, all other processes wait until it is done."""
+    if not is_main_process():
+        barrier()
+
+    yield
+
+    if is_main_process():
+        barrier()
+
+
+def broadcast_parameters(parameters: list[Parameter]):
+    """Copies all parameters from the main process, so randomly initialized weights match on every process."""
+    if not is_enabled():
+        return
+
+    with torch.no_grad():
+        for parameter in parameters:
+            tensor = parameter.data.to(device=__collective_device)
+            dist.broadcast(tensor, src=0)
+            if tensor is not parameter.data:
+                parameter.data.copy_(tensor)
+
+
+def __reduce_bucket(tensors: list[Tensor]):
+    flat = torch.cat([tensor.reshape(-1) for tensor in tensors]).to(device=__collective_device)
+    dist.all_reduce(flat, op=dist.ReduceOp.SUM)
+    flat.div_(world_size())
+
+    offset = 0
+    for tensor in tensors:
+        tensor.copy_(flat[offset:offset + tensor.numel()].view_as(tensor))
+        offset += tensor.numel()
+
+
+def all_reduce_gradients(parameters: list[Parameter]):
+    """Averages the gradients of all parameters across processes."""
+    if not is_enabled():
+        return
+
+    buckets = {}
+    for parameter in parameters:
+        if parameter.grad is not None:
+            buckets.setdefault((parameter.grad.device, parameter.grad.dtype), []).append(parameter.grad)
+
+    for grads in buckets.values():
+        bucket = []
+        bucket_bytes = 0
+        for grad in grads:
+            bucket.append(grad)
+            bucket_bytes += grad.numel() * grad.element_size()
+            if bucket_bytes >= __BUCKET_SIZE_BYTES:
+                __reduce_bucket(bucket)
+                bucket = []
+                bucket_bytes = 0
+        if bucket:
+            __reduce_bucket(bucket)
+
+
+def all_reduce_gradient(parameter: Parameter):
+    """Averages the gradient of a single parameter across processes. Used by the fused back pass."""
+    if is_enabled() and parameter.grad is not None:
+        __reduce_bucket([parameter.grad])
+
+
+def all_reduce_mean(value: float) -> float:
+    if not is_enabled():
+        return value
+
+    tensor = torch.tensor([value], dtype=torch.float64, device=__collective_device)
+    dist.all_reduce(tensor, op=dist.ReduceOp.SUM)
+    return tensor.item() / world_size()
+
+
+def all_reduce_sum(value: int) -> int:
+    if not is_enabled():
+        return value
+
+    tensor = torch.tensor([value], dtype=torch.int64, device=__collective_device)
+    dist.all_reduce(tensor, op=dist.ReduceOp.SUM)
+    return int(tensor.item())
+
+
+def broadcast_flag(flag: bool) -> bool:
+    """Shares a flag that is only known to the main process, like a stop command."""
+    if not is_enabled():
+        return flag
+
+    tensor = torch.tensor([1 if flag else 0], dtype=torch.int32, device=__collective_device)
+    dist.broadcast(tensor, src=0)
+    return bool(tensor.item())
+
+
+class NullSummaryWriter:
+    """Drop-in replacement for the tensorboard SummaryWriter on processes that don't log anything."""
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
@@ -1,3 +1,5 @@
+from typing import BinaryIO
+
 from PIL import Image, ImageOps
 
 
@@ -7,3 +9,16 @@ def load_image(path: str, convert_mode: str = 'RGB') -> Image.Image:
     if convert_mode:
         image = image.convert(convert_mode)
     return image
+
+
+def read_image_size(path: str | BinaryIO) -> tuple[int, int]:
+    """
+    Reads the size of an image as (width, height) from its header, without decoding the pixels.
+    The EXIF orientation is applied the same way as in load_image.
+    """
+    with Image.open(path) as image:
+        width, height = image.size
+        # orientations 5 to 8 rotate the image by 90 degrees
+        if image.getexif().get(0x0112, 1) in [5, 6, 7, 8]:
+            width, height = height, width
+    return width, height
@@ -1,5 +1,5 @@
 from modules.model.BaseModel import BaseModel
-from modules.util import create
+from modules.util import create, distributed_util
 from modules.util.config.TrainConfig import TrainConfig, TrainOptimizerConfig
 from modules.util.enum.Optimizer import Optimizer
 from modules.util.NamedParameterGroup import NamedParameterGroupCollection
@@ -53,6 +53,15 @@ def init_model_parameters(
         train_device: torch.device,
 ):
     model.parameters = parameters
+    model.param_group_mapping = parameters.unique_name_mapping
+
+    if model.inference_only:
+        model.optimizer_state_dict = None
+        model.ema_state_dict = None
+        return
+
+    # randomly initialized parameters need to match on every process before the optimizer and ema see them
+    distributed_util.broadcast_parameters(parameters.parameters())
 
     model.optimizer = create.create_optimizer(parameters, model.optimizer_state_dict, model.train_config)
     if model.optimizer is not None:
@@ -62,8 +71,6 @@ def init_model_parameters(
     model.ema = create.create_ema(parameters.parameters(), model.ema_state_dict, model.train_config)
     model.ema_state_dict = None
 
-    model.param_group_mapping = parameters.unique_name_mapping
-
 
 # Optimizer Key map with defaults
 OPTIMIZER_DEFAULT_PARAMETERS = {
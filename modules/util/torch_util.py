@@ -1,8 +1,11 @@
 import gc
+import time
 from collections.abc import Callable
 from contextlib import nullcontext
 from typing import Any
 
+from modules.util.MemoryPolicy import memory_policy
+
 import torch
 
 import accelerate
@@ -193,6 +196,45 @@ def tensors_record_stream(
             tensors_record_stream(stream, elem)
 
 
+def __tensors_to_device(data: Any, device: torch.device) -> Any:
+    if isinstance(data, torch.Tensor):
+        return data.to(device=device)
+    elif isinstance(data, list):
+        return [__tensors_to_device(elem, device) for elem in data]
+    elif isinstance(data, tuple) and not hasattr(data, '_fields'):
+        return tuple(__tensors_to_device(elem, device) for elem in data)
+    elif isinstance(data, dict):
+        # updated in place, to keep the type of model outputs
+        for key, elem in data.items():
+            data[key] = __tensors_to_device(elem, device)
+    return data
+
+
+def set_module_output_device(
+        module: torch.nn.Module,
+        device: torch.device | None,
+):
+    """
+    Runs a module on the device of its parameters, independent of the rest of the model. Tensor inputs are moved
+    to the module, outputs are moved to device. None removes the device again, the hooks are only registered once.
+    """
+    def forward_pre_hook(module, args, kwargs):
+        if module._output_device is None:
+            return None
+        module_device = next(module.parameters()).device
+        return __tensors_to_device(args, module_device), __tensors_to_device(kwargs, module_device)
+
+    def forward_hook(module, args, output):
+        if module._output_device is None:
+            return None
+        return __tensors_to_device(output, module._output_device)
+
+    if not hasattr(module, '_output_device'):
+        module.register_forward_pre_hook(forward_pre_hook, with_kwargs=True)
+        module.register_forward_hook(forward_hook)
+    module._output_device = device
+
+
 def unpin_module(
         module: torch.nn.Module,
 ):
@@ -210,23 +252,46 @@ def device_equals(device1: torch.device, device2: torch.device) -> bool:
         and (0 if device1.index is None else device1.index) == (0 if device2.index is None else device2.index)
 
 
-def torch_gc():
+def torch_gc(force: bool = False, required_bytes: int = 0, device: torch.device | None = None):
+    """
+    Hints that memory can be collected. Unless force is set, memory_policy decides if a garbage collection
+    or emptying the allocator caches is actually needed.
+
+    Args:
+        force: always collect and empty the caches
+        required_bytes: number of bytes the caller is about to allocate
+        device: the device of that allocation
+    """
+    if force:
+        collect, empty_cache = True, True
+    else:
+        collect, empty_cache = memory_policy.decide(required_bytes, device)
+        if not collect and not empty_cache:
+            memory_policy.avoided()
+            return
+
+    start_time = time.perf_counter()
+
     if torch.cuda.is_available():
         torch.cuda.synchronize()
     if torch.backends.mps.is_available():
         torch.mps.synchronize()
 
-    gc.collect()
+    if collect:
+        gc.collect()
 
-    if torch.cuda.is_available():
-        torch.cuda.empty_cache()
+    if empty_cache:
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
 
-        if torch_version > Version("2.6.0"):
-            # TODO: replace with a torch.cuda binding once that's available
-            torch._C._host_emptyCache()
+            if torch_version > Version("2.6.0"):
+                # TODO: replace with a torch.cuda binding once that's available
+                torch._C._host_emptyCache()
 
-    if torch.backends.mps.is_available():
-        torch.mps.empty_cache()
+        if torch.backends.mps.is_available():
+            torch.mps.empty_cache()
+
+    memory_policy.collected(collect, empty_cache, time.perf_counter() - start_time)
 
 
 def torch_sync():
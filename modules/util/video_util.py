@@ -0,0 +1,247 @@
+import math
+import os
+import pathlib
+import random
+
+import cv2
+import scenedetect
+
+# gaps between clips longer than this are skipped by seeking instead of decoding
+SEEK_GAP_SECONDS = 10
+
+
+def find_videos(input_dir: str) -> list[pathlib.Path]:
+    """
+    Returns all readable videos in a directory and its subdirectories
+    """
+    videos = []
+    for path in pathlib.Path(input_dir).glob("**/*.*"):
+        if path.is_file():
+            video = cv2.VideoCapture(str(path))
+            if video.isOpened() and video.read()[0]:
+                videos.append(path)
+            video.release()
+    return videos
+
+
+def timestamp_to_frame(timestamp: str, fps: float) -> int:
+    """
+    Converts a timestamp in the format hh:mm:ss into a frame number
+    """
+    return int(sum(int(x) * 60 ** i for i, x in enumerate(reversed(timestamp.split(':')))) * fps)
+
+
+def get_random_aspect(size: tuple[int, int], variation: float) -> tuple[int, int, int, int]:
+    """
+    Returns a random crop (y, height, x, width) of a frame of size (height, width). The aspect ratio of the crop
+    varies by up to variation, and tends towards a square aspect ratio.
+    """
+    if variation == 0:
+        return 0, size[0], 0, size[1]
+
+    old_aspect = size[0]/size[1]    #height, width
+    variation_scaled = old_aspect*variation
+    if old_aspect > 1.2:
+        new_aspect = max(1.0, random.triangular(old_aspect-(variation_scaled*1.5), old_aspect+(variation_scaled/2), old_aspect))
+    elif old_aspect < 0.85:
+        new_aspect = min(1.0, random.triangular(old_aspect-(variation_scaled/2), old_aspect+(variation_scaled*1.5), old_aspect))
+    else:
+        new_aspect = random.triangular(old_aspect-variation_scaled, old_aspect+variation_scaled)
+
+    new_aspect = round(new_aspect, 2)
+    if new_aspect > old_aspect:
+        new_height = int(size[0])
+        new_width = int(size[1]*(old_aspect/new_aspect))
+    elif new_aspect < old_aspect:
+        new_height = int(size[0]*(new_aspect/old_aspect))
+        new_width = int(size[1])
+    else:
+        new_height = int(size[0])
+        new_width = int(size[1])
+
+    position_x = random.randint(0, size[1]-new_width)
+    position_y = random.randint(0, size[0]-new_height)
+    return position_y, new_height, position_x, new_width
+
+
+def find_clips(
+        video_path: str,
+        fps: float,
+        timestamp_min_frame: int,
+        timestamp_max_frame: int,
+        max_length: float,
+        split_at_cuts: bool,
+) -> list[tuple[int, int]]:
+    """
+    Splits a frame range of a video into clips of at most max_length seconds, optionally at scene cuts.
+    Returns a list of (start, end) frames, the end frame is excluded.
+    """
+    max_length_frames = int(max_length * fps)   #convert max length from seconds to frames
+    min_length_frames = int(0.25*fps)           #minimum clip length of 1/4 second
+
+    if split_at_cuts:
+        timecode_list = scenedetect.detect(str(video_path), scenedetect.AdaptiveDetector(), start_time=timestamp_min_frame, end_time=timestamp_max_frame) #detect scene transitions
+        scene_list = [(x[0].get_frames(), x[1].get_frames()) for x in timecode_list]
+        if len(scene_list) == 0:
+            scene_list = [(timestamp_min_frame,timestamp_max_frame)]     #use start/end frames if no scenes detected
+    else:
+        scene_list = [(timestamp_min_frame,timestamp_max_frame)]  #default if not using cuts, start and end of time range
+
+    clips = []
+    for scene in scene_list:
+        length = scene[1]-scene[0]
+        if length > max_length_frames:  #check for any scenes longer than max length
+            n = math.ceil(length/max_length_frames) #divide into n new scenes
+            new_length = int(length/n)
+            new_splits = range(scene[0], scene[1]+min_length_frames, new_length)   #divide clip into closest chunks to max_length
+            for i, _n in enumerate(new_splits[:-1]):
+                if new_splits[i+1] - new_splits[i] > min_length_frames:
+                    clips += [(new_splits[i], new_splits[i+1])]
+        else:
+            if length > (min_length_frames+2):
+                clips += [(scene[0]+1, scene[1]-1)]      #trim first and last frame from detected scenes to avoid transition artifacts
+
+    return clips
+
+
+class _ClipWriter:
+    def __init__(
+            self,
+            clip: tuple[int, int],
+            output_path: str,
+            crop: tuple[int, int, int, int],
+            fps: float,
+            target_fps: int,
+    ):
+        self.start, self.end = clip
+        self.output_path = output_path
+        self.y, self.h, self.x, self.w = crop
+        self.fps = fps
+        self.output_fps = target_fps if target_fps > 0 else fps
+        self.writer = None
+
+    def __output_frame_count(self, frame_number: int) -> int:
+        # output frame k shows the source frame at time k / output_fps. This returns how many output frames
+        # show the given source frame: 0 to drop it, more than 1 to repeat it
+        relative_frame = frame_number - self.start
+        ratio = self.output_fps / self.fps
+        return math.ceil((relative_frame + 1) * ratio - 1e-6) - math.ceil(relative_frame * ratio - 1e-6)
+
+    def needs_frame(self, frame_number: int) -> bool:
+        return self.__output_frame_count(frame_number) > 0
+
+    def write(self, frame_number: int, frame):
+        if self.writer is None:
+            fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+            self.writer = cv2.VideoWriter(self.output_path, fourcc, self.output_fps, (self.w, self.h))
+
+        cropped_frame = frame[self.y:self.y+self.h, self.x:self.x+self.w]
+        for _ in range(self.__output_frame_count(frame_number)):
+            self.writer.write(cropped_frame)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.release()
+            self.writer = None
+
+
+def extract_clips(
+        video_path: str,
+        output_dir: str,
+        timestamp_min: str = "00:00:00",
+        timestamp_max: str = "99:99:99",
+        max_length: float = 3.0,
+        split_at_cuts: bool = False,
+        crop_variation: float = 0.0,
+        target_fps: int = 0,
+) -> list[str]:
+    """
+    Splits a video into clips, and writes each clip as an mp4 file to output_dir.
+
+    The video is decoded once as a stream. Every decoded frame is cropped and written to all clips that contain it,
+    resampled to target_fps. Frames that don't belong to any clip are skipped without converting them, long gaps
+    between clips are skipped by seeking.
+
+    Parameters:
+        video_path (`str`): the video to split
+        output_dir (`str`): the directory to write the clips to
+        timestamp_min (`str`): start of the range to extract, in the format hh:mm:ss
+        timestamp_max (`str`): end of the range to extract, in the format hh:mm:ss
+        max_length (`float`): the maximum length of a clip in seconds
+        split_at_cuts (`bool`): split clips at detected scene cuts
+        crop_variation (`float`): amount of random aspect ratio variation of the crop of each clip
+        target_fps (`int`): the frame rate of the clips, 0 to keep the frame rate of the video
+
+    Returns: the paths of all written clips
+    """
+    video = cv2.VideoCapture(video_path)
+    writers = []
+    try:
+        fps = video.get(cv2.CAP_PROP_FPS)
+        frame_count = int(video.get(cv2.CAP_PROP_FRAME_COUNT))
+        size = (int(video.get(cv2.CAP_PROP_FRAME_WIDTH)), int(video.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+
+        timestamp_max_frame = min(timestamp_to_frame(timestamp_max, fps), frame_count)
+        timestamp_min_frame = min(timestamp_to_frame(timestamp_min, fps), timestamp_max_frame)
+
+        clips = sorted(find_clips(video_path, fps, timestamp_min_frame, timestamp_max_frame, max_length, split_at_cuts))
+
+        print(f'Video "{os.path.basename(video_path)}" being split into {len(clips)} clips in {output_dir}...')
+        if len(clips) == 0:
+            return []
+
+        os.makedirs(output_dir, exist_ok=True)
+
+        basename = os.path.splitext(os.path.basename(video_path))[0]
+        for clip in clips:
+            output_name = f'{basename}_{clip[0]}-{clip[1]}'
+            if target_fps > 0:
+                output_name += f'_{target_fps}fps'
+            writers.append(_ClipWriter(
+                clip=clip,
+                output_path=os.path.join(output_dir, output_name + ".mp4"),
+                crop=get_random_aspect((size[1], size[0]), crop_variation),
+                fps=fps,
+                target_fps=target_fps,
+            ))
+
+        seek_gap_frames = int(SEEK_GAP_SECONDS * fps)
+        next_writer_index = 0
+        active_writers = []
+
+        frame_number = clips[0][0]
+        video.set(cv2.CAP_PROP_POS_FRAMES, frame_number)
+        while next_writer_index < len(writers) or active_writers:
+            if not active_writers:
+                next_start = writers[next_writer_index].start
+                if next_start - frame_number > seek_gap_frames:
+                    video.set(cv2.CAP_PROP_POS_FRAMES, next_start)
+                    frame_number = next_start
+
+            while next_writer_index < len(writers) and writers[next_writer_index].start <= frame_number:
+                active_writers.append(writers[next_writer_index])
+                next_writer_index += 1
+
+            # grab() only decodes, the frame is converted by retrieve() if any clip needs it
+            if not video.grab():
+                break
+
+            receiving_writers = [writer for writer in active_writers if writer.needs_frame(frame_number)]
+            if receiving_writers:
+                success, frame = video.retrieve()
+                if not success:
+                    break
+                for writer in receiving_writers:
+                    writer.write(frame_number, frame)
+
+            frame_number += 1
+
+            for writer in [writer for writer in active_writers if writer.end <= frame_number]:
+                writer.close()
+                active_writers.remove(writer)
+    finally:
+        for writer in writers:
+            writer.close()
+        video.release()
+
+    return [writer.output_path for writer in writers if os.path.exists(writer.output_path)]
@@ -16,7 +16,13 @@ def main():
     with open(args.config_path, "r") as f:
         train_config.from_dict(json.load(f))
 
-    trainer = GenerateLossesModel(train_config, args.output_path)
+    trainer = GenerateLossesModel(
+        train_config,
+        args.output_path,
+        batch_size=args.batch_size,
+        timesteps=args.timesteps,
+        seeds=args.seeds,
+    )
     trainer.start()
 
 
@@ -0,0 +1,21 @@
+from util.import_util import script_imports
+
+script_imports()
+
+from modules.util import concept_archive
+from modules.util.args.CreateConceptArchiveArgs import CreateConceptArchiveArgs
+
+
+def main():
+    args = CreateConceptArchiveArgs.parse_args()
+
+    concept_archive.create_archive(
+        input_dir=args.input_dir,
+        output_dir=args.output_dir,
+        shard_size=args.shard_size_mb * 1024 * 1024,
+        include_subdirectories=args.include_subdirectories,
+    )
+
+
+if __name__ == "__main__":
+    main()
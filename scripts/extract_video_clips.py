@@ -0,0 +1,41 @@
+from util.import_util import script_imports
+
+script_imports()
+
+import os
+
+from modules.util import video_util
+from modules.util.args.ExtractVideoClipsArgs import ExtractVideoClipsArgs
+
+
+def main():
+    args = ExtractVideoClipsArgs.parse_args()
+
+    if os.path.isdir(args.input_path):
+        input_dir = args.input_path
+        video_paths = [str(path) for path in video_util.find_videos(input_dir)]
+    else:
+        input_dir = os.path.dirname(args.input_path)
+        video_paths = [args.input_path]
+
+    print(f'Found {len(video_paths)} videos to process')
+
+    for video_path in video_paths:
+        output_dir = args.output_dir
+        if args.output_subdirectories:
+            output_dir = os.path.join(output_dir, os.path.splitext(os.path.relpath(video_path, input_dir))[0])
+
+        video_util.extract_clips(
+            video_path=video_path,
+            output_dir=output_dir,
+            timestamp_min=args.timestamp_min,
+            timestamp_max=args.timestamp_max,
+            max_length=args.max_length,
+            split_at_cuts=args.split_at_cuts,
+            crop_variation=args.crop_variation,
+            target_fps=args.target_fps,
+        )
+
+
+if __name__ == "__main__":
+    main()
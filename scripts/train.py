@@ -3,17 +3,20 @@ from util.import_util import script_imports
 script_imports()
 
 import json
+import os
 
 from modules.trainer.GenericTrainer import GenericTrainer
+from modules.util import distributed_util
 from modules.util.args.TrainArgs import TrainArgs
 from modules.util.callbacks.TrainCallbacks import TrainCallbacks
 from modules.util.commands.TrainCommands import TrainCommands
 from modules.util.config.SecretsConfig import SecretsConfig
 from modules.util.config.TrainConfig import TrainConfig
 
+import torch.multiprocessing as mp
 
-def main():
-    args = TrainArgs.parse_args()
+
+def train(args: TrainArgs):
     callbacks = TrainCallbacks()
     commands = TrainCommands()
 
@@ -29,6 +32,9 @@ def main():
         if args.secrets_path is not None:
             raise
 
+    if int(os.environ.get("WORLD_SIZE", 1)) > 1:
+        train_config.train_device = distributed_util.init_process_group(train_config.train_device)
+
     trainer = GenericTrainer(train_config, callbacks, commands)
 
     trainer.start()
@@ -42,6 +48,28 @@ def main():
     if not canceled or train_config.backup_before_save:
         trainer.end()
 
+    distributed_util.destroy_process_group()
+
+
+def train_process(local_rank: int, args: TrainArgs):
+    os.environ["MASTER_ADDR"] = args.master_address
+    os.environ["MASTER_PORT"] = str(args.master_port)
+    os.environ["WORLD_SIZE"] = str(args.num_nodes * args.num_processes)
+    os.environ["RANK"] = str(args.node_rank * args.num_processes + local_rank)
+    os.environ["LOCAL_RANK"] = str(local_rank)
+
+    train(args)
+
+
+def main():
+    args = TrainArgs.parse_args()
+
+    # processes started by an external launcher like torchrun already have their environment set up
+    if args.num_nodes * args.num_processes > 1 and "WORLD_SIZE" not in os.environ:
+        mp.spawn(train_process, args=(args,), nprocs=args.num_processes)
+    else:
+        train(args)
+
 
 if __name__ == '__main__':
     main()
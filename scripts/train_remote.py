@@ -4,11 +4,12 @@ script_imports()
 
 import json
 import os
-import pickle
 import threading
-import traceback
 from contextlib import suppress
+from pathlib import Path
 
+from modules.cloud.EventStream import EventReader, EventType, EventWriter, apply_command_event, fd_receiver, read_events
+from modules.cloud.UploadManifest import wait_for_upload
 from modules.trainer.GenericTrainer import GenericTrainer
 from modules.util.args.TrainArgs import TrainArgs
 from modules.util.callbacks.TrainCallbacks import TrainCallbacks
@@ -17,59 +18,33 @@ from modules.util.config.SecretsConfig import SecretsConfig
 from modules.util.config.TrainConfig import TrainConfig
 
 
-def write_request(filename,name, *params):
+def command_thread_function(commands: TrainCommands,filename : str,stop_event):
+    #open the pipe for reading and writing. This process then always is a writer itself, so the pipe
+    #doesn't return EOF if a client disconnects. The events of the next client continue the same stream,
+    #the reader counts their sequence numbers separately, because every client writes its own session:
     try:
-        with suppress(FileNotFoundError):
-            os.rename(filename,filename+'.write')
-        with open(filename+'.write', 'ab') as f:
-            pickle.dump(name,f)
-            pickle.dump(params,f)
-        os.rename(filename+'.write',filename)
-    except Exception:
-        #TrainCallbacks is suppressing all exceptions; at least print them:
-        traceback.print_exc()
-        raise
-
-def close_pipe(filename):
-    with open(filename, 'wb'): #send EOF by closing
-        os.remove(filename)
-
-
+        fd=os.open(filename,os.O_RDWR)
+    except FileNotFoundError:
+        return
 
-def command_thread_function(commands: TrainCommands,filename : str,stop_event):
-    while not stop_event.is_set():
-        try:
-            with open(filename, 'rb') as f:
-                remote_commands=pickle.load(f)
-        except FileNotFoundError:
-            break
-        except EOFError:
-            continue
-
-        if remote_commands.get_stop_command():
-            commands.stop()
-        for entry in remote_commands.get_and_reset_sample_custom_commands():
-            commands.sample_custom(entry)
-        if remote_commands.get_and_reset_sample_default_command():
-            commands.sample_default()
-        if remote_commands.get_and_reset_backup_command():
-            commands.backup()
-        if remote_commands.get_and_reset_save_command():
-            commands.save()
+    try:
+        read_events(fd_receiver(fd),EventReader(),
+                    lambda event_type,payload:apply_command_event(commands,event_type,payload),stop_event)
+    finally:
+        os.close(fd)
 
 
 
 def main():
     args = TrainArgs.parse_args()
+    event_writer = None
     if args.callback_path:
-        callbacks = TrainCallbacks(
-            on_update_train_progress=lambda *fargs:write_request(args.callback_path,"on_update_train_progress",*fargs),
-            on_update_status=lambda *fargs:write_request(args.callback_path,"on_update_status",*fargs),
-            on_sample_default=lambda *fargs:write_request(args.callback_path,"on_sample_default",*fargs),
-            on_update_sample_default_progress=lambda *fargs:write_request(args.callback_path,"on_update_sample_default_progress",*fargs),
-            on_sample_custom=lambda *fargs:write_request(args.callback_path,"on_sample_custom",*fargs),
-            on_update_sample_custom_progress=lambda *fargs:write_request(args.callback_path,"on_update_sample_custom_progress",*fargs),
-        )
+        #callbacks are appended to an event file instead of a pipe. Writing never blocks training,
+        #also in case of a detached cloud trainer, and clients can resume reading at any offset:
+        with open(args.callback_path, 'wb'):
+            pass
+        event_writer = EventWriter(lambda: open(args.callback_path, 'ab'))  # noqa: SIM115
+        callbacks = event_writer.train_callbacks()
     else:
         callbacks = TrainCallbacks()
     commands = TrainCommands()
@@ -86,7 +61,13 @@ def main():
         if args.secrets_path is not None:
             raise
 
-    trainer = GenericTrainer(train_config, callbacks, commands)
+    wait_for_data = None
+    if args.upload_manifest_path:
+        #the client is still uploading concepts. Load the model in the meantime:
+        def wait_for_data():
+            wait_for_upload(Path(args.upload_manifest_path), callbacks, commands)
+
+    trainer = GenericTrainer(train_config, callbacks, commands, wait_for_data)
 
     if args.command_path:
         stop_event=threading.Event()
@@ -100,10 +81,16 @@ def main():
     finally:
         if args.command_path:
             stop_event.set()
-            close_pipe(args.command_path)
             command_thread.join()
+            with suppress(FileNotFoundError):
+                os.remove(args.command_path)
 
-        trainer.end()
+        try:
+            trainer.end()
+        finally:
+            if event_writer:
+                event_writer.send(EventType.END)
+                event_writer.close()
 
 
 